@@ -1,8 +1,11 @@
 from fastapi import APIRouter
-from app.api.api_v1.endpoints import clusters, health
+from app.api.api_v1.endpoints import capacity, clusters, health, jobs, profiles
 
 api_router = APIRouter()
 
 # Include endpoint routers
 api_router.include_router(health.router, prefix="/health", tags=["health"])
-api_router.include_router(clusters.router, prefix="/clusters", tags=["clusters"])
\ No newline at end of file
+api_router.include_router(clusters.router, prefix="/clusters", tags=["clusters"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(capacity.router, prefix="/capacity", tags=["capacity"])
+api_router.include_router(profiles.router, prefix="/profiles", tags=["profiles"])
\ No newline at end of file
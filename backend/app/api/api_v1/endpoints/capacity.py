@@ -0,0 +1,29 @@
+from typing import Any, Dict
+
+from dbprov.capacity import GB, MB, CapacityError, WorkloadTarget, plan_capacity
+from fastapi import APIRouter, HTTPException
+
+from app.models.capacity import CapacityRequest
+
+router = APIRouter()
+
+@router.post("/plan")
+async def plan_cluster_capacity(request: CapacityRequest) -> Dict[str, Any]:
+    """Size instance type, WiredTiger cache, oplog and shard count for a workload"""
+    target = WorkloadTarget(
+        working_set_bytes=int(request.working_set_gb * GB),
+        write_bytes_per_sec=int(request.write_mb_per_sec * MB),
+        oplog_window_hours=request.oplog_window_hours,
+        peak_ops=request.peak_ops,
+        data_size_bytes=int(request.data_size_gb * GB) if request.data_size_gb else None,
+        cluster_type=request.cluster_type.value if request.cluster_type else None,
+        replica_nodes=request.replica_nodes,
+        headroom=request.headroom,
+        max_shards=request.max_shards,
+    )
+    try:
+        plan = plan_capacity(target)
+    except CapacityError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    result: Dict[str, Any] = plan.to_dict()
+    return result
@@ -1,50 +1,214 @@
-from fastapi import APIRouter
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from pydantic import BaseModel
 
+from app.api.deps import (
+    get_cluster_health,
+    get_cluster_registry,
+    get_job_queue,
+    get_metrics_store,
+    get_status_cache,
+)
+from app.core.config import settings
+from app.models.cluster import (
+    Cluster,
+    ClusterCreate,
+    ClusterScale,
+    ClusterStatus,
+    ClusterType,
+)
+from app.services.cluster_health import ClusterHealthService
+from app.services.cluster_registry import (
+    ClusterAlreadyExists,
+    ClusterRegistry,
+    InvalidCursor,
+)
+from app.services.jobs import JobQueue, JobQueueFull
+from app.services.metrics import RESOLUTIONS, MetricsStore
+from app.services.provisioning import provision_cluster, scale_cluster
+from app.services.status_cache import StatusCache, compute_etag, etag_matches
+
 router = APIRouter()
 
-# Basic models for future development
 class ClusterResponse(BaseModel):
     id: str
     name: str
-    status: str
-    type: str
+    status: ClusterStatus
+    type: ClusterType
     nodes: int
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_cluster(cls, cluster: Cluster) -> "ClusterResponse":
+        return cls(**cluster.model_dump())
+
+class ClusterDetailResponse(ClusterResponse):
+    live: Optional[Dict[str, Any]] = None
 
 class ClusterListResponse(BaseModel):
     clusters: List[ClusterResponse]
     total: int
+    next_cursor: Optional[str] = None
+
+class ClusterCreateAccepted(BaseModel):
+    cluster: ClusterResponse
+    job_id: str
+    status_url: str
+    events_url: str
+
+class ClusterScaleAccepted(BaseModel):
+    job_id: str
+    status_url: str
+    events_url: str
 
 @router.get("/", response_model=ClusterListResponse)
-async def list_clusters():
-    """List all MongoDB clusters"""
-    # Placeholder implementation
+async def list_clusters(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    type: Optional[ClusterType] = None,
+    status: Optional[ClusterStatus] = None,
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+):
+    """List MongoDB clusters, ordered by name"""
+    try:
+        page = await registry.list(limit=limit, cursor=cursor, type=type, status=status)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return ClusterListResponse(
-        clusters=[],
-        total=0
+        clusters=[ClusterResponse.from_cluster(c) for c in page.clusters],
+        total=page.total,
+        next_cursor=page.next_cursor,
+    )
+
+@router.get("/{cluster_id}", response_model=ClusterDetailResponse)
+async def get_cluster(
+    cluster_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    health: ClusterHealthService = Depends(get_cluster_health),
+    cache: StatusCache = Depends(get_status_cache),
+):
+    """Get details of a specific cluster, including its cached live state"""
+    cluster = await registry.get(cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    detail = ClusterDetailResponse(**cluster.model_dump())
+    if cluster.status == ClusterStatus.RUNNING:
+        try:
+            entry = await cache.get(cluster.id, lambda: health.snapshot(cluster))
+        except FileNotFoundError:
+            pass  # no inventory yet, nothing to probe
+        else:
+            detail.live = entry.value
+            response.headers["Age"] = str(int(entry.age(cache.clock())))
+    etag = compute_etag(detail.model_dump(mode="json"))
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return detail
+
+@router.get("/{cluster_id}/health")
+async def get_cluster_health_report(
+    cluster_id: str,
+    check_all: bool = False,
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    health: ClusterHealthService = Depends(get_cluster_health),
+) -> Dict[str, Any]:
+    """Probe every node of a cluster and report replication and election state"""
+    cluster = await registry.get(cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    try:
+        return await health.report(cluster, server_status=check_all)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/{cluster_id}/metrics")
+async def get_cluster_metrics(
+    cluster_id: str,
+    metric: Optional[str] = Query(None, description="e.g. connections.current; omit to list metrics"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Optional[str] = Query(None, pattern="^(" + "|".join(RESOLUTIONS) + ")$"),
+    step: Optional[float] = Query(None, gt=0, description="Re-bucket to this many seconds"),
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    store: MetricsStore = Depends(get_metrics_store),
+) -> Dict[str, Any]:
+    """Per-node time series collected for a cluster (default: the last hour)"""
+    cluster = await registry.get(cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    if metric is None:
+        return {"cluster_id": cluster_id, "metrics": store.metrics(cluster_id)}
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    series = store.query(
+        cluster_id, metric, start.timestamp(), end.timestamp(), resolution, step
     )
+    return {
+        "cluster_id": cluster_id,
+        "metric": metric,
+        "start": start,
+        "end": end,
+        "nodes": {node: data.to_dict() for node, data in sorted(series.items())},
+    }
 
-@router.get("/{cluster_id}", response_model=ClusterResponse)
-async def get_cluster(cluster_id: str):
-    """Get details of a specific cluster"""
-    # Placeholder implementation
-    return ClusterResponse(
-        id=cluster_id,
-        name=f"cluster-{cluster_id}",
-        status="placeholder",
-        type="replicaset",
-        nodes=3
+@router.post("/", response_model=ClusterCreateAccepted, status_code=202)
+async def create_cluster(
+    request: ClusterCreate,
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    queue: JobQueue = Depends(get_job_queue),
+):
+    """Create a new MongoDB cluster; provisioning runs as a background job"""
+    try:
+        cluster, job = await provision_cluster(registry, queue, request)
+    except ClusterAlreadyExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Provisioning queue is full: {e}")
+    jobs_url = f"{settings.API_V1_STR}/jobs/{job.id}"
+    return ClusterCreateAccepted(
+        cluster=ClusterResponse.from_cluster(cluster),
+        job_id=job.id,
+        status_url=jobs_url,
+        events_url=f"{jobs_url}/events",
     )
 
-@router.post("/")
-async def create_cluster():
-    """Create a new MongoDB cluster"""
-    # Placeholder implementation
-    return {"message": "Cluster creation endpoint - to be implemented"}
+@router.post("/{cluster_id}/scale", response_model=ClusterScaleAccepted, status_code=202)
+async def scale_cluster_online(
+    cluster_id: str,
+    request: ClusterScale,
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    queue: JobQueue = Depends(get_job_queue),
+) -> ClusterScaleAccepted:
+    """Add shards or mongos to a running cluster and follow the chunk rebalancing as a background job"""
+    cluster = await registry.get(cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    if cluster.status != ClusterStatus.RUNNING:
+        raise HTTPException(status_code=409, detail=f"Cluster {cluster.name} is {cluster.status.value}, not running")
+    if cluster.type != ClusterType.SHARDED:
+        raise HTTPException(status_code=409, detail="Only sharded clusters can be scaled out")
+    try:
+        job = await scale_cluster(registry, queue, cluster, request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Provisioning queue is full: {e}")
+    jobs_url = f"{settings.API_V1_STR}/jobs/{job.id}"
+    return ClusterScaleAccepted(job_id=job.id, status_url=jobs_url, events_url=f"{jobs_url}/events")
 
 @router.delete("/{cluster_id}")
-async def delete_cluster(cluster_id: str):
-    """Delete a MongoDB cluster"""
-    # Placeholder implementation
-    return {"message": f"Cluster {cluster_id} deletion endpoint - to be implemented"}
\ No newline at end of file
+async def delete_cluster(
+    cluster_id: str,
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    cache: StatusCache = Depends(get_status_cache),
+):
+    """Remove a MongoDB cluster from the registry"""
+    if not await registry.delete(cluster_id):
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    cache.invalidate(cluster_id)
+    return {"message": f"Cluster {cluster_id} deleted"}
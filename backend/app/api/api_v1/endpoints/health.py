@@ -1,6 +1,10 @@
-from fastapi import APIRouter
+import shutil
+from fastapi import APIRouter, Depends
 from datetime import datetime
+from app.api.deps import get_cluster_registry, get_job_queue
 from app.core.config import settings
+from app.services.cluster_registry import ClusterRegistry
+from app.services.jobs import JobQueue
 
 router = APIRouter()
 
@@ -16,14 +20,19 @@ async def health_check():
     }
 
 @router.get("/ready")
-async def readiness_check():
+async def readiness_check(
+    registry: ClusterRegistry = Depends(get_cluster_registry),
+    queue: JobQueue = Depends(get_job_queue),
+):
     """Readiness check endpoint"""
-    # In the future, check database connections, external services, etc.
+    checks = {
+        "database": "ok" if await registry.db.ping() else "unavailable",
+        "job_queue": "ok" if queue.running else "stopped",
+        "provisioner": "ok" if shutil.which(settings.DBPROVISION_COMMAND) else "missing",
+    }
     return {
-        "status": "ready",
+        "status": "ready" if all(v == "ok" for v in checks.values()) else "not_ready",
         "service": "mongocraft-backend",
-        "checks": {
-            "database": "not_configured",  # Will be updated when DB is added
-            "external_services": "ok"
-        }
+        "checks": checks,
+        "queued_jobs": queue.queued,
     }
\ No newline at end of file
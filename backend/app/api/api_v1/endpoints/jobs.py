@@ -0,0 +1,40 @@
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import get_job_queue
+from app.models.job import JobInfo
+from app.services.jobs import Job, JobQueue
+
+router = APIRouter()
+
+def _get_job(job_id: str, queue: JobQueue) -> Job:
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.get("/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str, queue: JobQueue = Depends(get_job_queue)) -> JobInfo:
+    """Get the status, phase progress and recent log lines of a job"""
+    return _get_job(job_id, queue).info()
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    last_event_id: Optional[int] = Header(None),
+    queue: JobQueue = Depends(get_job_queue),
+) -> StreamingResponse:
+    """Stream phase transitions and log lines of a job as Server-Sent Events"""
+    job = _get_job(job_id, queue)
+
+    async def events() -> AsyncIterator[str]:
+        async for event in job.stream(last_event_id or 0):
+            yield event.to_sse() if event is not None else ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,29 @@
+from typing import Any, Dict, List, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import get_profile_store
+from app.core.profiling import ProfileStore
+
+router = APIRouter()
+
+@router.get("/")
+async def list_profiles(store: ProfileStore = Depends(get_profile_store)) -> List[dict]:
+    """List recent request profiles, newest first"""
+    return [profile.summary() for profile in store.list()]
+
+@router.get("/{profile_id}", response_model=None)
+async def get_profile(
+    profile_id: str,
+    format: str = Query("summary", pattern="^(summary|collapsed)$"),
+    limit: int = Query(25, ge=1, le=500),
+    store: ProfileStore = Depends(get_profile_store),
+) -> Union[PlainTextResponse, Dict[str, Any]]:
+    """Get a request profile: hottest functions, or collapsed stacks for flame graphs"""
+    profile = store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return {**profile.summary(), "top": profile.top(limit)}
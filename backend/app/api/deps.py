@@ -0,0 +1,30 @@
+from app.core.profiling import ProfileStore, profile_store
+from app.services.cluster_health import ClusterHealthService, cluster_health
+from app.services.cluster_registry import ClusterRegistry, cluster_registry
+from app.services.jobs import JobQueue, job_queue
+from app.services.metrics import MetricsStore, metrics_store
+from app.services.status_cache import StatusCache, status_cache
+
+
+def get_cluster_registry() -> ClusterRegistry:
+    return cluster_registry
+
+
+def get_job_queue() -> JobQueue:
+    return job_queue
+
+
+def get_cluster_health() -> ClusterHealthService:
+    return cluster_health
+
+
+def get_status_cache() -> StatusCache:
+    return status_cache
+
+
+def get_metrics_store() -> MetricsStore:
+    return metrics_store
+
+
+def get_profile_store() -> ProfileStore:
+    return profile_store
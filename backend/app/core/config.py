@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import validator
@@ -30,8 +31,51 @@ class Settings(BaseSettings):
             return v
         raise ValueError(v)
     
-    # Database settings (for future use)
-    DATABASE_URL: Optional[str] = None
+    # Database settings (cluster registry)
+    DATABASE_URL: str = "sqlite:///./mongocraft.db"
+    DATABASE_POOL_SIZE: int = 5
+    
+    # Provisioning job queue
+    DBPROVISION_COMMAND: str = "dbprovision"
+    # State directory of the CLI; each created cluster gets its own workspace there
+    DBPROVISION_HOME: str = os.environ.get(
+        "DBPROVISION_HOME", str(Path.home() / ".dbprovision")
+    )
+    PROVISION_WORKERS: int = 4
+    PROVISION_QUEUE_SIZE: int = 100
+    PROVISION_TIMEOUT: Optional[float] = None
+    
+    # Cluster health probes
+    ANSIBLE_DIR: str = str(Path(__file__).resolve().parents[3] / "infra" / "ansible")
+    HEALTH_PROBE_TIMEOUT: float = 3.0
+    HEALTH_PROBE_CONCURRENCY: int = 64
+    MONGODB_USERNAME: Optional[str] = None
+    MONGODB_PASSWORD: Optional[str] = None
+    MONGODB_TLS: bool = False
+    
+    # Live status snapshot cache for GET /clusters/{id}
+    STATUS_CACHE_TTL: float = 5.0
+    STATUS_CACHE_STALE_TTL: float = 30.0
+    STATUS_CACHE_MAX_ENTRIES: int = 1000
+    STATUS_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    
+    # Metrics collection (clusters created with monitoring_enabled)
+    METRICS_ENABLED: bool = True
+    METRICS_INTERVAL: float = 10.0
+    METRICS_RAW_POINTS: int = 360
+    METRICS_MINUTE_POINTS: int = 1440
+    METRICS_HOUR_POINTS: int = 720
+    METRICS_MAX_SERIES: int = 5000
+    
+    # Request metrics (GET /metrics) and event-loop blocking detection
+    REQUEST_METRICS_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1
+    LOOP_BLOCK_WARN_MS: float = 250.0
+    
+    # Per-request sampling profiler (X-Profile: 1)
+    PROFILING_ENABLED: bool = False
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_MAX_PROFILES: int = 50
     
     # Security settings
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
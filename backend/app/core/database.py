@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_memory_ids = itertools.count()
+
+
+class Connection:
+    """A pooled SQLite connection whose calls run on the pool's executor."""
+
+    def __init__(self, raw: sqlite3.Connection, executor: ThreadPoolExecutor):
+        self._raw = raw
+        self._executor = executor
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, self._raw)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        def _execute(conn: sqlite3.Connection) -> int:
+            with conn:
+                return conn.execute(sql, params).rowcount
+
+        return await self.run(_execute)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def executescript(self, script: str) -> None:
+        def _executescript(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.executescript(script)
+
+        await self.run(_executescript)
+
+
+class Database:
+    """Fixed-size async pool over an embedded SQLite database.
+
+    Supported URLs are ``sqlite:///relative/path.db``, ``sqlite:////abs/path.db``
+    and ``sqlite:///:memory:`` (a private shared-cache database, handy for tests).
+    """
+
+    def __init__(self, url: str, pool_size: int = 5):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.url = url
+        self.pool_size = pool_size
+        self._target, self._uri = self._parse_url(url)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: List[sqlite3.Connection] = []
+
+    @staticmethod
+    def _parse_url(url: str) -> tuple[str, bool]:
+        prefix = "sqlite:///"
+        if not url.startswith(prefix):
+            raise ValueError(f"Unsupported DATABASE_URL (only sqlite is supported): {url}")
+        path = url[len(prefix):]
+        if path in ("", ":memory:"):
+            return f"file:mongocraft-{next(_memory_ids)}?mode=memory&cache=shared", True
+        return path, False
+
+    @property
+    def connected(self) -> bool:
+        return self._pool is not None
+
+    async def connect(self) -> None:
+        if self._pool is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+        self._pool = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        for _ in range(self.pool_size):
+            raw = await loop.run_in_executor(self._executor, self._open)
+            self._connections.append(raw)
+            self._pool.put_nowait(Connection(raw, self._executor))
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._target, uri=self._uri, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 30000")
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    async def close(self) -> None:
+        if self._pool is None:
+            return
+        for raw in self._connections:
+            raw.close()
+        self._connections.clear()
+        self._pool = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[Connection]:
+        if self._pool is None:
+            raise RuntimeError("Database is not connected")
+        pool = self._pool
+        conn = await pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put_nowait(conn)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        async with self.connection() as conn:
+            return await conn.execute(sql, params)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        async with self.connection() as conn:
+            return await conn.fetchall(sql, params)
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[sqlite3.Row]:
+        async with self.connection() as conn:
+            return await conn.fetchone(sql, params)
+
+    async def ping(self) -> bool:
+        try:
+            return (await self.fetchone("SELECT 1")) is not None
+        except (RuntimeError, sqlite3.Error):
+            return False
@@ -0,0 +1,468 @@
+"""Request metrics, event-loop lag detection and Prometheus text exposition.
+
+Metrics live in a small in-process registry rendered by ``GET /metrics`` in
+the Prometheus text format (0.0.4); the backend is a single process, so no
+multiprocess collector or client library is needed.
+"""
+
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request latencies: 5ms .. 10s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Event-loop wake-up lag: 1ms .. 5s
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Terraform/Ansible phases and whole jobs: 1s .. 2h
+PHASE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, values: Sequence[str]) -> LabelValues:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {values}")
+        return tuple(str(v) for v in values)
+
+    def _labelset(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0.0)]  # unlabelled series exist from the start
+        for key, value in items:
+            yield f"{self.name}{self._labelset(key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackGauge(Metric):
+    """Gauge whose values are read from ``collect`` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[LabelValues, float]],
+        labels: Sequence[str] = (),
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self) -> Iterator[str]:
+        try:
+            values = self.collect()
+        except Exception:
+            logger.exception("Collecting %s failed", self.name)
+            return
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{self._labelset(key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (+Inf last), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{self._labelset(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labelset(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._labelset(key)} {cumulative}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[LabelValues, float]],
+        labels: Sequence[str] = (),
+    ) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, collect, labels))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "mongocraft_http_requests_total",
+    "HTTP requests by route template and status code",
+    ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "mongocraft_http_request_duration_seconds",
+    "Time until the response is complete (until headers for event streams)",
+    ("method", "route"),
+)
+http_requests_in_flight = registry.gauge(
+    "mongocraft_http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ("method",),
+)
+event_loop_lag = registry.histogram(
+    "mongocraft_event_loop_lag_seconds",
+    "How late the event loop ran a timer that was due",
+    buckets=LAG_BUCKETS,
+)
+event_loop_blocked = registry.counter(
+    "mongocraft_event_loop_blocked_total",
+    "Times the event loop was blocked longer than LOOP_BLOCK_WARN_MS",
+)
+span_duration = registry.histogram(
+    "mongocraft_span_duration_seconds",
+    "Duration of named operations timed with span()",
+    ("span", "status"),
+    buckets=LATENCY_BUCKETS + (30.0, 60.0),
+)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time a block into ``mongocraft_span_duration_seconds{span=name}``."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        span_duration.observe(duration, name, status)
+        logger.debug("span %s %s %.3fs %s", name, status, duration, attributes)
+
+
+class ActiveRequest:
+    __slots__ = ("method", "path", "started")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.monotonic()
+
+
+# Requests being handled, by id(scope); read by the loop watchdog thread
+active_requests: Dict[int, ActiveRequest] = {}
+
+
+def _route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return str(getattr(route, "path", scope["path"]))
+    # Plain routes (docs, openapi.json) set only the endpoint; their paths are fixed
+    if "endpoint" in scope:
+        return str(scope["path"])
+    return "<unmatched>"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording per-route latency, status and in-flight counts.
+
+    Routes are labelled by their template (``/api/v1/clusters/{cluster_id}``),
+    read from the scope after routing, so label cardinality stays bounded.
+    Requests carrying ``X-Profile: 1`` are sampled by the profiler when
+    ``PROFILING_ENABLED`` is set; see ``app.core.profiling``.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        from app.core.profiling import profiler_for
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = 500
+        headers_sent_at: Optional[float] = None
+        streaming = False
+        profiler = profiler_for(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, headers_sent_at, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers_sent_at = time.perf_counter()
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type":
+                        streaming = value.startswith(b"text/event-stream")
+                if profiler is not None:
+                    message["headers"] = list(message.get("headers", ())) + [
+                        (b"x-profile-id", profiler.profile.id.encode())
+                    ]
+            await send(message)
+
+        key = id(scope)
+        active_requests[key] = ActiveRequest(method, scope["path"])
+        http_requests_in_flight.inc(method)
+        if profiler is not None:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            ended = time.perf_counter()
+            if profiler is not None:
+                profiler.stop()
+            http_requests_in_flight.dec(method)
+            active_requests.pop(key, None)
+            route = _route_template(scope)
+            # Event streams stay open for minutes; their latency is time to first byte
+            if streaming and headers_sent_at is not None:
+                ended = headers_sent_at
+            http_requests.inc(method, route, str(status))
+            http_request_duration.observe(ended - started, method, route)
+
+
+class LoopMonitor:
+    """Measures event-loop lag and reports handlers that block the loop.
+
+    A task sleeps for ``interval`` and records how late it wakes up. A
+    watchdog thread checks that task's heartbeat; when the loop has not run it
+    for longer than ``block_threshold`` seconds, it logs the loop thread's
+    stack and the requests in flight, once per stall.
+    """
+
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.25):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = 0.0
+        self._reported = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick(), name="loop-monitor")
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            event_loop_lag.observe(max(0.0, now - due))
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.block_threshold or self._reported == heartbeat:
+                continue
+            self._reported = heartbeat
+            event_loop_blocked.inc()
+            logger.warning(
+                "Event loop blocked for %.0f ms (threshold %.0f ms)\n%s",
+                blocked * 1000,
+                self.block_threshold * 1000,
+                self.describe_stall(),
+            )
+
+    def describe_stall(self) -> str:
+        now = time.monotonic()
+        lines = []
+        try:
+            requests = list(active_requests.values())
+        except RuntimeError:  # resized by the loop thread while copying
+            requests = []
+        for request in requests:
+            lines.append(
+                f"  in flight: {request.method} {request.path}"
+                f" ({(now - request.started) * 1000:.0f} ms)"
+            )
+        frame = (
+            sys._current_frames().get(self._loop_thread)
+            if self._loop_thread is not None
+            else None
+        )
+        if frame is not None:
+            lines.append("Event loop thread stack (most recent call last):")
+            lines.extend(
+                line.rstrip("\n") for line in traceback.format_stack(frame, limit=20)
+            )
+        return "\n".join(lines)
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    block_threshold=settings.LOOP_BLOCK_WARN_MS / 1000,
+)
@@ -0,0 +1,179 @@
+"""On-demand sampling profiler for single requests.
+
+With ``PROFILING_ENABLED`` set, a request sent with ``X-Profile: 1`` is
+sampled while it runs: a thread reads the event-loop thread's stack every
+``PROFILING_INTERVAL_MS`` and keeps the samples taken while that request's
+task was the one running. The response carries ``X-Profile-Id``; the profile
+is served by ``GET /api/v1/profiles/{id}`` as a summary or as collapsed
+stacks for flame graph tools. Other requests pay nothing.
+
+The sampler needs the GIL to read stacks, so CPU-bound code is sampled at
+most every ``sys.getswitchinterval()`` (5 ms). Sync (``def``) endpoints run
+in the threadpool and are not sampled.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from types import CodeType
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.types import Scope
+
+from app.core.config import settings
+
+Stack = Tuple[str, ...]
+
+PROFILE_HEADER = b"x-profile"
+
+
+def _frame_name(code: CodeType) -> str:
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class Profile:
+    def __init__(self, method: str, path: str, interval: float):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.created_at = datetime.now(timezone.utc)
+        self.duration = 0.0
+        # Ticks where the request's task ran, ran something else, or the loop idled
+        self.stacks: "Counter[Stack]" = Counter()
+        self.other_samples = 0
+        self.idle_samples = 0
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format, one ``frame;frame;... count`` per stack."""
+        return "".join(
+            ";".join(stack) + f" {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+    def top(self, limit: int = 25) -> List[Dict[str, Any]]:
+        own: "Counter[str]" = Counter()
+        total: "Counter[str]" = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        samples = self.samples or 1
+        return [
+            {
+                "function": name,
+                "self_pct": round(100 * own[name] / samples, 1),
+                "total_pct": round(100 * total[name] / samples, 1),
+            }
+            for name in sorted(total, key=lambda n: (own[n], total[n]), reverse=True)
+        ][:limit]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "interval_ms": round(self.interval * 1000, 2),
+            "samples": self.samples,
+            "other_samples": self.other_samples,
+            "idle_samples": self.idle_samples,
+        }
+
+
+class RequestProfiler:
+    """Samples the event-loop thread while ``task`` is the running task."""
+
+    def __init__(self, profile: Profile, task: asyncio.Task, store: "ProfileStore"):
+        self.profile = profile
+        self.task = task
+        self.store = store
+        self._loop = task.get_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._sample, name=f"profiler-{self.profile.id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.profile.duration = time.perf_counter() - self._started
+        self.store.add(self.profile)
+
+    def _sample(self) -> None:
+        profile = self.profile
+        while not self._stopped.wait(profile.interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            current = asyncio.current_task(self._loop)
+            if current is None:
+                profile.idle_samples += 1
+                continue
+            if current is not self.task:
+                profile.other_samples += 1
+                continue
+            if self._stopped.is_set():
+                break  # the loop thread is in stop(), joining this thread
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            profile.stacks[tuple(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """The most recent ``max_profiles`` request profiles."""
+
+    def __init__(self, max_profiles: int = 50):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Profile]:
+        with self._lock:
+            return list(reversed(self._profiles.values()))
+
+
+profile_store = ProfileStore(max_profiles=settings.PROFILING_MAX_PROFILES)
+
+
+def profiler_for(scope: Scope) -> Optional[RequestProfiler]:
+    """A profiler for this request when it asked for one and profiling is on."""
+    if not settings.PROFILING_ENABLED:
+        return None
+    value = dict(scope.get("headers") or ()).get(PROFILE_HEADER, b"").lower()
+    if value not in (b"1", b"true", b"yes"):
+        return None
+    task = asyncio.current_task()
+    if task is None:
+        return None
+    profile = Profile(
+        scope["method"], scope["path"], settings.PROFILING_INTERVAL_MS / 1000
+    )
+    return RequestProfiler(profile, task, profile_store)
@@ -1,13 +1,44 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.instrumentation import (
+    CONTENT_TYPE,
+    RequestMetricsMiddleware,
+    loop_monitor,
+    registry,
+)
 from app.api.api_v1.api import api_router
+from app.services.cluster_health import cluster_health
+from app.services.cluster_registry import cluster_registry
+from app.services.jobs import job_queue
+from app.services.provisioning import fail_interrupted
+from app.services.metrics import metrics_collector
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if settings.REQUEST_METRICS_ENABLED:
+        await loop_monitor.start()
+    await cluster_registry.connect()
+    await fail_interrupted(cluster_registry)
+    await job_queue.start()
+    if settings.METRICS_ENABLED:
+        await metrics_collector.start()
+    yield
+    await metrics_collector.stop()
+    await job_queue.stop()
+    await cluster_health.close()
+    await cluster_registry.close()
+    await loop_monitor.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="MongoDB Automation Platform Backend API",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -19,6 +50,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency/in-flight metrics and per-request profiling; outermost so
+# the timings include CORS handling
+if settings.REQUEST_METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -34,4 +70,10 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "mongocraft-backend"}
\ No newline at end of file
+    return {"status": "healthy", "service": "mongocraft-backend"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus metrics: request latency, event-loop lag, provisioning jobs"""
+    # Set as a header: media_type would get a second charset appended
+    return Response(registry.render(), headers={"Content-Type": CONTENT_TYPE})
\ No newline at end of file
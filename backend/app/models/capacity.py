@@ -0,0 +1,17 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.models.cluster import ClusterType
+
+
+class CapacityRequest(BaseModel):
+    working_set_gb: float = Field(..., gt=0, description="Hot data and indexes to keep in cache")
+    data_size_gb: Optional[float] = Field(None, gt=0, description="Total data size (default: working set)")
+    write_mb_per_sec: float = Field(0, ge=0, description="Oplog write volume at peak")
+    oplog_window_hours: float = Field(24, gt=0)
+    peak_ops: int = Field(0, ge=0)
+    cluster_type: Optional[ClusterType] = None
+    replica_nodes: int = Field(3, ge=1)
+    max_shards: int = Field(10, ge=1, le=10)
+    headroom: float = Field(0.3, ge=0)
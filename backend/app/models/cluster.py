@@ -0,0 +1,84 @@
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from dbprov.tuning import PROFILES
+from pydantic import BaseModel, Field
+
+
+class ClusterType(str, Enum):
+    STANDALONE = "standalone"
+    REPLICASET = "replicaset"
+    SHARDED = "sharded"
+
+
+class ClusterStatus(str, Enum):
+    PENDING = "pending"
+    PROVISIONING = "provisioning"
+    RUNNING = "running"
+    FAILED = "failed"
+    DELETING = "deleting"
+
+
+class ClusterCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=63, pattern=r"^[a-z][a-z0-9-]*$")
+    type: ClusterType = ClusterType.REPLICASET
+    project_id: str = Field(..., min_length=1)
+    region: str = "asia-northeast3"
+    zones: Optional[List[str]] = None
+    mongodb_version: str = "8.0"
+    replica_nodes: int = Field(3, ge=1)
+    shard_count: int = Field(3, ge=1)
+    config_servers: int = Field(3, ge=1)
+    mongos_count: int = Field(2, ge=1)
+    instance_type: str = "e2-standard-4"
+    disk_size: int = Field(100, ge=10)
+    disk_type: str = "pd-ssd"
+    cache_size: Optional[str] = Field(None, pattern=r"^\d+(\.\d+)?GB$")
+    oplog_size: Optional[str] = Field(None, pattern=r"^\d+MB$")
+    tuning_profile: str = Field("default", pattern=r"^(" + "|".join(PROFILES) + ")$")
+    enable_tls: bool = False
+    monitoring_enabled: bool = False
+    backup_enabled: bool = False
+
+    @property
+    def nodes(self) -> int:
+        if self.type == ClusterType.STANDALONE:
+            return 1
+        if self.type == ClusterType.SHARDED:
+            return (
+                self.shard_count * self.replica_nodes
+                + self.config_servers
+                + self.mongos_count
+            )
+        return self.replica_nodes
+
+
+class ClusterScale(BaseModel):
+    """Online scale-out of a running cluster; omitted fields are left as they are."""
+
+    shard_count: Optional[int] = Field(None, ge=1, le=10)
+    mongos_count: Optional[int] = Field(None, ge=1, le=5)
+    balancer_window: Optional[str] = Field(
+        None, pattern=r"^(any|\d{2}:\d{2}-\d{2}:\d{2})$"
+    )
+    secondary_throttle: Optional[bool] = None
+    wait_for_delete: Optional[bool] = None
+    wait: bool = True
+
+
+class Cluster(BaseModel):
+    id: str
+    name: str
+    type: ClusterType
+    status: ClusterStatus
+    nodes: int
+    spec: Dict[str, Any] = Field(default_factory=dict)
+    created_at: datetime
+    updated_at: datetime
+
+
+class ClusterPage(BaseModel):
+    clusters: List[Cluster]
+    total: int
+    next_cursor: Optional[str] = None
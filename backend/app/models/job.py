@@ -0,0 +1,46 @@
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class PhaseStatus(str, Enum):
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class PhaseInfo(BaseModel):
+    name: str
+    status: PhaseStatus
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = None
+
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    cluster_id: Optional[str] = None
+    status: JobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    phases: Dict[str, PhaseInfo] = {}
+    progress: Optional[Dict[str, Any]] = None
+    returncode: Optional[int] = None
+    error: Optional[str] = None
+    log_tail: List[str] = []
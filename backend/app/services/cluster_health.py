@@ -0,0 +1,88 @@
+import ssl
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dbprov.fleet import workspace_dir
+from dbprov.health import ClusterHealth, HealthProber, Node, load_topology
+from dbprov.wire import ConnectionPool, Credentials
+
+from app.core.config import settings
+from app.core.instrumentation import span
+from app.models.cluster import Cluster
+
+
+class ClusterHealthService:
+    """Probes managed clusters with one long-lived prober so node connections are reused."""
+
+    def __init__(
+        self,
+        ansible_dir: Path,
+        state_dir: Path,
+        timeout: float = 3.0,
+        concurrency: int = 64,
+        credentials: Optional[Credentials] = None,
+        tls: bool = False,
+    ):
+        self.ansible_dir = ansible_dir
+        self.state_dir = state_dir
+        self.prober = HealthProber(
+            ConnectionPool(
+                max_per_host=2,
+                connect_timeout=timeout,
+                tls=ssl.create_default_context() if tls else None,
+                credentials=credentials,
+            ),
+            concurrency=concurrency,
+            timeout=timeout,
+        )
+
+    def topology(self, cluster: Cluster) -> List[Node]:
+        """Nodes from the cluster's workspace inventories, else the shared ones."""
+        workspace = workspace_dir(self.state_dir, cluster.name) / "ansible"
+        root = workspace if workspace.is_dir() else self.ansible_dir
+        nodes: List[Node] = load_topology(root, cluster.name)
+        return nodes
+
+    async def check(self, cluster: Cluster, server_status: bool = False) -> ClusterHealth:
+        nodes = self.topology(cluster)
+        with span("cluster_health.probe", cluster=cluster.name, nodes=len(nodes)):
+            return await self.prober.probe(nodes, server_status=server_status)
+
+    async def report(self, cluster: Cluster, server_status: bool = False) -> Dict[str, Any]:
+        health = await self.check(cluster, server_status)
+        return {"cluster_id": cluster.id, "name": cluster.name, **health.to_dict()}
+
+    async def snapshot(self, cluster: Cluster) -> Dict[str, Any]:
+        """Compact live state without per-probe timings, so unchanged clusters compare equal."""
+        health = await self.check(cluster)
+        return {
+            "healthy": health.healthy,
+            "issues": list(health.issues),
+            "nodes": {
+                "total": len(health.nodes),
+                "reachable": sum(1 for n in health.nodes if n.ok),
+            },
+            "replica_sets": {name: {
+                "primary": rs.primary,
+                "term": rs.term,
+                "max_lag_seconds": rs.max_lag,
+                "members": [vars(m) for m in rs.members],
+            } for name, rs in health.replica_sets.items()},
+        }
+
+    async def close(self) -> None:
+        await self.prober.close()
+
+
+cluster_health = ClusterHealthService(
+    Path(settings.ANSIBLE_DIR),
+    Path(settings.DBPROVISION_HOME),
+    timeout=settings.HEALTH_PROBE_TIMEOUT,
+    concurrency=settings.HEALTH_PROBE_CONCURRENCY,
+    credentials=(
+        Credentials(settings.MONGODB_USERNAME, settings.MONGODB_PASSWORD or "")
+        if settings.MONGODB_USERNAME
+        else None
+    ),
+    tls=settings.MONGODB_TLS,
+)
@@ -0,0 +1,216 @@
+import base64
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import Database
+from app.models.cluster import Cluster, ClusterPage, ClusterStatus, ClusterType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clusters (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    nodes INTEGER NOT NULL,
+    spec TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_clusters_name ON clusters (name);
+CREATE INDEX IF NOT EXISTS ix_clusters_status_name ON clusters (status, name);
+CREATE INDEX IF NOT EXISTS ix_clusters_type_name ON clusters (type, name);
+
+-- Per (type, status) row counts kept by triggers so list totals never scan clusters
+CREATE TABLE IF NOT EXISTS cluster_counts (
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (type, status)
+);
+CREATE TRIGGER IF NOT EXISTS tr_clusters_insert AFTER INSERT ON clusters BEGIN
+    INSERT INTO cluster_counts (type, status, n) VALUES (NEW.type, NEW.status, 1)
+    ON CONFLICT (type, status) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_clusters_delete AFTER DELETE ON clusters BEGIN
+    UPDATE cluster_counts SET n = n - 1 WHERE type = OLD.type AND status = OLD.status;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_clusters_update AFTER UPDATE OF type, status ON clusters
+WHEN OLD.type IS NOT NEW.type OR OLD.status IS NOT NEW.status BEGIN
+    UPDATE cluster_counts SET n = n - 1 WHERE type = OLD.type AND status = OLD.status;
+    INSERT INTO cluster_counts (type, status, n) VALUES (NEW.type, NEW.status, 1)
+    ON CONFLICT (type, status) DO UPDATE SET n = n + 1;
+END;
+"""
+
+
+class ClusterAlreadyExists(Exception):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+class ClusterRegistry:
+    """Inventory of provisioned clusters, backed by the application database."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def connect(self) -> None:
+        await self.db.connect()
+        async with self.db.connection() as conn:
+            await conn.executescript(SCHEMA)
+
+    async def close(self) -> None:
+        await self.db.close()
+
+    async def create(
+        self,
+        name: str,
+        type: ClusterType,
+        nodes: int,
+        spec: Optional[Dict[str, Any]] = None,
+        status: ClusterStatus = ClusterStatus.PENDING,
+    ) -> Cluster:
+        now = datetime.now(timezone.utc)
+        cluster = Cluster(
+            id=uuid.uuid4().hex,
+            name=name,
+            type=type,
+            status=status,
+            nodes=nodes,
+            spec=spec or {},
+            created_at=now,
+            updated_at=now,
+        )
+        try:
+            await self.db.execute(
+                "INSERT INTO clusters (id, name, type, status, nodes, spec, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cluster.id,
+                    cluster.name,
+                    cluster.type.value,
+                    cluster.status.value,
+                    cluster.nodes,
+                    json.dumps(cluster.spec),
+                    now.isoformat(),
+                    now.isoformat(),
+                ),
+            )
+        except sqlite3.IntegrityError as e:
+            raise ClusterAlreadyExists(f"Cluster {name} already exists") from e
+        return cluster
+
+    async def get(self, cluster_id: str) -> Optional[Cluster]:
+        row = await self.db.fetchone("SELECT * FROM clusters WHERE id = ?", (cluster_id,))
+        return self._to_model(row) if row else None
+
+    async def get_by_name(self, name: str) -> Optional[Cluster]:
+        row = await self.db.fetchone("SELECT * FROM clusters WHERE name = ?", (name,))
+        return self._to_model(row) if row else None
+
+    async def update_status(self, cluster_id: str, status: ClusterStatus) -> bool:
+        updated = await self.db.execute(
+            "UPDATE clusters SET status = ?, updated_at = ? WHERE id = ?",
+            (status.value, datetime.now(timezone.utc).isoformat(), cluster_id),
+        )
+        return updated > 0
+
+    async def replace_status(self, old: ClusterStatus, new: ClusterStatus) -> int:
+        """Move every cluster in ``old`` to ``new``; returns how many there were."""
+        return await self.db.execute(
+            "UPDATE clusters SET status = ?, updated_at = ? WHERE status = ?",
+            (new.value, datetime.now(timezone.utc).isoformat(), old.value),
+        )
+
+    async def update_spec(self, cluster_id: str, spec: Dict[str, Any], nodes: int) -> bool:
+        updated = await self.db.execute(
+            "UPDATE clusters SET spec = ?, nodes = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(spec), nodes, datetime.now(timezone.utc).isoformat(), cluster_id),
+        )
+        return updated > 0
+
+    async def delete(self, cluster_id: str) -> bool:
+        return await self.db.execute("DELETE FROM clusters WHERE id = ?", (cluster_id,)) > 0
+
+    async def list(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        type: Optional[ClusterType] = None,
+        status: Optional[ClusterStatus] = None,
+    ) -> ClusterPage:
+        """Return one page ordered by name, continuing after ``cursor``."""
+        where, params = self._filters(type, status)
+        if cursor:
+            where.append("name > ?")
+            params.append(decode_cursor(cursor))
+
+        sql = "SELECT * FROM clusters"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY name LIMIT ?"
+
+        rows = await self.db.fetchall(sql, (*params, limit + 1))
+        clusters = [self._to_model(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(clusters[-1].name) if len(rows) > limit else None
+        return ClusterPage(
+            clusters=clusters, total=await self.count(type, status), next_cursor=next_cursor
+        )
+
+    async def count(
+        self, type: Optional[ClusterType] = None, status: Optional[ClusterStatus] = None
+    ) -> int:
+        where, params = self._filters(type, status)
+        sql = "SELECT COALESCE(SUM(n), 0) FROM cluster_counts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        row = await self.db.fetchone(sql, params)
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _filters(
+        type: Optional[ClusterType], status: Optional[ClusterStatus]
+    ) -> tuple[List[str], List[Any]]:
+        where: List[str] = []
+        params: List[Any] = []
+        if type is not None:
+            where.append("type = ?")
+            params.append(type.value)
+        if status is not None:
+            where.append("status = ?")
+            params.append(status.value)
+        return where, params
+
+    @staticmethod
+    def _to_model(row: sqlite3.Row) -> Cluster:
+        return Cluster(
+            id=row["id"],
+            name=row["name"],
+            type=row["type"],
+            status=row["status"],
+            nodes=row["nodes"],
+            spec=json.loads(row["spec"]),
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+
+cluster_registry = ClusterRegistry(Database(settings.DATABASE_URL, settings.DATABASE_POOL_SIZE))
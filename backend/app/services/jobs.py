@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from dbprov.process import ProcessRunner
+
+from app.core.config import settings
+from app.core.instrumentation import PHASE_BUCKETS, registry
+from app.models.job import JobInfo, JobStatus, PhaseInfo, PhaseStatus
+
+logger = logging.getLogger(__name__)
+
+# Phase transition lines printed by the dbprovision CLI scheduler
+PHASE_LINE = re.compile(
+    r"^==> \[(?P<name>[^\]]+)\] (?P<state>started|finished|failed)"
+    r"(?: \((?P<duration>[\d.]+)s\))?$"
+)
+
+# Chunk migration progress printed by ``dbprovision scale`` while it follows the balancer
+BALANCE_LINE = re.compile(
+    r"^Balancing: moved=(?P<moved>\d+) remaining=(?P<remaining>\d+)"
+    r" rate=(?P<rate>[\d.]+)/min eta=(?P<eta>\S+)"
+)
+
+SUBSCRIBER_BACKLOG = 1000
+
+phase_duration = registry.histogram(
+    "mongocraft_job_phase_duration_seconds",
+    "Terraform/Ansible phase durations reported by the dbprovision CLI",
+    ("kind", "phase", "status"),
+    buckets=PHASE_BUCKETS,
+)
+job_duration = registry.histogram(
+    "mongocraft_job_duration_seconds",
+    "Provisioning job run time, from start to exit",
+    ("kind", "status"),
+    buckets=PHASE_BUCKETS,
+)
+
+
+def phase_label(name: str) -> str:
+    """Phase name without its shard number or replica set, for metric labels."""
+    if name.startswith("add-members-"):
+        return "add-members"
+    return re.sub(r"-\d+$", "", name)
+
+JobCallback = Callable[["Job"], Awaitable[None]]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+@dataclass
+class JobEvent:
+    id: int
+    type: str
+    data: dict
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class Job:
+    """A queued provisioning command plus its bounded event history."""
+
+    def __init__(
+        self,
+        kind: str,
+        argv: Sequence[str],
+        cluster_id: Optional[str] = None,
+        on_finish: Optional[JobCallback] = None,
+        history: int = 1000,
+        tail: int = 50,
+    ):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.argv = list(argv)
+        self.cluster_id = cluster_id
+        self.on_finish = on_finish
+        self.status = JobStatus.QUEUED
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.phases: Dict[str, PhaseInfo] = {}
+        self.progress: Optional[dict] = None
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+        self.log_tail: Deque[str] = deque(maxlen=tail)
+        self.events: Deque[JobEvent] = deque(maxlen=history)
+        self._next_event_id = 1
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def info(self) -> JobInfo:
+        return JobInfo(
+            id=self.id,
+            kind=self.kind,
+            cluster_id=self.cluster_id,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            phases=dict(self.phases),
+            progress=self.progress,
+            returncode=self.returncode,
+            error=self.error,
+            log_tail=list(self.log_tail),
+        )
+
+    def publish(self, type: str, data: dict) -> None:
+        event = JobEvent(self._next_event_id, type, data)
+        self._next_event_id += 1
+        self.events.append(event)
+        for queue in list(self._subscribers):
+            if queue.qsize() >= SUBSCRIBER_BACKLOG:
+                # Slow consumer: end its stream, the client reconnects with Last-Event-ID
+                self._close_subscriber(queue)
+            else:
+                queue.put_nowait(event)
+
+    def set_status(self, status: JobStatus, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        now = datetime.now(timezone.utc)
+        if status == JobStatus.RUNNING:
+            self.started_at = now
+        elif status.finished:
+            self.finished_at = now
+            if self.started_at is not None:
+                elapsed = (now - self.started_at).total_seconds()
+                job_duration.observe(elapsed, self.kind, status.value)
+        data = {"status": status.value}
+        if error:
+            data["error"] = error
+        self.publish("status", data)
+        if status.finished:
+            for queue in list(self._subscribers):
+                self._close_subscriber(queue)
+
+    def _close_subscriber(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        queue.put_nowait(None)
+
+    def handle_line(self, stream: str, line: str) -> None:
+        self.log_tail.append(line)
+        match = PHASE_LINE.match(line)
+        balance = BALANCE_LINE.match(line)
+        if match:
+            name, state = match.group("name"), match.group("state")
+            duration = float(match.group("duration")) if match.group("duration") else None
+            status = PhaseStatus.RUNNING if state == "started" else PhaseStatus(state)
+            now = datetime.now(timezone.utc)
+            previous = self.phases.get(name)
+            started_at = now
+            if previous and previous.started_at and state != "started":
+                started_at = previous.started_at
+            self.phases[name] = PhaseInfo(
+                name=name,
+                status=status,
+                started_at=started_at,
+                finished_at=None if state == "started" else now,
+                duration=duration,
+            )
+            if state != "started":
+                if duration is None:
+                    duration = (now - started_at).total_seconds()
+                phase_duration.observe(duration, self.kind, phase_label(name), state)
+            self.publish("phase", self.phases[name].model_dump(mode="json"))
+        elif balance:
+            eta = balance.group("eta")
+            self.progress = {
+                "moved_chunks": int(balance.group("moved")),
+                "remaining_chunks": int(balance.group("remaining")),
+                "chunks_per_minute": float(balance.group("rate")),
+                "eta": None if eta == "-" else eta,
+            }
+            self.publish("progress", self.progress)
+        else:
+            self.publish("log", {"stream": stream, "line": line})
+
+    async def stream(
+        self, last_event_id: int = 0, keepalive: float = 15.0
+    ) -> AsyncIterator[Optional[JobEvent]]:
+        """Replay events after ``last_event_id`` then follow live ones.
+
+        Yields ``None`` as a keepalive tick when nothing happened for a while.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = self.status.finished
+        if not finished:
+            self._subscribers.add(queue)
+        try:
+            for event in list(self.events):
+                if event.id > last_event_id:
+                    last_event_id = event.id
+                    yield event
+            if finished:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                if event.id > last_event_id:
+                    last_event_id = event.id
+                    yield event
+        finally:
+            self._subscribers.discard(queue)
+
+
+class JobQueue:
+    """Bounded pool of workers running provisioning commands off the request path."""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queued: int = 100,
+        max_retained: int = 1000,
+        command_timeout: Optional[float] = None,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self.command_timeout = command_timeout
+        self.env = env
+        self.runner = ProcessRunner(echo=False, tail_lines=200)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not all(t.done() for t in self._tasks)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        queue, self._queue = self._queue, None
+        # Jobs only live in this process: ones that never started are over as well
+        while queue is not None and not queue.empty():
+            job = queue.get_nowait()
+            job.set_status(JobStatus.CANCELLED, "backend shut down before it started")
+            await self._finished(job)
+
+    def submit(
+        self,
+        kind: str,
+        argv: Sequence[str],
+        cluster_id: Optional[str] = None,
+        on_finish: Optional[JobCallback] = None,
+    ) -> Job:
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        job = Job(kind, argv, cluster_id=cluster_id, on_finish=on_finish)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self.max_queued} jobs already queued")
+        self.jobs[job.id] = job
+        job.publish("status", {"status": job.status.value})
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _evict(self) -> None:
+        while len(self.jobs) > self.max_retained:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if not oldest.status.finished:
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                job.set_status(JobStatus.CANCELLED, "backend shutting down")
+                raise
+            except Exception as e:
+                logger.exception("Job %s crashed", job.id)
+                job.set_status(JobStatus.FAILED, str(e))
+            finally:
+                self._queue.task_done()
+                await self._finished(job)
+
+    async def _finished(self, job: Job) -> None:
+        if job.on_finish is not None and job.status.finished:
+            try:
+                await asyncio.shield(job.on_finish(job))
+            except Exception:
+                logger.exception("Job %s completion hook failed", job.id)
+
+    async def _run(self, job: Job) -> None:
+        job.set_status(JobStatus.RUNNING)
+        result = await self.runner.run_async(
+            job.argv,
+            label=job.id,
+            timeout=self.command_timeout,
+            env=self.env,
+            on_line=job.handle_line,
+        )
+        job.returncode = result.returncode
+        if result.ok:
+            job.set_status(JobStatus.SUCCEEDED)
+        elif result.timed_out:
+            job.set_status(JobStatus.FAILED, f"timed out after {result.duration:.0f}s")
+        else:
+            job.set_status(JobStatus.FAILED, f"exited with code {result.returncode}")
+
+
+job_queue = JobQueue(
+    workers=settings.PROVISION_WORKERS,
+    max_queued=settings.PROVISION_QUEUE_SIZE,
+    command_timeout=settings.PROVISION_TIMEOUT,
+    env={**os.environ, "DBPROVISION_HOME": settings.DBPROVISION_HOME},
+)
+
+
+def _active_jobs() -> Dict[tuple, float]:
+    counts: Dict[tuple, float] = {}
+    for job in job_queue.jobs.values():
+        if not job.status.finished:
+            key = (job.kind, job.status.value)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _running_phases() -> Dict[tuple, float]:
+    counts: Dict[tuple, float] = {}
+    for job in job_queue.jobs.values():
+        if job.status == JobStatus.RUNNING:
+            for phase in job.phases.values():
+                if phase.status == PhaseStatus.RUNNING:
+                    key = (job.kind, phase_label(phase.name))
+                    counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+registry.callback(
+    "mongocraft_jobs",
+    "Provisioning jobs queued or running",
+    _active_jobs,
+    ("kind", "status"),
+)
+registry.callback(
+    "mongocraft_job_phases_running",
+    "Terraform/Ansible phases currently running",
+    _running_phases,
+    ("kind", "phase"),
+)
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dbprov.health import NodeHealth
+
+from app.core.config import settings
+from app.models.cluster import Cluster, ClusterStatus
+from app.services.cluster_health import ClusterHealthService, cluster_health
+from app.services.cluster_registry import ClusterRegistry, cluster_registry
+
+logger = logging.getLogger(__name__)
+
+# One row per sample or rolled-up bucket; a raw sample is a bucket of one
+SAMPLE = np.dtype(
+    [("t", "f8"), ("min", "f4"), ("max", "f4"), ("sum", "f8"), ("count", "u4")]
+)
+
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = ("raw", "1m", "1h")
+
+OPCOUNTERS = ("insert", "query", "update", "delete", "getmore", "command")
+
+SeriesKey = Tuple[str, str, str]  # (cluster_id, node address, metric)
+
+
+class RingBuffer:
+    """Fixed-capacity array of ``SAMPLE`` rows; the oldest row is overwritten when full."""
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=SAMPLE)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+
+    def append(self, t: float, vmin: float, vmax: float, vsum: float, count: int) -> None:
+        self.data[(self.start + self.size) % self.capacity] = (t, vmin, vmax, vsum, count)
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    @property
+    def oldest(self) -> Optional[float]:
+        return float(self.data["t"][self.start]) if self.size else None
+
+    def ordered(self) -> np.ndarray:
+        if self.size < self.capacity:
+            return self.data[: self.size]
+        return np.concatenate((self.data[self.start :], self.data[: self.start]))
+
+    def between(self, start: float, end: float) -> np.ndarray:
+        rows = self.ordered()
+        lo = np.searchsorted(rows["t"], start, side="left")
+        hi = np.searchsorted(rows["t"], end, side="right")
+        return rows[lo:hi]
+
+
+@dataclass
+class Series:
+    t: np.ndarray
+    mean: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    count: np.ndarray
+    resolution: str
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray, resolution: str) -> "Series":
+        count = rows["count"].astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = rows["sum"] / count
+        return cls(rows["t"], mean, rows["min"], rows["max"], rows["count"], resolution)
+
+    def downsample(self, step: float) -> "Series":
+        """Merge points into ``step``-second buckets, weighting means by sample count."""
+        if len(self.t) == 0:
+            return self
+        buckets = np.floor(self.t / step) * step
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        weight = self.count.astype(np.float64)
+        count = np.add.reduceat(weight, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.add.reduceat(self.mean * weight, starts) / count
+        return Series(
+            buckets[starts],
+            mean,
+            np.minimum.reduceat(self.min, starts),
+            np.maximum.reduceat(self.max, starts),
+            count.astype(np.uint32),
+            f"{step:g}s",
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "resolution": self.resolution,
+            "t": self.t.tolist(),
+            "mean": np.round(self.mean, 6).tolist(),
+            "min": np.round(self.min.astype(np.float64), 6).tolist(),
+            "max": np.round(self.max.astype(np.float64), 6).tolist(),
+        }
+
+
+@dataclass
+class Bucket:
+    """A roll-up bucket that is still accumulating samples."""
+
+    start: float
+    min: float
+    max: float
+    sum: float
+    count: int
+
+    def row(self) -> Tuple[float, float, float, float, int]:
+        return (self.start, self.min, self.max, self.sum, self.count)
+
+
+class MetricSeries:
+    """Raw samples plus 1m/1h roll-ups, each in its own ring buffer."""
+
+    def __init__(self, raw_points: int, minute_points: int, hour_points: int):
+        self.tiers = {
+            "raw": RingBuffer(raw_points),
+            "1m": RingBuffer(minute_points),
+            "1h": RingBuffer(hour_points),
+        }
+        self._open: Dict[str, Optional[Bucket]] = {"1m": None, "1h": None}
+
+    def add(self, t: float, value: float) -> None:
+        self.tiers["raw"].append(t, value, value, value, 1)
+        self._roll("1m", MINUTE, t, value, value, value, 1)
+
+    def _roll(self, tier: str, width: int, t: float, vmin: float, vmax: float,
+              vsum: float, count: int) -> None:
+        start = t - t % width
+        bucket = self._open[tier]
+        if bucket is not None and bucket.start != start:
+            self.tiers[tier].append(*bucket.row())
+            if tier == "1m":
+                self._roll("1h", HOUR, *bucket.row())
+            bucket = None
+        if bucket is None:
+            self._open[tier] = Bucket(start, vmin, vmax, vsum, count)
+        else:
+            bucket.min = min(bucket.min, vmin)
+            bucket.max = max(bucket.max, vmax)
+            bucket.sum += vsum
+            bucket.count += count
+
+    def resolution_for(self, start: float) -> str:
+        for name in RESOLUTIONS:
+            oldest = self.tiers[name].oldest
+            if oldest is not None and oldest <= start:
+                return name
+        return next(
+            (name for name in reversed(RESOLUTIONS) if self.tiers[name].size), "raw"
+        )
+
+    def query(self, start: float, end: float, resolution: Optional[str] = None) -> Series:
+        resolution = resolution or self.resolution_for(start)
+        rows = self.tiers[resolution].between(start, end)
+        bucket = self._open.get(resolution)
+        if bucket is not None and start <= bucket.start <= end:
+            rows = np.concatenate((rows, np.array([bucket.row()], dtype=SAMPLE)))
+        return Series.from_rows(rows, resolution)
+
+
+class MetricsStore:
+    """Bounded set of metric series; the least recently updated series is dropped first."""
+
+    def __init__(
+        self,
+        raw_points: int = 360,
+        minute_points: int = 1440,
+        hour_points: int = 720,
+        max_series: int = 5000,
+    ):
+        self.raw_points = raw_points
+        self.minute_points = minute_points
+        self.hour_points = hour_points
+        self.max_series = max_series
+        self.series: "OrderedDict[SeriesKey, MetricSeries]" = OrderedDict()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            ring.data.nbytes for s in self.series.values() for ring in s.tiers.values()
+        )
+
+    def add(self, key: SeriesKey, t: float, value: float) -> None:
+        series = self.series.get(key)
+        if series is None:
+            series = MetricSeries(self.raw_points, self.minute_points, self.hour_points)
+            self.series[key] = series
+            while len(self.series) > self.max_series:
+                self.series.popitem(last=False)
+        else:
+            self.series.move_to_end(key)
+        series.add(t, value)
+
+    def metrics(self, cluster_id: str) -> List[str]:
+        return sorted({m for c, _, m in self.series if c == cluster_id})
+
+    def query(
+        self,
+        cluster_id: str,
+        metric: str,
+        start: float,
+        end: float,
+        resolution: Optional[str] = None,
+        step: Optional[float] = None,
+    ) -> Dict[str, Series]:
+        """Per-node series of one metric between ``start`` and ``end`` (epoch seconds)."""
+        result = {}
+        for (c, node, m), series in self.series.items():
+            if c == cluster_id and m == metric:
+                data = series.query(start, end, resolution)
+                result[node] = data.downsample(step) if step else data
+        return result
+
+    def retain(self, cluster_ids: Iterable[str]) -> None:
+        keep = set(cluster_ids)
+        for key in [k for k in self.series if k[0] not in keep]:
+            del self.series[key]
+
+
+def node_metrics(node: NodeHealth) -> Dict[str, float]:
+    """Gauges and raw counters extracted from one probe result."""
+    values: Dict[str, float] = {"up": 1.0 if node.ok else 0.0}
+    if node.latency_ms is not None:
+        values["latency_ms"] = node.latency_ms
+    if node.lag_seconds is not None:
+        values["repl.lag_seconds"] = node.lag_seconds
+    status = node.server_status or {}
+    for name in ("current", "available"):
+        if name in status.get("connections", {}):
+            values[f"connections.{name}"] = float(status["connections"][name])
+    for name in OPCOUNTERS:
+        if name in status.get("opcounters", {}):
+            values[f"opcounters.{name}"] = float(status["opcounters"][name])
+    cache = status.get("cache") or {}
+    if cache.get("used_ratio") is not None:
+        values["cache.used_ratio"] = cache["used_ratio"]
+    if "dirty_bytes" in cache:
+        values["cache.dirty_bytes"] = float(cache["dirty_bytes"])
+    return values
+
+
+class MetricsCollector:
+    """Scrapes every monitored cluster at a fixed interval into a ``MetricsStore``."""
+
+    def __init__(
+        self,
+        store: MetricsStore,
+        registry: ClusterRegistry,
+        health: ClusterHealthService,
+        interval: float = 10.0,
+    ):
+        self.store = store
+        self.registry = registry
+        self.health = health
+        self.interval = interval
+        self.last_scrape: Optional[float] = None
+        # Last raw counter reading per series, to turn opcounters into per-second rates
+        self._counters: Dict[SeriesKey, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="metrics-collector")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        deadline = time.monotonic()
+        while True:
+            try:
+                await self.scrape()
+            except Exception:
+                logger.exception("Metrics scrape failed")
+            # Fixed-rate schedule; a slow scrape skips ticks instead of drifting
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                deadline = now + self.interval - (now - deadline) % self.interval
+            await asyncio.sleep(deadline - now)
+
+    async def monitored_clusters(self) -> List[Cluster]:
+        clusters, cursor = [], None
+        while True:
+            page = await self.registry.list(
+                limit=200, cursor=cursor, status=ClusterStatus.RUNNING
+            )
+            clusters += [c for c in page.clusters if c.spec.get("monitoring_enabled")]
+            cursor = page.next_cursor
+            if cursor is None:
+                return clusters
+
+    async def scrape(self) -> None:
+        clusters = await self.monitored_clusters()
+        self.store.retain(c.id for c in clusters)
+        live = {c.id for c in clusters}
+        for key in [k for k in self._counters if k[0] not in live]:
+            del self._counters[key]
+
+        results = await asyncio.gather(
+            *(self._scrape_cluster(c) for c in clusters), return_exceptions=True
+        )
+        for cluster, result in zip(clusters, results):
+            if isinstance(result, FileNotFoundError):
+                logger.debug("No inventory for %s, not scraping", cluster.name)
+            elif isinstance(result, Exception):
+                logger.warning("Scraping %s failed: %s", cluster.name, result)
+        self.last_scrape = time.time()
+
+    async def _scrape_cluster(self, cluster: Cluster) -> None:
+        nodes = self.health.topology(cluster)
+        report = await self.health.prober.probe(nodes, server_status=True)
+        now = time.time()
+        for node in report.nodes:
+            for metric, value in node_metrics(node).items():
+                key = (cluster.id, node.node.address, metric)
+                if metric.startswith("opcounters."):
+                    self._record_rate(key, now, value)
+                else:
+                    self.store.add(key, now, value)
+
+    def _record_rate(self, key: SeriesKey, t: float, value: float) -> None:
+        previous = self._counters.get(key)
+        self._counters[key] = (t, value)
+        if previous is None:
+            return
+        dt, delta = t - previous[0], value - previous[1]
+        if dt > 0 and delta >= 0:  # a negative delta means the node restarted
+            self.store.add(key, t, delta / dt)
+
+
+metrics_store = MetricsStore(
+    raw_points=settings.METRICS_RAW_POINTS,
+    minute_points=settings.METRICS_MINUTE_POINTS,
+    hour_points=settings.METRICS_HOUR_POINTS,
+    max_series=settings.METRICS_MAX_SERIES,
+)
+
+metrics_collector = MetricsCollector(
+    metrics_store,
+    cluster_registry,
+    cluster_health,
+    interval=settings.METRICS_INTERVAL,
+)
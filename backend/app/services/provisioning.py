@@ -0,0 +1,137 @@
+import logging
+from typing import List, Tuple
+
+from app.core.config import settings
+from app.models.cluster import (
+    Cluster,
+    ClusterCreate,
+    ClusterScale,
+    ClusterStatus,
+    ClusterType,
+)
+from app.models.job import JobStatus
+from app.services.cluster_registry import ClusterRegistry
+from app.services.jobs import Job, JobQueue, JobQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+def create_command(spec: ClusterCreate) -> List[str]:
+    """Translate an API create request into a ``dbprovision create`` invocation.
+
+    Workers run creates concurrently, so each runs in the cluster's own
+    workspace (terraform state, tfvars, inventories) instead of the shared
+    ``infra/`` directories.
+    """
+    argv = [
+        settings.DBPROVISION_COMMAND,
+        "create",
+        "--workspace",
+        "--cluster-name", spec.name,
+        "--cluster-type", spec.type.value,
+        "--project-id", spec.project_id,
+        "--region", spec.region,
+        "--mongodb-version", spec.mongodb_version,
+        "--replica-nodes", str(spec.replica_nodes),
+        "--instance-type", spec.instance_type,
+        "--disk-size", str(spec.disk_size),
+        "--disk-type", spec.disk_type,
+        "--tuning-profile", spec.tuning_profile,
+    ]  # fmt: skip
+    if spec.type == ClusterType.SHARDED:
+        argv += [
+            "--shard-count", str(spec.shard_count),
+            "--config-servers", str(spec.config_servers),
+            "--mongos-count", str(spec.mongos_count),
+        ]  # fmt: skip
+    if spec.cache_size:
+        argv += ["--cache-size", spec.cache_size]
+    if spec.oplog_size:
+        argv += ["--oplog-size", spec.oplog_size]
+    if spec.zones:
+        argv += ["--zones", ",".join(spec.zones)]
+    if spec.enable_tls:
+        argv.append("--enable-tls")
+    if spec.monitoring_enabled:
+        argv.append("--monitoring-enabled")
+    if spec.backup_enabled:
+        argv.append("--backup-enabled")
+    return argv
+
+
+def scale_command(cluster: Cluster, request: ClusterScale) -> List[str]:
+    """Translate an API scale request into a ``dbprovision scale`` invocation."""
+    argv = [settings.DBPROVISION_COMMAND, "scale", "--cluster", cluster.name]
+    if request.shard_count is not None:
+        argv += ["--shards", str(request.shard_count)]
+    if request.mongos_count is not None:
+        argv += ["--mongos", str(request.mongos_count)]
+    if request.balancer_window:
+        argv += ["--balancer-window", request.balancer_window]
+    if request.secondary_throttle is not None:
+        argv.append("--secondary-throttle" if request.secondary_throttle else "--no-secondary-throttle")
+    if request.wait_for_delete is not None:
+        argv.append("--wait-for-delete" if request.wait_for_delete else "--no-wait-for-delete")
+    if not request.wait:
+        argv.append("--no-wait")
+    return argv
+
+
+async def scale_cluster(
+    registry: ClusterRegistry, queue: JobQueue, cluster: Cluster, request: ClusterScale
+) -> Job:
+    """Queue an online scale-out; the cluster keeps serving, and its spec is updated once it succeeds."""
+
+    async def on_finish(job: Job) -> None:
+        if job.status != JobStatus.SUCCEEDED or not cluster.spec:
+            return
+        spec = dict(cluster.spec)
+        if request.shard_count is not None:
+            spec["shard_count"] = max(request.shard_count, spec.get("shard_count", 0))
+        if request.mongos_count is not None:
+            spec["mongos_count"] = max(request.mongos_count, spec.get("mongos_count", 0))
+        await registry.update_spec(cluster.id, spec, ClusterCreate(**spec).nodes)
+
+    return queue.submit("scale", scale_command(cluster, request), cluster.id, on_finish)
+
+
+async def provision_cluster(
+    registry: ClusterRegistry, queue: JobQueue, spec: ClusterCreate
+) -> Tuple[Cluster, Job]:
+    """Register the cluster and queue its creation; returns without waiting."""
+    cluster = await registry.create(
+        spec.name,
+        spec.type,
+        spec.nodes,
+        spec=spec.model_dump(mode="json"),
+        status=ClusterStatus.PROVISIONING,
+    )
+
+    async def on_finish(job: Job) -> None:
+        status = (
+            ClusterStatus.RUNNING
+            if job.status == JobStatus.SUCCEEDED
+            else ClusterStatus.FAILED
+        )
+        await registry.update_status(cluster.id, status)
+
+    try:
+        job = queue.submit("create", create_command(spec), cluster.id, on_finish)
+    except JobQueueFull:
+        await registry.delete(cluster.id)
+        raise
+    return cluster, job
+
+
+async def fail_interrupted(registry: ClusterRegistry) -> int:
+    """Mark clusters a previous backend process left provisioning as failed.
+
+    Jobs live in memory, so after a restart or crash nothing will ever finish
+    them; their workspaces are kept for a retry or a destroy.
+    """
+    count = await registry.replace_status(
+        ClusterStatus.PROVISIONING, ClusterStatus.FAILED
+    )
+    if count:
+        logger.warning("Marked %d interrupted provisioning cluster(s) as failed", count)
+    return count
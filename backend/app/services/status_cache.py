@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+def compute_etag(data: Any) -> str:
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    stored_at: float
+
+    def age(self, now: float) -> float:
+        return now - self.stored_at
+
+
+class StatusCache:
+    """LRU cache of probe snapshots with per-key single-flight loading.
+
+    Entries younger than ``ttl`` are served as is. Until ``ttl + stale_ttl``
+    they are still served, but trigger one background refresh. Concurrent
+    misses for the same key share a single loader call.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 5.0,
+        stale_ttl: float = 30.0,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.bytes = 0
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "evictions": 0, "errors": 0}
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str, loader: Loader) -> CacheEntry:
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = entry.age(now)
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale"] += 1
+                self._entries.move_to_end(key)
+                self._refresh(key, loader)
+                return entry
+            self._drop(key)
+        self.stats["misses"] += 1
+        # Shielded so a disconnecting client does not cancel the probe other waiters share
+        return await asyncio.shield(self._refresh(key, loader))
+
+    def invalidate(self, key: str) -> None:
+        self._drop(key)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+        self.bytes = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+    def _refresh(self, key: str, loader: Loader) -> asyncio.Future:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    async def _load(self, key: str, loader: Loader) -> CacheEntry:
+        value = await loader()
+        size = len(json.dumps(value, separators=(",", ":"), default=str))
+        entry = CacheEntry(value, size, self.clock())
+        # An invalidate() while loading means the result may describe a removed cluster
+        if self._inflight.get(key) is asyncio.current_task():
+            self._store(key, entry)
+        return entry
+
+    def _finished(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.warning("Status refresh for %s failed: %s", key, task.exception())
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        self._drop(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+
+status_cache = StatusCache(
+    ttl=settings.STATUS_CACHE_TTL,
+    stale_ttl=settings.STATUS_CACHE_STALE_TTL,
+    max_entries=settings.STATUS_CACHE_MAX_ENTRIES,
+    max_bytes=settings.STATUS_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+from typing import AsyncIterator, Iterator
+
+# Settings are read at import time: no background scraping, an in-memory
+# registry and a throwaway CLI state directory for every test run.
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ["METRICS_ENABLED"] = "False"
+os.environ.setdefault("DBPROVISION_HOME", tempfile.mkdtemp(prefix="mongocraft-tests-"))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.api.deps import (  # noqa: E402
+    get_cluster_registry,
+    get_job_queue,
+    get_status_cache,
+)
+from app.core.database import Database  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.cluster_registry import ClusterRegistry  # noqa: E402
+from app.services.jobs import JobQueue  # noqa: E402
+from app.services.status_cache import StatusCache  # noqa: E402
+
+
+@pytest.fixture
+async def registry() -> AsyncIterator[ClusterRegistry]:
+    registry = ClusterRegistry(Database("sqlite:///:memory:"))
+    await registry.connect()
+    yield registry
+    await registry.close()
+
+
+@pytest.fixture
+async def job_queue() -> AsyncIterator[JobQueue]:
+    queue = JobQueue(workers=2, max_queued=10)
+    await queue.start()
+    yield queue
+    await queue.stop()
+
+
+@pytest.fixture
+def status_cache() -> StatusCache:
+    return StatusCache(ttl=5.0, stale_ttl=30.0)
+
+
+@pytest.fixture
+def overrides(
+    registry: ClusterRegistry, job_queue: JobQueue, status_cache: StatusCache
+) -> Iterator[dict]:
+    """Route the API to the per-test services; tests may add more overrides."""
+    app.dependency_overrides.update(
+        {
+            get_cluster_registry: lambda: registry,
+            get_job_queue: lambda: job_queue,
+            get_status_cache: lambda: status_cache,
+        }
+    )
+    yield app.dependency_overrides
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+async def client(overrides: dict) -> AsyncIterator[httpx.AsyncClient]:
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
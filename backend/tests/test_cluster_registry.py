@@ -0,0 +1,111 @@
+import httpx
+import pytest
+
+from app.models.cluster import ClusterStatus, ClusterType
+from app.services.cluster_registry import (
+    ClusterAlreadyExists,
+    ClusterRegistry,
+    InvalidCursor,
+    encode_cursor,
+)
+
+
+async def populate(registry: ClusterRegistry, count: int) -> None:
+    for i in range(count):
+        type = ClusterType.SHARDED if i % 3 == 0 else ClusterType.REPLICASET
+        await registry.create(f"cluster-{i:03d}", type, 3)
+
+
+async def test_keyset_pagination_visits_every_cluster_once(registry: ClusterRegistry):
+    await populate(registry, 25)
+
+    names, cursor, pages = [], None, 0
+    while True:
+        page = await registry.list(limit=10, cursor=cursor)
+        assert page.total == 25
+        names += [c.name for c in page.clusters]
+        pages += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert names == sorted(f"cluster-{i:03d}" for i in range(25))
+
+
+async def test_pagination_continues_after_cursor_despite_inserts(
+    registry: ClusterRegistry,
+):
+    await populate(registry, 10)
+    first = await registry.list(limit=5)
+    # Rows added before the cursor do not shift the next page
+    await registry.create("cluster-000a", ClusterType.REPLICASET, 3)
+
+    second = await registry.list(limit=5, cursor=first.next_cursor)
+    assert [c.name for c in second.clusters] == [
+        f"cluster-{i:03d}" for i in range(5, 10)
+    ]
+    assert second.next_cursor is None
+
+
+async def test_filters_and_trigger_maintained_counts(registry: ClusterRegistry):
+    await populate(registry, 9)
+    assert await registry.count() == 9
+    assert await registry.count(type=ClusterType.SHARDED) == 3
+
+    page = await registry.list(type=ClusterType.SHARDED)
+    assert [c.name for c in page.clusters] == [
+        "cluster-000",
+        "cluster-003",
+        "cluster-006",
+    ]
+
+    running = await registry.get_by_name("cluster-003")
+    assert running is not None
+    await registry.update_status(running.id, ClusterStatus.RUNNING)
+    assert await registry.count(status=ClusterStatus.RUNNING) == 1
+    assert await registry.count(status=ClusterStatus.PENDING) == 8
+    assert await registry.count(ClusterType.SHARDED, ClusterStatus.PENDING) == 2
+
+    await registry.delete(running.id)
+    assert await registry.count() == 8
+    assert await registry.count(status=ClusterStatus.RUNNING) == 0
+
+
+async def test_duplicate_name_is_rejected(registry: ClusterRegistry):
+    await registry.create("orders", ClusterType.REPLICASET, 3)
+    with pytest.raises(ClusterAlreadyExists):
+        await registry.create("orders", ClusterType.SHARDED, 10)
+    assert await registry.count() == 1
+
+
+async def test_bad_cursor(registry: ClusterRegistry):
+    with pytest.raises(InvalidCursor):
+        await registry.list(cursor="not base64!")
+
+
+async def test_list_endpoint_pages(
+    client: httpx.AsyncClient, registry: ClusterRegistry
+):
+    await populate(registry, 5)
+
+    response = await client.get("/api/v1/clusters/", params={"limit": 3})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 5
+    assert body["next_cursor"] == encode_cursor("cluster-002")
+
+    response = await client.get(
+        "/api/v1/clusters/", params={"limit": 3, "cursor": body["next_cursor"]}
+    )
+    assert [c["name"] for c in response.json()["clusters"]] == [
+        "cluster-003",
+        "cluster-004",
+    ]
+    assert response.json()["next_cursor"] is None
+
+
+async def test_list_endpoint_rejects_bad_cursor(client: httpx.AsyncClient):
+    response = await client.get("/api/v1/clusters/", params={"cursor": "%%%"})
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.instrumentation import (
+    CONTENT_TYPE,
+    LoopMonitor,
+    Registry,
+    event_loop_blocked,
+    http_request_duration,
+    http_requests,
+    span,
+    span_duration,
+)
+
+ROUTE = "/api/v1/clusters/{cluster_id}"
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.counter("errors_total", "Errors")
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    lines = registry.render().splitlines()
+    assert lines[:3] == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a\\"b"} 3',
+    ]
+    assert lines[4:10] == [
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+    assert lines[-1] == "errors_total 0"  # unlabelled series exist from the start
+
+    with pytest.raises(ValueError):
+        registry.counter("errors_total", "Errors")
+    with pytest.raises(ValueError):
+        requests.inc()
+
+
+def test_span_records_status():
+    before = span_duration.count("test.span", "error")
+    with pytest.raises(RuntimeError):
+        with span("test.span", cluster="orders"):
+            raise RuntimeError("boom")
+    assert span_duration.count("test.span", "error") == before + 1
+
+
+async def test_metrics_endpoint_labels_route_templates(client: httpx.AsyncClient):
+    before = http_requests.value("GET", ROUTE, "404")
+    observed = http_request_duration.count("GET", ROUTE)
+    for cluster_id in ("missing-1", "missing-2"):
+        response = await client.get(f"/api/v1/clusters/{cluster_id}")
+        assert response.status_code == 404
+    await client.get("/no/such/path")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert http_requests.value("GET", ROUTE, "404") == before + 2
+    assert http_request_duration.count("GET", ROUTE) == observed + 2
+    assert http_requests.value("GET", "<unmatched>", "404") >= 1
+
+    text = response.text
+    sample = (
+        f'mongocraft_http_requests_total{{method="GET",route="{ROUTE}",status="404"}}'
+    )
+    assert f"{sample} {before + 2:g}" in text.splitlines()
+    assert "missing-1" not in text  # ids never become labels
+    assert "# TYPE mongocraft_event_loop_lag_seconds histogram" in text
+
+
+async def test_loop_monitor_reports_blocked_loop(caplog: pytest.LogCaptureFixture):
+    monitor = LoopMonitor(interval=0.01, block_threshold=0.05)
+    before = event_loop_blocked.value()
+    await monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)  # a handler doing blocking work on the loop
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    assert event_loop_blocked.value() == before + 1
+    assert "Event loop thread stack" in caplog.text
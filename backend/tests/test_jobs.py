@@ -0,0 +1,263 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.models.cluster import ClusterCreate, ClusterStatus, ClusterType
+from app.models.job import JobStatus, PhaseStatus
+from app.services.cluster_registry import ClusterRegistry
+from app.services.jobs import Job, JobEvent, JobQueue, JobQueueFull
+from app.services.provisioning import (
+    create_command,
+    fail_interrupted,
+    provision_cluster,
+)
+
+CLI_DIR = Path(__file__).resolve().parents[2] / "cli"
+
+# Prints what the dbprovision scheduler prints for two phases
+PHASES = """
+import time
+print("==> [terraform-init] started", flush=True)
+time.sleep(0.05)
+print("==> [terraform-init] finished (0.05s)", flush=True)
+print("==> [init-replica-set] started", flush=True)
+print("initiating rs0", flush=True)
+print("==> [init-replica-set] failed (0.01s)", flush=True)
+raise SystemExit({code})
+"""
+
+
+def python(code: str) -> List[str]:
+    return [sys.executable, "-c", code]
+
+
+async def wait(job: Job, timeout: float = 30.0) -> List[JobEvent]:
+    """Follow a job to the end; returns every event it published."""
+
+    async def drain() -> List[JobEvent]:
+        return [e async for e in job.stream(keepalive=timeout) if e is not None]
+
+    return await asyncio.wait_for(drain(), timeout)
+
+
+async def test_job_lifecycle_and_phases(job_queue: JobQueue):
+    finished: List[JobStatus] = []
+
+    async def on_finish(job: Job) -> None:
+        finished.append(job.status)
+
+    job = job_queue.submit("create", python(PHASES.format(code=0)), None, on_finish)
+    assert job.status == JobStatus.QUEUED
+    events = await wait(job)
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.returncode == 0
+    assert finished == [JobStatus.SUCCEEDED]
+    assert job.phases["terraform-init"].status == PhaseStatus.FINISHED
+    assert job.phases["terraform-init"].duration == 0.05
+    assert job.phases["init-replica-set"].status == PhaseStatus.FAILED
+    assert "initiating rs0" in job.info().log_tail
+
+    statuses = [e.data["status"] for e in events if e.type == "status"]
+    assert statuses == ["queued", "running", "succeeded"]
+    assert [e.id for e in events] == list(range(1, len(events) + 1))
+
+
+async def test_failed_command(job_queue: JobQueue):
+    job = job_queue.submit("create", python(PHASES.format(code=3)))
+    await wait(job)
+    assert job.status == JobStatus.FAILED
+    assert job.returncode == 3
+    assert job.error == "exited with code 3"
+
+
+async def test_stop_cancels_running_jobs():
+    queue = JobQueue(workers=1)
+    await queue.start()
+    finished: List[JobStatus] = []
+
+    async def on_finish(job: Job) -> None:
+        finished.append(job.status)
+
+    job = queue.submit("create", python("import time; time.sleep(30)"), None, on_finish)
+    while job.status != JobStatus.RUNNING:
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+    assert job.status == JobStatus.CANCELLED
+    assert job.error == "backend shutting down"
+    assert finished == [JobStatus.CANCELLED]
+
+
+async def test_stop_cancels_queued_jobs(registry: ClusterRegistry):
+    queue = JobQueue(workers=1)
+    await queue.start()
+    running = queue.submit("create", python("import time; time.sleep(30)"))
+    while running.status != JobStatus.RUNNING:
+        await asyncio.sleep(0.01)
+    cluster, queued = await provision_cluster(
+        registry, queue, ClusterCreate(name="orders", project_id="p")
+    )
+    await queue.stop()
+
+    assert queued.status == JobStatus.CANCELLED
+    assert queued.started_at is None
+    assert queued.error == "backend shut down before it started"
+    # Its completion hook ran: the cluster is not left provisioning
+    stored = await registry.get(cluster.id)
+    assert stored is not None and stored.status == ClusterStatus.FAILED
+
+
+async def test_interrupted_provisioning_fails_on_startup(registry: ClusterRegistry):
+    interrupted = await registry.create(
+        "orders", ClusterType.REPLICASET, 3, status=ClusterStatus.PROVISIONING
+    )
+    running = await registry.create(
+        "events", ClusterType.REPLICASET, 3, status=ClusterStatus.RUNNING
+    )
+
+    assert await fail_interrupted(registry) == 1
+    assert await fail_interrupted(registry) == 0
+    stored = await registry.get(interrupted.id)
+    assert stored is not None and stored.status == ClusterStatus.FAILED
+    stored = await registry.get(running.id)
+    assert stored is not None and stored.status == ClusterStatus.RUNNING
+    assert await registry.count(status=ClusterStatus.PROVISIONING) == 0
+    assert await registry.count(status=ClusterStatus.FAILED) == 1
+
+
+async def test_queue_full():
+    queue = JobQueue(workers=1, max_queued=1)
+    await queue.start()
+    try:
+        queue.submit("create", python("import time; time.sleep(30)"))
+        while queue.queued:
+            await asyncio.sleep(0.01)  # taken by the worker
+        queue.submit("create", python("pass"))
+        with pytest.raises(JobQueueFull):
+            queue.submit("create", python("pass"))
+    finally:
+        await queue.stop()
+
+
+async def test_live_subscribers_receive_events(job_queue: JobQueue):
+    job = job_queue.submit("create", python(PHASES.format(code=0)))
+    # Subscribe while queued: the whole history arrives, then the live events
+    events = await wait(job)
+    types = [e.type for e in events]
+    assert types[0] == "status" and types[-1] == "status"
+    assert types.count("phase") == 4
+
+
+async def test_sse_replays_after_last_event_id(
+    client: httpx.AsyncClient, job_queue: JobQueue
+):
+    job = job_queue.submit("create", python(PHASES.format(code=0)))
+    events = await wait(job)
+
+    response = await client.get(
+        f"/api/v1/jobs/{job.id}/events", headers={"Last-Event-ID": "3"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    ids = [
+        int(line.split(": ", 1)[1])
+        for line in response.text.splitlines()
+        if line.startswith("id: ")
+    ]
+    assert ids == [e.id for e in events if e.id > 3]
+    assert response.text.endswith(events[-1].to_sse())
+
+    response = await client.get(f"/api/v1/jobs/{job.id}")
+    assert response.json()["status"] == "succeeded"
+    assert (await client.get("/api/v1/jobs/unknown/events")).status_code == 404
+
+
+def test_create_runs_in_its_own_workspace():
+    argv = create_command(ClusterCreate(name="orders", project_id="p"))
+    assert argv[:3] == [settings.DBPROVISION_COMMAND, "create", "--workspace"]
+
+
+@pytest.fixture
+def simulated_cli(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> JobQueue:
+    """A job queue running the real dbprovision CLI with the simulated executor."""
+    command = tmp_path / "dbprovision"
+    command.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        f"sys.path.insert(0, {str(CLI_DIR)!r})\n"
+        "from dbprovision import main\n"
+        "main()\n"
+    )
+    command.chmod(0o755)
+    config = tmp_path / "simulator.yaml"
+    config.write_text("time_scale: 0.002\nseed: 1\n")
+    monkeypatch.setattr(settings, "DBPROVISION_COMMAND", str(command))
+    env = {
+        **os.environ,
+        "DBPROVISION_HOME": str(tmp_path / "home"),
+        "DBPROVISION_EXECUTOR": "simulator",
+        "DBPROVISION_SIMULATOR_CONFIG": str(config),
+    }
+    return JobQueue(workers=2, env=env)
+
+
+async def test_concurrent_creates_use_separate_terraform_state(
+    simulated_cli: JobQueue, registry: ClusterRegistry, tmp_path: Path
+):
+    queue = simulated_cli
+    await queue.start()
+    try:
+        submitted = [
+            await provision_cluster(
+                registry, queue, ClusterCreate(name=name, project_id="p")
+            )
+            for name in ("orders", "sessions")
+        ]
+        await asyncio.gather(*(wait(job, 120) for _, job in submitted))
+    finally:
+        await queue.stop()
+
+    jobs = [job for _, job in submitted]
+    for job in jobs:
+        assert job.status == JobStatus.SUCCEEDED, list(job.log_tail)
+    # Both ran at the same time
+    first, second = sorted(jobs, key=lambda j: j.started_at or j.created_at)
+    finished: Optional[float] = first.finished_at and first.finished_at.timestamp()
+    assert second.started_at is not None and finished is not None
+    assert second.started_at.timestamp() < finished
+
+    shared = CLI_DIR.parent / "infra" / "terraform"
+    for cluster, _ in submitted:
+        workspace = tmp_path / "home" / "clusters" / cluster.name
+        assert (workspace / "terraform" / f"{cluster.name}.tfvars").exists()
+        assert (workspace / "ansible" / "group_vars" / f"{cluster.name}.yml").exists()
+        assert not (shared / f"{cluster.name}.tfvars").exists()
+        stored = await registry.get(cluster.id)
+        assert stored is not None and stored.status == ClusterStatus.RUNNING
+
+
+async def test_health_reads_inventories_from_the_workspace(
+    registry: ClusterRegistry, tmp_path: Path
+):
+    from app.services.cluster_health import ClusterHealthService
+
+    inventories = tmp_path / "clusters" / "orders" / "ansible" / "inventories"
+    inventories.mkdir(parents=True)
+    (inventories / "orders.ini").write_text(
+        "[rs0]\norders-1 ansible_host=10.0.0.1\norders-2 ansible_host=10.0.0.2\n"
+    )
+    health = ClusterHealthService(tmp_path / "shared", tmp_path)
+    orders = await registry.create("orders", ClusterType.REPLICASET, 2)
+    sessions = await registry.create("sessions", ClusterType.REPLICASET, 3)
+
+    nodes = health.topology(orders)
+    assert [n.address for n in nodes] == ["10.0.0.1:27017", "10.0.0.2:27017"]
+    with pytest.raises(FileNotFoundError):
+        health.topology(sessions)
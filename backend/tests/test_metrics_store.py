@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import pytest
+
+from app.api.deps import get_metrics_store
+from app.models.cluster import ClusterType
+from app.services.cluster_registry import ClusterRegistry
+from app.services.metrics import (
+    HOUR,
+    MINUTE,
+    MetricSeries,
+    MetricsStore,
+    RingBuffer,
+    Series,
+)
+
+T0 = 1_700_000_000 - 1_700_000_000 % HOUR  # an hour boundary
+
+
+def test_ring_buffer_overwrites_oldest():
+    ring = RingBuffer(4)
+    for i in range(6):
+        ring.append(float(i), i, i, i, 1)
+
+    assert ring.size == 4
+    assert ring.oldest == 2.0
+    assert ring.ordered()["t"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert ring.between(3.0, 4.0)["t"].tolist() == [3.0, 4.0]
+    assert len(ring.between(10.0, 20.0)) == 0
+
+
+def test_minute_and_hour_roll_ups():
+    series = MetricSeries(raw_points=10, minute_points=100, hour_points=10)
+    # One sample every 10s for two hours, value = minute index
+    for i in range(2 * HOUR // 10):
+        series.add(T0 + i * 10, float(i // 6))
+
+    raw = series.query(T0, T0 + 2 * HOUR, "raw")
+    assert len(raw.t) == 10  # only the newest samples survive
+
+    minutes = series.query(T0, T0 + 2 * HOUR, "1m")
+    assert len(minutes.t) == 101  # a full ring of closed minutes plus the open one
+    assert minutes.t[-1] == T0 + 2 * HOUR - MINUTE
+    assert np.all(minutes.count == 6)
+    assert np.all(minutes.mean == minutes.min)
+
+    hours = series.query(T0, T0 + 2 * HOUR, "1h")
+    assert hours.t.tolist() == [T0, T0 + HOUR]
+    # The first hour is closed; the second still lacks its open minute
+    assert hours.count.tolist() == [360, 354]
+    assert hours.mean[0] == pytest.approx(29.5)
+    assert (hours.min[0], hours.max[0]) == (0, 59)
+
+
+def test_resolution_falls_back_to_coarser_tiers():
+    series = MetricSeries(raw_points=6, minute_points=60, hour_points=10)
+    for i in range(3 * HOUR // 10):
+        series.add(T0 + i * 10, 1.0)
+    now = T0 + 3 * HOUR
+
+    assert series.resolution_for(now - 30) == "raw"
+    assert series.resolution_for(now - 30 * MINUTE) == "1m"
+    assert series.resolution_for(T0) == "1h"
+
+
+def test_downsample_weights_means_by_count():
+    series = Series(
+        t=np.array([0.0, 10.0, 20.0, 60.0]),
+        mean=np.array([1.0, 4.0, 10.0, 7.0]),
+        min=np.array([1.0, 2.0, 10.0, 7.0], dtype=np.float32),
+        max=np.array([1.0, 6.0, 10.0, 7.0], dtype=np.float32),
+        count=np.array([1, 2, 1, 3], dtype=np.uint32),
+        resolution="raw",
+    )
+
+    merged = series.downsample(60)
+    assert merged.t.tolist() == [0.0, 60.0]
+    assert merged.mean.tolist() == pytest.approx([(1 + 8 + 10) / 4, 7.0])
+    assert merged.min.tolist() == [1.0, 7.0]
+    assert merged.max.tolist() == [10.0, 7.0]
+    assert merged.count.tolist() == [4, 3]
+    assert merged.resolution == "60s"
+
+
+def test_store_queries_per_node_and_evicts_idle_series():
+    store = MetricsStore(raw_points=10, max_series=3)
+    store.add(("c1", "a:27017", "up"), T0, 1.0)
+    store.add(("c1", "b:27017", "up"), T0, 0.0)
+    store.add(("c1", "a:27017", "latency_ms"), T0, 2.5)
+    store.add(("c1", "a:27017", "up"), T0 + 10, 1.0)
+    store.add(("c2", "c:27017", "up"), T0, 1.0)  # evicts the idlest: b/up
+
+    assert store.metrics("c1") == ["latency_ms", "up"]
+    result = store.query("c1", "up", T0, T0 + 60)
+    assert list(result) == ["a:27017"]
+    assert result["a:27017"].mean.tolist() == [1.0, 1.0]
+
+    store.retain(["c2"])
+    assert store.metrics("c1") == []
+    assert store.nbytes == (10 + 1440 + 720) * 28  # one series left
+
+
+async def test_metrics_endpoint(
+    client: httpx.AsyncClient, overrides: dict, registry: ClusterRegistry
+):
+    store = MetricsStore()
+    overrides[get_metrics_store] = lambda: store
+    cluster = await registry.create("orders", ClusterType.REPLICASET, 3)
+    for i in range(30):
+        store.add((cluster.id, "10.0.0.1:27017", "connections.current"), T0 + i, i)
+
+    url = f"/api/v1/clusters/{cluster.id}/metrics"
+    assert (await client.get(url)).json()["metrics"] == ["connections.current"]
+
+    start = datetime.fromtimestamp(T0, timezone.utc).isoformat()
+    end = datetime.fromtimestamp(T0 + 60, timezone.utc).isoformat()
+    params = {"metric": "connections.current", "start": start, "end": end, "step": 10}
+    response = await client.get(url, params=params)
+    assert response.status_code == 200
+    node = response.json()["nodes"]["10.0.0.1:27017"]
+    assert node["resolution"] == "10s"
+    assert node["mean"] == [4.5, 14.5, 24.5]
+
+    assert (
+        await client.get(url, params={**params, "resolution": "5m"})
+    ).status_code == 422
+    assert (await client.get("/api/v1/clusters/missing/metrics")).status_code == 404
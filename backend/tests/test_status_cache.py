@@ -0,0 +1,180 @@
+import asyncio
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from app.api.deps import get_cluster_health
+from app.models.cluster import Cluster, ClusterStatus, ClusterType
+from app.services.cluster_registry import ClusterRegistry
+from app.services.status_cache import StatusCache, compute_etag, etag_matches
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingLoader:
+    """Loader returning ``{"version": n}`` for its n-th call, optionally gated."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self) -> Dict[str, Any]:
+        self.calls += 1
+        version = self.calls
+        await self.gate.wait()
+        return {"version": version}
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = StatusCache()
+    loader = CountingLoader()
+    loader.gate.clear()
+
+    waiters = [asyncio.ensure_future(cache.get("c1", loader)) for _ in range(20)]
+    await asyncio.sleep(0)
+    loader.gate.set()
+    entries = await asyncio.gather(*waiters)
+
+    assert loader.calls == 1
+    assert {entry.value["version"] for entry in entries} == {1}
+    assert cache.stats["misses"] == 20
+    assert cache.stats["coalesced"] == 19
+    assert cache.info()["inflight"] == 0
+
+
+async def test_fresh_stale_and_expired_entries():
+    clock = FakeClock()
+    cache = StatusCache(ttl=5.0, stale_ttl=30.0, clock=clock)
+    loader = CountingLoader()
+
+    assert (await cache.get("c1", loader)).value == {"version": 1}
+    clock.now += 4
+    assert (await cache.get("c1", loader)).value == {"version": 1}
+    assert loader.calls == 1 and cache.stats["hits"] == 1
+
+    # Stale: the old snapshot is served at once and refreshed in the background
+    clock.now += 10
+    assert (await cache.get("c1", loader)).value == {"version": 1}
+    assert cache.stats["stale"] == 1
+    await asyncio.sleep(0)
+    assert loader.calls == 2
+    assert (await cache.get("c1", loader)).value == {"version": 2}
+
+    await asyncio.sleep(0)  # let the finished refresh leave the in-flight table
+    # Past ttl + stale_ttl the entry is dropped and the caller waits for a load
+    clock.now += 60
+    assert (await cache.get("c1", loader)).value == {"version": 3}
+    assert cache.stats["misses"] == 2
+
+
+async def test_failed_load_is_not_cached():
+    cache = StatusCache()
+
+    async def broken() -> Dict[str, Any]:
+        raise ConnectionError("probe failed")
+
+    with pytest.raises(ConnectionError):
+        await cache.get("c1", broken)
+    assert len(cache) == 0
+    assert cache.stats["errors"] == 1
+    assert (await cache.get("c1", CountingLoader())).value == {"version": 1}
+
+
+async def test_invalidate_during_load_discards_result():
+    cache = StatusCache()
+    loader = CountingLoader()
+    loader.gate.clear()
+
+    pending = asyncio.ensure_future(cache.get("c1", loader))
+    await asyncio.sleep(0)
+    cache.invalidate("c1")
+    loader.gate.set()
+    await pending
+    assert len(cache) == 0
+
+
+async def test_lru_eviction_by_entries_and_bytes():
+    cache = StatusCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        await cache.get(key, CountingLoader())
+    assert list(cache._entries) == ["b", "c"]
+    assert cache.stats["evictions"] == 1
+
+    small = StatusCache(max_bytes=30)
+    for key in ("a", "b", "c"):
+        await small.get(key, CountingLoader())
+    assert small.bytes <= 30
+    assert len(small) < 3
+
+
+def test_etag_matching():
+    etag = compute_etag({"b": 1, "a": [1, 2]})
+    assert etag == compute_etag({"a": [1, 2], "b": 1})
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+class StubHealth:
+    def __init__(self) -> None:
+        self.snapshots: List[str] = []
+
+    async def snapshot(self, cluster: Cluster) -> Dict[str, Any]:
+        self.snapshots.append(cluster.id)
+        return {"nodes": [{"address": "10.0.0.1:27017", "state": "PRIMARY"}]}
+
+
+@pytest.fixture
+async def running_cluster(registry: ClusterRegistry) -> Cluster:
+    cluster = await registry.create("orders", ClusterType.REPLICASET, 3)
+    await registry.update_status(cluster.id, ClusterStatus.RUNNING)
+    return cluster
+
+
+async def test_cluster_detail_etag_and_not_modified(
+    client: httpx.AsyncClient, overrides: dict, running_cluster: Cluster
+):
+    health = StubHealth()
+    overrides[get_cluster_health] = lambda: health
+    url = f"/api/v1/clusters/{running_cluster.id}"
+
+    first = await client.get(url)
+    assert first.status_code == 200
+    assert first.json()["live"]["nodes"][0]["state"] == "PRIMARY"
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    second = await client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.content == b""
+    # Both requests were answered from one probe
+    assert health.snapshots == [running_cluster.id]
+
+    changed = await client.get(url, headers={"If-None-Match": '"stale"'})
+    assert changed.status_code == 200
+
+
+async def test_cluster_delete_invalidates_cached_snapshot(
+    client: httpx.AsyncClient,
+    overrides: dict,
+    status_cache: StatusCache,
+    running_cluster: Cluster,
+):
+    overrides[get_cluster_health] = StubHealth
+    await client.get(f"/api/v1/clusters/{running_cluster.id}")
+    assert len(status_cache) == 1
+
+    response = await client.delete(f"/api/v1/clusters/{running_cluster.id}")
+    assert response.status_code == 200
+    assert len(status_cache) == 0
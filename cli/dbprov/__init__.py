@@ -0,0 +1 @@
+# dbprovision support modules
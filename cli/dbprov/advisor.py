@@ -0,0 +1,1040 @@
+"""Index and shard-key advice from sampled query traffic.
+
+Operations come from ``system.profile`` documents, ``$currentOp`` snapshots or
+the slow-query lines of mongod/mongos JSON logs (4.4+), either sampled live or
+read back from captured files, so the analysis also runs in CI without a
+cluster. Every operation is reduced to a *shape*: namespace, operation, and
+filter with each literal replaced by ``?``, plus the sort. For every field a
+namespace filters on we keep a distinct-count sketch (k minimum values), the
+heaviest values (space saving) and whether the values only ever grow; that is
+what a shard key choice hinges on.
+
+Recommendations follow the usual rules of thumb:
+
+* Indexes are laid out Equality, Sort, Range: equality fields by estimated
+  cardinality, then the sort, then one range field. Shapes an existing index
+  prefix serves, and shapes that examine few documents per result, are left
+  alone.
+* A shard key needs many distinct values and no dominating one, and a key
+  that grows monotonically should be hashed. Among acceptable keys the one
+  mongos can target for most of the traffic wins.
+* On sharded collections a shape whose filter does not pin the shard key
+  prefix is scatter-gather, as is anything mongos logged with ``nShards > 1``.
+
+All estimates only see the sample: a distinct count is a lower bound of the
+collection's, and frequencies are those of the queried values.
+"""
+
+import asyncio
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from dbprov.health import Node
+from dbprov.wire import Binary, CommandError, ConnectionPool, Decimal128, Int64, ObjectId, Regex, Timestamp
+
+SYSTEM_DATABASES = ("admin", "local", "config")
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+EQUALITY_OPERATORS = ("$eq", "$in")
+# Extended JSON wrappers of a single value, as written by mongod logs and mongoexport
+EXTENDED_JSON = ("$oid", "$date", "$numberLong", "$numberInt", "$numberDouble", "$numberDecimal", "$binary",
+                 "$timestamp", "$regularExpression", "$uuid", "$minKey", "$maxKey", "$symbol", "$code")
+# Values generated in increasing order when documents are inserted
+MONOTONIC_TYPES = ("$oid", "$date", "$timestamp")
+FINDINGS = ("index", "shard-key", "scatter")
+
+_NETWORK_ERRORS = (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+class AdvisorError(Exception):
+    pass
+
+
+@dataclass
+class AdvisorOptions:
+    examine_ratio: float = 10.0  # documents examined per document returned before an index pays off
+    min_count: int = 1  # operations a shape needs before it gets advice
+    min_cardinality: int = 100  # distinct values a shard key needs in the sample
+    max_frequency: float = 0.2  # largest share of operations one shard key value may have
+    min_coverage: float = 0.5  # share of operations a current shard key should target
+    top: int = 10
+
+
+# ---------------------------------------------------------------------------
+# Sketches
+# ---------------------------------------------------------------------------
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, default=str).encode()
+
+
+class DistinctSketch:
+    """K minimum values: distinct counts within ~1/sqrt(k) in O(k) memory."""
+
+    def __init__(self, k: int = 256):
+        self.k = k
+        self.hashes: List[int] = []
+        self.members: Set[int] = set()
+
+    def add(self, value: Any):
+        h = int.from_bytes(hashlib.blake2b(_canonical(value), digest_size=8).digest(), "big")
+        if h in self.members or (len(self.hashes) >= self.k and h >= self.hashes[-1]):
+            return
+        if len(self.hashes) >= self.k:
+            self.members.discard(self.hashes.pop())
+        bisect.insort(self.hashes, h)
+        self.members.add(h)
+
+    def estimate(self) -> int:
+        if len(self.hashes) < self.k:
+            return len(self.hashes)
+        return int((self.k - 1) / (self.hashes[-1] / 2 ** 64))
+
+
+class HeavyHitters:
+    """Space saving: the most frequent values with counts that never underestimate."""
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.counts: Dict[bytes, int] = {}
+        self.values: Dict[bytes, Any] = {}
+        self.total = 0
+
+    def add(self, value: Any):
+        key = _canonical(value)
+        self.total += 1
+        if key in self.counts:
+            self.counts[key] += 1
+            return
+        count = 1
+        if len(self.counts) >= self.capacity:
+            victim = min(self.counts, key=self.counts.__getitem__)
+            count += self.counts.pop(victim)
+            del self.values[victim]
+        self.counts[key] = count
+        self.values[key] = value
+
+    def top(self) -> Tuple[Any, float]:
+        if not self.counts:
+            return None, 0.0
+        key = max(self.counts, key=self.counts.__getitem__)
+        return self.values[key], self.counts[key] / self.total
+
+
+@dataclass
+class FieldStats:
+    distinct: DistinctSketch = field(default_factory=DistinctSketch)
+    hitters: HeavyHitters = field(default_factory=HeavyHitters)
+    observations: int = 0
+    increases: int = 0
+    comparisons: int = 0
+    generated: int = 0  # values of an insert-time generated type (ObjectId, date)
+    last: Any = None
+
+    def add(self, value: Any):
+        self.observations += 1
+        self.distinct.add(value)
+        self.hitters.add(value)
+        kind, key = _ordering(value)
+        if kind in MONOTONIC_TYPES:
+            self.generated += 1
+        if key is not None:
+            if self.last is not None and type(self.last) is type(key):
+                self.comparisons += 1
+                self.increases += key > self.last
+            self.last = key
+
+    @property
+    def cardinality(self) -> int:
+        return self.distinct.estimate()
+
+    @property
+    def frequency(self) -> float:
+        return self.hitters.top()[1]
+
+    @property
+    def monotonic(self) -> bool:
+        if self.observations and self.generated / self.observations >= 0.9:
+            return True
+        return self.comparisons >= 10 and self.increases / self.comparisons >= 0.9
+
+
+def _ordering(value: Any) -> Tuple[Optional[str], Any]:
+    """(extended JSON type, comparable key) of a literal, in observation order."""
+    if isinstance(value, bool):
+        return None, None
+    if isinstance(value, (int, float)):
+        return None, float(value)
+    if isinstance(value, str):
+        return None, value
+    if isinstance(value, dict) and len(value) == 1:
+        kind, inner = next(iter(value.items()))
+        if kind == "$date" and isinstance(inner, dict):
+            inner = inner.get("$numberLong", "")
+        if kind in ("$numberLong", "$numberInt", "$numberDouble", "$numberDecimal"):
+            try:
+                return kind, float(inner)
+            except (TypeError, ValueError):
+                return kind, None
+        if kind == "$timestamp" and isinstance(inner, dict):
+            return kind, (inner.get("t", 0), inner.get("i", 0))
+        return kind, str(inner) if kind in ("$oid", "$date") else None
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Operations and shapes
+# ---------------------------------------------------------------------------
+
+def extended_json(value: Any) -> Any:
+    """BSON values as canonical extended JSON, the form logs and captures use."""
+    if isinstance(value, dict):
+        return {k: extended_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and not isinstance(value, (Timestamp, Binary, Regex, Decimal128)):
+        return [extended_json(v) for v in value]
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return {"$date": value.isoformat(timespec="milliseconds").replace("+00:00", "Z")}
+    if isinstance(value, Timestamp):
+        return {"$timestamp": {"t": value.time, "i": value.inc}}
+    if isinstance(value, Int64):
+        return int(value)
+    if isinstance(value, Decimal128):
+        return {"$numberDecimal": value.raw.hex()}
+    if isinstance(value, Regex):
+        return {"$regularExpression": {"pattern": value.pattern, "options": value.flags}}
+    if isinstance(value, (bytes, Binary)):
+        return {"$binary": "..."}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _is_literal(value: Any) -> bool:
+    if not isinstance(value, dict):
+        return True
+    return len(value) >= 1 and next(iter(value)) in EXTENDED_JSON
+
+
+def shape_of(value: Any) -> Any:
+    """A filter with every literal replaced by ``?``; lists of values collapse to one ``?``."""
+    if isinstance(value, dict) and not _is_literal(value):
+        return {k: ("?" if k in ("$in", "$nin", "$all") else shape_of(v)) for k, v in sorted(value.items())}
+    if isinstance(value, list) and value and all(isinstance(v, dict) and not _is_literal(v) for v in value):
+        return [shape_of(v) for v in value]
+    return "?"
+
+
+@dataclass
+class Predicates:
+    """What a filter does with each field, as far as index and shard targeting care."""
+    equality: Dict[str, List[Any]] = field(default_factory=dict)
+    ranges: List[str] = field(default_factory=list)
+    other: List[str] = field(default_factory=list)
+    branches: List["Predicates"] = field(default_factory=list)  # of a top-level $or
+
+    def pins(self, name: str, hashed: bool = False) -> bool:
+        return name in self.equality or (not hashed and name in self.ranges)
+
+    def fields(self) -> List[str]:
+        return list(self.equality) + self.ranges + self.other
+
+
+def predicates_of(query: Mapping[str, Any], into: Optional[Predicates] = None) -> Predicates:
+    result = into if into is not None else Predicates()
+    for key, value in query.items():
+        if key == "$and" and isinstance(value, list):
+            for clause in value:
+                if isinstance(clause, dict):
+                    predicates_of(clause, result)
+        elif key in ("$or", "$nor") and isinstance(value, list):
+            branches = [predicates_of(c) for c in value if isinstance(c, dict)]
+            if key == "$or":
+                result.branches.extend(branches)
+            result.other.extend(f for b in branches for f in b.fields() if f not in result.other)
+        elif key.startswith("$"):
+            continue  # $expr, $text, $where, $comment: nothing an index prefix can use
+        elif _is_literal(value):
+            result.equality.setdefault(key, []).append(value)
+        elif any(op in value for op in EQUALITY_OPERATORS):
+            values = [value["$eq"]] if "$eq" in value else value["$in"]
+            if isinstance(values, list):
+                result.equality.setdefault(key, []).extend(values)
+        elif any(op in value for op in RANGE_OPERATORS):
+            if key not in result.ranges:
+                result.ranges.append(key)
+        elif key not in result.other:
+            result.other.append(key)
+    return result
+
+
+def targets(predicates: Predicates, key: Mapping[str, Any]) -> bool:
+    """Whether mongos can route a filter to the shards owning part of the key space."""
+    if not key:
+        return False
+    first, kind = next(iter(key.items()))
+    if predicates.pins(first, hashed=kind == "hashed"):
+        return True
+    return bool(predicates.branches) and all(targets(b, key) for b in predicates.branches)
+
+
+@dataclass
+class Operation:
+    ns: str
+    op: str
+    filter: Dict[str, Any]
+    sort: Dict[str, Any] = field(default_factory=dict)
+    millis: float = 0.0
+    docs_examined: Optional[int] = None
+    keys_examined: Optional[int] = None
+    returned: Optional[int] = None
+    plan: str = ""
+    shards: Optional[int] = None  # nShards of a mongos log line
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, dict) and len(value) == 1:
+        value = next(iter(value.values()))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value: Any) -> Optional[int]:
+    number = _number(value)
+    return None if number is None else int(number)
+
+
+def _namespace(ns: Optional[str], command: Mapping[str, Any]) -> Optional[str]:
+    db = command.get("$db") or (ns.split(".", 1)[0] if ns else None)
+    name = next(iter(command.values()), None) if command else None
+    if db and isinstance(name, str) and (not ns or ns.endswith(".$cmd") or "." not in ns):
+        return f"{db}.{name}"
+    return ns
+
+
+def _query_of(command: Mapping[str, Any]) -> Optional[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """(operation, filter, sort) of a command document, None when it reads nothing."""
+    if not command:
+        return None
+    name = next(iter(command))
+    if name == "find":
+        return "find", command.get("filter") or {}, command.get("sort") or {}
+    if name == "aggregate":
+        pipeline = [s for s in command.get("pipeline") or [] if isinstance(s, dict)]
+        query: Dict[str, Any] = {}
+        sort: Dict[str, Any] = {}
+        if pipeline and "$match" in pipeline[0]:
+            query = pipeline.pop(0)["$match"]
+        if pipeline and "$sort" in pipeline[0]:
+            sort = pipeline[0]["$sort"]
+        if pipeline and not query and not sort and next(iter(pipeline[0])) in ("$currentOp", "$collStats",
+                                                                                 "$indexStats", "$changeStream"):
+            return None
+        return "aggregate", query, sort
+    if name in ("count", "distinct"):
+        return name, command.get("query") or {}, {}
+    if name.lower() == "findandmodify":
+        return "findAndModify", command.get("query") or {}, command.get("sort") or {}
+    if name in ("update", "delete"):
+        specs = command.get("updates" if name == "update" else "deletes") or [{}]
+        return name, (specs[0] or {}).get("q") or {}, {}
+    if "q" in command:  # the per-statement form profile and log entries of writes carry
+        return "", command.get("q") or {}, {}
+    return None
+
+
+def operation_from_profile(doc: Mapping[str, Any]) -> Optional[Operation]:
+    """An operation from a ``system.profile`` document or a ``$currentOp`` entry."""
+    command = doc.get("command") or doc.get("query") or {}
+    if doc.get("op") == "getmore" or "getMore" in command:
+        command = doc.get("originatingCommand") or {}
+    query = _query_of(command)
+    if query is None:
+        return None
+    op, filter_, sort = query
+    op = op or {"remove": "delete"}.get(doc.get("op", ""), doc.get("op", ""))
+    ns = _namespace(doc.get("ns"), command)
+    millis = _number(doc.get("millis"))
+    if millis is None:
+        micros = _number(doc.get("microsecs_running"))
+        millis = micros / 1000.0 if micros is not None else 0.0
+    return Operation(ns or "", op, filter_ if isinstance(filter_, dict) else {}, sort if isinstance(sort, dict) else {},
+                     millis, _int(doc.get("docsExamined")), _int(doc.get("keysExamined")),
+                     _int(doc.get("nreturned", doc.get("nMatched"))), str(doc.get("planSummary", "")))
+
+
+def operation_from_log(entry: Mapping[str, Any]) -> Optional[Operation]:
+    """An operation from a ``Slow query`` line of a mongod or mongos JSON log."""
+    attr = entry.get("attr") or {}
+    if "durationMillis" not in attr or "ns" not in attr:
+        return None
+    command = dict(attr.get("command") or {})
+    if attr.get("type") in ("update", "remove") and "q" not in command and "q" in attr:
+        command["q"] = attr["q"]
+    if "getMore" in command:
+        command = attr.get("originatingCommand") or {}
+    query = _query_of(command)
+    if query is None:
+        return None
+    op, filter_, sort = query
+    op = op or {"remove": "delete"}.get(attr.get("type", ""), attr.get("type", ""))
+    return Operation(_namespace(attr["ns"], command) or "", op, filter_ if isinstance(filter_, dict) else {},
+                     sort if isinstance(sort, dict) else {}, _number(attr["durationMillis"]) or 0.0,
+                     _int(attr.get("docsExamined")), _int(attr.get("keysExamined")),
+                     _int(attr.get("nreturned", attr.get("nMatched"))), str(attr.get("planSummary", "")),
+                     _int(attr.get("nShards")))
+
+
+# ---------------------------------------------------------------------------
+# Catalog: shard keys and indexes
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Collection:
+    shard_key: Optional[Dict[str, Any]] = None
+    indexes: List[Dict[str, Any]] = field(default_factory=list)  # key patterns
+
+    def indexed(self, key: Sequence[str]) -> bool:
+        return any(list(index)[:len(key)] == list(key) for index in self.indexes)
+
+
+Catalog = Dict[str, Collection]
+
+
+def catalog_record(ns: str, collection: Collection) -> Dict[str, Any]:
+    return {"catalog": ns, "shardKey": collection.shard_key, "indexes": [{"key": k} for k in collection.indexes]}
+
+
+def _add_catalog(catalog: Catalog, record: Mapping[str, Any]) -> bool:
+    """Merge a catalog line (ours, or a ``config.collections`` export); False if it is none."""
+    if isinstance(record.get("catalog"), str):
+        ns, key, indexes = record["catalog"], record.get("shardKey"), record.get("indexes") or []
+    elif isinstance(record.get("_id"), str) and "." in record["_id"] and isinstance(record.get("key"), dict):
+        ns, key, indexes = record["_id"], record["key"], []
+    else:
+        return False
+    collection = catalog.setdefault(ns, Collection())
+    if key:
+        collection.shard_key = {k: _number(v) if _number(v) is not None else v for k, v in key.items()}
+    for index in indexes:
+        pattern = index.get("key") if isinstance(index, dict) and "key" in index else index
+        if isinstance(pattern, dict) and pattern not in collection.indexes:
+            collection.indexes.append(pattern)
+    return True
+
+
+def load_catalog(path: Path) -> Catalog:
+    """Shard keys and indexes from ``{"db.coll": {"shardKey": {...}, "indexes": [{...}]}}``."""
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise AdvisorError(f"Cannot read catalog {path}: {e}")
+    if not isinstance(data, dict):
+        raise AdvisorError(f"Catalog {path} must map namespaces to shardKey/indexes")
+    catalog: Catalog = {}
+    for ns, spec in data.items():
+        if not isinstance(spec, dict):
+            raise AdvisorError(f"Catalog entry {ns} must be an object")
+        _add_catalog(catalog, {"catalog": ns, **spec})
+    return catalog
+
+
+# ---------------------------------------------------------------------------
+# Capture files
+# ---------------------------------------------------------------------------
+
+def _records(path: Path) -> Iterator[Optional[Dict[str, Any]]]:
+    """JSON documents of a JSON-lines file or a JSON array (``.gz`` too); None for unparsable lines."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        if head == "[":
+            try:
+                data = json.loads(head + f.read())
+            except ValueError as e:
+                raise AdvisorError(f"{path} is not valid JSON: {e}")
+            for doc in data:
+                yield doc if isinstance(doc, dict) else None
+            return
+        for line in (head + f.readline(), *f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                doc = json.loads(line)
+            except ValueError:
+                yield None  # plain text log lines, truncated writes
+                continue
+            yield doc if isinstance(doc, dict) else None
+
+
+def read_capture(paths: Iterable[Path], catalog: Optional[Catalog] = None) -> Tuple[List[Operation], Catalog, int]:
+    """(operations, catalog, skipped lines) of captured profiler, ``$currentOp`` and log files."""
+    catalog = catalog if catalog is not None else {}
+    operations: List[Operation] = []
+    skipped = 0
+    for path in paths:
+        try:
+            for doc in _records(Path(path)):
+                if doc is None:
+                    skipped += 1
+                elif _add_catalog(catalog, doc):
+                    continue
+                elif "attr" in doc and "msg" in doc:
+                    operation = operation_from_log(doc)
+                    if operation is not None:
+                        operations.append(operation)
+                elif "ns" in doc and "op" in doc:
+                    operation = operation_from_profile(doc)
+                    if operation is not None:
+                        operations.append(operation)
+                else:
+                    skipped += 1
+        except OSError as e:
+            raise AdvisorError(f"Cannot read {path}: {e}")
+    return operations, catalog, skipped
+
+
+# ---------------------------------------------------------------------------
+# Analysis
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ShapeStats:
+    ns: str
+    op: str
+    shape: Dict[str, Any]
+    sort: Dict[str, Any]
+    predicates: Predicates
+    count: int = 0
+    millis: float = 0.0
+    docs_examined: int = 0
+    returned: int = 0
+    measured: int = 0  # operations that reported examined/returned counts
+    collscans: int = 0
+    scattered: int = 0  # operations mongos sent to more than one shard
+    shards: int = 0  # most shards one of them reached
+    plans: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def examine_ratio(self) -> Optional[float]:
+        if not self.measured:
+            return None
+        return self.docs_examined / max(self.returned, 1)
+
+    @property
+    def plan(self) -> str:
+        return max(self.plans, key=self.plans.__getitem__) if self.plans else ""
+
+    def describe(self) -> str:
+        text = f"{self.op} {json.dumps(self.shape, separators=(', ', ': '))}"
+        return text + (f" sort {json.dumps(self.sort)}" if self.sort else "")
+
+
+@dataclass
+class ShapeSummary:
+    ns: str
+    shape: str
+    count: int
+    millis: float
+    share: float
+    plan: str
+    examine_ratio: Optional[float]
+
+
+@dataclass
+class IndexAdvice:
+    ns: str
+    key: Dict[str, Any]
+    shapes: List[str]
+    count: int
+    millis: float
+    saved_millis: float
+    share: float  # of all sampled time the index could save
+
+    @property
+    def command(self) -> str:
+        db, coll = self.ns.split(".", 1)
+        return f"db.getSiblingDB({json.dumps(db)}).getCollection({json.dumps(coll)}).createIndex({json.dumps(self.key)})"
+
+
+@dataclass
+class KeyCandidate:
+    key: Dict[str, Any]
+    coverage: float  # share of the namespace's operations mongos could target
+    cardinality: int
+    frequency: float
+    monotonic: bool
+    problems: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ShardKeyAdvice:
+    ns: str
+    current: Optional[KeyCandidate]
+    recommended: Optional[KeyCandidate]
+    count: int
+
+
+@dataclass
+class ScatterGather:
+    ns: str
+    shape: str
+    count: int
+    millis: float
+    share: float
+    shards: Optional[int] = None
+
+
+@dataclass
+class AdvisorReport:
+    operations: int
+    skipped: int
+    namespaces: int
+    shape_count: int
+    total_millis: float
+    shapes: List[ShapeSummary]
+    indexes: List[IndexAdvice]
+    shard_keys: List[ShardKeyAdvice]
+    scatter: List[ScatterGather]
+
+    def findings(self) -> Dict[str, int]:
+        return {
+            "index": len(self.indexes),
+            "shard-key": sum(1 for a in self.shard_keys if a.current is not None and a.current.problems),
+            "scatter": len(self.scatter),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for advice, entry in zip(self.indexes, data["indexes"]):
+            entry["command"] = advice.command
+        data["findings"] = self.findings()
+        return data
+
+    def format(self) -> str:
+        lines = [f"Analyzed {self.operations} operations in {self.shape_count} shapes across "
+                 f"{self.namespaces} namespaces ({self.total_millis:.0f}ms sampled"
+                 + (f", {self.skipped} lines skipped)" if self.skipped else ")")]
+        if self.shapes:
+            lines += ["", "Top query shapes by time:"]
+            for s in self.shapes:
+                ratio = f" examined/returned {s.examine_ratio:.0f}" if s.examine_ratio is not None else ""
+                lines.append(f"  {s.ns:<24} {s.shape}")
+                lines.append(f"  {'':<24} {s.count} ops {s.millis:.0f}ms ({s.share:.1%})"
+                             + (f" {s.plan}" if s.plan else "") + ratio)
+        lines += ["", "Recommended indexes:" if self.indexes else "Recommended indexes: none"]
+        for advice in self.indexes:
+            lines.append(f"  {advice.ns:<24} {_key_text(advice.key)}")
+            shapes = len(advice.shapes)
+            lines.append(f"  {'':<24} {shapes} shape{'s' if shapes != 1 else ''}, {advice.count} ops, up to "
+                         f"{advice.saved_millis:.0f}ms saved ({advice.share:.1%} of sampled time)")
+            lines.append(f"  {'':<24} {advice.command}")
+        lines += ["", "Shard keys:" if self.shard_keys else "Shard keys: no advice"]
+        for advice in self.shard_keys:
+            current, recommended = advice.current, advice.recommended
+            if current is not None:
+                verdict = "; ".join(current.problems) or "fine"
+                lines.append(f"  {advice.ns:<24} current {_key_text(current.key)}: {verdict}")
+            else:
+                lines.append(f"  {advice.ns:<24} not sharded ({advice.count} ops sampled)")
+            if recommended is not None:
+                lines.append(f"  {'':<24} recommend {_key_text(recommended.key)}: {_candidate_text(recommended)}")
+        lines += ["", "Scatter-gather queries:" if self.scatter else "Scatter-gather queries: none"]
+        for s in self.scatter:
+            shards = f" on {s.shards} shards" if s.shards else ""
+            lines.append(f"  {s.ns:<24} {s.shape}")
+            lines.append(f"  {'':<24} {s.count} ops {s.millis:.0f}ms ({s.share:.1%}){shards}")
+        return "\n".join(lines)
+
+
+def _key_text(key: Mapping[str, Any]) -> str:
+    return "{" + ", ".join(f"{k}: {json.dumps(v if not isinstance(v, float) or v % 1 else int(v))}"
+                           for k, v in key.items()) + "}"
+
+
+def _candidate_text(candidate: KeyCandidate) -> str:
+    text = (f"~{candidate.cardinality} distinct values, top value {candidate.frequency:.0%}, "
+            f"targets {candidate.coverage:.0%} of operations")
+    return text + ("; " + "; ".join(candidate.problems) if candidate.problems else "")
+
+
+class QueryAdvisor:
+    """Accumulates operations into shapes and field statistics, then derives advice."""
+
+    def __init__(self, catalog: Optional[Catalog] = None, options: Optional[AdvisorOptions] = None):
+        self.catalog: Catalog = catalog if catalog is not None else {}
+        self.options = options or AdvisorOptions()
+        self.shapes: Dict[Tuple[str, str, str], ShapeStats] = {}
+        self.fields: Dict[str, Dict[str, FieldStats]] = {}
+        self.operations = 0
+        self.skipped = 0
+
+    def add(self, operation: Operation):
+        db, _, coll = operation.ns.partition(".")
+        if not coll or db in SYSTEM_DATABASES or coll.startswith("system."):
+            return
+        self.operations += 1
+        shape = shape_of(operation.filter)
+        shape = shape if isinstance(shape, dict) else {}
+        key = (operation.ns, operation.op, json.dumps([shape, operation.sort], sort_keys=True))
+        stats = self.shapes.get(key)
+        if stats is None:
+            stats = self.shapes[key] = ShapeStats(operation.ns, operation.op, shape, dict(operation.sort),
+                                                  predicates_of(operation.filter))
+        stats.count += 1
+        stats.millis += operation.millis
+        if operation.docs_examined is not None and operation.returned is not None:
+            stats.measured += 1
+            stats.docs_examined += operation.docs_examined
+            stats.returned += operation.returned
+        if operation.plan:
+            plan = operation.plan.split(",")[0].strip()
+            stats.plans[plan] = stats.plans.get(plan, 0) + 1
+            stats.collscans += plan.startswith("COLLSCAN")
+        if operation.shards is not None and operation.shards > 1:
+            stats.scattered += 1
+            stats.shards = max(stats.shards, operation.shards)
+        fields = self.fields.setdefault(operation.ns, {})
+        for name, values in predicates_of(operation.filter).equality.items():
+            field_stats = fields.setdefault(name, FieldStats())
+            for value in values:
+                field_stats.add(value)
+
+    def add_all(self, operations: Iterable[Operation]):
+        for operation in operations:
+            self.add(operation)
+
+    @property
+    def total_millis(self) -> float:
+        return sum(s.millis for s in self.shapes.values())
+
+    def report(self) -> AdvisorReport:
+        total = self.total_millis or 1.0
+        ranked = sorted(self.shapes.values(), key=lambda s: (-s.millis, -s.count))
+        summaries = [ShapeSummary(s.ns, s.describe(), s.count, round(s.millis, 1), s.millis / total, s.plan,
+                                  None if s.examine_ratio is None else round(s.examine_ratio, 1))
+                     for s in ranked[:self.options.top]]
+        namespaces = sorted({s.ns for s in self.shapes.values()})
+        return AdvisorReport(
+            operations=self.operations,
+            skipped=self.skipped,
+            namespaces=len(namespaces),
+            shape_count=len(self.shapes),
+            total_millis=round(self.total_millis, 1),
+            shapes=summaries,
+            indexes=self.index_advice()[:self.options.top],
+            shard_keys=[a for a in (self.shard_key_advice(ns) for ns in namespaces) if a is not None],
+            scatter=self.scatter_gather()[:self.options.top],
+        )
+
+    # Indexes
+
+    def index_key(self, stats: ShapeStats) -> Dict[str, Any]:
+        """Equality fields by cardinality, then the sort, then one range field."""
+        fields = self.fields.get(stats.ns, {})
+        key: Dict[str, Any] = {}
+        for name in sorted(stats.predicates.equality, key=lambda n: (-fields[n].cardinality if n in fields else 0, n)):
+            key[name] = 1
+        for name, direction in stats.sort.items():
+            if name not in key and name != "$natural":
+                key[name] = -1 if _number(direction) == -1 else 1
+        for name in stats.predicates.ranges:
+            if name not in key:
+                key[name] = 1
+                break
+        return key
+
+    def needs_index(self, stats: ShapeStats) -> bool:
+        if stats.op not in ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"):
+            return False
+        if stats.count < self.options.min_count or not stats.predicates.fields() and not stats.sort:
+            return False
+        ratio = stats.examine_ratio
+        return stats.collscans > stats.count / 2 or (ratio is not None and ratio >= self.options.examine_ratio)
+
+    def index_advice(self) -> List[IndexAdvice]:
+        total = self.total_millis or 1.0
+        by_ns: Dict[str, List[IndexAdvice]] = {}
+        for stats in sorted(self.shapes.values(), key=lambda s: -len(s.predicates.fields()) - len(s.sort)):
+            if not self.needs_index(stats):
+                continue
+            key = self.index_key(stats)
+            collection = self.catalog.get(stats.ns, Collection())
+            if not key or collection.indexed(list(key)):
+                continue
+            ratio = stats.examine_ratio
+            saved = stats.millis * (1 - 1 / ratio) if ratio and ratio > 1 else stats.millis
+            advice = by_ns.setdefault(stats.ns, [])
+            # A shape whose index is a prefix of one already advised is served by that one
+            target = next((a for a in advice if list(a.key)[:len(key)] == list(key)), None)
+            if target is None:
+                target = IndexAdvice(stats.ns, key, [], 0, 0.0, 0.0, 0.0)
+                advice.append(target)
+            target.shapes.append(stats.describe())
+            target.count += stats.count
+            target.millis += stats.millis
+            target.saved_millis += saved
+        result = [a for advices in by_ns.values() for a in advices]
+        for a in result:
+            a.millis = round(a.millis, 1)
+            a.saved_millis = round(a.saved_millis, 1)
+            a.share = a.saved_millis / total
+        return sorted(result, key=lambda a: -a.saved_millis)
+
+    # Shard keys
+
+    def evaluate_key(self, ns: str, key: Dict[str, Any]) -> KeyCandidate:
+        shapes = [s for s in self.shapes.values() if s.ns == ns]
+        count = sum(s.count for s in shapes) or 1
+        coverage = sum(s.count for s in shapes if targets(s.predicates, key)) / count
+        fields = self.fields.get(ns, {})
+        names = list(key)
+        stats = [fields[n] for n in names if n in fields]
+        cardinality, frequency = 0, 1.0
+        if len(stats) == len(names):
+            cardinality = min(_product(s.cardinality for s in stats), max(s.observations for s in stats))
+            frequency = _product(s.frequency for s in stats)
+        first = fields.get(names[0])
+        monotonic = first is not None and first.monotonic
+        hashed = key[names[0]] == "hashed"
+        problems = []
+        if coverage < self.options.min_coverage:
+            problems.append(f"only {coverage:.0%} of operations target specific shards")
+        if not stats:
+            problems.append("never queried by equality in the sample")
+        elif cardinality < self.options.min_cardinality:
+            problems.append(f"only ~{cardinality} distinct values")
+        if stats and frequency > self.options.max_frequency:
+            value = first.hitters.top()[0] if first is not None else None
+            problems.append(f"{json.dumps(value, default=str)} is in {frequency:.0%} of operations"
+                            if len(names) == 1 else f"top key values in {frequency:.0%} of operations")
+        if monotonic and not hashed:
+            problems.append(f"{names[0]} only increases, so inserts land on one chunk")
+        return KeyCandidate(dict(key), round(coverage, 3), cardinality, round(frequency, 3), monotonic, problems)
+
+    def shard_key_candidates(self, ns: str) -> List[Dict[str, Any]]:
+        fields = self.fields.get(ns, {})
+        candidates: List[Dict[str, Any]] = []
+        for name, stats in fields.items():
+            candidates.append({name: "hashed" if stats.monotonic else 1})
+        for stats in self.shapes.values():
+            names = sorted((n for n in stats.predicates.equality if n in fields),
+                           key=lambda n: (-fields[n].cardinality, n))
+            if len(names) >= 2 and not fields[names[0]].monotonic:
+                pair = {names[0]: 1, names[1]: 1}
+                if pair not in candidates:
+                    candidates.append(pair)
+        return candidates
+
+    def shard_key_advice(self, ns: str) -> Optional[ShardKeyAdvice]:
+        count = sum(s.count for s in self.shapes.values() if s.ns == ns)
+        if count < self.options.min_count:
+            return None
+        current_key = self.catalog.get(ns, Collection()).shard_key
+        current = self.evaluate_key(ns, current_key) if current_key else None
+        viable = [c for c in (self.evaluate_key(ns, k) for k in self.shard_key_candidates(ns)) if not c.problems]
+        best = max(viable, key=lambda c: (c.coverage, -len(c.key), c.cardinality), default=None)
+        if current is not None and (not current.problems or best is None or best.key == current.key):
+            return ShardKeyAdvice(ns, current, None, count) if current.problems else None
+        if best is None:
+            return None
+        return ShardKeyAdvice(ns, current, best, count)
+
+    # Scatter-gather
+
+    def scatter_gather(self) -> List[ScatterGather]:
+        total = self.total_millis or 1.0
+        result = []
+        for stats in self.shapes.values():
+            key = self.catalog.get(stats.ns, Collection()).shard_key
+            if stats.op not in ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"):
+                continue
+            if stats.scattered or (key and not targets(stats.predicates, key)):
+                result.append(ScatterGather(stats.ns, stats.describe(), stats.count, round(stats.millis, 1),
+                                            stats.millis / total, stats.shards or None))
+        return sorted(result, key=lambda s: (-s.millis, -s.count))
+
+
+def _product(values: Iterable[float]) -> Any:
+    result: Any = 1
+    for value in values:
+        result *= value
+    return result
+
+
+def analyze(operations: Iterable[Operation], catalog: Optional[Catalog] = None,
+            options: Optional[AdvisorOptions] = None, skipped: int = 0) -> AdvisorReport:
+    advisor = QueryAdvisor(catalog, options)
+    advisor.add_all(operations)
+    advisor.skipped = skipped
+    return advisor.report()
+
+
+def check_findings(report: AdvisorReport, fail_on: Sequence[str]) -> List[str]:
+    """Failure messages for the finding kinds a CI run should not accept."""
+    failures = []
+    findings = report.findings()
+    for kind in fail_on:
+        if findings.get(kind):
+            failures.append(f"{findings[kind]} {kind} finding(s)")
+    return failures
+
+
+# ---------------------------------------------------------------------------
+# Live sampling
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SampleOptions:
+    duration: float = 30.0  # seconds of $currentOp polling
+    interval: float = 1.0
+    slowms: Optional[int] = None  # turn on the profiler at this threshold while sampling
+    profile_limit: int = 10000  # system.profile documents per database and node
+    timeout: float = 5.0
+
+
+class LiveSampler:
+    """Collects profiler and ``$currentOp`` documents from every data-bearing node.
+
+    Raw documents are kept as extended JSON, so a live run and a capture of it
+    analyze identically.
+    """
+
+    def __init__(self, pool: ConnectionPool, options: Optional[SampleOptions] = None, progress=print):
+        self.pool = pool
+        self.options = options or SampleOptions()
+        self.progress = progress
+        self.records: List[Dict[str, Any]] = []
+        self.catalog: Catalog = {}
+        self.seen_ops: Set[Tuple[str, Any]] = set()
+
+    async def _command(self, node: Node, db: str, cmd: Dict[str, Any]) -> Dict[str, Any]:
+        async with self.pool.acquire(node.host, node.port) as conn:
+            return await asyncio.wait_for(conn.command(db, cmd), self.options.timeout)
+
+    async def _cursor(self, node: Node, db: str, cmd: Dict[str, Any], limit: int = 0) -> List[Dict[str, Any]]:
+        async with self.pool.acquire(node.host, node.port) as conn:
+            reply = await asyncio.wait_for(conn.command(db, cmd), self.options.timeout)
+            cursor = reply["cursor"]
+            docs = list(cursor.get("firstBatch", []))
+            collection = cursor.get("ns", "").split(".", 1)[-1]
+            while cursor.get("id") and (not limit or len(docs) < limit):
+                reply = await asyncio.wait_for(conn.command(db, {"getMore": Int64(cursor["id"]),
+                                                                 "collection": collection}), self.options.timeout)
+                cursor = reply["cursor"]
+                docs.extend(cursor.get("nextBatch", []))
+            return docs[:limit] if limit else docs
+
+    async def sample(self, nodes: Sequence[Node], routers: Sequence[Node] = ()) -> List[Dict[str, Any]]:
+        data_nodes = [n for n in nodes if n.role == "mongod"]
+        if not data_nodes:
+            raise AdvisorError("No data-bearing nodes to sample")
+        databases: Dict[Node, List[str]] = {}
+        for node in data_nodes:
+            try:
+                reply = await self._command(node, "admin", {"listDatabases": 1, "nameOnly": True})
+            except (CommandError, *_NETWORK_ERRORS) as e:
+                self.progress(f"  {node.address}: skipped ({e or type(e).__name__})")
+                continue
+            databases[node] = [d["name"] for d in reply.get("databases", []) if d["name"] not in SYSTEM_DATABASES]
+        if not databases:
+            raise AdvisorError("No node could be sampled")
+
+        previous = await self._enable_profiler(databases) if self.options.slowms is not None else {}
+        started = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            await self._poll_current_op(list(databases))
+        finally:
+            await self._restore_profiler(previous)
+        for node, names in databases.items():
+            for db in names:
+                query: Dict[str, Any] = {"ts": {"$gte": started}} if previous else {}
+                try:
+                    docs = await self._cursor(node, db, {"find": "system.profile", "filter": query,
+                                                         "sort": {"$natural": 1}}, self.options.profile_limit)
+                except (CommandError, *_NETWORK_ERRORS):
+                    continue
+                self.records.extend(extended_json(d) for d in docs)
+        await self._read_catalog(list(databases), routers)
+        return self.records
+
+    async def _enable_profiler(self, databases: Dict[Node, List[str]]) -> Dict[Tuple[Node, str], Dict[str, Any]]:
+        previous = {}
+        for node, names in databases.items():
+            for db in names:
+                try:
+                    reply = await self._command(node, db, {"profile": 1, "slowms": self.options.slowms})
+                except (CommandError, *_NETWORK_ERRORS) as e:
+                    self.progress(f"  {node.address}/{db}: cannot enable the profiler ({e or type(e).__name__})")
+                    continue
+                previous[(node, db)] = {"profile": reply.get("was", 0), "slowms": reply.get("slowms", 100)}
+        self.progress(f"Profiler enabled at {self.options.slowms}ms on {len(previous)} databases")
+        return previous
+
+    async def _restore_profiler(self, previous: Dict[Tuple[Node, str], Dict[str, Any]]):
+        for (node, db), settings in previous.items():
+            try:
+                await self._command(node, db, settings)
+            except (CommandError, *_NETWORK_ERRORS) as e:
+                self.progress(f"  {node.address}/{db}: profiler not restored ({e or type(e).__name__})")
+
+    async def _poll_current_op(self, nodes: List[Node]):
+        if self.options.duration <= 0:
+            return
+        pipeline = [{"$currentOp": {"allUsers": True}}, {"$match": {"active": True, "ns": {"$exists": True}}}]
+        deadline = time.monotonic() + self.options.duration
+        supported = set(nodes)
+        while supported and time.monotonic() < deadline:
+            for node in list(supported):
+                try:
+                    ops = await self._cursor(node, "admin", {"aggregate": 1, "pipeline": pipeline, "cursor": {}})
+                except (CommandError, *_NETWORK_ERRORS):
+                    supported.discard(node)
+                    continue
+                for op in ops:
+                    key = (node.address, op.get("opid"))
+                    if key not in self.seen_ops:
+                        self.seen_ops.add(key)
+                        self.records.append(extended_json(op))
+            await asyncio.sleep(self.options.interval)
+
+    async def _read_catalog(self, nodes: List[Node], routers: Sequence[Node]):
+        namespaces = sorted({op.ns for op in (operation_from_profile(r) for r in self.records) if op is not None})
+        source = routers[0] if routers else nodes[0]
+        if routers:
+            try:
+                docs = await self._cursor(source, "config", {"find": "collections", "filter": {}})
+            except (CommandError, *_NETWORK_ERRORS):
+                docs = []
+            for doc in docs:
+                if not doc.get("dropped"):
+                    _add_catalog(self.catalog, extended_json(doc))
+        for ns in namespaces:
+            db, _, coll = ns.partition(".")
+            if not coll or db in SYSTEM_DATABASES:
+                continue
+            try:
+                indexes = await self._cursor(source, db, {"listIndexes": coll})
+            except (CommandError, *_NETWORK_ERRORS):
+                continue
+            _add_catalog(self.catalog, {"catalog": ns, "indexes": extended_json(indexes)})
+
+    def capture_lines(self) -> Iterator[str]:
+        for ns, collection in sorted(self.catalog.items()):
+            yield json.dumps(catalog_record(ns, collection))
+        for record in self.records:
+            yield json.dumps(record, default=str)
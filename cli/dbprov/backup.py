@@ -0,0 +1,811 @@
+"""Streaming, compressed, content-addressed cluster backups.
+
+Every replica set (each shard of a sharded cluster) is dumped in parallel from
+one source node, a healthy secondary when there is one. A node serves at most
+``node_concurrency`` collections at a time and, with ``node_rate`` set, reads
+at most that many bytes per second, so the backup does not starve the
+application.
+
+Documents are copied as the exact BSON bytes the server sent, never decoded,
+and cut into chunks of ``chunk_size`` uncompressed bytes; concatenating a
+collection's decompressed chunks gives a ``mongodump``-compatible ``.bson``
+stream. Chunks are compressed with zstd
+(``pip install dbprovision[zstd]``, zlib otherwise) in a thread pool and
+written straight to the target as ``chunks/<sha256>``, keyed by the hash of
+the stored bytes: identical chunks are stored once across backups and a
+chunk's name is its checksum. Only the chunks in flight are held in memory.
+
+A sharded cluster is dumped with its balancer stopped (through a mongos, and
+restarted afterwards when it was running), so no chunk migrates between shards
+while they are read. Each shard dumps a sharded collection by the chunk
+ranges ``config.chunks`` says it owns (``find`` with ``min``/``max`` on the
+shard key index), so orphaned documents a migration left behind on a donor
+are not copied and every document is in exactly one dump, its owner's.
+
+Each replica set's newest oplog timestamp is recorded before and after its
+dump (``oplog_start``/``oplog_end``): the dump is not a snapshot, but
+replaying that replica set's oplog from ``oplog_start`` to at least
+``oplog_end`` over it makes it consistent (see ``dbprov.oplog``).
+
+The manifest (``manifests/<backup id>.json``) is written last, so a backup
+without one is incomplete. It lists every chunk with its stored and raw size
+and a ``root`` digest over all chunk hashes. ``verify_backup`` checks the
+manifest against its root and every chunk's presence and size with metadata
+requests only; ``deep=True`` also downloads, hashes and decodes every chunk.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import time
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+import zlib
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from dbprov.health import ClusterHealth, Node
+from dbprov.wire import (BSONError, CommandError, Credentials, Int64, MongoConnection, RawDocument, Timestamp,
+                         encode, split_documents)
+
+try:
+    import zstandard
+except ImportError:  # optional, see setup.py extras
+    zstandard = None
+
+MB = 1024 * 1024
+SYSTEM_DATABASES = ("admin", "config", "local")
+SECONDARY_PREFERRED = {"mode": "secondaryPreferred"}
+MANIFEST_VERSION = 1
+# Answers worth another try: throttling and transient server errors
+S3_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class BackupError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Compression
+# ---------------------------------------------------------------------------
+
+class Codec:
+    name = "none"
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # Compressor objects are not thread-safe; chunks are compressed on a pool
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+def get_codec(name: Optional[str] = None, level: Optional[int] = None) -> Codec:
+    """``zstd`` (the default when zstandard is installed), ``zlib`` or ``none``."""
+    name = name or ("zstd" if zstandard is not None else "zlib")
+    if name == "zstd":
+        if zstandard is None:
+            raise BackupError("zstd compression needs the zstandard package: pip install dbprovision[zstd]")
+        return ZstdCodec(level if level is not None else 3)
+    if name == "zlib":
+        return ZlibCodec(level if level is not None else 6)
+    if name == "none":
+        return Codec()
+    raise BackupError(f"Unknown compression {name!r}; choose zstd, zlib or none")
+
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+class LocalTarget:
+    """Backup objects as files under a directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def __str__(self) -> str:
+        return str(self.root)
+
+    def put(self, key: str, data: bytes):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{id(data)}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        tmp.replace(path)
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return (self.root / key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str) -> bytes:
+        try:
+            return (self.root / key).read_bytes()
+        except FileNotFoundError:
+            raise BackupError(f"{key} not found in {self.root}")
+
+    def list(self, prefix: str) -> List[str]:
+        base = self.root / prefix
+        if not base.is_dir():
+            return []
+        return sorted(str(p.relative_to(self.root)) for p in base.rglob("*") if p.is_file() and not p.name.startswith("."))
+
+
+class S3Target:
+    """Backup objects in an S3-compatible bucket (AWS, MinIO, GCS interoperability).
+
+    Requests are signed with AWS Signature V4 and use path-style URLs, which
+    every S3-compatible server accepts. Temporary credentials (an assumed role,
+    SSO) carry their session token in ``x-amz-security-token``. Connection
+    errors and throttling or 5xx answers are retried ``retries`` times with
+    exponential backoff.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 region: str = "us-east-1", timeout: float = 60.0, session_token: Optional[str] = None,
+                 retries: int = 4, backoff: float = 0.5):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        endpoint = endpoint or f"https://s3.{region}.amazonaws.com"
+        parsed = urllib.parse.urlsplit(endpoint)
+        self.secure = parsed.scheme == "https"
+        self.netloc = parsed.netloc
+        self.access_key = access_key or ""
+        self.secret_key = secret_key or ""
+        self.session_token = session_token
+        self.region = region
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_url(cls, url: str, endpoint: Optional[str] = None) -> "S3Target":
+        parsed = urllib.parse.urlsplit(url)
+        return cls(
+            bucket=parsed.netloc,
+            prefix=parsed.path,
+            endpoint=endpoint or os.environ.get("S3_ENDPOINT_URL"),
+            access_key=os.environ.get("AWS_ACCESS_KEY_ID"),
+            secret_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+            session_token=os.environ.get("AWS_SESSION_TOKEN"),
+            region=os.environ.get("AWS_REGION", "us-east-1"),
+        )
+
+    def __str__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def put(self, key: str, data: bytes):
+        status, body = self._request("PUT", key, data)
+        if status != 200:
+            raise BackupError(f"PUT {key} failed with HTTP {status}: {body[:200]!r}")
+
+    def size(self, key: str) -> Optional[int]:
+        status, headers = self._request("HEAD", key, headers_only=True)
+        if status == 404:
+            return None
+        if status != 200:
+            raise BackupError(f"HEAD {key} failed with HTTP {status}")
+        return int(headers.get("content-length", 0))
+
+    def get(self, key: str) -> bytes:
+        status, body = self._request("GET", key)
+        if status != 200:
+            raise BackupError(f"GET {key} failed with HTTP {status}")
+        return body
+
+    def list(self, prefix: str) -> List[str]:
+        keys, token = [], None
+        while True:
+            query = {"list-type": "2", "prefix": self.prefix + prefix}
+            if token:
+                query["continuation-token"] = token
+            status, body = self._request("GET", None, query=query)
+            if status != 200:
+                raise BackupError(f"Listing {prefix} failed with HTTP {status}")
+            root = ElementTree.fromstring(body)
+            ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            keys.extend(e.text[len(self.prefix):] for e in root.iter(f"{ns}Key") if e.text)
+            token = root.findtext(f"{ns}NextContinuationToken")
+            if root.findtext(f"{ns}IsTruncated") != "true" or not token:
+                return sorted(keys)
+
+    def _request(self, method: str, key: Optional[str], body: bytes = b"",
+                 query: Optional[Dict[str, str]] = None, headers_only: bool = False):
+        attempt = 0
+        while True:
+            try:
+                status, data = self._send(method, key, body, query, headers_only)
+            except BackupError:
+                if attempt >= self.retries:
+                    raise
+            else:
+                if status not in S3_RETRY_STATUSES or attempt >= self.retries:
+                    return status, data
+            # Every attempt is signed again: the signature covers the request time
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def _send(self, method: str, key: Optional[str], body: bytes, query: Optional[Dict[str, str]],
+              headers_only: bool):
+        path = "/" + self.bucket + ("/" + urllib.parse.quote(self.prefix + key, safe="/~") if key else "")
+        canonical_query = "&".join(f"{urllib.parse.quote(k, safe='~')}={urllib.parse.quote(v, safe='~')}"
+                                   for k, v in sorted((query or {}).items()))
+        now = time.gmtime()
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", now)
+        payload_hash = hashlib.sha256(body).hexdigest()
+        headers = {"host": self.netloc, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        signed_headers = ";".join(sorted(headers))
+        canonical = "\n".join([method, path, canonical_query,
+                               "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)), signed_headers, payload_hash])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        signing_key = ("AWS4" + self.secret_key).encode()
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed_headers}, Signature={signature}")
+
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        conn = connection_class(self.netloc, timeout=self.timeout)
+        try:
+            conn.request(method, path + (f"?{canonical_query}" if canonical_query else ""), body or None, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if headers_only:
+                return response.status, {k.lower(): v for k, v in response.getheaders()}
+            return response.status, data
+        except OSError as e:
+            raise BackupError(f"{method} {path} failed: {e}")
+        finally:
+            conn.close()
+
+
+def open_target(location: str, endpoint: Optional[str] = None):
+    if location.startswith("s3://"):
+        return S3Target.from_url(location, endpoint)
+    return LocalTarget(Path(location).expanduser())
+
+
+def chunk_key(digest: str) -> str:
+    return f"chunks/{digest[:2]}/{digest}"
+
+
+def manifest_key(backup_id: str) -> str:
+    return f"manifests/{backup_id}.json"
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ChunkRef:
+    sha256: str
+    size: int
+    raw_size: int
+    documents: int
+
+
+@dataclass
+class CollectionDump:
+    ns: str
+    shard: str
+    source: str
+    documents: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    options: Dict[str, Any] = field(default_factory=dict)
+    indexes: List[Dict[str, Any]] = field(default_factory=list)
+    chunks: List[ChunkRef] = field(default_factory=list)
+    shard_key: Optional[Dict[str, Any]] = None  # set when only the shard's own chunk ranges were dumped
+
+
+@dataclass
+class BackupManifest:
+    id: str
+    cluster: str
+    codec: str
+    chunk_size: int
+    started_at: str
+    finished_at: str = ""
+    shards: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    collections: List[CollectionDump] = field(default_factory=list)
+    root: str = ""
+    version: int = MANIFEST_VERSION
+
+    @property
+    def documents(self) -> int:
+        return sum(c.documents for c in self.collections)
+
+    @property
+    def raw_bytes(self) -> int:
+        return sum(c.raw_bytes for c in self.collections)
+
+    @property
+    def stored_bytes(self) -> int:
+        return sum(c.stored_bytes for c in self.collections)
+
+    def compute_root(self) -> str:
+        digest = hashlib.sha256()
+        for dump in sorted(self.collections, key=lambda c: (c.ns, c.shard)):
+            digest.update(f"{dump.ns}\0{dump.shard}\0{dump.documents}\0".encode())
+            for chunk in dump.chunks:
+                digest.update(bytes.fromhex(chunk.sha256))
+        return digest.hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BackupManifest":
+        collections = [CollectionDump(**{**c, "chunks": [ChunkRef(**r) for r in c["chunks"]]})
+                       for c in data.get("collections", [])]
+        fields = cls.__dataclass_fields__
+        return cls(**{**{k: v for k, v in data.items() if k in fields}, "collections": collections})
+
+    def format(self) -> str:
+        ratio = self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0
+        lines = [
+            f"Backup {self.id} of {self.cluster} ({self.codec}, {len(self.shards)} replica set(s))",
+            f"  {'Namespace':<40} {'Shard':<12} {'Documents':>10} {'Raw':>10} {'Stored':>10} {'Chunks':>7}",
+        ]
+        for c in sorted(self.collections, key=lambda c: (c.ns, c.shard)):
+            lines.append(f"  {c.ns:<40} {c.shard:<12} {c.documents:>10} {_mb(c.raw_bytes):>10} "
+                         f"{_mb(c.stored_bytes):>10} {len(c.chunks):>7}")
+        lines.append(f"  {self.documents} documents, {_mb(self.raw_bytes)} -> {_mb(self.stored_bytes)} "
+                     f"(x{ratio:.1f}), root {self.root[:16]}")
+        return "\n".join(lines)
+
+
+def _mb(size: int) -> str:
+    return f"{size / MB:.1f}MB"
+
+
+def _jsonable(value: Any) -> Any:
+    """Index specs and collection options as plain JSON (numbers, strings, nested documents)."""
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return int(value) if isinstance(value, Int64) else value
+    return str(value)
+
+
+def load_manifest(target, backup_id: str) -> BackupManifest:
+    try:
+        return BackupManifest.from_dict(json.loads(target.get(manifest_key(backup_id))))
+    except (ValueError, TypeError, KeyError) as e:
+        raise BackupError(f"Manifest of {backup_id} is unreadable: {e}")
+
+
+def list_backups(target, cluster: Optional[str] = None) -> List[BackupManifest]:
+    manifests = []
+    for key in target.list("manifests/"):
+        if key.endswith(".json"):
+            manifest = load_manifest(target, Path(key).stem)
+            if cluster is None or manifest.cluster == cluster:
+                manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m.started_at)
+
+
+def read_chunks(target, manifest: BackupManifest, dump: CollectionDump) -> Iterator[bytes]:
+    """Decompressed BSON of a collection dump, one chunk at a time, checksums verified."""
+    codec = get_codec(manifest.codec)
+    for chunk in dump.chunks:
+        data = target.get(chunk_key(chunk.sha256))
+        if hashlib.sha256(data).hexdigest() != chunk.sha256:
+            raise BackupError(f"Chunk {chunk.sha256[:16]} of {dump.ns} is corrupt")
+        raw = codec.decompress(data)
+        if len(raw) != chunk.raw_size:
+            raise BackupError(f"Chunk {chunk.sha256[:16]} of {dump.ns} decompressed to {len(raw)} bytes, "
+                              f"expected {chunk.raw_size}")
+        yield raw
+
+
+def read_documents(target, manifest: BackupManifest, dump: CollectionDump) -> Iterator[RawDocument]:
+    """The documents of a collection dump as stored, without decoding them."""
+    for raw in read_chunks(target, manifest, dump):
+        try:
+            yield from split_documents(raw)
+        except BSONError as e:
+            raise BackupError(f"A chunk of {dump.ns} holds malformed BSON: {e}")
+
+
+def verify_backup(target, backup_id: str, deep: bool = False) -> List[str]:
+    """Problems found with a backup; empty when it is intact."""
+    manifest = load_manifest(target, backup_id)
+    problems = []
+    if manifest.compute_root() != manifest.root:
+        problems.append("manifest root digest does not match its chunk list")
+    checked = set()
+    for dump in manifest.collections:
+        for chunk in dump.chunks:
+            if chunk.sha256 in checked:
+                continue
+            checked.add(chunk.sha256)
+            size = target.size(chunk_key(chunk.sha256))
+            if size is None:
+                problems.append(f"{dump.ns}: chunk {chunk.sha256[:16]} is missing")
+            elif size != chunk.size:
+                problems.append(f"{dump.ns}: chunk {chunk.sha256[:16]} is {size} bytes, expected {chunk.size}")
+        if deep and not problems:
+            try:
+                documents = sum(1 for _ in read_documents(target, manifest, dump))
+            except Exception as e:
+                problems.append(f"{dump.ns}: {e}")
+                continue
+            if documents != dump.documents:
+                problems.append(f"{dump.ns}: {documents} documents, manifest says {dump.documents}")
+    return problems
+
+
+# ---------------------------------------------------------------------------
+# Dumping
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BackupSource:
+    """The node a replica set (shard) is dumped from."""
+    shard: str
+    host: str
+    port: int
+    state: str = "UNKNOWN"
+    lag_seconds: Optional[float] = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def choose_sources(report: ClusterHealth) -> List[BackupSource]:
+    """One node per data-bearing replica set: the least lagging secondary, else the primary."""
+    by_set: Dict[str, List] = {}
+    for n in report.nodes:
+        if n.ok and n.node.role == "mongod" and n.state in ("PRIMARY", "SECONDARY", "STANDALONE"):
+            by_set.setdefault(n.set_name or n.node.address, []).append(n)
+    sources = []
+    for name, members in sorted(by_set.items()):
+        secondaries = sorted((m for m in members if m.state == "SECONDARY"),
+                             key=lambda m: (m.lag_seconds is None, m.lag_seconds or 0.0))
+        best = secondaries[0] if secondaries else members[0]
+        sources.append(BackupSource(name, best.node.host, best.node.port, best.state, best.lag_seconds))
+    return sources
+
+
+def choose_router(report: ClusterHealth) -> Optional[Node]:
+    """A reachable mongos of a sharded cluster; None for a replica set or when every router is down."""
+    return next((n.node for n in report.nodes if n.ok and n.node.role == "mongos"), None)
+
+
+@dataclass
+class OwnedRanges:
+    """The ``[min, max)`` shard key ranges of a sharded collection one replica set owns."""
+    key: Dict[str, Any]
+    ranges: List[Tuple[Dict[str, Any], Dict[str, Any]]] = field(default_factory=list)
+
+
+def owned_ranges(collections: List[Dict[str, Any]], chunks: List[Dict[str, Any]],
+                 shards: List[Dict[str, Any]]) -> Dict[Tuple[str, str], OwnedRanges]:
+    """Chunk ownership by ``(namespace, replica set)``, adjacent chunks of one owner merged into one range.
+
+    ``collections``, ``chunks`` and ``shards`` are ``config.collections``,
+    ``config.chunks`` and ``listShards`` as read through a mongos. Every
+    replica set gets an entry for every sharded collection, empty when it owns
+    none of its chunks.
+    """
+    sets = {s["_id"]: s["host"].partition("/")[0] if "/" in s["host"] else s["host"] for s in shards}
+    sharded = {c["_id"]: c for c in collections if not c.get("dropped")}
+    by_uuid = {c["uuid"]: ns for ns, c in sharded.items() if "uuid" in c}
+    owned: Dict[Tuple[str, str], List[Dict[str, Any]]] = {(ns, rs): [] for ns in sharded for rs in sets.values()}
+    for chunk in chunks:
+        # config.chunks names the collection by ns before 5.0, by uuid since
+        ns = chunk.get("ns") or by_uuid.get(chunk.get("uuid"))
+        if ns in sharded and chunk.get("shard") in sets:
+            owned[(ns, sets[chunk["shard"]])].append(chunk)
+    ownership = {}
+    for (ns, rs), mine in owned.items():
+        starts = {encode(c["min"]): c for c in mine}
+        ends = {encode(c["max"]) for c in mine}
+        ranges = []
+        for chunk in mine:
+            if encode(chunk["min"]) in ends:
+                continue
+            last = chunk
+            while encode(last["max"]) in starts:
+                last = starts[encode(last["max"])]
+            ranges.append((chunk["min"], last["max"]))
+        ownership[(ns, rs)] = OwnedRanges(sharded[ns]["key"], ranges)
+    return ownership
+
+
+async def read_cursor(conn: MongoConnection, db: str, cmd: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every document of a ``find``, following the cursor."""
+    reply = await conn.command(db, cmd)
+    cursor = reply["cursor"]
+    docs = list(cursor["firstBatch"])
+    while cursor["id"]:
+        reply = await conn.command(db, {"getMore": Int64(cursor["id"]), "collection": cmd["find"]})
+        cursor = reply["cursor"]
+        docs.extend(cursor["nextBatch"])
+    return docs
+
+
+async def oplog_position(conn: MongoConnection, newest: bool = True) -> Optional[Timestamp]:
+    """Timestamp of the newest (or oldest) oplog entry of a node; None when it has no oplog."""
+    try:
+        reply = await conn.command("local", {"find": "oplog.rs", "filter": {}, "sort": {"$natural": -1 if newest else 1},
+                                             "limit": 1, "projection": {"ts": 1}, "singleBatch": True,
+                                             "$readPreference": SECONDARY_PREFERRED})
+    except CommandError:
+        return None
+    batch = reply["cursor"]["firstBatch"]
+    return batch[0]["ts"] if batch else None
+
+
+class NodeThrottle:
+    """Limits how hard one source node is read: concurrent collections and bytes per second."""
+
+    def __init__(self, concurrency: int, bytes_per_sec: float = 0.0):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.rate = bytes_per_sec
+        self.allowance = bytes_per_sec
+        self.updated = time.monotonic()
+
+    async def consume(self, size: int):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate)
+        self.updated = now
+        self.allowance -= size
+        if self.allowance < 0:
+            await asyncio.sleep(-self.allowance / self.rate)
+
+
+@dataclass
+class BackupOptions:
+    chunk_size: int = 16 * MB
+    batch_size: int = 1000
+    node_concurrency: int = 2
+    node_rate: float = 0.0  # bytes per second per node, 0 = unthrottled
+    databases: List[str] = field(default_factory=list)
+    in_flight: int = 2  # chunks per collection being compressed or uploaded
+    timeout: float = 30.0
+
+
+class BackupEngine:
+    def __init__(self, target, codec: Codec, options: Optional[BackupOptions] = None,
+                 credentials: Optional[Credentials] = None, tls=None, workers: Optional[int] = None,
+                 progress=None):
+        self.target = target
+        self.codec = codec
+        self.options = options or BackupOptions()
+        self.credentials = credentials
+        self.tls = tls
+        self.workers = workers or min(8, os.cpu_count() or 2)
+        self.progress = progress or (lambda message: None)
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    async def run(self, cluster: str, sources: List[BackupSource], router: Optional[Node] = None) -> BackupManifest:
+        """Dump every source in parallel; with a ``router`` (mongos) the balancer is stopped meanwhile."""
+        if not sources:
+            raise BackupError("No reachable data-bearing node to back up")
+        started = datetime.datetime.now(datetime.timezone.utc)
+        manifest = BackupManifest(
+            id=f"backup-{started.strftime('%Y%m%dT%H%M%SZ')}",
+            cluster=cluster,
+            codec=self.codec.name,
+            chunk_size=self.options.chunk_size,
+            started_at=started.isoformat(),
+            shards={s.shard: {"source": s.address, "state": s.state, "lag_seconds": s.lag_seconds} for s in sources},
+        )
+        async with self.balancer_stopped(router):
+            ownership = await self.chunk_ownership(router) if router is not None else {}
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+                self._pool = pool
+                try:
+                    dumps = await asyncio.gather(*(self.dump_shard(source, manifest.shards[source.shard], ownership)
+                                                   for source in sources))
+                finally:
+                    self._pool = None
+        manifest.collections = [dump for shard in dumps for dump in shard]
+        manifest.finished_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        manifest.root = manifest.compute_root()
+        data = json.dumps(manifest.to_dict(), indent=2).encode()
+        await asyncio.get_running_loop().run_in_executor(None, self.target.put, manifest_key(manifest.id), data)
+        return manifest
+
+    async def connect(self, source) -> MongoConnection:
+        return await MongoConnection.open(source.host, source.port, self.options.timeout, self.tls, self.credentials)
+
+    @contextlib.asynccontextmanager
+    async def balancer_stopped(self, router: Optional[Node]) -> AsyncIterator[None]:
+        """Keep chunks where they are while the shards are dumped, so no document is read twice or missed."""
+        if router is None:
+            yield
+            return
+        conn = await self.connect(router)
+        try:
+            status = await conn.command("admin", {"balancerStatus": 1})
+            running = status.get("mode", "off") != "off"
+            if running:
+                # Returns once the current balancing round, and its migration, has finished
+                await conn.command("admin", {"balancerStop": 1, "maxTimeMS": int(self.options.timeout * 1000)})
+                self.progress(f"Balancer stopped on {router.address} for the backup")
+        except CommandError as e:
+            raise BackupError(f"Cannot stop the balancer on {router.address}: {e}")
+        finally:
+            await conn.close()
+        try:
+            yield
+        finally:
+            if running:
+                conn = await self.connect(router)
+                try:
+                    await conn.command("admin", {"balancerStart": 1})
+                    self.progress(f"Balancer restarted on {router.address}")
+                finally:
+                    await conn.close()
+
+    async def chunk_ownership(self, router: Node) -> Dict[Tuple[str, str], OwnedRanges]:
+        """Which replica set owns which chunks; read once the balancer is stopped, so it holds for the dump."""
+        conn = await self.connect(router)
+        try:
+            shards = (await conn.command("admin", {"listShards": 1}))["shards"]
+            collections = await read_cursor(conn, "config", {"find": "collections", "filter": {}})
+            chunks = await read_cursor(conn, "config", {"find": "chunks", "filter": {},
+                                                        "projection": {"ns": 1, "uuid": 1, "min": 1, "max": 1,
+                                                                       "shard": 1}})
+        except CommandError as e:
+            raise BackupError(f"Cannot read chunk ownership from {router.address}: {e}")
+        finally:
+            await conn.close()
+        return owned_ranges(collections, chunks, shards)
+
+    async def dump_shard(self, source: BackupSource, shard_info: Dict[str, Any],
+                         ownership: Dict[Tuple[str, str], OwnedRanges]) -> List[CollectionDump]:
+        conn = await self.connect(source)
+        try:
+            shard_info["oplog_start"] = await oplog_position(conn)
+            namespaces = await self.list_namespaces(conn)
+        finally:
+            await conn.close()
+        throttle = NodeThrottle(self.options.node_concurrency, self.options.node_rate)
+        self.progress(f"{source.shard}: {len(namespaces)} collections from {source.address} ({source.state})")
+        dumps = list(await asyncio.gather(*(self.dump_collection(source, throttle, db, info,
+                                                                 ownership.get((f"{db}.{info['name']}", source.shard)))
+                                            for db, info in namespaces)))
+        conn = await self.connect(source)
+        try:
+            shard_info["oplog_end"] = await oplog_position(conn)
+        finally:
+            await conn.close()
+        return dumps
+
+    async def list_namespaces(self, conn: MongoConnection) -> List[Tuple[str, Dict[str, Any]]]:
+        reply = await conn.command("admin", {"listDatabases": 1, "nameOnly": True,
+                                             "$readPreference": SECONDARY_PREFERRED})
+        names = [d["name"] for d in reply["databases"] if d["name"] not in SYSTEM_DATABASES]
+        if self.options.databases:
+            names = [n for n in names if n in self.options.databases]
+        namespaces = []
+        for db in names:
+            reply = await conn.command(db, {"listCollections": 1, "$readPreference": SECONDARY_PREFERRED})
+            for info in reply["cursor"]["firstBatch"]:
+                if info.get("type", "collection") == "collection" and not info["name"].startswith("system."):
+                    namespaces.append((db, info))
+        return namespaces
+
+    async def dump_collection(self, source: BackupSource, throttle: NodeThrottle, db: str, info: Dict[str, Any],
+                              owned: Optional[OwnedRanges] = None) -> CollectionDump:
+        """Dump one collection; with ``owned``, only the chunk ranges this replica set owns."""
+        name = info["name"]
+        dump = CollectionDump(f"{db}.{name}", source.shard, source.address, options=_jsonable(info.get("options", {})))
+        if owned is None:
+            scans = [{"hint": {"$natural": 1}}]
+        else:
+            dump.shard_key = _jsonable(owned.key)
+            scans = [{"hint": owned.key, "min": low, "max": high} for low, high in owned.ranges]
+        loop = asyncio.get_running_loop()
+        pending: List[asyncio.Future] = []
+        buffer = bytearray()
+        documents = 0
+
+        def flush():
+            nonlocal buffer, documents
+            pending.append(loop.run_in_executor(self._pool, self.store_chunk, bytes(buffer), documents))
+            buffer, documents = bytearray(), 0
+
+        async with throttle.slots:
+            conn = await self.connect(source)
+            try:
+                reply = await conn.command(db, {"listIndexes": name, "$readPreference": SECONDARY_PREFERRED})
+                dump.indexes = _jsonable(reply["cursor"]["firstBatch"])
+                for scan in scans:
+                    # Raw batches: documents go to the chunks byte for byte, whatever BSON types they hold
+                    reply = await conn.command(db, {"find": name, "filter": {}, **scan,
+                                                    "batchSize": self.options.batch_size,
+                                                    "$readPreference": SECONDARY_PREFERRED}, raw_batches=True)
+                    cursor = reply["cursor"]
+                    batch = cursor["firstBatch"]
+                    while True:
+                        size = 0
+                        for raw in batch:
+                            buffer += raw
+                            size += len(raw)
+                            documents += 1
+                            dump.documents += 1
+                            if len(buffer) >= self.options.chunk_size:
+                                flush()
+                                # Bound memory: wait for the oldest chunk before reading further
+                                while len(pending) - len(dump.chunks) > self.options.in_flight:
+                                    dump.chunks.append(await pending[len(dump.chunks)])
+                        dump.raw_bytes += size
+                        await throttle.consume(size)
+                        if not cursor["id"]:
+                            break
+                        reply = await conn.command(db, {"getMore": Int64(cursor["id"]), "collection": name,
+                                                        "batchSize": self.options.batch_size,
+                                                        "$readPreference": SECONDARY_PREFERRED}, raw_batches=True)
+                        cursor = reply["cursor"]
+                        batch = cursor["nextBatch"]
+            except (CommandError, BSONError) as e:
+                raise BackupError(f"Dumping {dump.ns} from {source.address} failed: {e}")
+            finally:
+                await conn.close()
+        if buffer:
+            flush()
+        for future in pending[len(dump.chunks):]:
+            dump.chunks.append(await future)
+        dump.stored_bytes = sum(c.size for c in dump.chunks)
+        self.progress(f"{source.shard}: {dump.ns} {dump.documents} documents in {len(dump.chunks)} chunks")
+        return dump
+
+    def store_chunk(self, raw: bytes, documents: int) -> ChunkRef:
+        data = self.codec.compress(raw)
+        digest = hashlib.sha256(data).hexdigest()
+        key = chunk_key(digest)
+        if self.target.size(key) != len(data):
+            self.target.put(key, data)
+        return ChunkRef(digest, len(data), len(raw), documents)
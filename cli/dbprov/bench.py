@@ -0,0 +1,729 @@
+"""YCSB-style load generator for provisioned clusters.
+
+A run loads ``record_count`` documents, then drives a read/update/insert/scan
+mix from many asyncio clients (optionally spread over several processes)
+against the primary of a replica set or every mongos of a sharded cluster.
+Latencies go into log-linear histograms with ~1% relative error, so p99.9
+stays accurate without keeping every sample, and histograms from several
+processes merge exactly.
+
+Against mongos the chunk map in ``config.chunks`` is read once and every
+operation is attributed to the shard owning its key (a scan counts towards
+the shard holding its first key), which gives the per-shard breakdown. This
+only works for range-sharding on ``_id``.
+"""
+
+import asyncio
+import bisect
+import concurrent.futures
+import datetime
+import json
+import math
+import multiprocessing
+import random
+import string
+import time
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dbprov.wire import CommandError, Credentials, MaxKey, MinKey, MongoConnection
+
+OPERATIONS = ("read", "update", "insert", "scan")
+DISTRIBUTIONS = ("uniform", "zipfian", "latest")
+PERCENTILES = (50, 95, 99, 99.9)
+ZIPFIAN_CONSTANT = 0.99
+LOAD_BATCH = 500
+
+# YCSB core workloads
+WORKLOADS: Dict[str, Dict[str, Any]] = {
+    "a": {"read": 0.5, "update": 0.5, "distribution": "zipfian"},
+    "b": {"read": 0.95, "update": 0.05, "distribution": "zipfian"},
+    "c": {"read": 1.0, "distribution": "zipfian"},
+    "d": {"read": 0.95, "insert": 0.05, "distribution": "latest"},
+    "e": {"scan": 0.95, "insert": 0.05, "distribution": "zipfian"},
+}
+
+_NETWORK_ERRORS = (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+class BenchError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Histograms
+# ---------------------------------------------------------------------------
+
+class Histogram:
+    """Log-linear histogram of microsecond latencies, HDR style.
+
+    Values below 128us get exact buckets; above that every power of two is
+    split into 64 buckets, bounding the relative error to 1/64.
+    """
+
+    SUB_BUCKET_BITS = 7
+    HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    @classmethod
+    def index(cls, value: int) -> int:
+        magnitude = max(0, value.bit_length() - cls.SUB_BUCKET_BITS)
+        return (magnitude << (cls.SUB_BUCKET_BITS - 1)) + (value >> magnitude)
+
+    @classmethod
+    def bucket_range(cls, index: int) -> Tuple[int, int]:
+        if index < 1 << cls.SUB_BUCKET_BITS:
+            return index, index
+        magnitude = (index >> (cls.SUB_BUCKET_BITS - 1)) - 1
+        low = (index - (magnitude << (cls.SUB_BUCKET_BITS - 1))) << magnitude
+        return low, low + (1 << magnitude) - 1
+
+    def record(self, value: int):
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_range(index)[1], self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "count": self.count,
+            "min_us": self.min or 0,
+            "mean_us": round(self.mean, 1),
+            "max_us": self.max,
+        }
+        for p in PERCENTILES:
+            data[f"p{p:g}_us".replace(".", "")] = self.percentile(p)
+        return data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.summary(), "total_us": self.total,
+                "buckets": {str(i): c for i, c in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Histogram":
+        hist = cls()
+        hist.counts = {int(i): c for i, c in data.get("buckets", {}).items()}
+        hist.count = data.get("count", 0)
+        hist.total = data.get("total_us", 0)
+        hist.min = data.get("min_us") if hist.count else None
+        hist.max = data.get("max_us", 0)
+        return hist
+
+
+# ---------------------------------------------------------------------------
+# Key choice
+# ---------------------------------------------------------------------------
+
+def key_name(number: int) -> str:
+    return f"user{number:012d}"
+
+
+def fnv1a_64(value: int) -> int:
+    h = 0xCBF29CE484222325
+    for _ in range(8):
+        h ^= value & 0xFF
+        h = (h * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+        value >>= 8
+    return h
+
+
+class ZipfianGenerator:
+    """Gray et al. zipfian over ``[0, items)``; item 0 is the most popular.
+
+    ``grow`` extends the item count incrementally, which the "latest"
+    distribution needs as inserts add keys.
+    """
+
+    def __init__(self, items: int, theta: float = ZIPFIAN_CONSTANT, rng: Optional[random.Random] = None):
+        self.theta = theta
+        self.rng = rng or random.Random()
+        self.alpha = 1 / (1 - theta)
+        self.zeta2 = 1 + 0.5 ** theta
+        self.items = 0
+        self.zetan = 0.0
+        self.eta = 0.0
+        self.grow(items)
+
+    def grow(self, items: int):
+        for i in range(self.items + 1, items + 1):
+            self.zetan += 1 / i ** self.theta
+        self.items = items
+        if items > 1:
+            self.eta = (1 - (2 / items) ** (1 - self.theta)) / (1 - self.zeta2 / self.zetan)
+
+    def next(self) -> int:
+        if self.items < 2:
+            return 0
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < self.zeta2:
+            return 1
+        return min(self.items - 1, int(self.items * (self.eta * u - self.eta + 1) ** self.alpha))
+
+
+class KeyChooser:
+    def __init__(self, distribution: str, records: int, rng: random.Random):
+        if distribution not in DISTRIBUTIONS:
+            raise BenchError(f"Unknown key distribution {distribution!r}")
+        self.distribution = distribution
+        self.records = records
+        self.rng = rng
+        self.zipfian = ZipfianGenerator(records, rng=rng) if distribution != "uniform" else None
+
+    def grow(self, records: int):
+        self.records = records
+        if self.distribution == "latest" and self.zipfian is not None:
+            self.zipfian.grow(records)
+
+    def next(self) -> int:
+        if self.zipfian is None:
+            return self.rng.randrange(self.records)
+        rank = self.zipfian.next()
+        if self.distribution == "latest":
+            return self.records - 1 - rank
+        # Scramble so the popular keys are spread over the key space (and shards)
+        return fnv1a_64(rank) % self.records
+
+
+# ---------------------------------------------------------------------------
+# Shard map
+# ---------------------------------------------------------------------------
+
+def _sortable(value: Any) -> Tuple[int, Any]:
+    if value is MinKey or getattr(value, "name", None) == "MinKey":
+        return (0, "")
+    if value is MaxKey or getattr(value, "name", None) == "MaxKey":
+        return (2, "")
+    return (1, value)
+
+
+class ShardMap:
+    """Chunk lower bounds on ``_id`` mapped to the owning shard."""
+
+    def __init__(self, chunks: Sequence[Tuple[Any, str]]):
+        ordered = sorted(((_sortable(low), shard) for low, shard in chunks), key=lambda c: c[0])
+        self.bounds = [low for low, _ in ordered]
+        self.shards = [shard for _, shard in ordered]
+
+    def __bool__(self) -> bool:
+        return bool(self.bounds)
+
+    def shard_for(self, key: Any) -> str:
+        index = bisect.bisect_right(self.bounds, (1, key)) - 1
+        return self.shards[index] if index >= 0 else "unknown"
+
+
+async def discover_chunks(conn: MongoConnection, database: str, collection: str) -> Tuple[List[Tuple[Any, str]], Optional[str]]:
+    """Read the chunk map of a sharded collection; returns (chunks, reason it is unavailable)."""
+    ns = f"{database}.{collection}"
+    reply = await conn.command("config", {"find": "collections", "filter": {"_id": ns}, "limit": 1, "singleBatch": True})
+    docs = reply["cursor"]["firstBatch"]
+    if not docs or docs[0].get("dropped"):
+        return [], f"{ns} is not sharded"
+    key = docs[0].get("key", {})
+    if list(key.items()) != [("_id", 1)]:
+        return [], f"per-shard breakdown needs range sharding on _id, {ns} is sharded on {dict(key)}"
+    query = {"uuid": docs[0]["uuid"]} if "uuid" in docs[0] else {"ns": ns}
+    reply = await conn.command("config", {"find": "chunks", "filter": query, "batchSize": 0x7FFFFFFF,
+                                          "singleBatch": True})
+    return [(chunk["min"]["_id"], chunk["shard"]) for chunk in reply["cursor"]["firstBatch"]], None
+
+
+# ---------------------------------------------------------------------------
+# Configuration and results
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BenchConfig:
+    hosts: List[Tuple[str, int]]
+    read: float = 0.95
+    update: float = 0.05
+    insert: float = 0.0
+    scan: float = 0.0
+    distribution: str = "zipfian"
+    record_count: int = 10000
+    operations: int = 0
+    duration: float = 30.0
+    clients: int = 16
+    processes: int = 1
+    document_size: int = 1000
+    field_count: int = 10
+    max_scan_length: int = 100
+    database: str = "dbprovision_bench"
+    collection: str = "usertable"
+    load: bool = True
+    timeout: float = 10.0
+    tls: bool = False
+    credentials: Optional[Credentials] = None
+    label: Optional[str] = None
+    seed: Optional[int] = None
+    chunks: List[Tuple[Any, str]] = field(default_factory=list)
+
+    def mix(self) -> Dict[str, float]:
+        return {op: getattr(self, op) for op in OPERATIONS}
+
+    def validate(self):
+        errors = []
+        if not self.hosts:
+            errors.append("no target hosts")
+        if any(ratio < 0 for ratio in self.mix().values()) or sum(self.mix().values()) <= 0:
+            errors.append("operation ratios must be non-negative and not all zero")
+        if self.distribution not in DISTRIBUTIONS:
+            errors.append(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        if self.record_count < 1:
+            errors.append("record count must be at least 1")
+        if self.clients < 1 or self.processes < 1 or self.clients < self.processes:
+            errors.append("need at least one client per process")
+        if self.operations <= 0 and self.duration <= 0:
+            errors.append("set a positive operation count or duration")
+        if self.field_count < 1 or self.document_size < self.field_count:
+            errors.append("document size must be at least one byte per field")
+        if errors:
+            raise BenchError("; ".join(errors))
+
+    def public(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("credentials")
+        data.pop("chunks")
+        data["hosts"] = [f"{h}:{p}" for h, p in self.hosts]
+        return data
+
+
+@dataclass
+class BenchResult:
+    config: Dict[str, Any]
+    target: str
+    started_at: str
+    duration: float
+    operations: Dict[str, Histogram]
+    errors: Dict[str, int]
+    shards: Dict[str, Dict[str, Histogram]]
+    load_duration: Optional[float] = None
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def total_ops(self) -> int:
+        return sum(h.count for h in self.operations.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.total_ops / self.duration if self.duration else 0.0
+
+    def overall(self) -> Histogram:
+        total = Histogram()
+        for hist in self.operations.values():
+            total.merge(hist)
+        return total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "label": self.config.get("label"),
+            "config": self.config,
+            "target": self.target,
+            "started_at": self.started_at,
+            "duration_s": round(self.duration, 3),
+            "load_duration_s": round(self.load_duration, 3) if self.load_duration is not None else None,
+            "total_ops": self.total_ops,
+            "throughput_ops": round(self.throughput, 1),
+            "overall": self.overall().summary(),
+            "operations": {op: h.to_dict() for op, h in self.operations.items()},
+            "errors": self.errors,
+            "shards": {shard: {op: h.to_dict() for op, h in ops.items()} for shard, ops in self.shards.items()},
+            "notes": self.notes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BenchResult":
+        return cls(
+            config=data["config"],
+            target=data.get("target", ""),
+            started_at=data.get("started_at", ""),
+            duration=data["duration_s"],
+            operations={op: Histogram.from_dict(h) for op, h in data["operations"].items()},
+            errors=data.get("errors", {}),
+            shards={s: {op: Histogram.from_dict(h) for op, h in ops.items()} for s, ops in data.get("shards", {}).items()},
+            load_duration=data.get("load_duration_s"),
+            notes=data.get("notes", []),
+        )
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format(self) -> str:
+        header = f"{'Operation':<10} {'Ops':>9} {'Errors':>7} {'Ops/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'p99.9':>9} {'Max':>9}"
+        lines = [f"Target: {self.target}", header]
+
+        def row(name: str, hist: Histogram, errors: int) -> str:
+            rate = hist.count / self.duration if self.duration else 0.0
+            cells = " ".join(f"{_ms(hist.percentile(p)):>9}" for p in PERCENTILES)
+            return f"{name:<10} {hist.count:>9} {errors:>7} {rate:>9.0f} {cells} {_ms(hist.max):>9}"
+
+        for op, hist in self.operations.items():
+            lines.append(row(op, hist, self.errors.get(op, 0)))
+        lines.append(row("TOTAL", self.overall(), sum(self.errors.values())))
+        for shard, ops in sorted(self.shards.items()):
+            total = Histogram()
+            for hist in ops.values():
+                total.merge(hist)
+            lines.append(row(f"  {shard}"[:10], total, 0))
+        load = f", load {self.load_duration:.1f}s" if self.load_duration is not None else ""
+        lines.append(f"\n{self.total_ops} operations in {self.duration:.1f}s: {self.throughput:.0f} ops/s{load}")
+        lines.extend(f"Note: {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def _ms(us: float) -> str:
+    return f"{us / 1000:.2f}ms"
+
+
+def check_targets(result: BenchResult, p99_ms: Optional[float] = None,
+                  throughput: Optional[float] = None) -> List[str]:
+    failures = []
+    if p99_ms is not None:
+        p99 = result.overall().percentile(99) / 1000
+        if p99 > p99_ms:
+            failures.append(f"p99 latency {p99:.2f}ms exceeds target {p99_ms:g}ms")
+    if throughput is not None and result.throughput < throughput:
+        failures.append(f"throughput {result.throughput:.0f} ops/s below target {throughput:g} ops/s")
+    total_errors = sum(result.errors.values())
+    if total_errors:
+        failures.append(f"{total_errors} operations failed")
+    return failures
+
+
+def compare(results: Sequence[BenchResult]) -> str:
+    """Side-by-side summary of several runs, e.g. one per tuning profile."""
+    names = [r.config.get("label") or r.started_at for r in results]
+    width = max(12, *(len(n) for n in names))
+    lines = [f"{'':<16}" + "".join(f"{n:>{width + 2}}" for n in names)]
+
+    def metric(title: str, values: List[float], fmt: str):
+        cells = []
+        for i, value in enumerate(values):
+            text = format(value, fmt)
+            if i and values[0]:
+                delta = (value - values[0]) / values[0] * 100
+                text += f" ({delta:+.0f}%)"
+            cells.append(f"{text:>{width + 2}}")
+        lines.append(f"{title:<16}" + "".join(cells))
+
+    metric("ops/s", [r.throughput for r in results], ".0f")
+    ops = [op for op in OPERATIONS if any(op in r.operations for r in results)]
+    for op in ops:
+        for p in (50, 99, 99.9):
+            values = [r.operations[op].percentile(p) / 1000 if op in r.operations else 0.0 for r in results]
+            metric(f"{op} p{p:g} ms", values, ".2f")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Running
+# ---------------------------------------------------------------------------
+
+class _Worker:
+    """Clients of one process; they share key choice and statistics."""
+
+    def __init__(self, config: BenchConfig, index: int):
+        self.config = config
+        self.index = index
+        self.rng = random.Random(None if config.seed is None else config.seed + index)
+        self.keys = KeyChooser(config.distribution, config.record_count, self.rng)
+        self.shard_map = ShardMap(config.chunks)
+        self.inserted = 0
+        self.issued = 0
+        share, extra = divmod(config.operations, config.processes)
+        self.budget = share + (1 if index < extra else 0)
+        self.field_size = max(1, config.document_size // config.field_count)
+        pool_size = max(1 << 16, self.field_size * 2)
+        self.payload = "".join(self.rng.choices(string.ascii_letters + string.digits, k=pool_size))
+        mix = config.mix()
+        total = sum(mix.values())
+        self.cumulative: List[Tuple[float, str]] = []
+        acc = 0.0
+        for op in OPERATIONS:
+            if mix[op] > 0:
+                acc += mix[op] / total
+                self.cumulative.append((acc, op))
+        self.operations = {op: Histogram() for _, op in self.cumulative}
+        self.errors = {op: 0 for _, op in self.cumulative}
+        self.shards: Dict[str, Dict[str, Histogram]] = {}
+
+    def value(self) -> str:
+        offset = self.rng.randrange(len(self.payload) - self.field_size)
+        return self.payload[offset:offset + self.field_size]
+
+    def choose(self) -> str:
+        u = self.rng.random()
+        for threshold, op in self.cumulative:
+            if u < threshold:
+                return op
+        return self.cumulative[-1][1]
+
+    def build(self, op: str) -> Tuple[Dict[str, Any], str]:
+        coll = self.config.collection
+        if op == "insert":
+            # Interleave new key numbers across processes so they never collide
+            number = self.config.record_count + self.inserted * self.config.processes + self.index
+            self.inserted += 1
+            key = key_name(number)
+            doc = {"_id": key, **{f"field{i}": self.value() for i in range(self.config.field_count)}}
+            return {"insert": coll, "documents": [doc], "ordered": True}, key
+        key = key_name(self.keys.next())
+        if op == "read":
+            return {"find": coll, "filter": {"_id": key}, "limit": 1, "singleBatch": True}, key
+        if op == "update":
+            field_name = f"field{self.rng.randrange(self.config.field_count)}"
+            return {"update": coll, "updates": [{"q": {"_id": key}, "u": {"$set": {field_name: self.value()}}}]}, key
+        length = self.rng.randint(1, self.config.max_scan_length)
+        return {"find": coll, "filter": {"_id": {"$gte": key}}, "sort": {"_id": 1},
+                "limit": length, "batchSize": length, "singleBatch": True}, key
+
+    def done(self, deadline: float) -> bool:
+        if self.config.operations > 0:
+            return self.issued >= self.budget
+        return time.monotonic() >= deadline
+
+    async def connect(self, slot: int) -> MongoConnection:
+        host, port = self.config.hosts[slot % len(self.config.hosts)]
+        return await MongoConnection.open(host, port, self.config.timeout,
+                                          _tls(self.config.tls), self.config.credentials)
+
+    async def client(self, slot: int, deadline: float):
+        conn = await self.connect(slot)
+        try:
+            while not self.done(deadline):
+                self.issued += 1
+                op = self.choose()
+                cmd, key = self.build(op)
+                started = time.perf_counter_ns()
+                try:
+                    reply = await asyncio.wait_for(conn.command(self.config.database, cmd, check=False),
+                                                   self.config.timeout)
+                    ok = bool(reply.get("ok")) and not reply.get("writeErrors")
+                except _NETWORK_ERRORS:
+                    ok = False
+                    await conn.close()
+                    conn = await self.connect(slot)
+                elapsed = (time.perf_counter_ns() - started) // 1000
+                if not ok:
+                    self.errors[op] += 1
+                    continue
+                self.operations[op].record(elapsed)
+                if self.shard_map:
+                    shard = self.shard_map.shard_for(key)
+                    self.shards.setdefault(shard, {}).setdefault(op, Histogram()).record(elapsed)
+                if op == "insert" and self.config.distribution == "latest":
+                    self.keys.grow(self.keys.records + 1)
+        finally:
+            await conn.close()
+
+    async def run(self) -> Dict[str, Any]:
+        share, extra = divmod(self.config.clients, self.config.processes)
+        count = share + (1 if self.index < extra else 0)
+        deadline = time.monotonic() + self.config.duration
+        started = time.monotonic()
+        # Offset slots per process so clients spread evenly over several mongos
+        await asyncio.gather(*(self.client(self.index * share + i, deadline) for i in range(count)))
+        return {
+            "duration": time.monotonic() - started,
+            "operations": {op: h.to_dict() for op, h in self.operations.items()},
+            "errors": self.errors,
+            "shards": {s: {op: h.to_dict() for op, h in ops.items()} for s, ops in self.shards.items()},
+        }
+
+
+def _tls(enabled: bool):
+    if not enabled:
+        return None
+    import ssl
+    return ssl.create_default_context()
+
+
+def _process_main(config: BenchConfig, index: int) -> Dict[str, Any]:
+    return asyncio.run(_Worker(config, index).run())
+
+
+async def resolve_target(config: BenchConfig) -> Tuple[List[Tuple[str, int]], str]:
+    """Keep only the hosts that take writes: every mongos, or the replica set primary."""
+    mongos, primaries, errors = [], [], []
+    for host, port in config.hosts:
+        try:
+            conn = await MongoConnection.open(host, port, config.timeout, _tls(config.tls), config.credentials)
+        except _NETWORK_ERRORS + (CommandError,) as e:
+            errors.append(f"{host}:{port}: {e or type(e).__name__}")
+            continue
+        try:
+            hello = await conn.command("admin", {"hello": 1})
+        finally:
+            await conn.close()
+        if hello.get("msg") == "isdbgrid":
+            mongos.append((host, port))
+        elif hello.get("isWritablePrimary"):
+            primaries.append((host, port))
+    if mongos:
+        return mongos, f"sharded cluster via {len(mongos)} mongos"
+    if primaries:
+        return primaries[:1], f"primary {primaries[0][0]}:{primaries[0][1]}"
+    detail = f" ({'; '.join(errors)})" if errors else ""
+    raise BenchError(f"No mongos or writable primary among {len(config.hosts)} host(s){detail}")
+
+
+async def load_data(config: BenchConfig) -> float:
+    """Drop the bench collection and insert ``record_count`` documents."""
+    started = time.monotonic()
+    conns = [await MongoConnection.open(h, p, config.timeout, _tls(config.tls), config.credentials)
+             for h, p in (config.hosts * config.clients)[:max(1, min(config.clients, 16))]]
+    worker = _Worker(replace(config, processes=1), 0)
+    try:
+        try:
+            await conns[0].command(config.database, {"drop": config.collection})
+        except CommandError as e:
+            if e.code != 26:  # NamespaceNotFound
+                raise
+        batches = [range(start, min(start + LOAD_BATCH, config.record_count))
+                   for start in range(0, config.record_count, LOAD_BATCH)]
+        queue: asyncio.Queue = asyncio.Queue()
+        for batch in batches:
+            queue.put_nowait(batch)
+
+        async def loader(conn: MongoConnection):
+            while not queue.empty():
+                batch = queue.get_nowait()
+                docs = [{"_id": key_name(n), **{f"field{i}": worker.value() for i in range(config.field_count)}}
+                        for n in batch]
+                reply = await conn.command(config.database, {"insert": config.collection, "ordered": False},
+                                           sequences={"documents": docs})
+                if reply.get("writeErrors"):
+                    raise BenchError(f"Loading failed: {reply['writeErrors'][0].get('errmsg')}")
+
+        await asyncio.gather(*(loader(c) for c in conns))
+    finally:
+        await asyncio.gather(*(c.close() for c in conns))
+    return time.monotonic() - started
+
+
+async def run_benchmark_async(config: BenchConfig) -> BenchResult:
+    config.validate()
+    hosts, target = await resolve_target(config)
+    config = replace(config, hosts=hosts)
+    notes: List[str] = []
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    load_duration = await load_data(config) if config.load else None
+
+    if "mongos" in target and not config.chunks:
+        conn = await MongoConnection.open(*hosts[0], config.timeout, _tls(config.tls), config.credentials)
+        try:
+            chunks, reason = await discover_chunks(conn, config.database, config.collection)
+        finally:
+            await conn.close()
+        config = replace(config, chunks=chunks)
+        if reason:
+            notes.append(reason)
+
+    if config.processes == 1:
+        parts = [await _Worker(config, 0).run()]
+    else:
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(config.processes, mp_context=context) as pool:
+            parts = await asyncio.gather(*(loop.run_in_executor(pool, _process_main, config, i)
+                                           for i in range(config.processes)))
+
+    operations: Dict[str, Histogram] = {}
+    errors: Dict[str, int] = {}
+    shards: Dict[str, Dict[str, Histogram]] = {}
+    for part in parts:
+        for op, data in part["operations"].items():
+            operations.setdefault(op, Histogram()).merge(Histogram.from_dict(data))
+        for op, count in part["errors"].items():
+            errors[op] = errors.get(op, 0) + count
+        for shard, ops in part["shards"].items():
+            for op, data in ops.items():
+                shards.setdefault(shard, {}).setdefault(op, Histogram()).merge(Histogram.from_dict(data))
+
+    return BenchResult(
+        config=config.public(),
+        target=target,
+        started_at=started_at,
+        duration=max(part["duration"] for part in parts),
+        operations=operations,
+        errors=errors,
+        shards=shards,
+        load_duration=load_duration,
+        notes=notes,
+    )
+
+
+def run_benchmark(config: BenchConfig) -> BenchResult:
+    return asyncio.run(run_benchmark_async(config))
+
+
+# ---------------------------------------------------------------------------
+# Stand-in cluster for CI
+# ---------------------------------------------------------------------------
+
+async def start_stand_in(shards: int = 0, record_count: int = 10000, database: str = "dbprovision_bench",
+                         collection: str = "usertable"):
+    """Start an in-process fake primary (or mongos with a chunk map over ``shards`` shards).
+
+    Returns the servers, to stop them afterwards, and the target address.
+    """
+    from dbprov.testing.fakemongo import FakeMongoServer, FakeReplicaSet, enable_crud
+
+    if shards:
+        server = FakeMongoServer(role="mongos")
+        store = enable_crud(server)
+        ns = f"{database}.{collection}"
+        store.collection("config", "collections").insert({"_id": ns, "key": {"_id": 1}, "unique": False})
+        chunks = store.collection("config", "chunks")
+        step = math.ceil(record_count / shards)
+        for i in range(shards):
+            low = MinKey if i == 0 else key_name(i * step)
+            high = MaxKey if i == shards - 1 else key_name((i + 1) * step)
+            chunks.insert({"_id": f"{ns}-{i}", "ns": ns, "min": {"_id": low}, "max": {"_id": high},
+                           "shard": f"shard{i + 1}"})
+    else:
+        server = FakeMongoServer(replica_set=FakeReplicaSet("bench"))
+        enable_crud(server)
+    await server.start()
+    return [server], (server.host, server.port)
@@ -0,0 +1,255 @@
+"""Sizes a cluster from workload targets.
+
+The planner picks the cheapest layout (shard count x machine type) whose
+WiredTiger cache holds each shard's slice of the working set and whose vCPUs
+cover its share of peak ops/s, both with ``headroom`` to spare. The oplog is
+sized to hold ``oplog_window_hours`` of each shard's write volume.
+
+Rules of thumb used here, all overridable through ``WorkloadTarget``:
+
+* WiredTiger's default cache is ``max(256MB, 50% of (RAM - 1GB))``; we keep
+  that ratio and write the value out explicitly.
+* A vCPU serves ``ops_per_vcpu`` (4000) simple indexed operations per second
+  when the working set is cached.
+* Disks are sized to stay below 80% full with data and oplog.
+* Among layouts within 15% of the cheapest, the one with fewest shards wins.
+"""
+
+import math
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+MIN_OPLOG_MB = 990
+MAX_SHARDS = 10  # infra/terraform variables.tf validation
+MAX_MONGOS = 5
+DISK_FILL_RATIO = 0.8
+SHARD_COST_TOLERANCE = 0.15
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*((?:[kmgtp]i?)?b?)\s*(?:/s)?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "b": 1, "k": 1024, "m": MB, "g": GB, "t": 1024 ** 4, "p": 1024 ** 5}
+
+
+class CapacityError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class MachineType:
+    name: str
+    vcpus: int
+    memory_gb: float
+    hourly_cost: float  # rough on-demand USD, only used to rank candidates
+
+    @property
+    def cache_gb(self) -> float:
+        return wiredtiger_cache_gb(self.memory_gb)
+
+
+MACHINE_TYPES: Tuple[MachineType, ...] = (
+    MachineType("e2-medium", 2, 4, 0.04),
+    MachineType("e2-standard-2", 2, 8, 0.09),
+    MachineType("e2-standard-4", 4, 16, 0.17),
+    MachineType("e2-highmem-2", 2, 16, 0.12),
+    MachineType("e2-standard-8", 8, 32, 0.34),
+    MachineType("e2-highmem-4", 4, 32, 0.23),
+    MachineType("e2-standard-16", 16, 64, 0.69),
+    MachineType("e2-highmem-8", 8, 64, 0.46),
+    MachineType("e2-standard-32", 32, 128, 1.38),
+    MachineType("e2-highmem-16", 16, 128, 0.93),
+    MachineType("n2-highmem-32", 32, 256, 2.14),
+    MachineType("n2-highmem-64", 64, 512, 4.28),
+)
+
+CONFIG_SERVER_TYPE = "e2-medium"
+MONGOS_TYPE = "e2-standard-4"
+
+
+def parse_size(value: str) -> int:
+    """Parse ``"200GB"``, ``"1.5TiB"``, ``"512M"`` or ``"5MB/s"`` into bytes."""
+    match = _SIZE.match(str(value))
+    if not match:
+        raise CapacityError(f"Invalid size: {value!r} (expected e.g. 200GB or 5MB/s)")
+    number, unit = float(match.group(1)), match.group(2).lower()
+    return int(number * _UNITS[unit[:1]])
+
+
+def wiredtiger_cache_gb(memory_gb: float) -> float:
+    # Round down to a quarter GB so the rendered value is a clean number
+    return max(0.25, math.floor((memory_gb - 1) * 0.5 * 4) / 4)
+
+
+@dataclass
+class WorkloadTarget:
+    working_set_bytes: int
+    write_bytes_per_sec: int = 0
+    oplog_window_hours: float = 24.0
+    peak_ops: int = 0
+    data_size_bytes: Optional[int] = None
+    cluster_type: Optional[str] = None  # "replicaset", "sharded" or None to choose
+    replica_nodes: int = 3
+    headroom: float = 0.3
+    ops_per_vcpu: int = 4000
+    max_shards: int = MAX_SHARDS
+
+
+@dataclass
+class CapacityPlan:
+    cluster_type: str
+    shard_count: int
+    replica_nodes: int
+    instance_type: str
+    vcpus: int
+    memory_gb: float
+    cache_size_gb: float
+    required_cache_gb: float
+    oplog_size_mb: int
+    disk_size_gb: int
+    config_servers: int
+    mongos_count: int
+    hourly_cost: float
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def cache_size(self) -> str:
+        return f"{self.cache_size_gb:g}GB"
+
+    @property
+    def oplog_size(self) -> str:
+        return f"{self.oplog_size_mb}MB"
+
+    def terraform_vars(self) -> Dict[str, Any]:
+        values: Dict[str, Any] = {
+            "cluster_type": self.cluster_type,
+            "replica_nodes": self.replica_nodes,
+            "instance_type": self.instance_type,
+            "disk_size": self.disk_size_gb,
+        }
+        if self.cluster_type == "sharded":
+            values.update({
+                "shard_count": self.shard_count,
+                "config_servers": self.config_servers,
+                "mongos_count": self.mongos_count,
+            })
+        return values
+
+    def ansible_vars(self) -> Dict[str, Any]:
+        return {"cache_size": self.cache_size, "oplog_size": self.oplog_size}
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["terraform_vars"] = self.terraform_vars()
+        data["ansible_vars"] = self.ansible_vars()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CapacityPlan":
+        fields = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+    def format(self) -> str:
+        layout = (f"{self.shard_count} shards x {self.replica_nodes} nodes"
+                  if self.cluster_type == "sharded" else f"{self.replica_nodes} nodes")
+        lines = [
+            f"Capacity plan: {self.cluster_type}, {layout}",
+            f"  Instance type     {self.instance_type} ({self.vcpus} vCPU, {self.memory_gb:g} GB)",
+            f"  WiredTiger cache  {self.cache_size} per node (working set needs {self.required_cache_gb:.1f}GB)",
+            f"  Oplog             {self.oplog_size} per replica set",
+            f"  Disk              {self.disk_size_gb}GB per node",
+        ]
+        if self.cluster_type == "sharded":
+            lines.append(f"  Config servers    {self.config_servers} x {CONFIG_SERVER_TYPE}")
+            lines.append(f"  Mongos            {self.mongos_count} x {MONGOS_TYPE}")
+        lines.append(f"  Est. cost         ${self.hourly_cost:.2f}/hour")
+        lines.extend(f"  Note: {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def _machine(name: str) -> MachineType:
+    return next(m for m in MACHINE_TYPES if m.name == name)
+
+
+def plan_capacity(target: WorkloadTarget,
+                  machine_types: Tuple[MachineType, ...] = MACHINE_TYPES) -> CapacityPlan:
+    if target.working_set_bytes <= 0:
+        raise CapacityError("Working set size must be positive")
+    if target.replica_nodes < 1:
+        raise CapacityError("Replica nodes must be at least 1")
+    if not 1 <= target.max_shards <= MAX_SHARDS:
+        raise CapacityError(f"Max shards must be between 1 and {MAX_SHARDS}")
+    if target.cluster_type not in (None, "replicaset", "sharded"):
+        raise CapacityError(f"Cannot plan capacity for a {target.cluster_type} cluster")
+
+    factor = 1 + target.headroom
+    by_cost = sorted(machine_types, key=lambda m: (m.hourly_cost, m.memory_gb))
+    # (shard count, sharded) layouts to price; one shard means a plain replica set
+    layouts = [(1, False)] if target.cluster_type != "sharded" else []
+    if target.cluster_type != "replicaset":
+        first = 1 if target.cluster_type == "sharded" else 2
+        layouts += [(n, True) for n in range(first, target.max_shards + 1)]
+
+    candidates: List[Tuple[float, int, str, MachineType, int]] = []
+    for shards, sharded in layouts:
+        cache_needed = target.working_set_bytes / shards * factor / GB
+        ops_needed = target.peak_ops / shards * factor
+        machine = next((m for m in by_cost if m.cache_gb >= cache_needed
+                        and m.vcpus * target.ops_per_vcpu >= ops_needed), None)
+        if machine is None:
+            continue
+        cost = machine.hourly_cost * shards * target.replica_nodes
+        mongos = 0
+        if sharded:
+            router = _machine(MONGOS_TYPE)
+            mongos = max(2, math.ceil(target.peak_ops * factor / (router.vcpus * target.ops_per_vcpu)))
+            cost += 3 * _machine(CONFIG_SERVER_TYPE).hourly_cost + min(mongos, MAX_MONGOS) * router.hourly_cost
+        candidates.append((cost, shards, "sharded" if sharded else "replicaset", machine, mongos))
+
+    if not candidates:
+        largest = max(machine_types, key=lambda m: m.memory_gb)
+        hint = "" if target.cluster_type != "replicaset" else "; try a sharded cluster"
+        raise CapacityError(
+            f"No layout of up to {target.max_shards} shards fits: each shard would need more than "
+            f"{largest.cache_gb:g}GB of cache ({largest.name}) or {largest.vcpus} vCPUs{hint}"
+        )
+
+    # Every shard is another replica set to operate, so only add shards for a real saving
+    cheapest = min(c[0] for c in candidates)
+    cost, shards, cluster_type, machine, mongos = min(
+        (c for c in candidates if c[0] <= cheapest * (1 + SHARD_COST_TOLERANCE)), key=lambda c: c[1])
+    notes: List[str] = []
+    if mongos > MAX_MONGOS:
+        notes.append(f"peak load calls for {mongos} mongos but terraform allows {MAX_MONGOS}; "
+                     f"use a larger router machine type")
+        mongos = MAX_MONGOS
+
+    oplog_bytes = target.write_bytes_per_sec / shards * target.oplog_window_hours * 3600 * factor
+    oplog_mb = max(MIN_OPLOG_MB, math.ceil(oplog_bytes / MB))
+    if oplog_mb == MIN_OPLOG_MB and target.write_bytes_per_sec:
+        notes.append(f"oplog set to the {MIN_OPLOG_MB}MB minimum")
+
+    data_bytes = (target.data_size_bytes or target.working_set_bytes) / shards * factor
+    disk_gb = max(10, math.ceil((data_bytes + oplog_mb * MB) / DISK_FILL_RATIO / GB))
+
+    cache_needed = target.working_set_bytes / shards * factor / GB
+    if target.replica_nodes % 2 == 0:
+        notes.append("even number of replica nodes; prefer an odd count for elections")
+
+    return CapacityPlan(
+        cluster_type=cluster_type,
+        shard_count=shards,
+        replica_nodes=target.replica_nodes,
+        instance_type=machine.name,
+        vcpus=machine.vcpus,
+        memory_gb=machine.memory_gb,
+        cache_size_gb=machine.cache_gb,
+        required_cache_gb=round(cache_needed, 2),
+        oplog_size_mb=oplog_mb,
+        disk_size_gb=disk_gb,
+        config_servers=3 if cluster_type == "sharded" else 0,
+        mongos_count=mongos,
+        hourly_cost=round(cost, 2),
+        notes=notes,
+    )
@@ -0,0 +1,445 @@
+"""Connection strings from the real topology of a provisioned cluster.
+
+Terraform outputs are read once and the parsed topology cached under
+``~/.dbprovision/discovery/<cluster>.json``, keyed by the size and mtime of
+the local ``terraform.tfstate`` (or, with a remote backend, valid for
+``max_age`` seconds). Every mongos and replica set member is then probed
+concurrently, and the measured hello round trips drive the options of the
+connection strings handed to applications:
+
+* ``localThresholdMS`` is wide enough to spread load over the routers (or
+  members) in the nearest zone, and no wider, since drivers pick among
+  servers within that window of the fastest one.
+* ``maxPoolSize`` splits the connections the busiest server still accepts
+  over the expected number of application instances, keeping 20% in
+  reserve: every instance keeps a pool to every server it is given.
+* Read-mostly profiles read from the nearest member with a staleness bound.
+
+Latency is measured from the host running the command, which stands in for
+the application when both live in the same VPC. With ``srv_domain`` the SRV
+and TXT records for a ``mongodb+srv://`` seed list are printed as well; the
+command does not create them.
+"""
+
+import asyncio
+import json
+import math
+import re
+import statistics
+import time
+import urllib.parse
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dbprov.health import DEFAULT_PORTS, ClusterHealth, HealthProber, Node, NodeHealth
+
+# Terraform outputs of infra/terraform/mongodb-cluster.tf, by role
+OUTPUTS = {"mongos": "mongo_routers", "mongod": "shard_servers", "config": "config_servers"}
+SHARD_MEMBERS = 3  # shard_servers instance_count = shard_count * 3
+DEFAULT_THRESHOLD_MS = 15  # the drivers' default localThresholdMS
+MAX_POOL_SIZE = 100  # the drivers' default maxPoolSize
+POOL_RESERVE = 0.2
+SRV_TTL = 60
+
+
+class DiscoveryError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    role: str
+    port: int
+    internal_ip: Optional[str] = None
+    external_ip: Optional[str] = None
+    zone: Optional[str] = None
+    replica_set: Optional[str] = None
+
+    def host(self, external: bool = False) -> str:
+        host = self.external_ip if external else self.internal_ip
+        return host or self.internal_ip or self.external_ip or self.name
+
+    def node(self, external: bool = False) -> Node:
+        return Node(self.host(external), self.port, self.role, self.replica_set, self.name)
+
+
+@dataclass
+class Topology:
+    cluster: str
+    endpoints: List[Endpoint]
+    source: str  # terraform, inventory or hosts
+    fingerprint: Optional[str] = None
+    discovered_at: float = field(default_factory=time.time)
+
+    @property
+    def sharded(self) -> bool:
+        return any(e.role == "mongos" for e in self.endpoints)
+
+    def by_role(self, role: str) -> List[Endpoint]:
+        return [e for e in self.endpoints if e.role == role]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Topology":
+        return cls(data["cluster"], [Endpoint(**e) for e in data["endpoints"]], data["source"],
+                   data.get("fingerprint"), data.get("discovered_at", 0.0))
+
+
+def _port(connection_strings: List[str], index: int, role: str) -> int:
+    try:
+        return int(str(connection_strings[index]).rsplit(":", 1)[1])
+    except (IndexError, ValueError):
+        return DEFAULT_PORTS[role]
+
+
+def _zone(value: Optional[str]) -> Optional[str]:
+    # Instance zones come back as URLs from some providers
+    return value.rsplit("/", 1)[-1] if value else value
+
+
+def topology_from_outputs(cluster: str, outputs: Dict[str, Any]) -> Topology:
+    """The cluster's instances from ``terraform output -json``.
+
+    Ports come from each module's ``connection_strings``; shard replica sets
+    follow the module layout, ``shard-server-1..3`` being ``shard1``.
+    """
+    endpoints = []
+    for role, output in OUTPUTS.items():
+        value = (outputs.get(output) or {}).get("value") or {}
+        hosts = (value.get("ansible_inventory") or {}).get("hosts") or {}
+        names = list(value.get("names") or hosts)
+        connections = list(value.get("connection_strings") or [])
+        for index, name in enumerate(names):
+            info = hosts.get(name) or {}
+            replica_set = None
+            if role == "mongod":
+                match = re.search(r"-(\d+)$", name)
+                number = int(match.group(1)) if match else index + 1
+                replica_set = f"shard{(number - 1) // SHARD_MEMBERS + 1}"
+            elif role == "config":
+                replica_set = "configRS"
+            endpoints.append(Endpoint(name, role, _port(connections, index, role), info.get("internal_ip"),
+                                      info.get("ansible_host"), _zone(info.get("zone")), replica_set))
+    if not endpoints:
+        raise DiscoveryError("Terraform outputs list no instances; was the cluster applied?")
+    return Topology(cluster, endpoints, "terraform")
+
+
+def topology_from_nodes(cluster: str, nodes: List[Node], source: str) -> Topology:
+    return Topology(cluster, [Endpoint(n.name or n.address, n.role, n.port, n.host, None, None, n.replica_set)
+                              for n in nodes], source)
+
+
+class TopologyCache:
+    """Parsed topologies on disk, one JSON file per cluster."""
+
+    def __init__(self, directory: Path, max_age: float = 300.0):
+        self.directory = Path(directory)
+        self.max_age = max_age
+
+    def path(self, cluster: str) -> Path:
+        return self.directory / f"{cluster}.json"
+
+    def load(self, cluster: str, fingerprint: Optional[str]) -> Optional[Topology]:
+        try:
+            topology = Topology.from_dict(json.loads(self.path(cluster).read_text()))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if fingerprint is not None:
+            return topology if topology.fingerprint == fingerprint else None
+        return topology if time.time() - topology.discovered_at <= self.max_age else None
+
+    def save(self, topology: Topology):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(topology.cluster)
+        staging = path.with_suffix(".tmp")
+        staging.write_text(json.dumps(topology.to_dict(), indent=2))
+        staging.replace(path)
+
+
+def state_fingerprint(terraform_dir: Path) -> Optional[str]:
+    """Identity of the local terraform state; None with a remote backend."""
+    try:
+        stat = (Path(terraform_dir) / "terraform.tfstate").stat()
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# ---------------------------------------------------------------------------
+# Recommendations
+# ---------------------------------------------------------------------------
+
+@dataclass
+class DiscoveryOptions:
+    external: bool = False  # connect through external IPs (from outside the VPC)
+    srv_domain: Optional[str] = None
+    app_instances: int = 10  # application processes sharing the servers' connections
+    tls: bool = False
+    username: Optional[str] = None
+    max_staleness: int = 90  # seconds, for read-mostly profiles (the minimum drivers accept)
+
+
+@dataclass
+class EndpointStatus:
+    name: str
+    role: str
+    address: str
+    zone: Optional[str]
+    replica_set: Optional[str]
+    reachable: bool
+    state: str
+    latency_ms: Optional[float] = None
+    available_connections: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ZoneLatency:
+    zone: str
+    reachable: int
+    total: int
+    min_ms: Optional[float] = None
+    median_ms: Optional[float] = None
+
+
+@dataclass
+class ConnectionProfile:
+    name: str
+    description: str
+    uri: str
+    srv_uri: Optional[str] = None
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Discovery:
+    topology: Topology
+    endpoints: List[EndpointStatus]
+    zones: List[ZoneLatency]
+    profiles: List[ConnectionProfile]
+    dns_records: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["topology"] = {k: v for k, v in data["topology"].items() if k != "endpoints"}
+        return data
+
+    def format(self) -> str:
+        topology = self.topology
+        age = time.time() - topology.discovered_at
+        origin = f"cached {age:.0f}s ago" if self.cached else "just read"
+        lines = [f"Cluster {topology.cluster}: {'sharded' if topology.sharded else 'replica set'}, "
+                 f"{len(topology.endpoints)} instances from {topology.source} ({origin})", ""]
+        lines.append(f"{'endpoint':<26} {'role':<7} {'zone':<16} {'state':<10} {'latency':>9}")
+        for e in self.endpoints:
+            latency = f"{e.latency_ms:.1f}ms" if e.latency_ms is not None else "-"
+            lines.append(f"{e.address:<26} {e.role:<7} {e.zone or '-':<16} {e.state:<10} {latency:>9}"
+                         + (f"  {e.error}" if e.error else ""))
+        if self.zones:
+            lines += ["", "Latency by zone: " + ", ".join(
+                f"{z.zone} {z.median_ms:.1f}ms ({z.reachable}/{z.total})" if z.median_ms is not None
+                else f"{z.zone} unreachable (0/{z.total})" for z in self.zones)]
+        for profile in self.profiles:
+            lines += ["", f"[{profile.name}] {profile.description}", f"  {profile.uri}"]
+            if profile.srv_uri:
+                lines.append(f"  {profile.srv_uri}")
+        if self.dns_records:
+            lines += ["", "DNS records for the mongodb+srv:// seed list:"]
+            lines += [f"  {record}" for record in self.dns_records]
+        for warning in self.warnings:
+            lines.append(f"Warning: {warning}")
+        return "\n".join(lines)
+
+
+def zone_latencies(statuses: List[EndpointStatus]) -> List[ZoneLatency]:
+    zones: Dict[str, List[EndpointStatus]] = {}
+    for status in statuses:
+        zones.setdefault(status.zone or "unknown", []).append(status)
+    result = []
+    for zone, members in zones.items():
+        latencies = [s.latency_ms for s in members if s.reachable and s.latency_ms is not None]
+        result.append(ZoneLatency(zone, len(latencies), len(members),
+                                  round(min(latencies), 2) if latencies else None,
+                                  round(statistics.median(latencies), 2) if latencies else None))
+    return sorted(result, key=lambda z: (z.median_ms is None, z.median_ms or 0.0, z.zone))
+
+
+def local_threshold_ms(latencies: List[Tuple[str, float]]) -> int:
+    """Window over the fastest server that covers the nearest zone's servers.
+
+    ``latencies`` are ``(zone, ms)`` of the servers a driver selects among.
+    Servers of farther zones only fall inside when they are about as fast.
+    """
+    if not latencies:
+        return DEFAULT_THRESHOLD_MS
+    zone, nearest = min(latencies, key=lambda z: z[1])
+    spread = max(ms for z, ms in latencies if z == zone) - nearest
+    return max(1, min(DEFAULT_THRESHOLD_MS, math.ceil(spread * 2) + 1))
+
+
+def pool_size(available: List[int], app_instances: int) -> int:
+    """maxPoolSize per application instance from the connections each server can still accept.
+
+    Drivers size the pool per server, so every instance may open
+    ``maxPoolSize`` connections to each one: the server with the fewest to
+    spare sets the limit, however many servers there are.
+    """
+    if not available:
+        return MAX_POOL_SIZE
+    share = int(min(available) * (1 - POOL_RESERVE) / max(1, app_instances))
+    return max(5, min(MAX_POOL_SIZE, share))
+
+
+def _uri(scheme: str, hosts: str, username: Optional[str], options: Dict[str, Any]) -> str:
+    credentials = f"{urllib.parse.quote(username, safe='')}:<password>@" if username else ""
+    query = urllib.parse.urlencode({k: str(v).lower() if isinstance(v, bool) else v for k, v in options.items()},
+                                   safe=":,")
+    return f"{scheme}://{credentials}{hosts}/" + (f"?{query}" if query else "")
+
+
+def srv_records(name: str, targets: List[Tuple[str, str, int]], txt: Dict[str, Any]) -> List[str]:
+    """Zone-file lines: one A record per target host, the SRV seed list and its TXT options."""
+    records = [f"{host}.{name}. {SRV_TTL} IN A {ip}" for host, ip, _ in targets]
+    records += [f"_mongodb._tcp.{name}. {SRV_TTL} IN SRV 0 0 {port} {host}.{name}." for host, _, port in targets]
+    if txt:
+        records.append(f'{name}. {SRV_TTL} IN TXT "{urllib.parse.urlencode(txt)}"')
+    return records
+
+
+def recommend(topology: Topology, statuses: List[EndpointStatus],
+              options: DiscoveryOptions) -> Tuple[List[ConnectionProfile], List[str], List[str]]:
+    """(profiles, DNS records, warnings) for the servers applications connect to."""
+    warnings: List[str] = []
+    role = "mongos" if topology.sharded else "mongod"
+    servers = [s for s in statuses if s.role == role]
+    reachable = [s for s in servers if s.reachable]
+    if len(reachable) < len(servers):
+        warnings.append(f"{len(servers) - len(reachable)} of {len(servers)} {role} unreachable; "
+                        f"options are tuned on the reachable ones")
+    set_names = sorted({s.replica_set for s in reachable if s.replica_set}
+                       or {s.replica_set for s in servers if s.replica_set})
+    if not topology.sharded and len(set_names) > 1:
+        raise DiscoveryError(f"Members belong to several replica sets ({', '.join(set_names)}); pass one set")
+
+    endpoints = {e.name: e for e in topology.endpoints}
+    hosts = ",".join(s.address for s in servers)
+    threshold = local_threshold_ms([(s.zone or "unknown", s.latency_ms) for s in reachable
+                                    if s.latency_ms is not None])
+    if topology.sharded:
+        available = [s.available_connections for s in reachable if s.available_connections is not None]
+    else:
+        # Writes only go to the primary; secondaries add read capacity
+        available = [s.available_connections for s in reachable
+                     if s.available_connections is not None and s.state == "PRIMARY"]
+    max_pool = pool_size(available, options.app_instances)
+
+    base: Dict[str, Any] = {}
+    txt: Dict[str, Any] = {}
+    if not topology.sharded and set_names:
+        base["replicaSet"] = txt["replicaSet"] = set_names[0]
+    if options.username:
+        base["authSource"] = txt["authSource"] = "admin"
+    base.update({"retryWrites": True, "w": "majority", "maxPoolSize": max_pool,
+                 "minPoolSize": max(1, max_pool // 10), "localThresholdMS": threshold})
+    if options.tls:
+        base["tls"] = True
+
+    read_mostly = dict(base)
+    read_mostly.update({"readPreference": "nearest" if topology.sharded else "secondaryPreferred",
+                        "maxStalenessSeconds": options.max_staleness})
+    profiles = [
+        ConnectionProfile("read-write", "primary reads and majority writes", "", None,
+                          dict(base, readPreference="primary")),
+        ConnectionProfile("read-mostly", f"reads from the nearest {'shard member' if topology.sharded else 'member'}"
+                          f" at most {options.max_staleness}s behind", "", None, read_mostly),
+    ]
+
+    records: List[str] = []
+    name = None
+    if options.srv_domain:
+        domain = options.srv_domain.strip(".")
+        if domain.count(".") < 1:
+            warnings.append(f"SRV domain {domain} needs at least two labels; skipping mongodb+srv")
+        else:
+            name = f"{topology.cluster}.{domain}"
+            targets = [(endpoints[s.name].name if s.name in endpoints else s.name,
+                        s.address.rsplit(":", 1)[0], int(s.address.rsplit(":", 1)[1])) for s in servers]
+            records = srv_records(name, targets, txt)
+    for profile in profiles:
+        profile.uri = _uri("mongodb", hosts, options.username, profile.options)
+        if name:
+            # TXT carries replicaSet/authSource; mongodb+srv turns TLS on unless told otherwise
+            srv_options = {k: v for k, v in profile.options.items() if k not in txt and k != "tls"}
+            if not options.tls:
+                srv_options["tls"] = False
+            profile.srv_uri = _uri("mongodb+srv", name, options.username, srv_options)
+    if not topology.sharded and not any(s.state == "PRIMARY" for s in reachable):
+        warnings.append("no reachable primary; pool size assumes the drivers' default")
+    return profiles, records, warnings
+
+
+# ---------------------------------------------------------------------------
+# Service
+# ---------------------------------------------------------------------------
+
+class DiscoveryService:
+    """Topology discovery with an on-disk cache; concurrent callers share one terraform read."""
+
+    def __init__(self, cluster: str, read_outputs: Callable[[], Awaitable[Dict[str, Any]]], cache: TopologyCache,
+                 fingerprint: Optional[str] = None):
+        self.cluster = cluster
+        self.read_outputs = read_outputs
+        self.cache = cache
+        self.fingerprint = fingerprint
+        self._topology: Optional[Topology] = None
+        self._lock = asyncio.Lock()
+        self.cached = False
+
+    async def topology(self, refresh: bool = False) -> Topology:
+        async with self._lock:
+            if self._topology is None and not refresh:
+                self._topology = self.cache.load(self.cluster, self.fingerprint)
+                self.cached = self._topology is not None
+            if self._topology is None or refresh:
+                topology = topology_from_outputs(self.cluster, await self.read_outputs())
+                topology.fingerprint = self.fingerprint
+                self.cache.save(topology)
+                self._topology, self.cached = topology, False
+            return self._topology
+
+    async def discover(self, prober: HealthProber, options: DiscoveryOptions, refresh: bool = False,
+                       topology: Optional[Topology] = None) -> Discovery:
+        topology = topology or await self.topology(refresh)
+        return await probe_topology(topology, prober, options, cached=self.cached)
+
+
+async def probe_topology(topology: Topology, prober: HealthProber, options: DiscoveryOptions,
+                         cached: bool = False) -> Discovery:
+    """Probe every router and data-bearing member at once and derive connection profiles."""
+    targets = [e for e in topology.endpoints if e.role in ("mongos", "mongod")]
+    if not targets:
+        raise DiscoveryError(f"Cluster {topology.cluster} has no mongos or shard members")
+    nodes = [e.node(options.external) for e in targets]
+    report: ClusterHealth = await prober.probe(nodes, server_status=True)
+    by_node: Dict[Node, NodeHealth] = {n.node: n for n in report.nodes}
+    statuses = []
+    for endpoint, node in zip(targets, nodes):
+        health = by_node.get(node)
+        available = None
+        if health is not None and health.server_status:
+            available = (health.server_status.get("connections") or {}).get("available")
+        statuses.append(EndpointStatus(
+            endpoint.name, endpoint.role, node.address, endpoint.zone,
+            (health.set_name if health is not None and health.set_name else endpoint.replica_set),
+            bool(health and health.ok), health.state if health else "UNKNOWN",
+            round(health.latency_ms, 2) if health and health.latency_ms is not None else None,
+            available, health.error if health else None))
+    profiles, records, warnings = recommend(topology, statuses, options)
+    return Discovery(topology, statuses, zone_latencies(statuses), profiles, records, warnings, cached)
@@ -0,0 +1,373 @@
+"""Declarative provisioning of many clusters: ``dbprovision apply -f fleet.yaml``.
+
+A fleet manifest lists clusters with the same options as ``dbprovision
+create`` (``cluster_type``, ``replica_nodes``, ``tuning_profile`` ...), plus
+``defaults`` shared by all of them::
+
+    fleet: prod
+    concurrency: 4            # clusters provisioned at the same time
+    max_parallel: 2           # phases per cluster (overridable per cluster)
+    rate_limit:
+      terraform_per_minute: 12
+      burst: 3
+    defaults:
+      project_id: my-project
+      region: asia-northeast3
+    clusters:
+      - name: orders
+        cluster_type: sharded
+        shard_count: 3
+      - name: sessions
+        replica_nodes: 5
+
+Every cluster gets its own workspace under ``~/.dbprovision/clusters/<name>``
+with a copy of the terraform sources, its own state, plans and fingerprint
+cache, and its own inventories and group_vars, so clusters never share a
+working directory. Provider plugins are shared through
+``TF_PLUGIN_CACHE_DIR``. The fingerprint of each cluster's resolved options is
+recorded in ``fleet-state.json`` after a successful run; ``plan_fleet`` diffs
+the manifest against it.
+"""
+
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import io
+import json
+import re
+import shutil
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, TextIO
+
+CLUSTER_NAME = re.compile(r"^[a-z][a-z0-9-]{0,38}[a-z0-9]$")
+STATE_FILE = "fleet-state.json"
+FLEET_KEYS = {"fleet", "concurrency", "max_parallel", "rate_limit", "defaults", "clusters"}
+
+# Not cluster options: they come from the manifest itself
+RESERVED_OPTIONS = {"name", "cluster_name"}
+
+CREATE = "create"
+UPDATE = "update"
+UNCHANGED = "unchanged"
+ORPHANED = "orphaned"
+
+
+class FleetError(ValueError):
+    pass
+
+
+@dataclass
+class ClusterSpec:
+    name: str
+    options: Dict[str, Any]
+
+    @property
+    def fingerprint(self) -> str:
+        payload = json.dumps(self.options, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def argv(self) -> List[str]:
+        """The options as ``dbprovision create`` arguments."""
+        argv = ["--cluster-name", self.name]
+        for key, value in self.options.items():
+            flag = "--" + key.replace("_", "-")
+            if value is None or value is False:
+                continue
+            if value is True:
+                argv.append(flag)
+            elif isinstance(value, list) and key != "zones":
+                for item in value:
+                    argv.extend([flag, str(item)])
+            elif isinstance(value, list):
+                argv.extend([flag, ",".join(str(z) for z in value)])
+            else:
+                argv.extend([flag, str(value)])
+        return argv
+
+
+@dataclass
+class FleetManifest:
+    name: str
+    clusters: List[ClusterSpec]
+    concurrency: int = 4
+    max_parallel: int = 2
+    terraform_per_minute: float = 0.0
+    burst: int = 1
+
+    @classmethod
+    def load(cls, path: Path) -> "FleetManifest":
+        import yaml  # only manifests need it; every --cluster command imports this module
+        try:
+            with open(path) as f:
+                data = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise FleetError(f"Cannot read fleet manifest {path}: {e}")
+        return cls.from_dict(data, default_name=Path(path).stem)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any], default_name: str = "default") -> "FleetManifest":
+        errors = []
+        unknown = set(data) - FLEET_KEYS
+        if unknown:
+            errors.append(f"unknown top-level key(s): {', '.join(sorted(unknown))}")
+        defaults = data.get("defaults") or {}
+        rate_limit = data.get("rate_limit") or {}
+        clusters: List[ClusterSpec] = []
+        seen = set()
+        for index, entry in enumerate(data.get("clusters") or []):
+            name = entry.get("name") if isinstance(entry, dict) else None
+            if not name or not CLUSTER_NAME.match(str(name)):
+                errors.append(f"clusters[{index}]: name must be 2-40 lowercase letters, digits or dashes")
+                continue
+            if name in seen:
+                errors.append(f"clusters[{index}]: duplicate cluster name {name}")
+                continue
+            seen.add(name)
+            options = {**defaults, **entry}
+            for key in RESERVED_OPTIONS & set(options):
+                options.pop(key)
+            clusters.append(ClusterSpec(name, {k.replace("-", "_"): v for k, v in options.items()}))
+        if not clusters and not errors:
+            errors.append("no clusters defined")
+
+        manifest = cls(
+            name=str(data.get("fleet") or default_name),
+            clusters=clusters,
+            concurrency=int(data.get("concurrency", 4)),
+            max_parallel=int(data.get("max_parallel", 2)),
+            terraform_per_minute=float(rate_limit.get("terraform_per_minute", 0)),
+            burst=int(rate_limit.get("burst", 1)),
+        )
+        if manifest.concurrency < 1 or manifest.max_parallel < 1:
+            errors.append("concurrency and max_parallel must be at least 1")
+        if manifest.terraform_per_minute < 0 or manifest.burst < 1:
+            errors.append("rate_limit needs terraform_per_minute >= 0 and burst >= 1")
+        if errors:
+            raise FleetError("; ".join(errors))
+        return manifest
+
+
+@dataclass
+class Change:
+    action: str
+    name: str
+    spec: Optional[ClusterSpec] = None
+    reason: str = ""
+
+
+def plan_fleet(manifest: FleetManifest, state: Mapping[str, Dict[str, Any]]) -> List[Change]:
+    """Diff the manifest against the clusters recorded in ``state``."""
+    changes = []
+    for spec in manifest.clusters:
+        entry = state.get(spec.name)
+        if entry is None:
+            changes.append(Change(CREATE, spec.name, spec, "not provisioned"))
+        elif entry.get("status") != "ok":
+            changes.append(Change(UPDATE, spec.name, spec, "last run failed"))
+        elif entry.get("fingerprint") != spec.fingerprint:
+            changed = sorted(k for k in set(spec.options) | set(entry.get("options", {}))
+                             if spec.options.get(k) != entry.get("options", {}).get(k))
+            changes.append(Change(UPDATE, spec.name, spec, "changed: " + ", ".join(changed)))
+        else:
+            changes.append(Change(UNCHANGED, spec.name, spec))
+    names = {spec.name for spec in manifest.clusters}
+    for name, entry in sorted(state.items()):
+        if entry.get("fleet") == manifest.name and name not in names:
+            changes.append(Change(ORPHANED, name, reason="no longer in manifest; destroy it with dbprovision destroy"))
+    return changes
+
+
+def format_changes(changes: List[Change]) -> str:
+    symbols = {CREATE: "+", UPDATE: "~", UNCHANGED: "=", ORPHANED: "?"}
+    lines = [f"  {symbols[c.action]} {c.name:<40} {c.action:<10} {c.reason}".rstrip() for c in changes]
+    counts = {action: sum(1 for c in changes if c.action == action) for action in symbols}
+    lines.append(f"\n{counts[CREATE]} to create, {counts[UPDATE]} to update, {counts[UNCHANGED]} unchanged"
+                 + (f", {counts[ORPHANED]} orphaned" if counts[ORPHANED] else ""))
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# State and workspaces
+# ---------------------------------------------------------------------------
+
+class FleetState:
+    """Last successful spec of every cluster provisioned through a fleet."""
+
+    def __init__(self, state_dir: Path):
+        self.path = Path(state_dir) / STATE_FILE
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def record(self, fleet: str, spec: ClusterSpec, ok: bool):
+        entries = self.load()
+        previous = entries.get(spec.name, {})
+        entries[spec.name] = {
+            "fleet": fleet,
+            # A failed update keeps the last good spec so the diff still shows what changed
+            "fingerprint": spec.fingerprint if ok else previous.get("fingerprint"),
+            "options": spec.options if ok else previous.get("options", {}),
+            "status": "ok" if ok else "failed",
+            "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self._save(entries)
+
+    def forget(self, name: str):
+        entries = self.load()
+        if entries.pop(name, None) is not None:
+            self._save(entries)
+
+    def _save(self, entries: Dict[str, Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        tmp.replace(self.path)
+
+
+def workspace_dir(state_dir: Path, cluster_name: str) -> Path:
+    return Path(state_dir) / "clusters" / cluster_name
+
+
+def sync_terraform_sources(source: Path, target: Path):
+    """Copy the terraform configuration into a cluster workspace, leaving its state alone."""
+    ignore = shutil.ignore_patterns(".terraform", "*.tfstate", "*.tfstate.*", "*.tfvars", ".terraform.lock.hcl")
+    target.mkdir(parents=True, exist_ok=True)
+    for path in Path(source).iterdir():
+        if ignore(str(source), [path.name]):
+            continue
+        if path.is_dir():
+            shutil.copytree(path, target / path.name, ignore=ignore, dirs_exist_ok=True)
+        else:
+            shutil.copy2(path, target / path.name)
+    lock = Path(source) / ".terraform.lock.hcl"
+    if lock.exists() and not (target / lock.name).exists():
+        # Start from the pinned provider versions; init may update the copy afterwards
+        shutil.copy2(lock, target / lock.name)
+
+
+# ---------------------------------------------------------------------------
+# Running
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """Token bucket shared by every cluster, to stay under cloud API quotas."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+current_cluster: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("current_cluster", default=None)
+
+
+class PrefixedOutput(io.TextIOBase):
+    """Stdout/stderr wrapper that prefixes whole lines with the cluster the writing task works on."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.partial: Dict[Optional[str], str] = {}
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        name = current_cluster.get()
+        buffered = self.partial.pop(name, "") + text
+        *lines, rest = buffered.split("\n")
+        for line in lines:
+            self.stream.write(f"[{name}] {line}\n" if name else f"{line}\n")
+        if rest:
+            self.partial[name] = rest
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+@dataclass
+class ClusterOutcome:
+    name: str
+    action: str
+    ok: bool
+    duration: float = 0.0
+    error: Optional[str] = None
+    log_file: Optional[Path] = None
+
+
+@dataclass
+class FleetReport:
+    outcomes: List[ClusterOutcome] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(o.ok for o in self.outcomes)
+
+    def format(self) -> str:
+        lines = [f"{'Cluster':<40} {'Action':<10} {'Wall':>8}  Status"]
+        for o in sorted(self.outcomes, key=lambda o: (o.ok, o.name)):
+            status = "ok" if o.ok else f"FAILED: {o.error}"
+            lines.append(f"{o.name:<40} {o.action:<10} {o.duration:>7.1f}s  {status}")
+            if not o.ok and o.log_file and o.log_file.exists():
+                lines.append(f"{'':<40} log: {o.log_file}")
+        failed = sum(1 for o in self.outcomes if not o.ok)
+        lines.append(f"\n{len(self.outcomes) - failed} succeeded, {failed} failed in {self.wall_time:.1f}s")
+        return "\n".join(lines)
+
+
+async def run_fleet(changes: List[Change], concurrency: int, provision) -> FleetReport:
+    """Provision every create/update change, ``concurrency`` clusters at a time.
+
+    ``provision(change)`` is awaited with ``current_cluster`` set and returns a
+    ``ClusterOutcome``; an exception in one cluster is recorded as its failure
+    and never cancels the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async def one(change: Change) -> ClusterOutcome:
+        async with semaphore:
+            current_cluster.set(change.name)
+            began = time.monotonic()
+            try:
+                outcome = await provision(change)
+            except (Exception, SystemExit) as e:
+                outcome = ClusterOutcome(change.name, change.action, False, error=str(e) or type(e).__name__)
+            outcome.duration = time.monotonic() - began
+            print(f"==> {change.action} {'finished' if outcome.ok else 'failed'} ({outcome.duration:.1f}s)")
+            return outcome
+
+    work = [c for c in changes if c.action in (CREATE, UPDATE)]
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = PrefixedOutput(stdout), PrefixedOutput(stderr)
+    try:
+        # Each task runs in a copy of the current context, so current_cluster stays per cluster
+        outcomes = await asyncio.gather(*(one(change) for change in work))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return FleetReport(list(outcomes), time.monotonic() - started)
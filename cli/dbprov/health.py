@@ -0,0 +1,377 @@
+import asyncio
+import datetime
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from dbprov.wire import CommandError, ConnectionPool
+
+DEFAULT_PORTS = {"mongod": 27017, "config": 27019, "mongos": 27016}
+# Inventories a sharded cluster's nodes are deployed from, by role
+INVENTORY_FILES = {"config": "config-servers.ini", "mongod": "shard-servers.ini", "mongos": "mongos.ini"}
+MEMBER_STATES = {0: "STARTUP", 1: "PRIMARY", 2: "SECONDARY", 3: "RECOVERING", 5: "STARTUP2",
+                 6: "UNKNOWN", 7: "ARBITER", 8: "DOWN", 9: "ROLLBACK", 10: "REMOVED"}
+
+
+@dataclass(frozen=True)
+class Node:
+    host: str
+    port: int
+    role: str = "mongod"
+    replica_set: Optional[str] = None
+    name: Optional[str] = field(default=None, compare=False)  # Ansible inventory hostname
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+@dataclass
+class NodeHealth:
+    node: Node
+    ok: bool
+    state: str = "UNKNOWN"
+    set_name: Optional[str] = None
+    primary: Optional[str] = None
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    config_server: bool = False
+    member: Optional[str] = None  # name in the replica set config, not necessarily the inventory address
+    lag_seconds: Optional[float] = None
+    repl_status: Optional[Dict[str, Any]] = None
+    server_status: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class MemberHealth:
+    name: str
+    state: str
+    healthy: bool
+    lag_seconds: Optional[float] = None
+
+
+@dataclass
+class ReplicaSetHealth:
+    name: str
+    primary: Optional[str]
+    term: Optional[int] = None
+    election_date: Optional[datetime.datetime] = None
+    members: List[MemberHealth] = field(default_factory=list)
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def max_lag(self) -> Optional[float]:
+        lags = [m.lag_seconds for m in self.members if m.lag_seconds is not None]
+        return max(lags) if lags else None
+
+
+@dataclass
+class ClusterHealth:
+    nodes: List[NodeHealth]
+    replica_sets: Dict[str, ReplicaSetHealth]
+    duration_ms: float
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def healthy(self) -> bool:
+        return not self.issues
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "duration_ms": round(self.duration_ms, 1),
+            "issues": list(self.issues),
+            "nodes": [{
+                "address": n.node.address,
+                "role": n.node.role,
+                "ok": n.ok,
+                "state": n.state,
+                "set_name": n.set_name,
+                "latency_ms": round(n.latency_ms, 2) if n.latency_ms is not None else None,
+                "lag_seconds": n.lag_seconds,
+                "error": n.error,
+                "server_status": _json_safe(n.server_status),
+            } for n in self.nodes],
+            "replica_sets": {name: {
+                "primary": rs.primary,
+                "term": rs.term,
+                "election_date": rs.election_date.isoformat() if rs.election_date else None,
+                "max_lag_seconds": rs.max_lag,
+                "issues": list(rs.issues),
+                "members": [vars(m) for m in rs.members],
+            } for name, rs in self.replica_sets.items()},
+        }
+
+    def summary(self) -> str:
+        reachable = sum(1 for n in self.nodes if n.ok)
+        roles: Dict[str, int] = {}
+        for n in self.nodes:
+            roles[n.node.role] = roles.get(n.node.role, 0) + 1
+        lines = [f"Nodes: {reachable}/{len(self.nodes)} reachable ("
+                 + ", ".join(f"{count} {role}" for role, count in sorted(roles.items())) + ")"]
+        for name, rs in sorted(self.replica_sets.items()):
+            lag = f"{rs.max_lag:.0f}s" if rs.max_lag is not None else "-"
+            healthy = sum(1 for m in rs.members if m.healthy)
+            lines.append(f"  {name:<16} primary={rs.primary or 'NONE':<24} members={healthy}/{len(rs.members)} max lag={lag}")
+        lines.append("Status: " + ("OK" if self.healthy else f"{len(self.issues)} issue(s), run 'dbprovision health' for details"))
+        return "\n".join(lines)
+
+    def format(self) -> str:
+        lines = [f"{'Node':<28} {'Role':<7} {'State':<11} {'Set':<12} {'RTT':>8} {'Lag':>7}  Error"]
+        for n in sorted(self.nodes, key=lambda n: (n.node.role, n.set_name or "", n.node.address)):
+            rtt = f"{n.latency_ms:.1f}ms" if n.latency_ms is not None else "-"
+            lag = f"{n.lag_seconds:.0f}s" if n.lag_seconds is not None else "-"
+            lines.append(f"{n.node.address:<28} {n.node.role:<7} {n.state:<11} {n.set_name or '-':<12} "
+                         f"{rtt:>8} {lag:>7}  {n.error or ''}")
+        if self.replica_sets:
+            lines.append("")
+        for name, rs in sorted(self.replica_sets.items()):
+            lag = f"{rs.max_lag:.0f}s" if rs.max_lag is not None else "-"
+            lines.append(f"Replica set {name}: primary={rs.primary or 'NONE'} term={rs.term} max lag={lag}")
+        lines.append(f"\nChecked {len(self.nodes)} nodes in {self.duration_ms:.0f}ms")
+        if self.issues:
+            lines.append("Issues:")
+            lines.extend(f"  - {issue}" for issue in self.issues)
+        else:
+            lines.append("All checks passed")
+        return "\n".join(lines)
+
+
+def _json_safe(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+# ---------------------------------------------------------------------------
+# Topology
+# ---------------------------------------------------------------------------
+
+def parse_inventory(path: Path) -> Dict[str, List[Tuple[str, Dict[str, str]]]]:
+    """Parse an Ansible INI inventory into ``{group: [(host, hostvars)]}``."""
+    groups: Dict[str, List[Tuple[str, Dict[str, str]]]] = {}
+    current: Optional[str] = None
+    for raw in Path(path).read_text().splitlines():
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            name = line[1:-1]
+            current = None if ":" in name else name
+            if current is not None:
+                groups.setdefault(current, [])
+            continue
+        if current is None:
+            continue
+        host, *pairs = line.split()
+        hostvars = dict(pair.split("=", 1) for pair in pairs if "=" in pair)
+        groups[current].append((host, hostvars))
+    return groups
+
+
+def nodes_from_inventory(path: Path, role: str) -> List[Node]:
+    nodes = []
+    seen = set()
+    for group, hosts in parse_inventory(path).items():
+        for host, hostvars in hosts:
+            address = hostvars.get("ansible_host", host)
+            port = int(hostvars.get("mongodb_port", DEFAULT_PORTS[role]))
+            if (address, port) in seen:
+                continue
+            seen.add((address, port))
+            replica_set = None if role == "mongos" else hostvars.get("replica_set_name", group)
+            nodes.append(Node(address, port, role, replica_set, host))
+    return nodes
+
+
+def load_topology(ansible_dir: Path, cluster_name: str) -> List[Node]:
+    """Nodes of a cluster, from the inventories written for its Ansible runs."""
+    inventories = Path(ansible_dir) / "inventories"
+    own = inventories / f"{cluster_name}.ini"
+    if own.exists():
+        return nodes_from_inventory(own, "mongod")
+
+    nodes: List[Node] = []
+    for role, filename in INVENTORY_FILES.items():
+        if (inventories / filename).exists():
+            nodes.extend(nodes_from_inventory(inventories / filename, role))
+    if not nodes:
+        raise FileNotFoundError(f"No inventory found for cluster {cluster_name} in {inventories}")
+    return nodes
+
+
+def parse_hosts(spec: str, role: str = "mongod") -> List[Node]:
+    nodes = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        nodes.append(Node(host, int(port) if port else DEFAULT_PORTS[role], role))
+    return nodes
+
+
+# ---------------------------------------------------------------------------
+# Probing
+# ---------------------------------------------------------------------------
+
+class HealthProber:
+    """Probes every node of a cluster concurrently.
+
+    All commands for a node are pipelined on one pooled connection, so a node
+    costs a single round trip and a whole cluster roughly the slowest node's
+    RTT. ``concurrency`` caps the number of nodes probed at the same time and
+    ``timeout`` bounds each node (connect + commands).
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None, concurrency: int = 64,
+                 timeout: float = 3.0, max_lag: float = 10.0):
+        self.pool = pool or ConnectionPool(max_per_host=2, connect_timeout=timeout)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def close(self):
+        await self.pool.close()
+
+    async def probe(self, nodes: List[Node], server_status: bool = False,
+                    repl_status: bool = True) -> ClusterHealth:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        results = await asyncio.gather(*(self.probe_node(n, server_status, repl_status) for n in nodes))
+        report = ClusterHealth(list(results), {}, (time.monotonic() - started) * 1000)
+        self._aggregate(report)
+        return report
+
+    async def probe_node(self, node: Node, server_status: bool = False, repl_status: bool = True) -> NodeHealth:
+        assert self._semaphore is not None
+        commands: List[Dict[str, Any]] = [{"hello": 1}]
+        if repl_status and node.role != "mongos":
+            commands.append({"replSetGetStatus": 1})
+        if server_status:
+            commands.append({"serverStatus": 1, "repl": 0, "metrics": 0, "locks": 0})
+
+        async with self._semaphore:
+            try:
+                started = time.monotonic()
+                replies = await asyncio.wait_for(self._run(node, commands), self.timeout)
+                latency = (time.monotonic() - started) * 1000
+            except asyncio.TimeoutError:
+                return NodeHealth(node, False, state="TIMEOUT", error=f"no reply within {self.timeout:.1f}s")
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                return NodeHealth(node, False, state="DOWN", error=str(e) or type(e).__name__)
+            except CommandError as e:
+                return NodeHealth(node, False, state="ERROR", error=str(e))
+
+        hello = replies[0]
+        result = NodeHealth(node, bool(hello.get("ok")), latency_ms=latency,
+                            set_name=hello.get("setName"), primary=hello.get("primary"),
+                            config_server=bool(hello.get("configsvr")), member=hello.get("me"))
+        if hello.get("msg") == "isdbgrid":
+            result.state = "MONGOS"
+        elif hello.get("setName"):
+            result.state = "PRIMARY" if hello.get("isWritablePrimary") else (
+                "SECONDARY" if hello.get("secondary") else "OTHER")
+        else:
+            result.state = "STANDALONE"
+
+        for cmd, reply in zip(commands[1:], replies[1:]):
+            if "replSetGetStatus" in cmd and reply.get("ok"):
+                result.repl_status = reply
+                if result.member is None:
+                    result.member = next((m["name"] for m in reply.get("members", []) if m.get("self")), None)
+            elif "serverStatus" in cmd and reply.get("ok"):
+                result.server_status = summarize_server_status(reply)
+        return result
+
+    async def _run(self, node: Node, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        async with self.pool.acquire(node.host, node.port) as conn:
+            replies = await conn.pipeline("admin", commands, check=False)
+        if not replies[0].get("ok"):
+            raise CommandError(replies[0])
+        return replies
+
+    def _aggregate(self, report: ClusterHealth):
+        by_set: Dict[str, List[NodeHealth]] = {}
+        for n in report.nodes:
+            if not n.ok:
+                report.issues.append(f"{n.node.address} ({n.node.role}) unreachable: {n.error}")
+            if n.set_name:
+                by_set.setdefault(n.set_name, []).append(n)
+
+        for name, members in by_set.items():
+            rs = self._replica_set_health(name, members)
+            report.replica_sets[name] = rs
+            report.issues.extend(f"{name}: {issue}" for issue in rs.issues)
+
+    def _replica_set_health(self, name: str, members: List[NodeHealth]) -> ReplicaSetHealth:
+        claimed = {m.primary for m in members if m.ok and m.primary}
+        primaries = [m.node.address for m in members if m.state == "PRIMARY"]
+        views = [m.repl_status for m in members if m.repl_status]
+        # Prefer the primary's view of the set, it has the freshest member optimes
+        view = next((v for v in views if v.get("myState") == 1), views[0] if views else None)
+
+        rs = ReplicaSetHealth(name, primaries[0] if len(primaries) == 1 else None)
+        if len(primaries) > 1 or len(claimed) > 1:
+            rs.issues.append(f"conflicting primaries reported: {', '.join(sorted(set(primaries) | claimed))}")
+        elif not primaries and not claimed:
+            rs.issues.append("no primary")
+        elif rs.primary is None and claimed:
+            rs.primary = next(iter(claimed))
+
+        if view is None:
+            return rs
+
+        rs.term = int(view["term"]) if view.get("term") is not None else None
+        optimes = {m["name"]: m.get("optimeDate") for m in view.get("members", [])}
+        primary_member = next((m for m in view.get("members", []) if m.get("state") == 1), None)
+        if primary_member is not None:
+            rs.election_date = primary_member.get("electionDate")
+        reference = primary_member.get("optimeDate") if primary_member else max(
+            (t for t in optimes.values() if t is not None), default=None)
+
+        # Members are named as configured (often hostnames) while nodes come from the inventory (often IPs)
+        lag_by_member: Dict[str, float] = {}
+        for member in view.get("members", []):
+            state = MEMBER_STATES.get(member.get("state"), str(member.get("state")))
+            healthy = member.get("health", 1) == 1 and state in ("PRIMARY", "SECONDARY", "ARBITER")
+            lag = None
+            if reference is not None and member.get("optimeDate") is not None and state == "SECONDARY":
+                lag = max(0.0, (reference - member["optimeDate"]).total_seconds())
+                lag_by_member[member["name"].lower()] = lag
+            rs.members.append(MemberHealth(member["name"], state, healthy, lag))
+            if not healthy:
+                rs.issues.append(f"member {member['name']} is {state}")
+            elif lag is not None and lag > self.max_lag:
+                rs.issues.append(f"member {member['name']} lags {lag:.0f}s behind the primary")
+
+        for m in members:
+            m.lag_seconds = lag_by_member.get((m.member or m.node.address).lower(), m.lag_seconds)
+        return rs
+
+
+def summarize_server_status(status: Mapping[str, Any]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {
+        "uptime": status.get("uptime"),
+        "version": status.get("version"),
+        "connections": dict(status.get("connections", {})),
+        "opcounters": {k: int(v) for k, v in status.get("opcounters", {}).items()},
+    }
+    cache = status.get("wiredTiger", {}).get("cache")
+    if cache:
+        configured = cache.get("maximum bytes configured") or 0
+        used = cache.get("bytes currently in the cache") or 0
+        dirty = cache.get("tracked dirty bytes in the cache") or 0
+        summary["cache"] = {
+            "configured_bytes": int(configured),
+            "used_bytes": int(used),
+            "dirty_bytes": int(dirty),
+            "used_ratio": round(used / configured, 4) if configured else None,
+        }
+    return summary
@@ -0,0 +1,465 @@
+"""Load test of the provisioning pipeline against the simulator (``dbprov.simulator``).
+
+``pipeline`` provisions many clusters in this process the way ``dbprovision
+apply`` does, with every terraform and ansible-playbook command simulated,
+and reports end-to-end throughput plus what the orchestration itself costs:
+the time phases spend outside simulated commands, and how long a phase waits
+between its last dependency finishing and starting::
+
+    python -m dbprov.loadtest pipeline --clusters 300 --concurrency 50 --time-scale 0.001
+
+``backend`` drives a running backend started with
+``DBPROVISION_EXECUTOR=simulator``: it submits clusters concurrently while
+readers poll the cluster and job endpoints, and reports API latency per
+route until every job finished::
+
+    python -m dbprov.loadtest backend --url http://127.0.0.1:8000 --clusters 100 --readers 16
+
+Both exit with 1 when a ``--min-*`` or ``--max-*`` budget is missed, so CI
+catches scaling regressions.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import http.client
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from dbprov.simulator import SimulatorConfig
+
+DEFAULT_MIX = "replicaset=3,sharded=1,standalone=1"
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered)))) - 1]
+
+
+def parse_mix(text: str) -> List[str]:
+    """``replicaset=3,sharded=1`` as the repeating sequence of cluster types."""
+    sequence = []
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in ("standalone", "replicaset", "sharded"):
+            raise ValueError(f"Unknown cluster type in mix: {kind}")
+        sequence.extend([kind.strip()] * int(weight or 1))
+    if not sequence:
+        raise ValueError("Empty cluster mix")
+    return sequence
+
+
+def cluster_options(kind: str, shards: int) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"cluster_type": kind, "project_id": "loadtest"}
+    if kind == "sharded":
+        options["shard_count"] = shards
+    return options
+
+
+class LagMonitor:
+    """Largest delay of a periodic timer, i.e. how long the event loop was busy at once."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.monotonic() - due)
+
+
+@dataclass
+class PipelineResult:
+    clusters: int
+    succeeded: int
+    failed: int
+    quota_errors: int
+    nodes: int
+    wall_s: float
+    clusters_per_minute: float
+    phases: int
+    phases_per_second: float
+    cluster_p50_s: float
+    cluster_p95_s: float
+    simulated_s: float
+    overhead_ms_per_phase: float
+    wait_p50_ms: float
+    wait_p95_ms: float
+    wait_max_ms: float
+    loop_lag_max_ms: float
+    budget_failures: List[str] = field(default_factory=list)
+
+    def format(self) -> str:
+        lines = [
+            f"Provisioned {self.clusters} clusters ({self.nodes} simulated nodes) in {self.wall_s:.2f}s: "
+            f"{self.succeeded} ok, {self.failed} failed ({self.quota_errors} over quota)",
+            f"  throughput      {self.clusters_per_minute:10.1f} clusters/min {self.phases_per_second:10.1f} phases/s",
+            f"  cluster wall    {self.cluster_p50_s * 1000:10.1f}ms p50 {self.cluster_p95_s * 1000:10.1f}ms p95",
+            f"  phase overhead  {self.overhead_ms_per_phase:10.3f}ms per phase outside "
+            f"{self.simulated_s:.1f}s of simulated commands",
+            f"  phase wait      {self.wait_p50_ms:10.3f}ms p50 {self.wait_p95_ms:10.3f}ms p95 "
+            f"{self.wait_max_ms:10.3f}ms max (ready -> started)",
+            f"  event loop      {self.loop_lag_max_ms:10.1f}ms longest busy stretch",
+        ]
+        lines.extend(f"BUDGET MISSED: {failure}" for failure in self.budget_failures)
+        return "\n".join(lines)
+
+
+async def run_pipeline(config: SimulatorConfig, clusters: int, concurrency: int, max_parallel: int,
+                       mix: Sequence[str], shards: int) -> PipelineResult:
+    # The CLI module builds each cluster exactly like `dbprovision apply`
+    from dbprov.fleet import CREATE, Change, ClusterOutcome, ClusterSpec, run_fleet, workspace_dir
+    from dbprov.process import ProcessError
+    from dbprov.simulator import SimulatedCloud, SimulatedRunner
+    from dbprovision import DBProvision, fleet_cluster_args, state_home
+
+    state_dir = state_home()
+    run_id = uuid.uuid4().hex[:6]
+    kinds = itertools.cycle(mix)
+    changes = [Change(CREATE, f"lt-{run_id}-{i}", ClusterSpec(f"lt-{run_id}-{i}", cluster_options(next(kinds), shards)))
+               for i in range(clusters)]
+    reports = []
+    runners = []
+
+    async def provision(change) -> ClusterOutcome:
+        cluster = DBProvision(workspace=workspace_dir(state_dir, change.name), echo=False)
+        runner = SimulatedRunner(config, state_dir / "simulator", log_file=cluster.log_file, echo=False)
+        cluster.runner = runner
+        runners.append(runner)
+        try:
+            args = fleet_cluster_args(change.spec, max_parallel)
+            cluster.validate_parameters(args)
+            report = await cluster.deploy_cluster_async(args, change.name)
+        finally:
+            cluster.close()
+        reports.append(report)
+        failure = report.failures[0] if report.failures else None
+        return ClusterOutcome(change.name, change.action, report.ok, error=repr(failure.error) if failure else None)
+
+    monitor = LagMonitor()
+    monitor.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fleet = await run_fleet(changes, concurrency, provision)
+    await monitor.stop()
+
+    results = [r for report in reports for r in report.results.values()]
+    quota = sum(1 for r in results if isinstance(r.error, ProcessError)
+                and any("quotaExceeded" in line for line in r.error.result.tail))
+    simulated = sum(r.simulated_time for r in runners)
+    waits = [r.wait * 1000 for r in results]
+    walls = [o.duration for o in fleet.outcomes]
+    succeeded = sum(1 for o in fleet.outcomes if o.ok)
+    wall = fleet.wall_time or 1e-9
+    nodes = SimulatedCloud(state_dir / "simulator").instances()
+    return PipelineResult(
+        clusters=clusters, succeeded=succeeded, failed=clusters - succeeded, quota_errors=quota, nodes=nodes,
+        wall_s=round(wall, 3), clusters_per_minute=round(succeeded / wall * 60, 1),
+        phases=len(results), phases_per_second=round(len(results) / wall, 1),
+        cluster_p50_s=round(percentile(walls, 50), 4), cluster_p95_s=round(percentile(walls, 95), 4),
+        simulated_s=round(simulated, 3),
+        overhead_ms_per_phase=round(max(0.0, sum(r.duration for r in results) - simulated) / max(1, len(results))
+                                    * 1000, 3),
+        wait_p50_ms=round(percentile(waits, 50), 3), wait_p95_ms=round(percentile(waits, 95), 3),
+        wait_max_ms=round(max(waits, default=0.0), 3), loop_lag_max_ms=round(monitor.max_lag * 1000, 1),
+    )
+
+
+class ApiClient:
+    """One keep-alive HTTP connection per thread, timing every request by route."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = self.local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, route: str, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any]:
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        for attempt in range(2):
+            reused = getattr(self.local, "conn", None) is not None
+            started = time.perf_counter()
+            try:
+                conn = self._connection()
+                conn.request(method, path, payload, headers)
+                response = conn.getresponse()
+                data = response.read()
+                status = response.status
+                break
+            except (OSError, http.client.HTTPException):
+                self.local.conn = None
+                # The server closed an idle keep-alive connection: retry once on a new one
+                if reused and attempt == 0:
+                    continue
+                with self.lock:
+                    self.errors[route] += 1
+                return 0, None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if status >= 500:
+                self.errors[route] += 1
+        if "json" not in response.getheader("content-type", ""):
+            return status, data.decode(errors="replace")
+        return status, json.loads(data) if data else None
+
+
+@dataclass
+class RouteStats:
+    route: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+@dataclass
+class BackendResult:
+    clusters: int
+    submitted: int
+    succeeded: int
+    failed: int
+    wall_s: float
+    clusters_per_minute: float
+    routes: List[RouteStats]
+    loop_blocked: Optional[int] = None
+    budget_failures: List[str] = field(default_factory=list)
+
+    def format(self) -> str:
+        lines = [f"{self.submitted}/{self.clusters} clusters submitted, {self.succeeded} succeeded, "
+                 f"{self.failed} failed in {self.wall_s:.1f}s ({self.clusters_per_minute:.1f} clusters/min)",
+                 f"{'route':<32} {'requests':>9} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+        for r in self.routes:
+            lines.append(f"{r.route:<32} {r.requests:>9} {r.errors:>7} {r.p50_ms:>7.1f}ms {r.p95_ms:>7.1f}ms "
+                         f"{r.p99_ms:>7.1f}ms {r.max_ms:>7.1f}ms")
+        if self.loop_blocked is not None:
+            lines.append(f"Backend event loop blocked {self.loop_blocked} time(s) during the run")
+        lines.extend(f"BUDGET MISSED: {failure}" for failure in self.budget_failures)
+        return "\n".join(lines)
+
+
+def _loop_blocked(client: ApiClient) -> Optional[int]:
+    status, text = client.request("GET /metrics", "GET", "/metrics")
+    if status != 200 or not isinstance(text, str):
+        return None
+    for line in text.splitlines():
+        if line.startswith("mongocraft_event_loop_blocked_total "):
+            return int(float(line.split()[1]))
+    return None
+
+
+def run_backend(url: str, clusters: int, concurrency: int, readers: int, mix: Sequence[str], shards: int,
+                timeout: float, api: str = "/api/v1", keep: bool = False) -> BackendResult:
+    client = ApiClient(url)
+    blocked_before = _loop_blocked(client)
+    run_id = uuid.uuid4().hex[:6]
+    kinds = itertools.cycle(mix)
+    specs = [{"name": f"lt-{run_id}-{i}", "type": next(kinds), "project_id": "loadtest", "shard_count": shards}
+             for i in range(clusters)]
+    submitted: Dict[str, str] = {}  # job id -> cluster id
+    finished: Dict[str, str] = {}
+    lock = threading.Lock()
+    done = threading.Event()
+    started = time.monotonic()
+
+    def submit(spec: dict):
+        status, body = client.request("POST /clusters", "POST", f"{api}/clusters/", spec)
+        if status == 202:
+            with lock:
+                submitted[body["job_id"]] = body["cluster"]["id"]
+
+    def read(worker: int):
+        for step in itertools.count(worker):
+            if done.is_set():
+                return
+            with lock:
+                jobs = [j for j in submitted if j not in finished]
+                cluster_ids = list(submitted.values())
+            if step % 3 == 0 or not jobs:
+                client.request("GET /clusters", "GET", f"{api}/clusters/?limit=50")
+            if cluster_ids and step % 3 == 1:
+                client.request("GET /clusters/{id}", "GET", f"{api}/clusters/{cluster_ids[step % len(cluster_ids)]}")
+            if jobs:
+                job_id = jobs[step % len(jobs)]
+                status, body = client.request("GET /jobs/{id}", "GET", f"{api}/jobs/{job_id}")
+                if status == 200 and body["status"] in ("succeeded", "failed", "cancelled"):
+                    with lock:
+                        finished[job_id] = body["status"]
+            time.sleep(0.01)
+
+    with ThreadPoolExecutor(max_workers=concurrency + readers) as pool:
+        poll = [pool.submit(read, i) for i in range(readers)]
+        list(pool.map(submit, specs))
+        deadline = started + timeout
+        while time.monotonic() < deadline:
+            with lock:
+                if len(finished) >= len(submitted):
+                    break
+            time.sleep(0.05)
+        done.set()
+        for future in poll:
+            future.result()
+    wall = time.monotonic() - started
+
+    if not keep:
+        for cluster_id in submitted.values():
+            client.request("DELETE /clusters/{id}", "DELETE", f"{api}/clusters/{cluster_id}")
+    blocked_after = _loop_blocked(client)
+    routes = [RouteStats(route, len(values) + client.errors[route], client.errors[route],
+                         *(round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)),
+                         round(max(values, default=0.0) * 1000, 1))
+              for route, values in sorted(client.latencies.items())]
+    succeeded = sum(1 for s in finished.values() if s == "succeeded")
+    return BackendResult(
+        clusters=clusters, submitted=len(submitted), succeeded=succeeded, failed=len(finished) - succeeded,
+        wall_s=round(wall, 2), clusters_per_minute=round(succeeded / wall * 60, 1), routes=routes,
+        loop_blocked=blocked_after - blocked_before if None not in (blocked_before, blocked_after) else None,
+    )
+
+
+def simulator_config(args) -> SimulatorConfig:
+    config = SimulatorConfig.load(args.config) if args.config else SimulatorConfig(seed=args.seed)
+    if args.time_scale is not None:
+        config.time_scale = args.time_scale
+    if args.quota is not None:
+        config.quota_instances = args.quota
+    if args.failure_rate:
+        for key in ("terraform apply", "ansible"):
+            config.failures.setdefault(key, args.failure_rate)
+    return config
+
+
+def pipeline_budget(result: PipelineResult, args) -> List[str]:
+    failures = []
+    if args.min_clusters_per_minute and result.clusters_per_minute < args.min_clusters_per_minute:
+        failures.append(f"{result.clusters_per_minute} clusters/min < {args.min_clusters_per_minute}")
+    if args.max_overhead_ms is not None and result.overhead_ms_per_phase > args.max_overhead_ms:
+        failures.append(f"{result.overhead_ms_per_phase}ms overhead per phase > {args.max_overhead_ms}ms")
+    if args.max_wait_ms is not None and result.wait_p95_ms > args.max_wait_ms:
+        failures.append(f"{result.wait_p95_ms}ms p95 phase wait > {args.max_wait_ms}ms")
+    return failures
+
+
+def backend_budget(result: BackendResult, args) -> List[str]:
+    failures = []
+    if result.submitted < result.clusters:
+        failures.append(f"only {result.submitted} of {result.clusters} clusters accepted")
+    for route in result.routes:
+        if args.max_p95_ms is not None and route.p95_ms > args.max_p95_ms:
+            failures.append(f"{route.route} p95 {route.p95_ms}ms > {args.max_p95_ms}ms")
+        if route.errors:
+            failures.append(f"{route.route}: {route.errors} failed requests")
+    if args.min_clusters_per_minute and result.clusters_per_minute < args.min_clusters_per_minute:
+        failures.append(f"{result.clusters_per_minute} clusters/min < {args.min_clusters_per_minute}")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m dbprov.loadtest",
+                                     description="Load-test provisioning with simulated terraform and ansible")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    for name, help in (("pipeline", "Provision clusters in this process"), ("backend", "Drive a running backend")):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("--clusters", type=int, default=100, help="Clusters to provision")
+        p.add_argument("--concurrency", type=int, default=20, help="Clusters submitted or provisioned at a time")
+        p.add_argument("--mix", default=DEFAULT_MIX, help=f"Cluster types and weights (default: {DEFAULT_MIX})")
+        p.add_argument("--shards", type=int, default=3, help="Shards of every sharded cluster")
+        p.add_argument("--min-clusters-per-minute", type=float, help="Fail below this provisioning throughput")
+        p.add_argument("--json", action="store_true", help="Print results as JSON")
+    pipeline = sub.choices["pipeline"]
+    pipeline.add_argument("--max-parallel", type=int, default=8, help="Phases per cluster at a time")
+    pipeline.add_argument("--config", help="Simulator config file (default: built-in latencies)")
+    pipeline.add_argument("--time-scale", type=float, default=0.001,
+                          help="Multiplier of the simulated latencies; 0 measures pure overhead")
+    pipeline.add_argument("--seed", type=int, default=1, help="Seed of latencies and failures")
+    pipeline.add_argument("--quota", type=int, help="Instance quota of the simulated project")
+    pipeline.add_argument("--failure-rate", type=float, default=0.0,
+                          help="Probability that a terraform apply or playbook fails")
+    pipeline.add_argument("--keep", action="store_true", help="Keep the temporary state directory")
+    pipeline.add_argument("--max-overhead-ms", type=float, help="Fail above this orchestration overhead per phase")
+    pipeline.add_argument("--max-wait-ms", type=float, help="Fail above this p95 wait from ready to started")
+    backend = sub.choices["backend"]
+    backend.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL")
+    backend.add_argument("--readers", type=int, default=8, help="Threads polling clusters and jobs meanwhile")
+    backend.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for every job")
+    backend.add_argument("--keep", action="store_true", help="Leave the clusters registered")
+    backend.add_argument("--max-p95-ms", type=float, help="Fail when a route's p95 latency is above this")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.mode == "pipeline":
+        from dbprov.simulator import SimulatorError
+        try:
+            config = simulator_config(args)
+        except SimulatorError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        home = tempfile.mkdtemp(prefix="dbprov-loadtest-")
+        os.environ["DBPROVISION_HOME"] = home
+        try:
+            result = asyncio.run(run_pipeline(config, args.clusters, args.concurrency, args.max_parallel, mix,
+                                              args.shards))
+        finally:
+            if args.keep:
+                print(f"State kept in {home}", file=sys.stderr)
+            else:
+                import shutil
+                shutil.rmtree(home, ignore_errors=True)
+        result.budget_failures = pipeline_budget(result, args)
+    else:
+        result = run_backend(args.url, args.clusters, args.concurrency, args.readers, mix, args.shards,
+                             args.timeout, keep=args.keep)
+        result.budget_failures = backend_budget(result, args)
+
+    print(json.dumps(asdict(result), indent=2) if args.json else result.format())
+    if result.budget_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
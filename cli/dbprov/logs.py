@@ -0,0 +1,643 @@
+"""Columnar analytics over mongod/mongos structured (JSON) logs.
+
+A log is streamed once, line by line, into typed columns that are saved as
+NumPy ``.npy`` files and memory-mapped on later runs, so repeated queries do
+not parse the log again. Only lines a query needs (slow operations,
+connection accept/end, elections and replica set state transitions) go
+through ``json.loads``; a byte-level pre-filter skips the rest, which are
+only counted by severity.
+
+The cache directory of a log is named after a hash of its first 64KB, and
+its metadata records how many bytes were parsed plus a hash of the last 64KB
+of them. An unchanged log is served straight from the cache, a log that only
+grew is parsed from where the cache ends and the new rows appended, and
+anything else (rotation, truncation) is parsed from scratch. Compressed
+(``.gz``) logs cannot be resumed and are keyed by size and both ends instead.
+
+NumPy is optional: ``pip install dbprovision[logs]``.
+"""
+
+import array
+import datetime
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # optional, see setup.py extras
+    numpy = None
+
+CACHE_VERSION = 1
+FINGERPRINT_BYTES = 64 * 1024
+READ_BUFFER = 4 * 1024 * 1024
+
+SLOW_QUERY = 51803
+CONNECTION_ACCEPTED = 22943
+CONNECTION_ENDED = 22944
+STATE_TRANSITION = 21358
+
+# Lines worth decoding; everything else only has its severity counted
+_INTERESTING = re.compile(rb'"id": ?(?:51803|22943|22944|21358)[,} ]|"c": ?"ELECTION"')
+_SEVERITY = re.compile(rb'"s": ?"([A-Z]\d?)"')
+
+# Latency bands of the histogram, in milliseconds
+LATENCY_BANDS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BUCKETS_MS = (60_000, 300_000, 900_000, 3_600_000, 6 * 3_600_000, 24 * 3_600_000)
+OP_COLUMNS = {"time": "q", "duration": "d", "ns": "q", "op": "q", "plan": "q",
+              "docs_examined": "q", "keys_examined": "q", "returned": "q"}
+CONNECTION_COLUMNS = {"time": "q", "delta": "b", "open": "q", "remote": "q"}
+DICTIONARIES = ("ns", "op", "plan", "remote")
+REPORTS = ("summary", "slow", "latency", "connections", "elections")
+EVENT_ATTRS = ("oldState", "newState", "term", "reason", "electionTerm", "candidateIndex", "primary")
+
+
+class LogError(Exception):
+    pass
+
+
+def require_numpy():
+    if numpy is None:
+        raise LogError("Log analytics need the numpy package: pip install dbprovision[logs]")
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def epoch_ms(value: Any) -> Optional[int]:
+    """Milliseconds since the epoch of a log ``t`` field (``{"$date": ISO-8601}``)."""
+    if isinstance(value, dict):
+        value = value.get("$date")
+    if isinstance(value, dict):  # {"$numberLong": "..."} in canonical extended JSON
+        value = value.get("$numberLong")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _int(value: Any, default: int = -1) -> int:
+    if isinstance(value, dict) and len(value) == 1:  # {"$numberLong": "..."}
+        value = next(iter(value.values()))
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_bucket(value: str) -> int:
+    """Milliseconds of a bucket width such as ``30s``, ``5m``, ``1h`` or ``1d``."""
+    match = re.fullmatch(r"\s*(\d+)\s*([smhd])\s*", value)
+    if not match or not int(match.group(1)):
+        raise LogError(f"Invalid bucket width {value!r}, expected e.g. 5m or 1h")
+    return int(match.group(1)) * {"s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}[match.group(2)]
+
+
+def format_ms(value: int) -> str:
+    return datetime.datetime.fromtimestamp(value / 1000, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Dictionary:
+    """Dictionary encoding of a string column."""
+
+    def __init__(self, values: Sequence[str] = ()):
+        self.values: List[str] = list(values)
+        self.codes: Dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ColumnBuilder:
+    """Rows appended to typed ``array.array`` columns, cheap to hand to NumPy."""
+
+    def __init__(self, columns: Dict[str, str]):
+        self.columns = {name: array.array(code) for name, code in columns.items()}
+
+    def append(self, **row):
+        for name, column in self.columns.items():
+            column.append(row[name])
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    def arrays(self) -> Dict[str, Any]:
+        return {name: numpy.frombuffer(column, dtype=column.typecode) if len(column)
+                else numpy.zeros(0, dtype=column.typecode) for name, column in self.columns.items()}
+
+
+@dataclass
+class ParseState:
+    """Everything a parse accumulates besides the columns; saved as the cache metadata."""
+    lines: int = 0
+    skipped: int = 0
+    severity: Dict[str, int] = field(default_factory=dict)
+    first: Optional[int] = None
+    last: Optional[int] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class LogParser:
+    def __init__(self, dictionaries: Optional[Dict[str, Dictionary]] = None, state: Optional[ParseState] = None):
+        self.dictionaries = dictionaries or {name: Dictionary() for name in DICTIONARIES}
+        self.state = state or ParseState()
+        self.ops = ColumnBuilder(OP_COLUMNS)
+        self.connections = ColumnBuilder(CONNECTION_COLUMNS)
+
+    def feed(self, line: bytes):
+        state = self.state
+        state.lines += 1
+        match = _SEVERITY.search(line, 0, 64)
+        if match:
+            severity = match.group(1).decode()
+            state.severity[severity] = state.severity.get(severity, 0) + 1
+        if not _INTERESTING.search(line):
+            return
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            state.skipped += 1
+            return
+        at = epoch_ms(entry.get("t"))
+        if at is None:
+            state.skipped += 1
+            return
+        state.first = at if state.first is None else min(state.first, at)
+        state.last = at if state.last is None else max(state.last, at)
+        attr = entry.get("attr") or {}
+        kind = entry.get("id")
+        if kind == SLOW_QUERY:
+            self._slow_op(at, attr)
+        elif kind in (CONNECTION_ACCEPTED, CONNECTION_ENDED):
+            remote = str(attr.get("remote", "")).rsplit(":", 1)[0]
+            self.connections.append(time=at, delta=1 if kind == CONNECTION_ACCEPTED else -1,
+                                    open=_int(attr.get("connectionCount")),
+                                    remote=self.dictionaries["remote"].code(remote))
+        else:
+            event = {"time": at, "component": entry.get("c", ""), "id": kind, "msg": entry.get("msg", "")}
+            event.update({k: attr[k] for k in EVENT_ATTRS if k in attr and not isinstance(attr[k], (dict, list))})
+            state.events.append(event)
+
+    def _slow_op(self, at: int, attr: Dict[str, Any]):
+        command = attr.get("command")
+        op = attr.get("type", "")
+        if op == "command" and isinstance(command, dict) and command:
+            op = next(iter(command))
+        plan = str(attr.get("planSummary", "")).split(" ", 1)[0].rstrip(",")
+        self.ops.append(time=at, duration=float(_int(attr.get("durationMillis"), 0)),
+                        ns=self.dictionaries["ns"].code(str(attr.get("ns", ""))),
+                        op=self.dictionaries["op"].code(op), plan=self.dictionaries["plan"].code(plan),
+                        docs_examined=_int(attr.get("docsExamined")),
+                        keys_examined=_int(attr.get("keysExamined")),
+                        returned=_int(attr.get("nreturned", attr.get("nMatched"))))
+
+
+def _stream_lines(f, partial: bool = False) -> Iterable[Tuple[bytes, int]]:
+    """(line, bytes consumed so far) for every complete line.
+
+    A last line without a newline is still being written unless ``partial``
+    says the file is finished; it is left for the next incremental parse.
+    """
+    consumed = 0
+    pending = b""
+    while True:
+        block = f.read(READ_BUFFER)
+        if not block:
+            break
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            consumed += len(line) + 1
+            yield line, consumed
+    if partial and pending.strip():
+        yield pending, consumed + len(pending)
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+def _hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _read_range(path: Path, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(max(0, start))
+        return f.read(end - max(0, start))
+
+
+def cache_key(path: Path) -> str:
+    if path.suffix == ".gz":
+        size = path.stat().st_size
+        return _hash(_read_range(path, 0, FINGERPRINT_BYTES) + str(size).encode()
+                     + _read_range(path, size - FINGERPRINT_BYTES, size))
+    return _hash(_read_range(path, 0, FINGERPRINT_BYTES))
+
+
+@dataclass
+class LogTable:
+    """Columns of one or more logs; arrays may be memory-mapped cache files."""
+    ops: Dict[str, Any]
+    connections: Dict[str, Any]
+    dictionaries: Dict[str, List[str]]
+    events: List[Dict[str, Any]]
+    state: ParseState
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def concat(cls, tables: Sequence["LogTable"]) -> "LogTable":
+        if len(tables) == 1:
+            return tables[0]
+        merged = {name: Dictionary() for name in DICTIONARIES}
+        ops: Dict[str, List[Any]] = {name: [] for name in OP_COLUMNS}
+        connections: Dict[str, List[Any]] = {name: [] for name in CONNECTION_COLUMNS}
+        state = ParseState()
+        events: List[Dict[str, Any]] = []
+        sources: List[Dict[str, Any]] = []
+        for table in tables:
+            remap = {name: numpy.array([merged[name].code(v) for v in table.dictionaries[name]] or [0],
+                                       dtype=numpy.int64) for name in DICTIONARIES}
+            for name, column in table.ops.items():
+                ops[name].append(remap[name][column] if name in remap else column)
+            for name, column in table.connections.items():
+                connections[name].append(remap[name][column] if name in remap else column)
+            state.lines += table.state.lines
+            state.skipped += table.state.skipped
+            for severity, count in table.state.severity.items():
+                state.severity[severity] = state.severity.get(severity, 0) + count
+            state.first = _bound(min, state.first, table.state.first)
+            state.last = _bound(max, state.last, table.state.last)
+            events.extend(table.events)
+            sources.extend(table.sources)
+        events.sort(key=lambda e: e["time"])
+        return cls({n: numpy.concatenate(c) for n, c in ops.items()},
+                   {n: numpy.concatenate(c) for n, c in connections.items()},
+                   {n: d.values for n, d in merged.items()}, events, state, sources)
+
+
+def _bound(pick, a: Optional[int], b: Optional[int]) -> Optional[int]:
+    return b if a is None else a if b is None else pick(a, b)
+
+
+class LogCache:
+    """Parsed logs as ``.npy`` columns under ``root/<key>/``."""
+
+    def __init__(self, root: Path, progress=print):
+        require_numpy()
+        self.root = Path(root)
+        self.progress = progress
+
+    def load(self, path: Path, rebuild: bool = False) -> LogTable:
+        path = Path(path)
+        try:
+            key = cache_key(path)
+            size = path.stat().st_size
+        except OSError as e:
+            raise LogError(f"Cannot read {path}: {e}")
+        directory = self.root / key
+        meta = None if rebuild else self._meta(directory)
+        if meta is not None and path.suffix != ".gz":
+            parsed = meta["size"]
+            tail = _hash(_read_range(path, parsed - FINGERPRINT_BYTES, parsed)) if parsed <= size else None
+            if tail != meta["tail"]:
+                meta = None
+            elif parsed < size:
+                return self._parse(path, directory, key, self._open(directory, meta, path), parsed)
+        if meta is not None:
+            return self._open(directory, meta, path)
+        return self._parse(path, directory, key)
+
+    @staticmethod
+    def _meta(directory: Path) -> Optional[Dict[str, Any]]:
+        try:
+            meta = json.loads((directory / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CACHE_VERSION else None
+
+    def _open(self, directory: Path, meta: Dict[str, Any], path: Path) -> LogTable:
+        columns = {}
+        for group, names in (("ops", OP_COLUMNS), ("connections", CONNECTION_COLUMNS)):
+            columns[group] = {name: numpy.load(directory / f"{group}.{name}.npy", mmap_mode="r") for name in names}
+        state = ParseState(meta["lines"], meta["skipped"], meta["severity"], meta["first"], meta["last"],
+                           meta["events"])
+        events = [dict(e, source=path.name) for e in meta["events"]]
+        source = {"path": str(path), "key": directory.name, "bytes": meta["size"], "lines": meta["lines"],
+                  "parse_seconds": meta["parse_seconds"]}
+        return LogTable(columns["ops"], columns["connections"], meta["dictionaries"], events, state, [source])
+
+    def _parse(self, path: Path, directory: Path, key: str, previous: Optional[LogTable] = None,
+               offset: int = 0) -> LogTable:
+        started = time.monotonic()
+        if previous is not None:
+            parser = LogParser({n: Dictionary(v) for n, v in previous.dictionaries.items()}, previous.state)
+            self.progress(f"Parsing {path} from byte {offset} ({previous.state.lines} lines cached)")
+        else:
+            parser = LogParser()
+            self.progress(f"Parsing {path} into the columnar cache ...")
+        consumed = offset
+        try:
+            if path.suffix == ".gz":
+                with gzip.open(path, "rb") as f:
+                    for line, _ in _stream_lines(f, partial=True):
+                        parser.feed(line)
+                consumed = path.stat().st_size
+            else:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for line, position in _stream_lines(f):
+                        parser.feed(line)
+                        consumed = offset + position
+        except (OSError, EOFError) as e:
+            raise LogError(f"Cannot read {path}: {e}")
+
+        ops, connections = parser.ops.arrays(), parser.connections.arrays()
+        if previous is not None:
+            ops = {n: numpy.concatenate([numpy.asarray(previous.ops[n]), c]) for n, c in ops.items()}
+            connections = {n: numpy.concatenate([numpy.asarray(previous.connections[n]), c])
+                           for n, c in connections.items()}
+        state = parser.state
+        elapsed = time.monotonic() - started
+        if previous is not None:
+            elapsed += previous.sources[0]["parse_seconds"]
+        meta = {
+            "version": CACHE_VERSION,
+            "source": str(path),
+            "size": consumed,
+            "tail": _hash(_read_range(path, consumed - FINGERPRINT_BYTES, consumed)) if path.suffix != ".gz" else None,
+            "lines": state.lines,
+            "skipped": state.skipped,
+            "severity": state.severity,
+            "first": state.first,
+            "last": state.last,
+            "events": state.events,
+            "dictionaries": {n: d.values for n, d in parser.dictionaries.items()},
+            "parse_seconds": round(elapsed, 3),
+        }
+        self._write(directory, meta, ops, connections)
+        self.progress(f"Cached {state.lines} lines ({len(ops['time'])} slow ops, {len(connections['time'])} "
+                      f"connection events) in {time.monotonic() - started:.1f}s")
+        return self._open(directory, meta, path)
+
+    def _write(self, directory: Path, meta: Dict[str, Any], ops: Dict[str, Any], connections: Dict[str, Any]):
+        staging = directory.with_name(f".{directory.name}.{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for group, columns in (("ops", ops), ("connections", connections)):
+            for name, column in columns.items():
+                numpy.save(staging / f"{group}.{name}.npy", numpy.ascontiguousarray(column))
+        (staging / "meta.json").write_text(json.dumps(meta))
+        # Swap in whole: a reader never sees columns of two different parses
+        if directory.exists():
+            retired = directory.with_name(f".{directory.name}.old.{os.getpid()}")
+            directory.rename(retired)
+            shutil.rmtree(retired, ignore_errors=True)
+        staging.rename(directory)
+
+
+def load_logs(paths: Sequence[Path], cache_dir: Path, rebuild: bool = False, progress=print) -> LogTable:
+    cache = LogCache(cache_dir, progress)
+    return LogTable.concat([cache.load(Path(p), rebuild) for p in paths])
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+@dataclass
+class LogFilter:
+    since: Optional[int] = None  # epoch ms
+    until: Optional[int] = None
+    namespace: Optional[str] = None  # glob, e.g. "shop.*"
+    min_ms: float = 0.0
+
+
+def choose_bucket(first: Optional[int], last: Optional[int], buckets: int = 24) -> int:
+    span = (last or 0) - (first or 0)
+    return next((b for b in BUCKETS_MS if span / b <= buckets), BUCKETS_MS[-1])
+
+
+def _mask(columns: Dict[str, Any], flt: LogFilter):
+    mask = numpy.ones(len(columns["time"]), dtype=bool)
+    if flt.since is not None:
+        mask &= columns["time"] >= flt.since
+    if flt.until is not None:
+        mask &= columns["time"] < flt.until
+    return mask
+
+
+def _ops(table: LogTable, flt: LogFilter) -> Dict[str, Any]:
+    ops = table.ops
+    mask = _mask(ops, flt)
+    if flt.min_ms:
+        mask &= ops["duration"] >= flt.min_ms
+    if flt.namespace:
+        wanted = [i for i, ns in enumerate(table.dictionaries["ns"]) if fnmatch.fnmatchcase(ns, flt.namespace)]
+        mask &= numpy.isin(ops["ns"], wanted)
+    return {name: numpy.asarray(column)[mask] for name, column in ops.items()}
+
+
+def _groups(keys, values) -> Tuple[Any, Any, Any, Any]:
+    """(sort order, group keys, start offsets, sizes) of rows sorted by key, then value."""
+    order = numpy.lexsort((values, keys))
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    sizes = numpy.diff(numpy.r_[starts, len(keys)])
+    return order, keys[starts], starts, sizes
+
+
+def _percentile(starts, sizes, values, q: float):
+    """Nearest-rank percentile of every group of sorted ``values``."""
+    rank = numpy.clip(numpy.ceil(sizes * q / 100.0).astype(numpy.int64) - 1, 0, None)
+    return values[starts + rank]
+
+
+def slow_ops_by_namespace(table: LogTable, flt: LogFilter, top: int = 10) -> List[Dict[str, Any]]:
+    ops = _ops(table, flt)
+    if not len(ops["time"]):
+        return []
+    order, names, starts, sizes = _groups(ops["ns"], ops["duration"])
+    durations = ops["duration"][order]
+    totals = numpy.add.reduceat(durations, starts)
+    examined = numpy.add.reduceat(numpy.clip(ops["docs_examined"][order], 0, None), starts)
+    returned = numpy.add.reduceat(numpy.clip(ops["returned"][order], 0, None), starts)
+    collscan = table.dictionaries["plan"].index("COLLSCAN") if "COLLSCAN" in table.dictionaries["plan"] else -1
+    scans = numpy.add.reduceat((ops["plan"][order] == collscan).astype(numpy.int64), starts)
+    p50, p95, p99 = (_percentile(starts, sizes, durations, q) for q in (50, 95, 99))
+    maximum = durations[starts + sizes - 1]
+    rows = []
+    for i in numpy.argsort(-totals, kind="stable")[:top]:
+        rows.append({
+            "namespace": table.dictionaries["ns"][int(names[i])],
+            "count": int(sizes[i]),
+            "total_ms": float(totals[i]),
+            "p50_ms": float(p50[i]),
+            "p95_ms": float(p95[i]),
+            "p99_ms": float(p99[i]),
+            "max_ms": float(maximum[i]),
+            "collscans": int(scans[i]),
+            "docs_examined": int(examined[i]),
+            "returned": int(returned[i]),
+        })
+    return rows
+
+
+def latency_over_time(table: LogTable, flt: LogFilter, bucket_ms: Optional[int] = None) -> Dict[str, Any]:
+    ops = _ops(table, flt)
+    bucket_ms = bucket_ms or choose_bucket(table.state.first, table.state.last)
+    if not len(ops["time"]):
+        return {"bucket_ms": bucket_ms, "bands_ms": list(LATENCY_BANDS), "rows": []}
+    order, keys, starts, sizes = _groups(ops["time"] // bucket_ms, ops["duration"])
+    durations = ops["duration"][order]
+    bands = numpy.searchsorted(numpy.array(LATENCY_BANDS[1:]), durations, side="right")
+    group = numpy.repeat(numpy.arange(len(keys)), sizes)
+    histogram = numpy.bincount(group * len(LATENCY_BANDS) + bands,
+                               minlength=len(keys) * len(LATENCY_BANDS)).reshape(len(keys), len(LATENCY_BANDS))
+    p50, p95, p99 = (_percentile(starts, sizes, durations, q) for q in (50, 95, 99))
+    rows = [{
+        "start": int(keys[i] * bucket_ms),
+        "count": int(sizes[i]),
+        "p50_ms": float(p50[i]),
+        "p95_ms": float(p95[i]),
+        "p99_ms": float(p99[i]),
+        "max_ms": float(durations[starts[i] + sizes[i] - 1]),
+        "histogram": [int(c) for c in histogram[i]],
+    } for i in range(len(keys))]
+    return {"bucket_ms": bucket_ms, "bands_ms": list(LATENCY_BANDS), "rows": rows}
+
+
+def connection_churn(table: LogTable, flt: LogFilter, bucket_ms: Optional[int] = None,
+                     top: int = 10) -> Dict[str, Any]:
+    conns = table.connections
+    mask = _mask(conns, flt)
+    times, deltas = numpy.asarray(conns["time"])[mask], numpy.asarray(conns["delta"])[mask]
+    opened, remotes = numpy.asarray(conns["open"])[mask], numpy.asarray(conns["remote"])[mask]
+    bucket_ms = bucket_ms or choose_bucket(table.state.first, table.state.last)
+    result: Dict[str, Any] = {"bucket_ms": bucket_ms, "accepted": int((deltas > 0).sum()),
+                              "ended": int((deltas < 0).sum()), "rows": [], "remotes": []}
+    if not len(times):
+        return result
+    order, keys, starts, sizes = _groups(times // bucket_ms, times)
+    accepted = numpy.add.reduceat((deltas[order] > 0).astype(numpy.int64), starts)
+    peak = numpy.maximum.reduceat(opened[order], starts)
+    result["rows"] = [{"start": int(keys[i] * bucket_ms), "accepted": int(accepted[i]),
+                       "ended": int(sizes[i] - accepted[i]), "peak_open": int(peak[i])} for i in range(len(keys))]
+    counts = numpy.bincount(remotes[deltas > 0], minlength=len(table.dictionaries["remote"]))
+    result["remotes"] = [{"remote": table.dictionaries["remote"][int(i)], "accepted": int(counts[i])}
+                         for i in numpy.argsort(-counts, kind="stable")[:top] if counts[i]]
+    minutes = max((int(times.max()) - int(times.min())) / 60_000, 1.0)
+    result["accepted_per_minute"] = round(result["accepted"] / minutes, 2)
+    return result
+
+
+def election_events(table: LogTable, flt: LogFilter) -> List[Dict[str, Any]]:
+    return [e for e in table.events
+            if (flt.since is None or e["time"] >= flt.since) and (flt.until is None or e["time"] < flt.until)]
+
+
+def summary(table: LogTable) -> Dict[str, Any]:
+    state = table.state
+    return {
+        "sources": table.sources,
+        "lines": state.lines,
+        "skipped": state.skipped,
+        "severity": dict(sorted(state.severity.items())),
+        "first": state.first,
+        "last": state.last,
+        "slow_ops": int(len(table.ops["time"])),
+        "connection_events": int(len(table.connections["time"])),
+        "election_events": len(table.events),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Formatting
+# ---------------------------------------------------------------------------
+
+def _span(first: Optional[int], last: Optional[int]) -> str:
+    return f"{format_ms(first)} -> {format_ms(last)}" if first is not None and last is not None else "no timestamps"
+
+
+def format_summary(data: Dict[str, Any]) -> str:
+    lines = [f"{len(data['sources'])} log(s), {data['lines']} lines, {_span(data['first'], data['last'])}"]
+    for source in data["sources"]:
+        lines.append(f"  {source['path']}  {source['bytes'] / 1024 ** 2:.1f}MB  cache {source['key'][:12]}")
+    severity = ", ".join(f"{k}={v}" for k, v in data["severity"].items())
+    lines.append(f"  severity: {severity or '-'}")
+    lines.append(f"  slow ops: {data['slow_ops']}, connection events: {data['connection_events']}, "
+                 f"election events: {data['election_events']}" + (f", unparsable: {data['skipped']}"
+                                                                    if data["skipped"] else ""))
+    return "\n".join(lines)
+
+
+def format_slow_ops(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "Slow operations: none"
+    lines = ["Slow operations by namespace:",
+             f"  {'namespace':<32} {'count':>7} {'total':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+             f"{'COLLSCAN':>8} {'exam/ret':>9}"]
+    for r in rows:
+        ratio = f"{r['docs_examined'] / max(r['returned'], 1):.0f}" if r["docs_examined"] else "-"
+        lines.append(f"  {r['namespace'][:32]:<32} {r['count']:>7} {r['total_ms'] / 1000:>9.1f}s "
+                     f"{r['p50_ms']:>6.0f}ms {r['p95_ms']:>6.0f}ms {r['p99_ms']:>6.0f}ms {r['max_ms']:>6.0f}ms "
+                     f"{r['collscans']:>8} {ratio:>9}")
+    return "\n".join(lines)
+
+
+def format_latency(data: Dict[str, Any]) -> str:
+    if not data["rows"]:
+        return "Latency over time: no slow operations"
+    bands = data["bands_ms"]
+    labels = [f"<{b}" for b in bands[1:]] + [f">={bands[-1]}"]
+    lines = [f"Latency over time ({data['bucket_ms'] // 60_000} min buckets, ms):",
+             f"  {'start':<19} {'count':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}  "
+             + " ".join(f"{label:>6}" for label in labels)]
+    for r in data["rows"]:
+        lines.append(f"  {format_ms(r['start']):<19} {r['count']:>7} {r['p50_ms']:>7.0f} {r['p95_ms']:>7.0f} "
+                     f"{r['p99_ms']:>7.0f} {r['max_ms']:>7.0f}  " + " ".join(f"{c:>6}" for c in r["histogram"]))
+    return "\n".join(lines)
+
+
+def format_connections(data: Dict[str, Any]) -> str:
+    if not data["rows"]:
+        return "Connection churn: no connection events"
+    lines = [f"Connection churn: {data['accepted']} accepted, {data['ended']} ended "
+             f"({data['accepted_per_minute']}/min), {data['bucket_ms'] // 60_000} min buckets:",
+             f"  {'start':<19} {'accepted':>9} {'ended':>9} {'peak open':>10}"]
+    for r in data["rows"]:
+        lines.append(f"  {format_ms(r['start']):<19} {r['accepted']:>9} {r['ended']:>9} {r['peak_open']:>10}")
+    if data["remotes"]:
+        lines.append("  Top clients: " + ", ".join(f"{r['remote']} ({r['accepted']})" for r in data["remotes"]))
+    return "\n".join(lines)
+
+
+def format_elections(events: List[Dict[str, Any]]) -> str:
+    if not events:
+        return "Elections and state transitions: none"
+    lines = ["Elections and state transitions:"]
+    for e in events:
+        detail = (f"{e['oldState']} -> {e['newState']}" if "newState" in e
+                  else " ".join(f"{k}={e[k]}" for k in EVENT_ATTRS if k in e))
+        lines.append(f"  {format_ms(e['time'])}  {e.get('source', ''):<20} {e['msg']}" + (f"  {detail}" if detail else ""))
+    return "\n".join(lines)
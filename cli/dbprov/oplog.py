@@ -0,0 +1,827 @@
+"""Incremental backups by tailing the oplog, and point-in-time restore.
+
+An ``OplogTailer`` follows ``local.oplog.rs`` of one node per replica set
+(each shard of a sharded cluster) with a tailable, awaitData cursor and writes
+what it reads to the backup target as compressed segments::
+
+    oplog/<replica set>/<start>-<end>.<codec>
+
+``start`` and ``end`` are oplog timestamps packed into 20-digit integers, so
+segment names sort by time and the listing is the index. A segment holds the
+entries after ``start`` up to and including ``end``; a tailer resumes from the
+``end`` of the newest segment, so consecutive segments chain
+(``next.start == previous.end``) and any break in the chain is a window that
+was not captured.
+
+Restoring to a point in time loads the newest base backup that was consistent
+before it (every shard's ``oplog_end`` at or before the target) and replays
+each shard's chain from that backup's ``oplog_start`` up to the target. Shard
+streams are merged by timestamp; DDL commands are barriers, everything between
+two barriers is applied per namespace in parallel, in order within a
+namespace and batched into ordered ``update``/``delete`` commands. Replayed
+writes are idempotent (inserts become upserts by ``_id``), which is what makes
+a non-snapshot dump consistent once its window has been replayed over it.
+"""
+
+import asyncio
+import concurrent.futures
+import datetime
+import heapq
+import re
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dbprov.backup import (MB, SECONDARY_PREFERRED, SYSTEM_DATABASES, BackupError, BackupManifest, BackupSource,
+                           Codec, CollectionDump, _mb, get_codec, list_backups, load_manifest, oplog_position,
+                           read_documents)
+from dbprov.wire import (BSONError, CommandError, ConnectionPool, Credentials, Int64, MongoConnection, RawDocument,
+                         Timestamp, decode_all, encode)
+
+SEGMENT_KEY = re.compile(r"^oplog/(?P<shard>[^/]+)/(?P<start>\d{20})-(?P<end>\d{20})\.(?P<codec>\w+)$")
+# Replaying DDL through mongos or over a restored base meets these; they mean "already done"
+IGNORED_COMMAND_ERRORS = {26: "NamespaceNotFound", 27: "IndexNotFound", 48: "NamespaceExists",
+                          85: "IndexOptionsConflict", 86: "IndexKeySpecsConflict"}
+CAPPED_POSITION_LOST = 136
+# The tailed member stepped down, shut down or left PRIMARY/SECONDARY: find another one
+STATE_CHANGE_ERRORS = {91: "ShutdownInProgress", 189: "PrimarySteppedDown", 10107: "NotWritablePrimary",
+                       11600: "InterruptedAtShutdown", 11602: "InterruptedDueToReplStateChange",
+                       13435: "NotPrimaryNoSecondaryOk", 13436: "NotPrimaryOrSecondary"}
+DUPLICATE_KEY = 11000
+
+
+class OplogError(BackupError):
+    pass
+
+
+class RestoreError(OplogError):
+    pass
+
+
+def pack_ts(ts: Timestamp) -> int:
+    return (ts.time << 32) | ts.inc
+
+
+def unpack_ts(value: int) -> Timestamp:
+    return Timestamp(value >> 32, value & 0xFFFFFFFF)
+
+
+def as_timestamp(value: Any) -> Optional[Timestamp]:
+    """Timestamps come back from manifest JSON as ``[time, inc]`` lists."""
+    return Timestamp(*value) if value is not None else None
+
+
+def format_ts(ts: Optional[Timestamp]) -> str:
+    if ts is None:
+        return "-"
+    moment = datetime.datetime.fromtimestamp(ts.time, datetime.timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ") + ("" if ts.inc == 0xFFFFFFFF else f"#{ts.inc}")
+
+
+def parse_point_in_time(text: str) -> Timestamp:
+    """``2024-05-01T12:30:00Z`` (naive means UTC) or Unix seconds; the whole second is included."""
+    try:
+        seconds = int(float(text))
+    except ValueError:
+        try:
+            moment = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            raise OplogError(f"Invalid point in time {text!r}; use ISO 8601 (2024-05-01T12:30:00Z) or Unix seconds")
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        seconds = int(moment.timestamp())
+    return Timestamp(seconds, 0xFFFFFFFF)
+
+
+# ---------------------------------------------------------------------------
+# Segments
+# ---------------------------------------------------------------------------
+
+@dataclass
+class OplogSegment:
+    shard: str
+    start: Timestamp  # exclusive: the last entry of the previous segment
+    end: Timestamp  # inclusive: the last entry of this one
+    codec: str
+
+    @property
+    def key(self) -> str:
+        return f"oplog/{self.shard}/{pack_ts(self.start):020d}-{pack_ts(self.end):020d}.{self.codec}"
+
+    @classmethod
+    def parse(cls, key: str) -> Optional["OplogSegment"]:
+        match = SEGMENT_KEY.match(key)
+        if match is None:
+            return None
+        return cls(match["shard"], unpack_ts(int(match["start"])), unpack_ts(int(match["end"])), match["codec"])
+
+
+def list_segments(target) -> Dict[str, List[OplogSegment]]:
+    """Every replica set's segments in time order."""
+    segments: Dict[str, List[OplogSegment]] = {}
+    for key in target.list("oplog/"):
+        segment = OplogSegment.parse(key)
+        if segment is not None:
+            segments.setdefault(segment.shard, []).append(segment)
+    for chain in segments.values():
+        chain.sort(key=lambda s: (s.start, s.end))
+    return segments
+
+
+def coverage(segments: List[OplogSegment]) -> List[Tuple[Timestamp, Timestamp]]:
+    """Contiguous ``(start, end]`` ranges a replica set's segments cover."""
+    ranges: List[Tuple[Timestamp, Timestamp]] = []
+    for segment in segments:
+        if ranges and segment.start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], segment.end))
+        else:
+            ranges.append((segment.start, segment.end))
+    return ranges
+
+
+def segment_chain(shard: str, segments: List[OplogSegment], start: Timestamp,
+                  until: Timestamp) -> List[OplogSegment]:
+    """The segments holding every entry of ``shard`` after ``start`` up to ``until``."""
+    chain: List[OplogSegment] = []
+    position = start
+    while position < until:
+        covering = [s for s in segments if s.start <= position < s.end]
+        if not covering:
+            reached = max((s.end for s in segments if s.end <= position), default=None)
+            if not any(s.start > position for s in segments):
+                raise OplogError(f"{shard}: oplog segments only reach {format_ts(reached or position)}, "
+                                 f"cannot restore to {format_ts(until)}")
+            raise OplogError(f"{shard}: no oplog segment covers {format_ts(position)}; the oplog was not tailed "
+                             f"from then until {format_ts(min(s.start for s in segments if s.start > position))}")
+        segment = max(covering, key=lambda s: s.end)
+        chain.append(segment)
+        position = segment.end
+    return chain
+
+
+def read_segment(target, segment: OplogSegment) -> List[Dict[str, Any]]:
+    codec = get_codec(segment.codec)
+    try:
+        return decode_all(codec.decompress(target.get(segment.key)))
+    except Exception as e:  # zlib.error, zstandard.ZstdError, BSONError ...
+        raise OplogError(f"Oplog segment {segment.key} is unreadable: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Tailing
+# ---------------------------------------------------------------------------
+
+@dataclass
+class TailOptions:
+    segment_size: int = 16 * MB
+    segment_seconds: float = 60.0
+    batch_size: int = 1000
+    await_ms: int = 1000
+    timeout: float = 30.0
+    max_backoff: float = 30.0
+
+
+@dataclass
+class TailStats:
+    shard: str
+    entries: int = 0
+    segments: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    position: Optional[Timestamp] = None
+
+
+class OplogTailer:
+    """Follows one replica set's oplog and writes it to the target in segments.
+
+    Only majority-committed entries are read, so nothing a failover rolls back
+    reaches a segment. When the tailed member goes away the replica set is
+    rediscovered from the hosts its members report and tailing resumes on
+    another secondary (or the primary) from the last entry written.
+    """
+
+    def __init__(self, target, codec: Codec, source: BackupSource, options: Optional[TailOptions] = None,
+                 credentials: Optional[Credentials] = None, tls=None, progress=None):
+        self.target = target
+        self.codec = codec
+        self.source = source
+        self.options = options or TailOptions()
+        self.credentials = credentials
+        self.tls = tls
+        self.progress = progress or (lambda message: None)
+        self.stats = TailStats(source.shard)
+        self.members: List[str] = [source.address]
+        self._buffer = bytearray()
+        self._start: Optional[Timestamp] = None
+        self._opened = 0.0
+
+    async def run(self, resume: Optional[Timestamp], stop: asyncio.Event) -> TailStats:
+        """Tail from ``resume`` (exclusive; the current end of the oplog if None) until ``stop`` is set."""
+        self.stats.position = resume
+        backoff = 1.0
+        while not stop.is_set():
+            try:
+                conn = await self.connect()
+            except OplogError as e:
+                self.progress(f"{e}, retrying in {backoff:.0f}s")
+                await self._wait(stop, backoff)
+                backoff = min(backoff * 2, self.options.max_backoff)
+                continue
+            try:
+                await self.check_window(conn)
+                await self.follow(conn, stop)
+                backoff = 1.0
+            except CommandError as e:
+                if e.code == CAPPED_POSITION_LOST:
+                    raise OplogError(f"{self.source.shard}: the oplog rolled over past {format_ts(self.stats.position)} "
+                                     f"while tailing; take a new base backup")
+                if e.code not in STATE_CHANGE_ERRORS:
+                    raise OplogError(f"{self.source.shard}: tailing {self.source.address} failed: {e}")
+                self.progress(f"{self.source.shard}: {self.source.address} is no longer readable ({e}), "
+                              f"resuming from {format_ts(self.stats.position)}")
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, BSONError) as e:
+                self.progress(f"{self.source.shard}: lost {self.source.address} ({e or type(e).__name__}), "
+                              f"resuming from {format_ts(self.stats.position)}")
+                await self._wait(stop, backoff)
+                backoff = min(backoff * 2, self.options.max_backoff)
+            finally:
+                await conn.close()
+        await self.flush()
+        return self.stats
+
+    async def connect(self) -> MongoConnection:
+        """A readable member of the replica set: the one tailed so far, else a secondary, else the primary."""
+        candidates = [self.source.address] + [m for m in self.members if m != self.source.address]
+        fallback: Optional[Tuple[MongoConnection, BackupSource]] = None
+        errors = []
+        for address in candidates:
+            host, _, port = address.rpartition(":")
+            try:
+                conn = await MongoConnection.open(host, int(port), self.options.timeout, self.tls, self.credentials)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, BSONError, CommandError) as e:
+                errors.append(f"{address} ({e or type(e).__name__})")
+                continue
+            try:
+                hello = await asyncio.wait_for(conn.command("admin", {"hello": 1}), self.options.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, BSONError, CommandError) as e:
+                await conn.close()
+                errors.append(f"{address} ({e or type(e).__name__})")
+                continue
+            if hello.get("setName", self.source.shard) != self.source.shard:
+                await conn.close()
+                errors.append(f"{address} (member of {hello['setName']})")
+                continue
+            if hello.get("hosts"):
+                self.members = list(hello["hosts"]) + list(hello.get("passives", []))
+            state = "SECONDARY" if hello.get("secondary") else "PRIMARY" if hello.get("isWritablePrimary") else None
+            if state is None:
+                await conn.close()
+                errors.append(f"{address} (neither primary nor secondary)")
+                continue
+            source = BackupSource(self.source.shard, host, int(port), state)
+            if address == self.source.address or state == "SECONDARY":
+                if fallback is not None:
+                    await fallback[0].close()
+                return self._switch(conn, source)
+            if fallback is None:
+                fallback = (conn, source)
+            else:
+                await conn.close()
+        if fallback is not None:
+            return self._switch(*fallback)
+        raise OplogError(f"{self.source.shard}: no readable member ({', '.join(errors)})")
+
+    def _switch(self, conn: MongoConnection, source: BackupSource) -> MongoConnection:
+        if source.address != self.source.address:
+            self.progress(f"{source.shard}: tailing {source.address} ({source.state}) instead of {self.source.address}")
+        self.source = source
+        return conn
+
+    async def check_window(self, conn: MongoConnection):
+        if self.stats.position is None:
+            self.stats.position = await oplog_position(conn)
+            if self.stats.position is None:
+                raise OplogError(f"{self.source.shard}: {self.source.address} has no oplog; "
+                                 f"only replica set members can be tailed")
+            self._start = self.stats.position
+            return
+        oldest = await oplog_position(conn, newest=False)
+        if oldest is not None and oldest > self.stats.position:
+            raise OplogError(f"{self.source.shard}: the oplog on {self.source.address} starts at {format_ts(oldest)}, "
+                             f"after the last tailed entry {format_ts(self.stats.position)}; take a new base backup")
+        if not self._buffer:
+            self._start = self.stats.position
+
+    async def follow(self, conn: MongoConnection, stop: asyncio.Event):
+        reply = await conn.command("local", {"find": "oplog.rs", "filter": {"ts": {"$gt": self.stats.position}},
+                                             "tailable": True, "awaitData": True, "batchSize": self.options.batch_size,
+                                             "readConcern": {"level": "majority"},
+                                             "$readPreference": SECONDARY_PREFERRED})
+        cursor = reply["cursor"]
+        batch = cursor["firstBatch"]
+        while True:
+            for entry in batch:
+                raw = encode(entry)
+                if not self._buffer:
+                    self._opened = time.monotonic()
+                self._buffer += raw
+                self.stats.entries += 1
+                self.stats.raw_bytes += len(raw)
+                self.stats.position = entry["ts"]
+                if len(self._buffer) >= self.options.segment_size:
+                    await self.flush()
+            if self._buffer and time.monotonic() - self._opened >= self.options.segment_seconds:
+                await self.flush()
+            if stop.is_set() or not cursor["id"]:
+                return
+            reply = await conn.command("local", {"getMore": Int64(cursor["id"]), "collection": "oplog.rs",
+                                                 "batchSize": self.options.batch_size,
+                                                 "maxTimeMS": self.options.await_ms})
+            cursor = reply["cursor"]
+            batch = cursor["nextBatch"]
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        segment = OplogSegment(self.source.shard, self._start, self.stats.position, self.codec.name)
+        raw, self._buffer = bytes(self._buffer), bytearray()
+        size = await asyncio.get_running_loop().run_in_executor(None, self.write_segment, segment, raw)
+        self.stats.segments += 1
+        self.stats.stored_bytes += size
+        self._start = segment.end
+        self.progress(f"{segment.shard}: segment up to {format_ts(segment.end)} ({_mb(len(raw))} -> {_mb(size)})")
+
+    def write_segment(self, segment: OplogSegment, raw: bytes) -> int:
+        data = self.codec.compress(raw)
+        self.target.put(segment.key, data)
+        return len(data)
+
+    @staticmethod
+    async def _wait(stop: asyncio.Event, seconds: float):
+        try:
+            await asyncio.wait_for(stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def resume_points(target, cluster: str, shards: List[str]) -> Dict[str, Optional[Timestamp]]:
+    """Where each replica set's tailing continues: its newest segment, else the newest base backup's start."""
+    segments = list_segments(target)
+    backups = list_backups(target, cluster)
+    points: Dict[str, Optional[Timestamp]] = {}
+    for shard in shards:
+        if segments.get(shard):
+            points[shard] = max(s.end for s in segments[shard])
+            continue
+        starts = [as_timestamp(b.shards[shard].get("oplog_start")) for b in backups if shard in b.shards]
+        points[shard] = next((s for s in reversed(starts) if s is not None), None)
+    return points
+
+
+async def tail_cluster(target, cluster: str, codec: Codec, sources: List[BackupSource],
+                       options: Optional[TailOptions] = None, credentials: Optional[Credentials] = None, tls=None,
+                       duration: float = 0.0, progress=None) -> List[TailStats]:
+    """Tail every replica set until ``duration`` seconds pass (0: until SIGINT/SIGTERM)."""
+    if not sources:
+        raise OplogError("No reachable data-bearing node to tail")
+    progress = progress or (lambda message: None)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    if duration > 0:
+        loop.call_later(duration, stop.set)
+    points = resume_points(target, cluster, [s.shard for s in sources])
+    tailers = [OplogTailer(target, codec, source, options, credentials, tls, progress) for source in sources]
+    for tailer in tailers:
+        point = points[tailer.source.shard]
+        progress(f"{tailer.source.shard}: tailing {tailer.source.address} from {format_ts(point) if point else 'now'}")
+
+    async def run(tailer: OplogTailer) -> TailStats:
+        try:
+            return await tailer.run(points[tailer.source.shard], stop)
+        except BaseException:
+            # Let the other replica sets flush what they have buffered before failing
+            stop.set()
+            raise
+
+    try:
+        results = await asyncio.gather(*(run(t) for t in tailers), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return list(results)
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(signum)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+
+# ---------------------------------------------------------------------------
+# Restore planning
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RestorePlan:
+    base: BackupManifest
+    until: Optional[Timestamp]
+    starts: Dict[str, Timestamp] = field(default_factory=dict)
+    stops: Dict[str, Timestamp] = field(default_factory=dict)
+    segments: Dict[str, List[OplogSegment]] = field(default_factory=dict)
+    warnings: List[str] = field(default_factory=list)
+
+    def format(self) -> str:
+        target = format_ts(self.until) if self.until else "end of the backup"
+        lines = [f"Restore {self.base.cluster} to {target}",
+                 f"  base: {self.base.id} ({self.base.documents} documents, {len(self.base.collections)} collection dumps)"]
+        for shard in sorted(self.base.shards):
+            chain = self.segments.get(shard, [])
+            if chain:
+                lines.append(f"  {shard}: replay {format_ts(self.starts[shard])} -> {format_ts(self.stops[shard])} "
+                             f"from {len(chain)} oplog segment(s)")
+            else:
+                lines.append(f"  {shard}: nothing to replay")
+        lines.extend(f"  Warning: {w}" for w in self.warnings)
+        return "\n".join(lines)
+
+
+def plan_restore(target, cluster: str, backup_id: Optional[str] = None,
+                 until: Optional[Timestamp] = None) -> RestorePlan:
+    """Pick the base backup for ``until`` and the oplog segments to replay over it."""
+    if backup_id:
+        base = load_manifest(target, backup_id)
+    else:
+        if until is None:
+            raise OplogError("Give a --backup-id, a --point-in-time or both")
+        candidates = [b for b in list_backups(target, cluster) if b.finished_at and b.shards and
+                      all(as_timestamp(s.get("oplog_end")) is not None and as_timestamp(s["oplog_end"]) <= until
+                          for s in b.shards.values())]
+        if not candidates:
+            raise OplogError(f"No backup of {cluster} with oplog positions was consistent by {format_ts(until)}")
+        base = candidates[-1]
+    plan = RestorePlan(base, until)
+    shards_of: Dict[str, List[CollectionDump]] = {}
+    for dump in base.collections:
+        shards_of.setdefault(dump.ns, []).append(dump)
+    unowned = sorted(ns for ns, dumps in shards_of.items()
+                     if len(dumps) > 1 and any(d.shard_key is None for d in dumps))
+    if unowned:
+        plan.warnings.append(f"{', '.join(unowned)} dumped from several shards without chunk ownership; where an "
+                             f"orphaned copy is in another shard's dump, the first copy loaded is kept")
+    segments = list_segments(target)
+    for shard, info in base.shards.items():
+        start, end = as_timestamp(info.get("oplog_start")), as_timestamp(info.get("oplog_end"))
+        if start is None or end is None:
+            if until is not None:
+                raise OplogError(f"{base.id} was taken without oplog positions for {shard}; "
+                                 f"it cannot be rolled forward")
+            plan.warnings.append(f"{shard}: no oplog position recorded; its data is as dumped, not a snapshot")
+            continue
+        if until is not None and end > until:
+            raise OplogError(f"{base.id} is only consistent from {format_ts(end)} ({shard}); "
+                             f"choose an earlier backup or a later point in time")
+        stop = until if until is not None else end
+        try:
+            chain = segment_chain(shard, segments.get(shard, []), start, stop)
+        except OplogError as e:
+            if until is not None:
+                raise
+            plan.warnings.append(f"{e}; restoring {shard} as dumped, which may not be a consistent snapshot")
+            continue
+        plan.starts[shard], plan.stops[shard], plan.segments[shard] = start, stop, chain
+    return plan
+
+
+# ---------------------------------------------------------------------------
+# Applying
+# ---------------------------------------------------------------------------
+
+def diff_updates(diff: Dict[str, Any], prefix: str = "") -> List[Dict[str, Any]]:
+    """Update documents equivalent to a ``$v: 2`` oplog delta, in the order they must run."""
+    sets: Dict[str, Any] = {}
+    unsets: Dict[str, Any] = {}
+    first: List[Dict[str, Any]] = []
+
+    def walk(delta: Dict[str, Any], path: str):
+        for key, value in delta.items():
+            if key in ("u", "i"):
+                sets.update((path + name, v) for name, v in value.items())
+            elif key == "d":
+                unsets.update((path + name, "") for name in value)
+            elif key.startswith("s") and isinstance(value, dict):
+                if value.get("a"):
+                    walk_array(value, path + key[1:])
+                else:
+                    walk(value, path + key[1:] + ".")
+
+    def walk_array(delta: Dict[str, Any], path: str):
+        if "l" in delta:
+            # Resizes run first; $set and $push on the same array cannot share an update
+            first.append({"$push": {path: {"$each": [], "$slice": delta["l"]}}})
+        for key, value in delta.items():
+            if key.startswith("u"):
+                sets[f"{path}.{key[1:]}"] = value
+            elif key.startswith("s") and isinstance(value, dict):
+                if value.get("a"):
+                    walk_array(value, f"{path}.{key[1:]}")
+                else:
+                    walk(value, f"{path}.{key[1:]}.")
+
+    walk(diff, prefix)
+    update: Dict[str, Any] = {}
+    if sets:
+        update["$set"] = sets
+    if unsets:
+        update["$unset"] = unsets
+    return first + ([update] if update else [])
+
+
+def write_statements(entry: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    """The ``update`` or ``delete`` statements that replay one CRUD oplog entry."""
+    op, o = entry["op"], entry["o"]
+    if op == "i":
+        return "update", [{"q": entry.get("o2") or {"_id": o["_id"]}, "u": o, "upsert": True}]
+    if op == "d":
+        return "delete", [{"q": o, "limit": 1}]
+    query = entry["o2"]
+    if o.get("$v") == 2 and "diff" in o:
+        updates = diff_updates(o["diff"])
+    elif any(key.startswith("$") for key in o):
+        updates = [{k: v for k, v in o.items() if k != "$v"}]
+    else:
+        updates = [o]
+    return "update", [{"q": query, "u": u} for u in updates]
+
+
+def replay_command(entry: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """``(db, command)`` that replays a DDL oplog entry; None for entries with nothing to apply."""
+    db = entry["ns"].split(".", 1)[0]
+    o = entry["o"]
+    name = next(iter(o))
+    if name in ("create", "drop", "collMod", "dropDatabase", "dropIndexes"):
+        return db, {k: v for k, v in o.items() if k != "idIndex"}
+    if name == "createIndexes":
+        return db, {"createIndexes": o["createIndexes"],
+                    "indexes": [{k: v for k, v in o.items() if k != "createIndexes"}]}
+    if name == "commitIndexBuild":
+        return db, {"createIndexes": o["commitIndexBuild"], "indexes": o["indexes"]}
+    if name == "renameCollection":
+        return "admin", {k: o[k] for k in ("renameCollection", "to", "dropTarget") if k in o}
+    return None
+
+
+def command_namespace(entry: Dict[str, Any]) -> str:
+    """The namespace a DDL entry acts on (``db.`` for database-wide commands)."""
+    db = entry["ns"].split(".", 1)[0]
+    name, value = next(iter(entry["o"].items()))
+    if name == "renameCollection":
+        return value
+    return f"{db}.{value}" if isinstance(value, str) else f"{db}."
+
+
+@dataclass
+class RestoreOptions:
+    concurrency: int = 8
+    batch_size: int = 1000
+    max_batch_bytes: int = 8 * MB
+    max_buffered: int = 100_000  # oplog entries held before an apply round
+    drop: bool = False
+    databases: List[str] = field(default_factory=list)
+    timeout: float = 30.0
+
+
+@dataclass
+class RestoreStats:
+    documents: int = 0
+    duplicates: int = 0
+    indexes: int = 0
+    entries: int = 0
+    commands: int = 0
+    skipped: int = 0
+    rounds: int = 0
+    load_seconds: float = 0.0
+    replay_seconds: float = 0.0
+
+    def format(self) -> str:
+        return (f"  base: {self.documents} documents ({self.duplicates} duplicates skipped), {self.indexes} indexes "
+                f"in {self.load_seconds:.1f}s\n"
+                f"  oplog: {self.entries} writes and {self.commands} commands in {self.rounds} round(s), "
+                f"{self.skipped} entries skipped, in {self.replay_seconds:.1f}s")
+
+
+class RestoreEngine:
+    """Loads a base backup into a mongos or primary and replays oplog segments over it."""
+
+    def __init__(self, target, options: Optional[RestoreOptions] = None, credentials: Optional[Credentials] = None,
+                 tls=None, progress=None):
+        self.target = target
+        self.options = options or RestoreOptions()
+        self.progress = progress or (lambda message: None)
+        self.pool = ConnectionPool(max_per_host=self.options.concurrency, connect_timeout=self.options.timeout,
+                                   tls=tls, credentials=credentials)
+        self.stats = RestoreStats()
+        self.host = ""
+        self.port = 0
+
+    async def run(self, plan: RestorePlan, host: str, port: int) -> RestoreStats:
+        self.host, self.port = host, port
+        try:
+            started = time.monotonic()
+            await self.load_base(plan.base)
+            self.stats.load_seconds = time.monotonic() - started
+            started = time.monotonic()
+            await self.replay(plan)
+            self.stats.replay_seconds = time.monotonic() - started
+        finally:
+            await self.pool.close()
+        return self.stats
+
+    def wanted(self, ns: str) -> bool:
+        db, _, coll = ns.partition(".")
+        if db in SYSTEM_DATABASES or coll.startswith("system."):
+            return False
+        return not self.options.databases or db in self.options.databases
+
+    async def command(self, db: str, cmd: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        async with self.pool.acquire(self.host, self.port) as conn:
+            return await conn.command(db, cmd, **kwargs)
+
+    async def ddl(self, db: str, cmd: Dict[str, Any]):
+        reply = await self.command(db, cmd, check=False)
+        if not reply.get("ok") and reply.get("code") not in IGNORED_COMMAND_ERRORS:
+            raise RestoreError(f"{next(iter(cmd))} on {db} failed: {reply.get('errmsg', reply)}")
+
+    # -- base ------------------------------------------------------------
+
+    async def load_base(self, base: BackupManifest):
+        by_ns: Dict[str, List] = {}
+        for dump in base.collections:
+            if self.wanted(dump.ns):
+                by_ns.setdefault(dump.ns, []).append(dump)
+        self.progress(f"Loading {base.id}: {len(by_ns)} collections")
+        slots = asyncio.Semaphore(self.options.concurrency)
+        with concurrent.futures.ThreadPoolExecutor(self.options.concurrency) as readers:
+            await asyncio.gather(*(self.load_collection(base, ns, dumps, slots, readers)
+                                   for ns, dumps in sorted(by_ns.items())))
+
+    async def load_collection(self, base: BackupManifest, ns: str, dumps: List, slots: asyncio.Semaphore,
+                              readers: concurrent.futures.ThreadPoolExecutor):
+        db, coll = ns.split(".", 1)
+        loop = asyncio.get_running_loop()
+        async with slots:
+            if self.options.drop:
+                await self.ddl(db, {"drop": coll})
+            await self.ddl(db, {"create": coll, **dumps[0].options})
+            for dump in dumps:
+                batches = self.batches(base, dump)
+                while True:
+                    # Chunks are fetched and decompressed off the event loop
+                    batch = await loop.run_in_executor(readers, next, batches, None)
+                    if batch is None:
+                        break
+                    await self.insert(db, coll, batch)
+            indexes = {}
+            for dump in dumps:
+                for index in dump.indexes:
+                    if index.get("name") != "_id_":
+                        indexes.setdefault(index["name"], {k: v for k, v in index.items() if k != "ns"})
+            if indexes:
+                await self.ddl(db, {"createIndexes": coll, "indexes": list(indexes.values())})
+                self.stats.indexes += len(indexes)
+        self.progress(f"  {ns}: loaded from {len(dumps)} dump(s)")
+
+    def batches(self, base: BackupManifest, dump: CollectionDump) -> Iterator[List[RawDocument]]:
+        """Insert batches of at most ``batch_size`` documents and ``max_batch_bytes``, sent as they were dumped."""
+        batch: List[RawDocument] = []
+        size = 0
+        for document in read_documents(self.target, base, dump):
+            if batch and (len(batch) >= self.options.batch_size or size + len(document) > self.options.max_batch_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(document)
+            size += len(document)
+        if batch:
+            yield batch
+
+    async def insert(self, db: str, coll: str, documents: List[RawDocument]):
+        reply = await self.command(db, {"insert": coll, "ordered": False}, sequences={"documents": documents})
+        errors = reply.get("writeErrors", [])
+        fatal = [e for e in errors if e.get("code") != DUPLICATE_KEY]
+        if fatal:
+            raise RestoreError(f"Inserting into {db}.{coll} failed: {fatal[0].get('errmsg')}")
+        # Dumps hold only the chunks their shard owned, so a duplicate is a document already in the
+        # destination (restoring without --drop), which is kept
+        self.stats.duplicates += len(errors)
+        self.stats.documents += len(documents) - len(errors)
+
+    # -- oplog -----------------------------------------------------------
+
+    async def replay(self, plan: RestorePlan):
+        if not plan.segments:
+            return
+        self.progress(f"Replaying oplog of {len(plan.segments)} replica set(s)")
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        buffered = 0
+        with concurrent.futures.ThreadPoolExecutor(len(plan.segments)) as readers:
+            streams = [self.entries(shard, chain, plan.starts[shard], plan.stops[shard], readers)
+                       for shard, chain in plan.segments.items()]
+            for entry in self.expand(heapq.merge(*streams, key=lambda e: e["ts"])):
+                if entry["op"] == "c":
+                    await self.apply_round(pending)
+                    pending, buffered = {}, 0
+                    await self.apply_command(entry)
+                    continue
+                pending.setdefault(entry["ns"], []).append(entry)
+                buffered += 1
+                if buffered >= self.options.max_buffered:
+                    await self.apply_round(pending)
+                    pending, buffered = {}, 0
+            await self.apply_round(pending)
+
+    def entries(self, shard: str, chain: List[OplogSegment], start: Timestamp, stop: Timestamp,
+                readers: concurrent.futures.ThreadPoolExecutor) -> Iterator[Dict[str, Any]]:
+        """A replica set's entries in ``(start, stop]``, reading the next segment while this one is replayed."""
+        upcoming = readers.submit(read_segment, self.target, chain[0]) if chain else None
+        for i, segment in enumerate(chain):
+            entries = upcoming.result()
+            upcoming = readers.submit(read_segment, self.target, chain[i + 1]) if i + 1 < len(chain) else None
+            for entry in entries:
+                if start < entry["ts"] <= stop:
+                    yield entry
+
+    def expand(self, entries: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Unpack transactions into their writes and drop what a restore must not replay."""
+        transactions: Dict[Any, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            op, o = entry["op"], entry.get("o", {})
+            if op == "n" or entry.get("fromMigrate"):
+                # Chunk migrations copy documents between shards; replaying them would duplicate writes
+                self.stats.skipped += 1
+                continue
+            if op == "c" and "applyOps" in o:
+                key = (repr(entry.get("lsid")), entry.get("txnNumber"))
+                ops = transactions.pop(key, []) + [{**inner, "ts": entry["ts"]} for inner in o["applyOps"]]
+                if o.get("partialTxn") or o.get("prepare"):
+                    transactions[key] = ops
+                    continue
+                yield from self.expand(iter(ops))
+                continue
+            if op == "c" and ("commitTransaction" in o or "abortTransaction" in o):
+                ops = transactions.pop((repr(entry.get("lsid")), entry.get("txnNumber")), [])
+                if "commitTransaction" in o:
+                    yield from self.expand(iter({**inner, "ts": entry["ts"]} for inner in ops))
+                continue
+            if not self.wanted(command_namespace(entry) if op == "c" else entry["ns"]):
+                self.stats.skipped += 1
+                continue
+            yield entry
+
+    async def apply_command(self, entry: Dict[str, Any]):
+        replay = replay_command(entry)
+        if replay is None:
+            self.stats.skipped += 1
+            return
+        db, cmd = replay
+        await self.ddl(db, cmd)
+        self.stats.commands += 1
+
+    async def apply_round(self, pending: Dict[str, List[Dict[str, Any]]]):
+        """Apply buffered writes: namespaces in parallel, each in oplog order."""
+        if not pending:
+            return
+        slots = asyncio.Semaphore(self.options.concurrency)
+
+        async def apply_namespace(ns: str, entries: List[Dict[str, Any]]):
+            async with slots:
+                await self.apply_writes(ns, entries)
+
+        await asyncio.gather(*(apply_namespace(ns, entries) for ns, entries in pending.items()))
+        self.stats.rounds += 1
+
+    async def apply_writes(self, ns: str, entries: List[Dict[str, Any]]):
+        db, coll = ns.split(".", 1)
+        kind, statements = None, []
+        for entry in entries:
+            entry_kind, entry_statements = write_statements(entry)
+            if statements and (entry_kind != kind or len(statements) >= self.options.batch_size):
+                await self.write(db, coll, kind, statements)
+                statements = []
+            kind = entry_kind
+            statements.extend(entry_statements)
+            self.stats.entries += 1
+        if statements:
+            await self.write(db, coll, kind, statements)
+
+    async def write(self, db: str, coll: str, kind: str, statements: List[Dict[str, Any]]):
+        field_name = "updates" if kind == "update" else "deletes"
+        reply = await self.command(db, {kind: coll, "ordered": True}, sequences={field_name: statements})
+        if reply.get("writeErrors"):
+            error = reply["writeErrors"][0]
+            raise RestoreError(f"Replaying into {db}.{coll} failed at statement {error.get('index')}: "
+                               f"{error.get('errmsg')}")
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import logging.handlers
+import os
+import signal
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Sequence, Union
+
+LineCallback = Callable[[str, str], None]
+
+STREAM_LIMIT = 1024 * 1024
+
+_runner_ids = itertools.count(1)
+
+
+class ProcessError(Exception):
+    def __init__(self, result: "ProcessResult"):
+        self.result = result
+        if result.timed_out:
+            reason = "timed out"
+        elif result.cancelled:
+            reason = "was cancelled"
+        else:
+            reason = f"exited with code {result.returncode}"
+        super().__init__(f"{' '.join(result.cmd)} {reason}")
+
+
+@dataclass
+class ProcessResult:
+    cmd: List[str]
+    returncode: Optional[int]
+    duration: float
+    tail: List[str]
+    output: Optional[List[str]] = None
+    timed_out: bool = False
+    cancelled: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    @property
+    def stdout(self) -> str:
+        return "\n".join(self.output or [])
+
+
+@dataclass
+class _Pumps:
+    tail: Deque[str]
+    output: Optional[List[str]] = None
+    truncated: int = field(default=0)
+
+
+class ProcessRunner:
+    """Runs external commands and streams their output as it is produced.
+
+    Every line goes to the console (prefixed with the caller's label so the
+    output of parallel phases stays readable) and to a size-rotated log file.
+    Only the last ``tail_lines`` lines are kept in memory for error reports,
+    unless the caller asks to ``capture`` stdout for small, parseable outputs.
+    Commands run in their own process group so timeouts and cancellation can
+    take down child processes (terraform providers, ssh) as well. Output still
+    open ``drain_timeout`` seconds after a command exited (a grandchild such as
+    an ssh ControlPersist master holding the pipes) is no longer waited for.
+    ``close()`` releases the log file.
+    """
+
+    def __init__(self, log_file: Optional[Path] = None, tail_lines: int = 200,
+                 echo: bool = True, max_log_bytes: int = 10 * 1024 * 1024, log_backups: int = 5,
+                 kill_grace: float = 10.0, drain_timeout: float = 5.0):
+        self.tail_lines = tail_lines
+        self.echo = echo
+        self.kill_grace = kill_grace
+        self.drain_timeout = drain_timeout
+        self.logger = self._make_logger(log_file, max_log_bytes, log_backups)
+
+    def _make_logger(self, log_file: Optional[Path], max_bytes: int, backups: int) -> logging.Logger:
+        # Not registered with logging.getLogger(): every runner gets its own handlers, even
+        # when runners come and go (one per cluster in `apply`)
+        logger = logging.Logger(f"dbprovision.process.{next(_runner_ids)}", logging.INFO)
+        logger.propagate = False
+        if log_file is not None:
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+        return logger
+
+    def close(self):
+        for handler in list(self.logger.handlers):
+            handler.close()
+            self.logger.removeHandler(handler)
+
+    def run(self, cmd: Sequence[str], **kwargs) -> ProcessResult:
+        return asyncio.run(self.run_async(cmd, **kwargs))
+
+    async def run_async(self, cmd: Sequence[str], cwd: Optional[Union[str, Path]] = None,
+                        label: Optional[str] = None, timeout: Optional[float] = None,
+                        capture: bool = False, env: Optional[dict] = None,
+                        on_line: Optional[LineCallback] = None, echo: Optional[bool] = None) -> ProcessResult:
+        cmd = [str(c) for c in cmd]
+        label = label or Path(cmd[0]).name
+        started = time.monotonic()
+        self.logger.info("[%s] $ %s (cwd=%s)", label, " ".join(cmd), cwd or os.getcwd())
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            limit=STREAM_LIMIT,
+        )
+        pumps = _Pumps(tail=deque(maxlen=self.tail_lines), output=[] if capture else None)
+        echo = self.echo if echo is None else echo
+        readers = asyncio.gather(
+            self._pump(proc.stdout, "stdout", label, pumps, on_line, echo),
+            self._pump(proc.stderr, "stderr", label, pumps, on_line, echo),
+        )
+
+        timed_out = cancelled = False
+        try:
+            await asyncio.wait_for(asyncio.shield(self._exited(proc)), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._kill(proc, label)
+        except asyncio.CancelledError:
+            cancelled = True
+            await self._kill(proc, label)
+        finally:
+            await self._drain(proc, readers, label)
+
+        result = ProcessResult(cmd=cmd, returncode=proc.returncode, duration=time.monotonic() - started,
+                               tail=list(pumps.tail), output=pumps.output,
+                               timed_out=timed_out, cancelled=cancelled)
+        self.logger.info("[%s] exit=%s after %.1fs%s", label, proc.returncode, result.duration,
+                         f" ({pumps.truncated} overlong lines dropped)" if pumps.truncated else "")
+        if cancelled:
+            raise asyncio.CancelledError()
+        return result
+
+    @staticmethod
+    async def _exited(proc: asyncio.subprocess.Process):
+        # Before Python 3.12 Process.wait() also waits for the pipes to close; the return code is
+        # set as soon as the process exits, so check it while a grandchild holds them open
+        waiter = asyncio.ensure_future(proc.wait())
+        try:
+            while proc.returncode is None:
+                await asyncio.wait([waiter], timeout=0.1)
+        finally:
+            waiter.cancel()
+
+    async def _drain(self, proc: asyncio.subprocess.Process, readers: "asyncio.Future", label: str):
+        try:
+            await asyncio.wait_for(readers, self.drain_timeout)
+        except asyncio.TimeoutError:
+            self.logger.info("[%s] output still open %.0fs after exit, no longer reading it", label,
+                             self.drain_timeout)
+            # Our ends of the pipes; Process has no public way to close them
+            proc._transport.close()  # type: ignore[attr-defined]
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str, label: str, pumps: _Pumps,
+                    on_line: Optional[LineCallback], echo: bool):
+        console = sys.stdout if name == "stdout" else sys.stderr
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:
+                # Line longer than STREAM_LIMIT; asyncio already discarded it.
+                pumps.truncated += 1
+                continue
+            if not raw:
+                break
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            pumps.tail.append(line)
+            if pumps.output is not None and name == "stdout":
+                pumps.output.append(line)
+            self.logger.info("[%s] %s", label, line)
+            if echo:
+                print(f"[{label}] {line}", file=console, flush=True)
+            if on_line:
+                on_line(name, line)
+
+    async def _kill(self, proc: asyncio.subprocess.Process, label: str):
+        if proc.returncode is not None:
+            return
+        self.logger.info("[%s] terminating process group %s", label, proc.pid)
+        self._signal_group(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self._exited(proc), self.kill_grace)
+        except asyncio.TimeoutError:
+            self._signal_group(proc, signal.SIGKILL)
+            await self._exited(proc)
+
+    @staticmethod
+    def _signal_group(proc: asyncio.subprocess.Process, sig: int):
+        try:
+            os.killpg(os.getpgid(proc.pid), sig)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,412 @@
+"""Zero-downtime rolling operations: upgrades, config changes and resizes node by node.
+
+A rolling operation applies one node action (an Ansible play, a targeted
+Terraform apply, or a simulated restart) to every node of a cluster without
+taking a replica set's majority or its primary away for longer than an
+election:
+
+* the config server replica set first, then the shards, ``blast_radius`` of
+  them at a time, then the mongos routers one at a time -- the order MongoDB
+  documents for binary upgrades;
+* within a replica set, secondaries one at a time, then the primary is stepped
+  down with ``replSetStepDown`` (which waits for a caught-up secondary) and,
+  once another member has been elected, handled like a secondary. Roles are
+  re-read before every step: whichever node is primary by then is stepped
+  down first, even if the plan had it as a secondary;
+* every step is gated: before it, the set must have a primary, every member
+  healthy and no secondary more than ``max_lag`` seconds behind; after it, the
+  node must be back as a healthy secondary and caught up again. A gate that
+  does not pass within ``step_timeout`` fails the step.
+
+A failed step halts the operation: replica sets in progress finish their
+current step but start no new one, and the report lists what was skipped.
+
+Planning refuses a cluster with a member down or missing from the node list,
+since that member would be left out while its peers are taken down. Before
+an upgrade, ``upgrade_problem`` checks the binaries actually running and each
+replica set's featureCompatibilityVersion: no downgrades, one major release
+at a time, and the FCV already raised to the running release.
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from dbprov.health import ClusterHealth, HealthProber, Node
+from dbprov.wire import BSONError, CommandError, ConnectionPool
+
+NodeAction = Callable[[Node], Awaitable[None]]
+# Instance name prefixes of infra/terraform/mongodb-cluster.tf and the module creating them
+TERRAFORM_MODULES = {"config-server": "config_servers", "shard-server": "shard_servers", "mongo-router": "mongo_routers"}
+
+PENDING, RUNNING, DONE, FAILED, SKIPPED = "pending", "running", "done", "failed", "skipped"
+
+
+class RollingError(Exception):
+    pass
+
+
+@dataclass
+class RollingOptions:
+    blast_radius: int = 1  # shards operated on at the same time
+    max_lag: float = 10.0
+    step_timeout: float = 600.0
+    poll_interval: float = 2.0
+    step_down_seconds: int = 60
+    catch_up_seconds: int = 10
+    include_routers: bool = True
+    timeout: float = 5.0  # per health probe
+
+
+@dataclass
+class RollingStep:
+    replica_set: str
+    node: Node
+    role: str  # secondary, primary, router
+    status: str = PENDING
+    seconds: float = 0.0
+    election_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.replica_set} {self.node.address}"
+
+
+@dataclass
+class SetPlan:
+    name: str
+    members: List[Node]
+    steps: List[RollingStep]
+    config_server: bool = False
+
+
+@dataclass
+class RollingPlan:
+    config: Optional[SetPlan]
+    shards: List[SetPlan]
+    routers: List[RollingStep] = field(default_factory=list)
+
+    @property
+    def steps(self) -> List[RollingStep]:
+        sets = ([self.config] if self.config else []) + self.shards
+        return [step for s in sets for step in s.steps] + self.routers
+
+    def format(self) -> str:
+        lines = []
+        for plan in ([self.config] if self.config else []) + self.shards:
+            kind = "config servers" if plan.config_server else "replica set"
+            order = " -> ".join(f"{s.node.address}{' (step down)' if s.role == 'primary' else ''}" for s in plan.steps)
+            lines.append(f"  {plan.name} ({kind}): {order}")
+        if self.routers:
+            lines.append(f"  mongos: {' -> '.join(s.node.address for s in self.routers)}")
+        return "\n".join(lines)
+
+
+@dataclass
+class RollingReport:
+    operation: str
+    steps: List[RollingStep]
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return all(s.status == DONE for s in self.steps)
+
+    def format(self) -> str:
+        lines = [f"Rolling {self.operation}: {sum(s.status == DONE for s in self.steps)}/{len(self.steps)} nodes "
+                 f"in {self.seconds:.1f}s",
+                 f"  {'Replica set':<16} {'Node':<24} {'Role':<10} {'Status':<8} {'Time':>7} {'Election':>9}"]
+        for s in self.steps:
+            election = f"{s.election_seconds:.1f}s" if s.election_seconds is not None else ""
+            lines.append(f"  {s.replica_set:<16} {s.node.address:<24} {s.role:<10} {s.status:<8} "
+                         f"{s.seconds:>6.1f}s {election:>9}")
+            if s.error:
+                lines.append(f"    {s.error}")
+        elections = [s.election_seconds for s in self.steps if s.election_seconds is not None]
+        if elections:
+            lines.append(f"  Writes paused for at most {max(elections):.1f}s per replica set (step-down to new primary)")
+        return "\n".join(lines)
+
+
+def instance_address(name: str) -> str:
+    """Terraform address of the VM behind inventory host ``name`` (``shard-server-4`` -> ``...[3]``)."""
+    match = re.fullmatch(r"(?P<prefix>[a-z-]+)-(?P<number>\d+)", name)
+    if match is None or match["prefix"] not in TERRAFORM_MODULES:
+        raise RollingError(f"{name} is not an instance created by infra/terraform, cannot resize it")
+    return (f"module.{TERRAFORM_MODULES[match['prefix']]}.google_compute_instance."
+            f"mongodb_instances[{int(match['number']) - 1}]")
+
+
+async def wait_until(prober: HealthProber, nodes: List[Node], check: Callable[[ClusterHealth], Optional[str]],
+                     what: str, timeout: float, interval: float) -> ClusterHealth:
+    """Probe ``nodes`` until ``check`` finds nothing wrong (returns None) or ``timeout`` seconds pass."""
+    deadline = time.monotonic() + timeout
+    while True:
+        report = await prober.probe(nodes)
+        problem = check(report)
+        if problem is None:
+            return report
+        if time.monotonic() >= deadline:
+            raise RollingError(f"{what}: {problem} after {timeout:.0f}s")
+        await asyncio.sleep(interval)
+
+
+def plan_rolling(report: ClusterHealth, include_routers: bool = True) -> RollingPlan:
+    """Order every node: config servers, shards (secondaries first, primary last), routers.
+
+    Raises ``RollingError`` when a node is unreachable or a replica set has
+    members that are unhealthy or not among the probed nodes.
+    """
+    down = [f"{n.node.address} ({n.error})" for n in report.nodes if not n.ok]
+    if down:
+        raise RollingError(f"Cannot plan a rolling operation, unreachable: {', '.join(down)}")
+    by_set: Dict[str, List] = {}
+    routers = []
+    for n in report.nodes:
+        if n.state == "MONGOS" or n.node.role == "mongos":
+            routers.append(n)
+        elif n.set_name:
+            by_set.setdefault(n.set_name, []).append(n)
+    problems = []
+    for name, members in sorted(by_set.items()):
+        rs = report.replica_sets.get(name)
+        if rs is None:
+            continue
+        problems.extend(f"{name} member {m.name} is {m.state}" for m in rs.members if not m.healthy)
+        data_bearing = [m for m in rs.members if m.state != "ARBITER"]
+        if len(data_bearing) > len(members):
+            problems.append(f"{name} has {len(data_bearing)} members but only {len(members)} were given")
+    if problems:
+        raise RollingError(f"Cannot plan a rolling operation: {'; '.join(problems)}")
+    config, shards = None, []
+    for name, members in sorted(by_set.items()):
+        primary = report.replica_sets[name].primary if name in report.replica_sets else None
+        secondaries = sorted((m for m in members if m.node.address != primary), key=lambda m: m.node.address)
+        steps = [RollingStep(name, m.node, "secondary") for m in secondaries]
+        steps += [RollingStep(name, m.node, "primary") for m in members if m.node.address == primary]
+        plan = SetPlan(name, [m.node for m in members], steps,
+                       any(m.config_server or m.node.role == "config" for m in members))
+        if plan.config_server and config is None:
+            config = plan
+        else:
+            shards.append(plan)
+    router_steps = [RollingStep("mongos", n.node, "router") for n in routers] if include_routers else []
+    return RollingPlan(config, shards, router_steps)
+
+
+def parse_version(version: str) -> Tuple[int, int]:
+    """``(major, minor)`` of a MongoDB version string such as ``7.0.12``."""
+    major, _, rest = version.partition(".")
+    return int(major), int(rest.partition(".")[0] or 0)
+
+
+async def read_versions(pool: ConnectionPool,
+                        report: ClusterHealth) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """The binary version of every reachable node, and the featureCompatibilityVersion of every replica set."""
+    versions: Dict[str, str] = {}
+    fcvs: Dict[str, Any] = {}
+
+    async def read(n):
+        async with pool.acquire(n.node.host, n.node.port) as conn:
+            versions[n.node.address] = (await conn.command("admin", {"buildInfo": 1}))["version"]
+            if n.state == "PRIMARY":
+                reply = await conn.command("admin", {"getParameter": 1, "featureCompatibilityVersion": 1})
+                fcvs[n.set_name] = reply["featureCompatibilityVersion"]
+
+    await asyncio.gather(*(read(n) for n in report.nodes if n.ok))
+    return versions, fcvs
+
+
+def upgrade_problem(target: str, versions: Mapping[str, str],
+                    fcvs: Mapping[str, Mapping[str, Any]]) -> Optional[str]:
+    """Why the cluster cannot be rolled to ``target``; None when it can.
+
+    ``fcvs`` maps replica sets to their ``featureCompatibilityVersion``
+    parameter (``{"version": ..., "targetVersion": ...}``).
+    """
+    if not versions:
+        return None
+    wanted = parse_version(target)
+    newer = sorted(address for address, version in versions.items() if parse_version(version) > wanted)
+    if newer:
+        return (f"{', '.join(newer)} already run {max(versions.values(), key=parse_version)}; "
+                f"a rolling upgrade cannot downgrade to {target}")
+    oldest = min(parse_version(v) for v in versions.values())
+    running = f"{oldest[0]}.{oldest[1]}"
+    if wanted[0] > oldest[0] + 1:
+        return (f"MongoDB upgrades one major release at a time ({running} -> {target}); "
+                f"upgrade through each release and raise featureCompatibilityVersion in between")
+    for name, fcv in sorted(fcvs.items()):
+        version = fcv.get("version", "")
+        if fcv.get("targetVersion"):
+            return (f"{name}: featureCompatibilityVersion is moving from {version} to {fcv['targetVersion']}; "
+                    f"let setFeatureCompatibilityVersion finish first")
+        if wanted != oldest and parse_version(version) != oldest:
+            return (f"{name}: featureCompatibilityVersion is {version}; set it to {running} with "
+                    f"setFeatureCompatibilityVersion before upgrading to {target}")
+    return None
+
+
+class RollingOperation:
+    def __init__(self, action: NodeAction, options: Optional[RollingOptions] = None,
+                 pool: Optional[ConnectionPool] = None, progress=None):
+        self.action = action
+        self.options = options or RollingOptions()
+        self.pool = pool or ConnectionPool(max_per_host=2, connect_timeout=self.options.timeout)
+        self.prober = HealthProber(self.pool, timeout=self.options.timeout, max_lag=self.options.max_lag)
+        self.progress = progress or (lambda message: None)
+        self.halted = asyncio.Event()
+
+    async def close(self):
+        await self.prober.close()
+
+    async def run(self, operation: str, plan: RollingPlan) -> RollingReport:
+        started = time.monotonic()
+        if plan.config is not None:
+            await self.roll_set(plan.config)
+        slots = asyncio.Semaphore(max(1, self.options.blast_radius))
+
+        async def roll_shard(shard: SetPlan):
+            async with slots:
+                await self.roll_set(shard)
+
+        await asyncio.gather(*(roll_shard(shard) for shard in plan.shards))
+        for step in plan.routers:
+            await self.run_step(step, self.roll_router)
+        return RollingReport(operation, plan.steps, time.monotonic() - started)
+
+    async def roll_set(self, plan: SetPlan):
+        for step in plan.steps:
+            await self.run_step(step, lambda s: self.roll_member(plan, s))
+
+    async def run_step(self, step: RollingStep, body: Callable[[RollingStep], Awaitable[None]]):
+        if self.halted.is_set():
+            step.status = SKIPPED
+            return
+        step.status = RUNNING
+        self.progress(f"==> [{step.label}] started")
+        started = time.monotonic()
+        try:
+            await body(step)
+            step.status = DONE
+        except (RollingError, CommandError, OSError, asyncio.TimeoutError) as e:
+            step.status = FAILED
+            step.error = str(e) or type(e).__name__
+            self.halted.set()
+        except Exception as e:
+            # Node actions raise their own errors (a failed playbook ...); stop rolling either way
+            step.status = FAILED
+            step.error = f"{type(e).__name__}: {e}"
+            self.halted.set()
+        step.seconds = time.monotonic() - started
+        if step.status == DONE:
+            self.progress(f"==> [{step.label}] finished ({step.seconds:.1f}s)")
+        else:
+            self.progress(f"==> [{step.label}] failed: {step.error}")
+
+    # -- gates -----------------------------------------------------------
+
+    async def wait_for(self, nodes: List[Node], check: Callable[[ClusterHealth], Optional[str]],
+                       what: str) -> ClusterHealth:
+        return await wait_until(self.prober, nodes, check, what, self.options.step_timeout,
+                                self.options.poll_interval)
+
+    @staticmethod
+    def set_problem(name: str, report: ClusterHealth) -> Optional[str]:
+        """Why replica set ``name`` is not ready for (or recovered from) a step; None when it is."""
+        down = [n.node.address for n in report.nodes if not n.ok]
+        if down:
+            return f"{', '.join(down)} unreachable"
+        rs = report.replica_sets.get(name)
+        if rs is None:
+            return "replica set not found"
+        if rs.issues:
+            return rs.issues[0]
+        return None
+
+    async def roll_member(self, plan: SetPlan, step: RollingStep):
+        report = await self.wait_for(plan.members, lambda r: self.set_problem(plan.name, r),
+                                     f"{plan.name} not healthy")
+        # An election since the plan was made may have moved the primary: go by what the node is now
+        mine = next(n for n in report.nodes if n.node == step.node)
+        step.role = "primary" if mine.state == "PRIMARY" else "secondary"
+        if step.role == "primary":
+            step.election_seconds = await self.step_down(plan, step.node)
+        await self.action(step.node)
+
+        def recovered(report: ClusterHealth) -> Optional[str]:
+            mine = next(n for n in report.nodes if n.node == step.node)
+            if mine.ok and mine.state != "SECONDARY":
+                return f"{step.node.address} is {mine.state}"
+            return self.set_problem(plan.name, report)
+
+        await self.wait_for(plan.members, recovered, f"{step.node.address} did not rejoin {plan.name}")
+
+    async def step_down(self, plan: SetPlan, primary: Node) -> float:
+        """Hand the primary role to a caught-up secondary; returns how long the set had no primary."""
+        started = time.monotonic()
+        try:
+            async with self.pool.acquire(primary.host, primary.port) as conn:
+                await conn.command("admin", {"replSetStepDown": self.options.step_down_seconds,
+                                             "secondaryCatchUpPeriodSecs": self.options.catch_up_seconds})
+        except (OSError, asyncio.IncompleteReadError, BSONError):
+            pass  # servers before 4.2 close every connection when stepping down
+
+        def elected(report: ClusterHealth) -> Optional[str]:
+            rs = report.replica_sets.get(plan.name)
+            if rs is None or rs.primary in (None, primary.address):
+                return "no new primary"
+            return None
+
+        await self.wait_for(plan.members, elected, f"{plan.name} did not elect a new primary")
+        return time.monotonic() - started
+
+    async def roll_router(self, step: RollingStep):
+        await self.action(step.node)
+
+        def reachable(report: ClusterHealth) -> Optional[str]:
+            node = report.nodes[0]
+            return None if node.ok else f"{node.node.address} unreachable: {node.error}"
+
+        await self.wait_for([step.node], reachable, f"mongos {step.node.address} did not come back")
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+async def simulate(options: RollingOptions, shards: int = 2, members: int = 3, routers: int = 2,
+                   downtime: float = 1.0, catch_up: float = 2.0, progress=None) -> RollingReport:
+    """Roll a restart through an in-process fake sharded cluster; every node is down ``downtime`` seconds."""
+    from dbprov.testing.fakemongo import FakeMongoServer, FakeReplicaSet, restart_member, start_replica_set, stop_all
+
+    sets: List[FakeReplicaSet] = [await start_replica_set("configRS", members, config_server=True)]
+    for i in range(1, shards + 1):
+        sets.append(await start_replica_set(f"shard{i}", members))
+    mongos = [await FakeMongoServer(role="mongos").start() for _ in range(routers)]
+    servers = [m for rs in sets for m in rs.members] + mongos
+    by_address = {s.address: s for s in servers}
+
+    async def restart(node: Node):
+        server = by_address[node.address]
+        if server.replica_set is None:
+            await server.stop()
+            await asyncio.sleep(downtime)
+            await server.start()
+        else:
+            await restart_member(server, downtime, catch_up)
+
+    nodes = [Node(s.host, s.port, "mongos" if s.role == "mongos" else "mongod") for s in servers]
+    operation = RollingOperation(restart, options, progress=progress)
+    try:
+        report = await operation.prober.probe(nodes)
+        plan = plan_rolling(report, options.include_routers)
+        if progress:
+            progress(plan.format())
+        return await operation.run("restart (simulated)", plan)
+    finally:
+        await operation.close()
+        await stop_all(servers)
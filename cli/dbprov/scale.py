@@ -0,0 +1,497 @@
+"""Online scale-out: new shards and replica set members, and the balancing that follows.
+
+Adding capacity to a running sharded cluster takes three steps, each safe to
+run again after a failure:
+
+* provision only the new instances -- a Terraform apply targeted at them
+  (``new_instance_targets``) -- and deploy MongoDB on them with the playbooks
+  ``dbprovision create`` uses;
+* join them: ``addShard`` through a mongos for a new shard replica set, and
+  ``replSetReconfig`` on the primary for a new member of an existing set, one
+  member at a time, each waited on until its initial sync is done;
+* let the balancer move chunks onto the new shards. ``MigrationMonitor``
+  samples the ``moveChunk.commit`` entries of ``config.changelog`` and what
+  each shard holds to report the migration rate, what is left to move and an
+  ETA. ``BalancerSettings`` keeps migrations inside a window and throttles
+  them (``_secondaryThrottle``/``_waitForDelete``) so rebalancing does not
+  compete with foreground traffic.
+
+From 6.0.3 the balancer evens out data size rather than chunk counts: a
+collection is balanced once its shards hold within three chunk sizes of each
+other, however many chunks that takes. Against such a cluster the monitor
+follows the owned bytes of ``$shardedDataDistribution`` and asks
+``balancerCollectionStatus`` whether each collection is balanced; older
+clusters are followed by chunk counts.
+"""
+
+import asyncio
+import datetime
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dbprov.health import ClusterHealth, HealthProber, Node, parse_hosts, parse_inventory
+from dbprov.rolling import RollingError, RollingOperation, instance_address, wait_until
+from dbprov.wire import ConnectionPool
+
+# shard_servers instances per shard in infra/terraform/mongodb-cluster.tf: shard k is shard-server-(3k-2)..3k
+SHARD_MEMBERS = 3
+SHARD_PORT = 27017
+# First release whose balancer evens out data size and that has $shardedDataDistribution
+DATA_BALANCING = (6, 0, 3)
+CHUNK_SIZE_MB = 128  # default of the config.settings chunksize document
+WINDOW = re.compile(r"(\d{2}):(\d{2})-(\d{2}):(\d{2})")
+
+
+class ScaleError(Exception):
+    pass
+
+
+@dataclass
+class ScaleOptions:
+    max_lag: float = 10.0
+    sync_timeout: float = 3600.0  # initial sync of one new member
+    poll_interval: float = 5.0
+    timeout: float = 5.0  # per request
+    rate_window: float = 300.0  # seconds of migrations the rate is averaged over
+    settle: float = 120.0  # no migration for this long with the balancer idle counts as balanced
+    watch_timeout: float = 0.0  # stop watching after this long (0: until balanced)
+
+
+def parse_window(spec: str) -> Dict[str, str]:
+    """``HH:MM-HH:MM`` (local time of the config servers) as an ``activeWindow``; ``any`` removes the window."""
+    if spec.strip().lower() == "any":
+        return {}
+    match = WINDOW.fullmatch(spec.strip())
+    if match is None or int(match[1]) > 23 or int(match[3]) > 23 or int(match[2]) > 59 or int(match[4]) > 59:
+        raise ScaleError(f"Invalid balancer window {spec!r}, expected HH:MM-HH:MM or 'any'")
+    return {"start": f"{match[1]}:{match[2]}", "stop": f"{match[3]}:{match[4]}"}
+
+
+def parse_members(items: List[str]) -> Dict[str, List[Node]]:
+    """``SET=host:port[,host:port]`` items (repeatable) as new members by replica set."""
+    members: Dict[str, List[Node]] = {}
+    for item in items:
+        set_name, _, hosts = item.partition("=")
+        if not set_name or not hosts:
+            raise ScaleError(f"Invalid member {item!r}, expected SET=host:port")
+        members.setdefault(set_name, []).extend(parse_hosts(hosts))
+    return members
+
+
+@dataclass
+class BalancerSettings:
+    """Changes to the ``balancer`` document of ``config.settings``; None leaves a setting as it is."""
+    window: Optional[Dict[str, str]] = None  # {} removes the window
+    secondary_throttle: Optional[bool] = None
+    wait_for_delete: Optional[bool] = None
+    enabled: Optional[bool] = None
+
+    @property
+    def changed(self) -> bool:
+        return any(v is not None for v in (self.window, self.secondary_throttle, self.wait_for_delete, self.enabled))
+
+    def update(self) -> Dict[str, Any]:
+        set_fields: Dict[str, Any] = {}
+        unset_fields: Dict[str, Any] = {}
+        if self.window:
+            set_fields["activeWindow"] = self.window
+        elif self.window is not None:
+            unset_fields["activeWindow"] = 1
+        if self.secondary_throttle is not None:
+            # Each migrated batch waits for a majority of the recipient shard
+            set_fields["_secondaryThrottle"] = {"w": "majority"} if self.secondary_throttle else False
+        if self.wait_for_delete is not None:
+            set_fields["_waitForDelete"] = self.wait_for_delete
+        update: Dict[str, Any] = {}
+        if set_fields:
+            update["$set"] = set_fields
+        if unset_fields:
+            update["$unset"] = unset_fields
+        return update
+
+    def format(self) -> str:
+        parts = []
+        if self.enabled is not None:
+            parts.append("balancer " + ("on" if self.enabled else "off"))
+        if self.window is not None:
+            parts.append(f"window {self.window['start']}-{self.window['stop']}" if self.window else "no window")
+        if self.secondary_throttle is not None:
+            parts.append("secondary throttle " + ("on" if self.secondary_throttle else "off"))
+        if self.wait_for_delete is not None:
+            parts.append("wait for delete " + ("on" if self.wait_for_delete else "off"))
+        return ", ".join(parts) or "unchanged"
+
+
+# ---------------------------------------------------------------------------
+# New instances
+# ---------------------------------------------------------------------------
+
+def shard_instance_names(shard: int) -> List[str]:
+    """Inventory/VM names of shard ``shard`` (1-based)."""
+    first = (shard - 1) * SHARD_MEMBERS + 1
+    return [f"shard-server-{first + i}" for i in range(SHARD_MEMBERS)]
+
+
+def router_instance_names(current: int, wanted: int) -> List[str]:
+    return [f"mongo-router-{i}" for i in range(current + 1, wanted + 1)]
+
+
+def new_instance_targets(current_shards: int, shards: int, current_routers: int, routers: int) -> List[str]:
+    """Terraform addresses of exactly the instances a scale-out creates."""
+    names = [name for shard in range(current_shards + 1, shards + 1) for name in shard_instance_names(shard)]
+    names += router_instance_names(current_routers, routers)
+    return [instance_address(name) for name in names]
+
+
+def instances_from_outputs(outputs: Dict[str, Any], output: str) -> Dict[str, Dict[str, str]]:
+    """``name -> {ansible_host, internal_ip, zone}`` from ``terraform output -json`` (``shard_servers``/``mongo_routers``)."""
+    try:
+        return dict(outputs[output]["value"]["ansible_inventory"]["hosts"])
+    except (KeyError, TypeError):
+        raise ScaleError(f"Terraform output {output} has no ansible_inventory hosts")
+
+
+def add_inventory_hosts(path: Path, group: str, hosts: List[Tuple[str, Dict[str, str]]]) -> int:
+    """Add ``hosts`` to ``[group]`` of an INI inventory (creating either if needed).
+
+    Hosts already anywhere in the file are left alone, so a rerun adds
+    nothing twice. Returns how many hosts were added.
+    """
+    path = Path(path)
+    known = {host for members in parse_inventory(path).values() for host, _ in members} if path.exists() else set()
+    lines = [f"{name} " + " ".join(f"{k}={v}" for k, v in hostvars.items())
+             for name, hostvars in hosts if name not in known]
+    if not lines:
+        return 0
+    existing = path.read_text().splitlines() if path.exists() else []
+    header = next((i for i, line in enumerate(existing) if line.strip() == f"[{group}]"), None)
+    if header is None:
+        existing += ([""] if existing and existing[-1].strip() else []) + [f"[{group}]"] + lines
+    else:
+        end = header + 1
+        for i in range(header + 1, len(existing)):
+            if existing[i].strip().startswith("["):
+                break
+            if existing[i].strip():
+                end = i + 1
+        existing[end:end] = lines
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(existing) + "\n")
+    return len(lines)
+
+
+# ---------------------------------------------------------------------------
+# Balancing progress
+# ---------------------------------------------------------------------------
+
+def chunks_to_move(counts: Dict[str, int]) -> int:
+    """Migrations left before every shard holds ``total / shards`` chunks, give or take one."""
+    if len(counts) < 2:
+        return 0
+    total = sum(counts.values())
+    low, high = total // len(counts), -(-total // len(counts))
+    return max(sum(max(0, n - high) for n in counts.values()), sum(max(0, low - n) for n in counts.values()))
+
+
+def data_to_move(sizes: Dict[str, int], threshold: int) -> int:
+    """Bytes of one collection above the per-shard mean, once its shards are more than ``threshold`` apart."""
+    if len(sizes) < 2 or max(sizes.values()) - min(sizes.values()) <= threshold:
+        return 0
+    mean = sum(sizes.values()) / len(sizes)
+    return int(sum(max(0.0, n - mean) for n in sizes.values()))
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def format_seconds(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m"
+
+
+@dataclass
+class BalanceSample:
+    at: float
+    chunks: Dict[str, int]
+    moved: int  # moveChunk.commit entries since the monitor started
+    balancer_on: bool
+    in_round: bool
+    by_data: bool = False  # 6.0.3+: the fields below are filled and decide the balance
+    data: Dict[str, Dict[str, int]] = field(default_factory=dict)  # owned bytes by collection and shard
+    threshold: int = 0  # bytes apart a collection's shards may be and still count as balanced
+    compliant: bool = True  # balancerCollectionStatus of every collection
+
+    @property
+    def shard_bytes(self) -> Dict[str, int]:
+        totals = {name: 0 for name in self.chunks}
+        for sizes in self.data.values():
+            for name, size in sizes.items():
+                totals[name] = totals.get(name, 0) + size
+        return totals
+
+    @property
+    def remaining(self) -> int:
+        """Chunks, or from 6.0.3 bytes, the balancer still has to move."""
+        if not self.by_data:
+            return chunks_to_move(self.chunks)
+        if self.compliant:
+            return 0
+        # Never 0 while a collection is out of compliance, e.g. with a draining shard
+        return max(1, sum(data_to_move(sizes, self.threshold) for sizes in self.data.values()))
+
+
+@dataclass
+class MigrationProgress:
+    sample: BalanceSample
+    remaining: int
+    rate: float  # chunks, or bytes from 6.0.3, per second over the rate window
+    idle: float = 0.0  # seconds since the last migration
+    balanced: bool = False
+
+    @property
+    def eta(self) -> Optional[float]:
+        if self.remaining == 0:
+            return 0.0
+        return self.remaining / self.rate if self.rate > 0 else None
+
+    def format(self) -> str:
+        eta = format_seconds(self.eta) if self.eta is not None else "-"
+        state = "" if self.sample.balancer_on else " (balancer off)"
+        if self.sample.by_data:
+            data = self.sample.shard_bytes
+            shards = " ".join(f"{name}={format_bytes(data[name])}/{n}"
+                              for name, n in sorted(self.sample.chunks.items()))
+            return (f"Balancing: moved={self.sample.moved} remaining={format_bytes(self.remaining)} "
+                    f"rate={format_bytes(self.rate * 60)}/min eta={eta}{state} | {shards}")
+        shards = " ".join(f"{name}={n}" for name, n in sorted(self.sample.chunks.items()))
+        return (f"Balancing: moved={self.sample.moved} remaining={self.remaining} rate={self.rate * 60:.1f}/min "
+                f"eta={eta}{state} | {shards}")
+
+
+class MigrationMonitor:
+    """Follows chunk migrations through one mongos; every ``sample`` costs two round trips, three from 6.0.3."""
+
+    def __init__(self, pool: ConnectionPool, router: Node, options: Optional[ScaleOptions] = None):
+        self.pool = pool
+        self.router = router
+        self.options = options or ScaleOptions()
+        self.since: Optional[datetime.datetime] = None
+        self.by_data: Optional[bool] = None
+        self.history: Deque[BalanceSample] = deque()
+        self.last_move = time.monotonic()
+
+    async def sample(self) -> BalanceSample:
+        async with self.pool.acquire(self.router.host, self.router.port) as conn:
+            if self.by_data is None:
+                info = await conn.command("admin", {"buildInfo": 1})
+                self.by_data = tuple(info.get("versionArray", [0])[:3]) >= DATA_BALANCING
+            admin: List[Dict[str, Any]] = [{"hello": 1}, {"listShards": 1}, {"balancerStatus": 1}]
+            if self.by_data:
+                admin.append({"aggregate": 1, "pipeline": [{"$shardedDataDistribution": {}}], "cursor": {}})
+            hello, shards, status, *distribution = await conn.pipeline("admin", admin)
+            if self.since is None:
+                # The cluster's clock, not ours, decides which changelog entries are new
+                self.since = hello.get("localTime") or datetime.datetime.now(datetime.timezone.utc)
+            names = [s["_id"] for s in shards.get("shards", [])]
+            config = [{"count": "chunks", "query": {"shard": name}} for name in names]
+            config.append({"count": "changelog", "query": {"what": "moveChunk.commit", "time": {"$gte": self.since}}})
+            if self.by_data:
+                config.append({"find": "settings", "filter": {"_id": "chunksize"}, "limit": 1})
+            counts = await conn.pipeline("config", config)
+            sample = BalanceSample(time.monotonic(), {name: int(c["n"]) for name, c in zip(names, counts)},
+                                   int(counts[len(names)]["n"]), status.get("mode", "full") != "off",
+                                   bool(status.get("inBalancerRound")), self.by_data)
+            if self.by_data:
+                cursor = distribution[0]["cursor"]
+                collections = list(cursor["firstBatch"])
+                while cursor["id"]:
+                    cursor = (await conn.command("admin", {"getMore": cursor["id"], "collection": "$cmd.aggregate"}))[
+                        "cursor"]
+                    collections.extend(cursor["nextBatch"])
+                # A shard without data of a collection is left out of $shardedDataDistribution
+                sample.data = {c["ns"]: dict({name: 0 for name in names},
+                                             **{s["shardName"]: int(s["ownedSizeBytes"]) for s in c["shards"]})
+                               for c in collections}
+                chunk_size = counts[-1]["cursor"]["firstBatch"]
+                sample.threshold = 3 * int(chunk_size[0]["value"] if chunk_size else CHUNK_SIZE_MB) * 1024 * 1024
+                # Collections dropped since the distribution was read answer with an error; they need no balancing
+                statuses = await conn.pipeline("admin", [{"balancerCollectionStatus": ns} for ns in sample.data],
+                                               check=False)
+                sample.compliant = all(s.get("balancerCompliant", True) for s in statuses if s.get("ok"))
+        return sample
+
+    def progress(self, sample: BalanceSample) -> MigrationProgress:
+        if self.history and sample.moved > self.history[-1].moved:
+            self.last_move = sample.at
+        self.history.append(sample)
+        while len(self.history) > 2 and sample.at - self.history[1].at >= self.options.rate_window:
+            self.history.popleft()
+        first = self.history[0]
+        remaining = sample.remaining
+        elapsed = sample.at - first.at
+        if elapsed <= 0:
+            rate = 0.0
+        elif sample.by_data:
+            # Bytes still to move shrink as migrations land; new writes can outgrow them
+            rate = max(0.0, (first.remaining - remaining) / elapsed)
+        else:
+            rate = (sample.moved - first.moved) / elapsed
+        idle = sample.at - self.last_move
+        # The balancer's own threshold may leave a few chunks of imbalance; it is done when it stops moving them
+        balanced = remaining == 0 or (sample.balancer_on and not sample.in_round and idle >= self.options.settle)
+        return MigrationProgress(sample, remaining, rate, idle, balanced)
+
+    async def watch(self, progress=None) -> MigrationProgress:
+        """Sample until the cluster is balanced or ``watch_timeout`` passes; returns the last progress."""
+        started = time.monotonic()
+        while True:
+            current = self.progress(await self.sample())
+            if progress:
+                progress(current.format())
+            if current.balanced:
+                return current
+            if self.options.watch_timeout and time.monotonic() - started >= self.options.watch_timeout:
+                return current
+            await asyncio.sleep(self.options.poll_interval)
+
+
+# ---------------------------------------------------------------------------
+# Joining new nodes
+# ---------------------------------------------------------------------------
+
+class ScaleOperation:
+    def __init__(self, options: Optional[ScaleOptions] = None, pool: Optional[ConnectionPool] = None,
+                 progress=None):
+        self.options = options or ScaleOptions()
+        self.pool = pool or ConnectionPool(max_per_host=2, connect_timeout=self.options.timeout)
+        self.prober = HealthProber(self.pool, timeout=self.options.timeout, max_lag=self.options.max_lag)
+        self.progress = progress or (lambda message: None)
+
+    async def close(self):
+        await self.prober.close()
+
+    async def add_shard(self, router: Node, name: str, hosts: List[str]) -> str:
+        """``addShard`` the replica set ``name``; a shard already added with the same hosts is not an error."""
+        async with self.pool.acquire(router.host, router.port) as conn:
+            reply = await conn.command("admin", {"addShard": f"{name}/{','.join(hosts)}", "name": name})
+        self.progress(f"Added shard {reply.get('shardAdded', name)} ({', '.join(hosts)})")
+        return reply.get("shardAdded", name)
+
+    async def add_members(self, set_name: str, members: List[Node], new: List[Node]):
+        """Add ``new`` to replica set ``set_name`` one at a time, each fully synced before the next.
+
+        Adding voting members one by one keeps the majority of the old
+        configuration in every new one, as MongoDB requires for reconfigs.
+        """
+        members = list(members)
+        for node in new:
+            report = await self.wait(members, lambda r: RollingOperation.set_problem(set_name, r),
+                                     f"{set_name} not healthy", self.options.sync_timeout)
+            primary = report.replica_sets[set_name].primary
+            host, _, port = primary.rpartition(":")
+            async with self.pool.acquire(host, int(port)) as conn:
+                config = (await conn.command("admin", {"replSetGetConfig": 1}))["config"]
+                if node.address in {m["host"] for m in config["members"]}:
+                    self.progress(f"{node.address} is already a member of {set_name}")
+                    members.append(node)
+                    continue
+                config["version"] = int(config["version"]) + 1
+                config["members"].append({"_id": max(int(m["_id"]) for m in config["members"]) + 1,
+                                          "host": node.address})
+                await conn.command("admin", {"replSetReconfig": config})
+            self.progress(f"Added {node.address} to {set_name}, waiting for its initial sync")
+            members.append(node)
+
+            def synced(report: ClusterHealth) -> Optional[str]:
+                mine = next(n for n in report.nodes if n.node == node)
+                if mine.ok and mine.state != "SECONDARY":
+                    return f"{node.address} is {mine.state}"
+                return RollingOperation.set_problem(set_name, report)
+
+            await self.wait(members, synced, f"{node.address} did not finish its initial sync",
+                            self.options.sync_timeout)
+            self.progress(f"{node.address} is a caught-up secondary of {set_name}")
+
+    async def wait(self, nodes: List[Node], check, what: str, timeout: float) -> ClusterHealth:
+        try:
+            return await wait_until(self.prober, nodes, check, what, timeout, self.options.poll_interval)
+        except RollingError as e:
+            raise ScaleError(str(e))
+
+    async def configure_balancer(self, router: Node, settings: BalancerSettings):
+        async with self.pool.acquire(router.host, router.port) as conn:
+            update = settings.update()
+            if update:
+                await conn.command("config", {"update": "settings", "updates": [
+                    {"q": {"_id": "balancer"}, "u": update, "upsert": True}]})
+            if settings.enabled is not None:
+                await conn.command("admin", {"balancerStart" if settings.enabled else "balancerStop": 1})
+        self.progress(f"Balancer settings: {settings.format()}")
+
+    async def watch(self, router: Node) -> MigrationProgress:
+        return await MigrationMonitor(self.pool, router, self.options).watch(self.progress)
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SimulationResult:
+    progress: MigrationProgress
+    seconds: float
+    shards: Dict[str, int] = field(default_factory=dict)
+
+
+async def simulate(options: ScaleOptions, balancer: BalancerSettings, shards: int = 2, new_shards: int = 1,
+                   new_members: int = 0, chunks: int = 60, move_seconds: float = 0.1,
+                   progress=None) -> SimulationResult:
+    """Scale an in-process fake cluster: ``shards`` balanced shards of ``chunks`` full chunks get
+    ``new_shards`` more (and ``new_members`` more members on shard1), then the fake balancer
+    moves one chunk per ``move_seconds`` until no two shards are three chunks' data apart."""
+    from dbprov.testing.fakemongo import FakeMongoServer, enable_sharding, start_replica_set, stop_all
+
+    started = time.monotonic()
+    sets = [await start_replica_set(f"shard{i}", SHARD_MEMBERS) for i in range(1, shards + 1)]
+    mongos = FakeMongoServer(role="mongos")
+    store = enable_sharding(mongos, move_seconds=move_seconds)
+    await mongos.start()
+    for rs in sets:
+        store.collection("config", "shards").insert({"_id": rs.name, "host": f"{rs.name}/{','.join(rs.hosts())}",
+                                                     "state": 1})
+    for i in range(chunks):
+        store.collection("config", "chunks").insert({"_id": f"app.events-{i}", "ns": "app.events",
+                                                     "min": {"_id": i * 1000}, "max": {"_id": (i + 1) * 1000},
+                                                     "shard": sets[i % shards].name, "count": 1000,
+                                                     "bytes": CHUNK_SIZE_MB * 1024 * 1024})
+    added = [await start_replica_set(f"shard{i}", SHARD_MEMBERS) for i in range(shards + 1, shards + new_shards + 1)]
+    spares = [await FakeMongoServer().start() for _ in range(new_members)]
+    servers = [m for rs in sets + added for m in rs.members] + spares + [mongos]
+    router = Node(mongos.host, mongos.port, "mongos")
+    operation = ScaleOperation(options, progress=progress)
+    try:
+        if balancer.changed:
+            await operation.configure_balancer(router, balancer)
+        if spares:
+            await operation.add_members("shard1", [Node(m.host, m.port) for m in sets[0].members],
+                                        [Node(s.host, s.port) for s in spares])
+        for rs in added:
+            await operation.add_shard(router, rs.name, rs.hosts())
+        result = await operation.watch(router)
+        return SimulationResult(result, time.monotonic() - started, dict(result.sample.chunks))
+    finally:
+        await operation.close()
+        await stop_all(servers)
@@ -0,0 +1,224 @@
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Union
+
+PhaseAction = Callable[[], Union[object, Awaitable[object]]]
+PhaseListener = Callable[[str, str, Optional["PhaseResult"]], None]
+
+
+@dataclass
+class Phase:
+    name: str
+    action: PhaseAction
+    depends_on: Sequence[str] = ()
+    description: str = ""  # what the action does, for dry runs
+
+
+@dataclass
+class PhaseResult:
+    name: str
+    started: float
+    finished: float
+    ok: bool
+    error: Optional[BaseException] = None
+    value: object = None
+    ready: float = 0.0  # when its last dependency finished
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+    @property
+    def wait(self) -> float:
+        """Time from ready to started: scheduling overhead plus waiting for a free worker."""
+        return max(0.0, self.started - self.ready) if self.ready else 0.0
+
+
+@dataclass
+class ScheduleReport:
+    started: float
+    finished: float
+    results: Dict[str, PhaseResult] = field(default_factory=dict)
+    critical_path: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.skipped and all(r.ok for r in self.results.values())
+
+    @property
+    def wall_time(self) -> float:
+        return self.finished - self.started
+
+    @property
+    def serial_time(self) -> float:
+        return sum(r.duration for r in self.results.values())
+
+    @property
+    def failures(self) -> List[PhaseResult]:
+        return [r for r in self.results.values() if not r.ok]
+
+    def format(self) -> str:
+        lines = [f"{'Phase':<36} {'Start':>8} {'Wall':>8}  Status"]
+        ordered = sorted(self.results.values(), key=lambda r: r.started)
+        for r in ordered:
+            marker = " *" if r.name in self.critical_path else ""
+            status = "ok" if r.ok else "FAILED"
+            lines.append(
+                f"{r.name:<36} {r.started - self.started:>7.1f}s {r.duration:>7.1f}s  {status}{marker}"
+            )
+        for name in self.skipped:
+            lines.append(f"{name:<36} {'-':>8} {'-':>8}  skipped")
+        lines.append("")
+        lines.append(f"Total wall time: {self.wall_time:.1f}s (serial sum {self.serial_time:.1f}s)")
+        if self.critical_path:
+            lines.append("Critical path (*): " + " -> ".join(self.critical_path))
+        return "\n".join(lines)
+
+
+class PhaseScheduler:
+    """Runs a DAG of phases, starting each one as soon as its dependencies finish.
+
+    Coroutine actions are awaited directly; plain callables run on the default
+    thread pool so blocking subprocess calls do not stall the loop. At most
+    ``max_workers`` phases run at the same time. After the first failure no new
+    phases are started, the ones already running are allowed to finish.
+    """
+
+    def __init__(self, max_workers: int = 4, listener: Optional[PhaseListener] = None):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self.listener = listener
+        self.phases: Dict[str, Phase] = {}
+
+    def add(self, name: str, action: PhaseAction, depends_on: Sequence[str] = (), description: str = "") -> str:
+        if name in self.phases:
+            raise ValueError(f"Duplicate phase: {name}")
+        self.phases[name] = Phase(name, action, tuple(depends_on), description)
+        return name
+
+    def validate(self):
+        for phase in self.phases.values():
+            for dep in phase.depends_on:
+                if dep not in self.phases:
+                    raise ValueError(f"Phase {phase.name} depends on unknown phase {dep}")
+        self.topological_order()
+
+    def topological_order(self) -> List[str]:
+        indegree = {name: len(p.depends_on) for name, p in self.phases.items()}
+        dependents: Dict[str, List[str]] = {name: [] for name in self.phases}
+        for phase in self.phases.values():
+            for dep in phase.depends_on:
+                dependents[dep].append(phase.name)
+
+        ready = [name for name, deg in indegree.items() if deg == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for child in dependents[name]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+
+        if len(order) != len(self.phases):
+            cycle = sorted(set(self.phases) - set(order))
+            raise ValueError(f"Dependency cycle between phases: {', '.join(cycle)}")
+        return order
+
+    def stages(self) -> List[List[str]]:
+        """Phases in the rounds they would start in if every phase took equally long.
+
+        Each round holds at most ``max_workers`` phases whose dependencies all
+        finished in earlier rounds; nothing is run.
+        """
+        self.validate()
+        done: Set[str] = set()
+        pending = self.topological_order()
+        stages = []
+        while pending:
+            ready = [n for n in pending if all(d in done for d in self.phases[n].depends_on)][:self.max_workers]
+            stages.append(ready)
+            done.update(ready)
+            pending = [n for n in pending if n not in done]
+        return stages
+
+    def format_plan(self) -> str:
+        lines = [f"{'Step':>4}  {'Phase':<36} After"]
+        for step, names in enumerate(self.stages(), 1):
+            for name in names:
+                phase = self.phases[name]
+                lines.append(f"{step:>4}  {name:<36} {', '.join(phase.depends_on) or '-'}")
+                if phase.description:
+                    lines.append(f"{'':>6}$ {phase.description}")
+        return "\n".join(lines)
+
+    def run(self) -> ScheduleReport:
+        import asyncio
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> ScheduleReport:
+        # Imported here so building and printing a schedule stays cheap
+        import asyncio
+        self.validate()
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_workers)
+        report = ScheduleReport(started=time.monotonic(), finished=0.0)
+        pending = dict(self.phases)
+        running: Dict[asyncio.Task, str] = {}
+        failed = False
+
+        async def execute(phase: Phase, ready: float) -> PhaseResult:
+            async with semaphore:
+                self._notify(phase.name, "started", None)
+                started = time.monotonic()
+                try:
+                    if asyncio.iscoroutinefunction(phase.action):
+                        value = await phase.action()
+                    else:
+                        value = await loop.run_in_executor(None, phase.action)
+                    result = PhaseResult(phase.name, started, time.monotonic(), True, value=value, ready=ready)
+                except (Exception, SystemExit) as e:
+                    result = PhaseResult(phase.name, started, time.monotonic(), False, error=e, ready=ready)
+                self._notify(phase.name, "finished" if result.ok else "failed", result)
+                return result
+
+        while pending or running:
+            if not failed:
+                for name in [n for n, p in pending.items() if all(d in report.results for d in p.depends_on)]:
+                    phase = pending.pop(name)
+                    ready = max((report.results[d].finished for d in phase.depends_on), default=report.started)
+                    running[asyncio.ensure_future(execute(phase, ready))] = name
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.pop(task)
+                result = task.result()
+                report.results[result.name] = result
+                if not result.ok:
+                    failed = True
+
+        report.skipped = sorted(pending)
+        report.finished = time.monotonic()
+        report.critical_path = self._critical_path(report)
+        return report
+
+    def _notify(self, name: str, state: str, result: Optional[PhaseResult]):
+        if self.listener:
+            self.listener(name, state, result)
+
+    def _critical_path(self, report: ScheduleReport) -> List[str]:
+        # Walk back from the phase that finished last, following the dependency
+        # that released it (the one finishing latest) at every step.
+        if not report.results:
+            return []
+        current: Optional[PhaseResult] = max(report.results.values(), key=lambda r: r.finished)
+        path = []
+        while current is not None:
+            path.append(current.name)
+            deps = [report.results[d] for d in self.phases[current.name].depends_on if d in report.results]
+            current = max(deps, key=lambda r: r.finished) if deps else None
+        return list(reversed(path))
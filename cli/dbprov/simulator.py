@@ -0,0 +1,477 @@
+"""Local stand-in for terraform and ansible-playbook, for load-testing the pipeline.
+
+With ``DBPROVISION_EXECUTOR=simulator`` every terraform and ansible-playbook
+command ``DBProvision`` runs goes to ``SimulatedRunner`` instead of a
+subprocess: it sleeps for a modelled latency, streams plausible output lines,
+writes the files the real tools leave behind (provider directory, saved plan)
+and exits like they would. Nothing is created in any cloud. Other commands
+still run as subprocesses.
+
+``DBPROVISION_SIMULATOR_CONFIG`` names a YAML or JSON file with the model::
+
+    time_scale: 0.01          # 1.0 = realistic durations
+    seed: 42                  # same latencies and failures on every run
+    quota:
+      instances: 200          # apply fails once the simulated project holds more
+    latency:                  # seconds: base + per_node * nodes, +-jitter (fraction)
+      terraform apply: {base: 45, per_node: 2, jitter: 0.3}
+      ansible: {base: 20, per_node: 1.5}
+      deploy-shard-servers.yml: {base: 60, per_node: 3}
+    failures:                 # probability that one command fails
+      terraform apply: 0.02
+      init-replica-set.yml: 0.05
+
+Latency and failure keys are ``terraform <action>``, ``ansible`` for every
+playbook, or a playbook file name. Applied clusters and their instances are
+recorded in ``<state dir>/simulator/clusters.json``, shared by every process
+using the same ``DBPROVISION_HOME``, so the instance quota holds across a
+fleet run or the backend's concurrent jobs, and ``terraform output -json``
+describes what was applied.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from dbprov.process import LineCallback, ProcessResult, ProcessRunner
+
+EXECUTOR_ENV = "DBPROVISION_EXECUTOR"
+CONFIG_ENV = "DBPROVISION_SIMULATOR_CONFIG"
+
+ROLE_PORTS = {"mongos": 27017, "mongod": 27018, "config": 27019}
+
+
+class SimulatorError(ValueError):
+    pass
+
+
+@dataclass
+class Latency:
+    base: float
+    per_node: float = 0.0
+    jitter: float = 0.2
+
+    def sample(self, nodes: int, rng: random.Random) -> float:
+        mean = self.base + self.per_node * nodes
+        return max(0.0, mean * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+
+DEFAULT_LATENCIES = {
+    "terraform init": Latency(8.0, jitter=0.3),
+    "terraform plan": Latency(6.0, 0.3),
+    "terraform apply": Latency(45.0, 2.0, 0.3),
+    "terraform destroy": Latency(30.0, 1.0, 0.3),
+    "terraform output": Latency(1.0),
+    "ansible": Latency(20.0, 1.5, 0.3),
+}
+
+
+@dataclass
+class SimulatorConfig:
+    time_scale: float = 1.0
+    seed: Optional[int] = None
+    quota_instances: Optional[int] = None
+    latencies: Dict[str, Latency] = field(default_factory=dict)
+    failures: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SimulatorConfig":
+        errors = []
+        unknown = set(data) - {"time_scale", "seed", "quota", "latency", "failures"}
+        if unknown:
+            errors.append(f"unknown key(s): {', '.join(sorted(unknown))}")
+        latencies = {}
+        for key, value in (data.get("latency") or {}).items():
+            try:
+                latencies[key] = Latency(**value)
+            except TypeError:
+                errors.append(f"latency.{key}: expected base, per_node and jitter in seconds")
+        failures = {}
+        for key, value in (data.get("failures") or {}).items():
+            if not isinstance(value, (int, float)) or not 0 <= value <= 1:
+                errors.append(f"failures.{key}: must be a probability between 0 and 1")
+            else:
+                failures[key] = float(value)
+        time_scale = data.get("time_scale", 1.0)
+        if not isinstance(time_scale, (int, float)) or time_scale < 0:
+            errors.append("time_scale must be a number >= 0")
+        quota = data.get("quota") or {}
+        if errors:
+            raise SimulatorError("; ".join(errors))
+        return cls(time_scale=float(time_scale), seed=data.get("seed"), quota_instances=quota.get("instances"),
+                   latencies=latencies, failures=failures)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SimulatorConfig":
+        import yaml
+        try:
+            with open(path) as f:
+                data = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise SimulatorError(f"Cannot read simulator config {path}: {e}")
+        if not isinstance(data, dict):
+            raise SimulatorError(f"Simulator config {path} must be a mapping")
+        return cls.from_dict(data)
+
+    def latency(self, operation: str, playbook: Optional[str] = None) -> Latency:
+        for key in (playbook, operation):
+            if key and key in self.latencies:
+                return self.latencies[key]
+        return DEFAULT_LATENCIES[operation]
+
+    def failure_rate(self, operation: str, playbook: Optional[str] = None) -> float:
+        for key in (playbook, operation):
+            if key and key in self.failures:
+                return self.failures[key]
+        return 0.0
+
+
+def read_vars_file(path: Path) -> Dict[str, Any]:
+    """Values of a ``.tfvars`` file as written by ``render_tfvars``."""
+    values = {}
+    for line in Path(path).read_text().splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            with contextlib.suppress(json.JSONDecodeError):
+                values[key.strip()] = json.loads(value.strip())
+    return values
+
+
+def instance_names(spec: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Instances by role, named like the terraform modules name them."""
+    replicas = int(spec.get("replica_nodes", 3))
+    if spec.get("cluster_type") == "standalone":
+        return {"mongod": ["shard-server-1"]}
+    if spec.get("cluster_type") != "sharded":
+        return {"mongod": [f"shard-server-{i}" for i in range(1, replicas + 1)]}
+    return {
+        "config": [f"config-server-{i}" for i in range(1, int(spec.get("config_servers", 3)) + 1)],
+        "mongod": [f"shard-server-{i}" for i in range(1, int(spec.get("shard_count", 1)) * replicas + 1)],
+        "mongos": [f"mongo-router-{i}" for i in range(1, int(spec.get("mongos_count", 1)) + 1)],
+    }
+
+
+# Parsed state files by path, with the (inode, mtime, size) they were read at
+_STATE_CACHE: Dict[Path, Tuple[Tuple[int, int, int], Dict[str, Dict[str, Any]]]] = {}
+
+
+class SimulatedCloud:
+    """Applied clusters of the simulated project, in a JSON file locked across processes."""
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = Path(state_dir)
+        self.path = self.state_dir / "clusters.json"
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """The clusters under a file lock; changes made under an ``exclusive`` lock are saved."""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.state_dir / "clusters.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            clusters = dict(self._read())
+            yield clusters
+            if exclusive:
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(clusters))
+                tmp.replace(self.path)
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        # Every command reads the state: parse the file again only when another write replaced it
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return {}
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = _STATE_CACHE.get(self.path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            clusters = json.loads(self.path.read_text())
+        except json.JSONDecodeError:
+            clusters = {}
+        _STATE_CACHE[self.path] = (version, clusters)
+        return clusters
+
+    def clusters(self) -> Dict[str, Dict[str, Any]]:
+        with self._locked() as clusters:
+            return clusters
+
+    def instances(self) -> int:
+        return sum(c["instances"] for c in self.clusters().values())
+
+    def apply(self, name: str, spec: Dict[str, Any], terraform_dir: Path, quota: Optional[int]) -> Optional[int]:
+        """Record the cluster; returns the quota limit instead when it would be exceeded."""
+        nodes = sum(len(names) for names in instance_names(spec).values())
+        with self._locked(exclusive=True) as clusters:
+            others = sum(c["instances"] for n, c in clusters.items() if n != name)
+            if quota is not None and others + nodes > quota:
+                return quota
+            clusters[name] = {"spec": spec, "instances": nodes, "terraform_dir": str(terraform_dir)}
+        return None
+
+    def destroy(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._locked(exclusive=True) as clusters:
+            return clusters.pop(name, None)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.clusters().get(name)
+
+    def in_directory(self, terraform_dir: Path) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """The cluster last applied from this terraform directory (its ``terraform output``)."""
+        matches = [(n, c) for n, c in self.clusters().items() if c["terraform_dir"] == str(terraform_dir)]
+        return matches[-1] if matches else None
+
+
+def terraform_outputs(cluster: Dict[str, Any]) -> Dict[str, Any]:
+    """``terraform output -json`` of infra/terraform/mongodb-cluster.tf for a simulated cluster."""
+    from dbprov.discovery import OUTPUTS
+    spec = cluster["spec"]
+    region = spec.get("region", "asia-northeast3")
+    zones = spec.get("zones") or [f"{region}-{z}" for z in "abc"]
+    outputs = {}
+    for subnet, (role, names) in enumerate(instance_names(spec).items()):
+        hosts, connections = {}, []
+        for i, name in enumerate(names):
+            ip = f"10.{10 + subnet}.{i // 250}.{i % 250 + 2}"
+            hosts[name] = {"ansible_host": ip, "internal_ip": ip, "zone": zones[i % len(zones)]}
+            connections.append(f"{ip}:{ROLE_PORTS[role]}")
+        outputs[OUTPUTS[role]] = {"sensitive": False, "type": "object", "value": {
+            "names": names, "internal_ips": [h["internal_ip"] for h in hosts.values()],
+            "connection_strings": connections, "ansible_inventory": {"hosts": hosts}}}
+    return outputs
+
+
+def _option(cmd: Sequence[str], prefix: str) -> Optional[str]:
+    for arg in cmd:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return None
+
+
+def _after(cmd: Sequence[str], flag: str) -> Optional[str]:
+    try:
+        return cmd[cmd.index(flag) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+@dataclass
+class Outcome:
+    """What a simulated command prints and how it exits."""
+    lines: List[Tuple[str, str]]  # (stream, line)
+    returncode: int = 0
+    nodes: int = 0
+
+
+class SimulatedRunner(ProcessRunner):
+    """``ProcessRunner`` whose terraform and ansible-playbook commands are simulated.
+
+    Results, logging, echo, ``on_line`` callbacks, timeouts and cancellation
+    behave like the subprocess runner's. ``simulated_time`` adds up the
+    modelled latencies, so callers can tell them apart from their own overhead.
+    """
+
+    def __init__(self, config: SimulatorConfig, state_dir: Path, **kwargs):
+        super().__init__(**kwargs)
+        self.config = config
+        self.cloud = SimulatedCloud(state_dir)
+        self.simulated_time = 0.0
+        self.commands = 0
+
+    def _rng(self, cmd: Sequence[str], cwd: Optional[Union[str, Path]]) -> random.Random:
+        if self.config.seed is None:
+            return random.Random()
+        return random.Random(f"{self.config.seed}|{cwd}|{' '.join(cmd)}")
+
+    async def run_async(self, cmd: Sequence[str], cwd: Optional[Union[str, Path]] = None,
+                        label: Optional[str] = None, timeout: Optional[float] = None,
+                        capture: bool = False, env: Optional[dict] = None,
+                        on_line: Optional[LineCallback] = None, echo: Optional[bool] = None) -> ProcessResult:
+        cmd = [str(c) for c in cmd]
+        tool = Path(cmd[0]).name if cmd else ""
+        if tool not in ("terraform", "ansible-playbook"):
+            return await super().run_async(cmd, cwd, label, timeout, capture, env, on_line, echo)
+
+        label = label or tool
+        started = time.monotonic()
+        self.logger.info("[%s] $ %s (cwd=%s, simulated)", label, " ".join(cmd), cwd)
+        directory = Path(cwd) if cwd else Path.cwd()
+        rng = self._rng(cmd, cwd)
+        if tool == "terraform":
+            operation = f"terraform {cmd[1] if len(cmd) > 1 else ''}"
+            playbook = None
+        else:
+            operation, playbook = "ansible", Path(next((a for a in cmd[1:] if a.endswith(".yml")), "")).name
+        if operation not in DEFAULT_LATENCIES:
+            return self._result(cmd, started, [("stderr", f"Error: {operation} is not simulated")], 1, capture)
+
+        fails = rng.random() < self.config.failure_rate(operation, playbook)
+        if tool == "terraform":
+            outcome = self._terraform(cmd, directory, fails, rng)
+        else:
+            outcome = self._ansible(cmd, directory, playbook, fails, rng)
+        duration = self.config.latency(operation, playbook).sample(outcome.nodes, rng) * self.config.time_scale
+        if outcome.returncode not in (0, 2):
+            duration *= rng.uniform(0.1, 1.0)  # errors surface part of the way through
+
+        pumps = deque(maxlen=self.tail_lines)
+        output: Optional[List[str]] = [] if capture else None
+        echo = self.echo if echo is None else echo
+        step = duration / max(1, len(outcome.lines))
+        timed_out = False
+        self.commands += 1
+        try:
+            for stream, line in outcome.lines:
+                if timeout is not None and time.monotonic() + step - started > timeout:
+                    await asyncio.sleep(max(0.0, timeout - (time.monotonic() - started)))
+                    timed_out = True
+                    break
+                if step:
+                    await asyncio.sleep(step)
+                pumps.append(line)
+                if output is not None and stream == "stdout":
+                    output.append(line)
+                self.logger.info("[%s] %s", label, line)
+                if echo:
+                    print(f"[{label}] {line}", file=sys.stdout if stream == "stdout" else sys.stderr, flush=True)
+                if on_line:
+                    on_line(stream, line)
+        finally:
+            self.simulated_time += time.monotonic() - started
+        returncode = -15 if timed_out else outcome.returncode
+        result = ProcessResult(cmd=cmd, returncode=returncode, duration=time.monotonic() - started,
+                               tail=list(pumps), output=output, timed_out=timed_out)
+        self.logger.info("[%s] exit=%s after %.1fs (simulated)", label, returncode, result.duration)
+        return result
+
+    def _result(self, cmd: List[str], started: float, lines: List[Tuple[str, str]], returncode: int,
+                capture: bool) -> ProcessResult:
+        output = [line for stream, line in lines if stream == "stdout"] if capture else None
+        return ProcessResult(cmd=cmd, returncode=returncode, duration=time.monotonic() - started,
+                             tail=[line for _, line in lines], output=output)
+
+    def _terraform(self, cmd: List[str], directory: Path, fails: bool, rng: random.Random) -> Outcome:
+        action = cmd[1]
+        if action == "init":
+            (directory / ".terraform" / "providers" / "registry.terraform.io").mkdir(parents=True, exist_ok=True)
+            return Outcome([("stdout", "Initializing the backend..."),
+                            ("stdout", "Initializing provider plugins..."),
+                            ("stdout", "- Using previously-installed hashicorp/google v5.10.0"),
+                            ("stdout", "Terraform has been successfully initialized!")])
+
+        if action == "output":
+            found = self.cloud.in_directory(directory)
+            outputs = terraform_outputs(found[1]) if found else {}
+            return Outcome([("stdout", line) for line in json.dumps(outputs, indent=2).splitlines()])
+
+        vars_file = _option(cmd, "-var-file=")
+        plan_path = _option(cmd, "-out=") or (cmd[-1] if cmd[-1].endswith(".tfplan") else None)
+        if action == "apply" and vars_file is None and plan_path:
+            plan = json.loads(Path(plan_path).read_text())
+            name, spec = plan["cluster"], plan["spec"]
+        else:
+            path = directory / vars_file if vars_file else None
+            if path is None or not path.exists():
+                return Outcome([("stderr", f"Error: Failed to read variables file {vars_file}")], 1)
+            name, spec = path.stem, read_vars_file(path)
+        nodes = sum(len(n) for n in instance_names(spec).values())
+        current = self.cloud.get(name)
+
+        if action == "plan":
+            changes = current is None or current["spec"] != spec
+            if plan_path:
+                Path(plan_path).write_text(json.dumps({"cluster": name, "spec": spec}))
+            if not changes:
+                summary = "No changes. Your infrastructure matches the configuration."
+            elif current is None:
+                summary = f"Plan: {nodes} to add, 0 to change, 0 to destroy."
+            else:
+                summary = f"Plan: 0 to add, {nodes} to change, 0 to destroy."
+            return Outcome([("stdout", "Refreshing state..."), ("stdout", summary)],
+                           2 if changes and "-detailed-exitcode" in cmd else 0, nodes)
+
+        if action == "destroy":
+            if fails:
+                error = "Error: Error waiting for instance deletion: timeout (simulated)"
+                return Outcome([("stderr", error)], 1, nodes)
+            removed = self.cloud.destroy(name)
+            count = removed["instances"] if removed else 0
+            return Outcome([("stdout", f"{n}: Destroying...") for n in self._resources(spec)[:count]]
+                           + [("stdout", f"Destroy complete! Resources: {count} destroyed.")], 0, count)
+
+        resources = self._resources(spec)
+        lines = [("stdout", f"{r}: Creating...") for r in resources]
+        if fails:
+            failed = rng.choice(resources)
+            return Outcome(lines + [("stderr", f"Error: Error waiting to create Instance: {failed}: "
+                                               "operation timed out (simulated)")], 1, nodes)
+        limit = self.cloud.apply(name, spec, directory, self.config.quota_instances)
+        if limit is not None:
+            region = spec.get("region", "asia-northeast3")
+            return Outcome(lines[:1] + [("stderr", "Error: Error creating instance: googleapi: Error 403: Quota "
+                                                   f"'INSTANCES' exceeded.  Limit: {limit:.1f} in region {region}., "
+                                                   "quotaExceeded")], 1, nodes)
+        lines += [("stdout", f"{r}: Creation complete after {rng.randint(20, 60)}s") for r in resources]
+        lines.append(("stdout", f"Apply complete! Resources: {len(resources)} added, 0 changed, 0 destroyed."))
+        return Outcome(lines, 0, nodes)
+
+    @staticmethod
+    def _resources(spec: Dict[str, Any]) -> List[str]:
+        modules = {"config": "config_servers", "mongod": "shard_servers", "mongos": "mongo_routers"}
+        return [f"module.{modules[role]}.google_compute_instance.this[\"{name}\"]"
+                for role, names in instance_names(spec).items() for name in names]
+
+    def _ansible(self, cmd: List[str], directory: Path, playbook: str, fails: bool,
+                 rng: random.Random) -> Outcome:
+        vars_file = _after(cmd, "-e")
+        cluster = self.cloud.get(Path(vars_file.lstrip("@")).stem) if vars_file else None
+        if cluster is None:
+            return Outcome([("stderr", f"[WARNING]: Unable to parse {_after(cmd, '-i')} as an inventory source"),
+                            ("stdout", "PLAY RECAP *********************************************************")], 0)
+        hosts = self._hosts(instance_names(cluster["spec"]), playbook, _after(cmd, "--limit"),
+                            int(cluster["spec"].get("replica_nodes", 3)))
+        tasks = ["Gathering Facts", "Install MongoDB packages", "Render mongod.conf", "Start mongod"]
+        lines = [("stdout", f"PLAY [{playbook}] ***")]
+        for task in tasks:
+            lines.append(("stdout", f"TASK [{task}] ***"))
+            lines.extend(("stdout", f"ok: [{host}]") for host in hosts)
+        failed = rng.choice(hosts) if fails and hosts else None
+        if failed:
+            lines.append(("stdout", f"fatal: [{failed}]: FAILED! => {{\"msg\": \"mongod did not become ready "
+                                    "(simulated)\"}"))
+        lines.append(("stdout", "PLAY RECAP ***"))
+        for host in hosts:
+            bad = int(host == failed)
+            lines.append(("stdout", f"{host:<26}: ok={len(tasks) - bad} changed={len(tasks) - 1 - bad} "
+                                    f"unreachable=0 failed={bad}"))
+        return Outcome(lines, 2 if failed else 0, len(hosts))
+
+    @staticmethod
+    def _hosts(names: Dict[str, List[str]], playbook: str, limit: Optional[str], replicas: int) -> List[str]:
+        if "config" in playbook:
+            return names.get("config", [])
+        if "mongos" in playbook or "sharding" in playbook:
+            return names.get("mongos", [])
+        shards = names.get("mongod", [])
+        match = re.fullmatch(r"shard(\d+)", limit or "")
+        if match:
+            number = int(match.group(1))
+            return shards[(number - 1) * replicas:number * replicas]
+        return shards
+
+
+def simulated_runner(state_dir: Path, **kwargs) -> SimulatedRunner:
+    """The runner ``DBPROVISION_EXECUTOR=simulator`` selects, modelled by ``DBPROVISION_SIMULATOR_CONFIG``."""
+    path = os.environ.get(CONFIG_ENV)
+    config = SimulatorConfig.load(path) if path else SimulatorConfig()
+    return SimulatedRunner(config, Path(state_dir) / "simulator", **kwargs)
@@ -0,0 +1,151 @@
+"""Startup-time budget of the dbprovision CLI.
+
+Runs a few commands in fresh interpreters, the way cron runs ``status`` and
+``health``, and fails when one takes longer than its budget or imports a
+module it should not need. Times are medians of ``runs`` and exclude the
+bare interpreter start, so the budget holds on slow and fast machines alike::
+
+    python -m dbprov.startup --runs 20 --budget-ms 80
+
+``status`` also starts an event loop and probes a host, so its budget has
+``headroom_ms`` on top: importing asyncio alone takes 30-40ms on a slow VM.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Never needed to parse arguments, print help or probe a cluster
+HEAVY = ("numpy", "yaml", "zstandard", "dbprov.advisor", "dbprov.backup", "dbprov.bench", "dbprov.logs",
+         "dbprov.oplog", "dbprov.testing")
+CLUSTER = ("asyncio", "ssl", "dbprov.wire", "dbprov.health")
+
+
+@dataclass
+class Case:
+    name: str
+    argv: Sequence[str]
+    forbidden: Sequence[str] = HEAVY
+    headroom_ms: float = 0.0  # added to the budget
+
+
+CASES = [
+    Case("help", ["--help"], HEAVY + CLUSTER),
+    Case("status --help", ["status", "--help"], HEAVY + CLUSTER),
+    # Connection refused right away: the whole status path without a cluster
+    Case("status", ["status", "--cluster", "startup-bench", "--hosts", "127.0.0.1:9", "--timeout", "0.2"],
+         HEAVY + ("dbprov.fleet",), headroom_ms=50.0),
+    Case("create --dry-run", ["create", "--cluster-type", "sharded", "--project-id", "startup-bench", "--dry-run"],
+         ("numpy", "zstandard", "asyncio", "dbprov.process", "dbprov.backup", "dbprov.logs")),
+]
+
+
+@dataclass
+class CaseResult:
+    name: str
+    median_ms: float
+    max_ms: float
+    overhead_ms: float
+    budget_ms: float
+    forbidden_imports: List[str] = field(default_factory=list)
+    returncode: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and self.overhead_ms <= self.budget_ms and not self.forbidden_imports
+
+
+def _env() -> Dict[str, str]:
+    # Source checkouts run without installing: put cli/ (dbprovision.py and dbprov/) on the path
+    root = str(Path(__file__).resolve().parent.parent)
+    path = os.environ.get("PYTHONPATH")
+    env = {**os.environ, "PYTHONPATH": root + (os.pathsep + path if path else "")}
+    # Installed CLIs run from cached bytecode; let the warm-up run write it
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+# What the console_scripts entry point does; `-m dbprovision` would recompile the module every run
+ENTRY_POINT = ["-c", "import sys; from dbprovision import main; sys.argv[0] = 'dbprovision'; main()"]
+
+
+def _time(argv: Sequence[str], env: Dict[str, str]) -> Tuple[float, int]:
+    started = time.perf_counter()
+    result = subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000, result.returncode
+
+
+def imported_modules(argv: Sequence[str], env: Dict[str, str]) -> List[str]:
+    """Modules a command imports, from ``python -X importtime``."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + list(argv), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.append(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def measure(cases: Sequence[Case], runs: int = 10, budget_ms: float = 100.0) -> Tuple[float, List[CaseResult]]:
+    """(interpreter start in ms, results); every command gets one untimed warm-up run."""
+    env = _env()
+    bare = [sys.executable, "-c", "pass"]
+    _time(bare, env)
+    baseline = statistics.median(_time(bare, env)[0] for _ in range(runs))
+    results = []
+    for case in cases:
+        argv = [sys.executable] + ENTRY_POINT + list(case.argv)
+        _time(argv, env)
+        timings = [_time(argv, env) for _ in range(runs)]
+        median = statistics.median(t for t, _ in timings)
+        loaded = set(imported_modules(ENTRY_POINT + list(case.argv), env))
+        forbidden = sorted(m for m in case.forbidden if m in loaded)
+        results.append(CaseResult(case.name, round(median, 1), round(max(t for t, _ in timings), 1),
+                                  round(max(0.0, median - baseline), 1), budget_ms + case.headroom_ms, forbidden,
+                                  timings[-1][1]))
+    return round(baseline, 1), results
+
+
+def format_results(baseline: float, results: Sequence[CaseResult], runs: int) -> str:
+    lines = [f"Startup time, median of {runs} runs (interpreter alone {baseline:.1f}ms):",
+             f"{'command':<20} {'median':>9} {'max':>9} {'overhead':>9} {'budget':>8}"]
+    for r in results:
+        status = "ok" if r.ok else "OVER BUDGET" if r.overhead_ms > r.budget_ms else "FAILED"
+        lines.append(f"{r.name:<20} {r.median_ms:>7.1f}ms {r.max_ms:>7.1f}ms {r.overhead_ms:>7.1f}ms "
+                     f"{r.budget_ms:>6.0f}ms  {status}")
+        if r.returncode:
+            lines.append(f"{'':<20} exited {r.returncode}")
+        if r.forbidden_imports:
+            lines.append(f"{'':<20} imports {', '.join(r.forbidden_imports)}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m dbprov.startup", description="Check the CLI startup-time budget")
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per command")
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="Most milliseconds a command may add to the interpreter start")
+    parser.add_argument("--only", action="append", metavar="CASE", choices=[c.name for c in CASES],
+                        help="Measure only this case (repeatable)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in CASES if not args.only or c.name in args.only]
+    baseline, results = measure(cases, max(1, args.runs), args.budget_ms)
+    if args.json:
+        print(json.dumps({"interpreter_ms": baseline, "results": [asdict(r) for r in results]}, indent=2))
+    else:
+        print(format_results(baseline, results, args.runs))
+    if not all(r.ok for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Test doubles: nothing here is used to provision or operate a real cluster.
+
+Only the ``--fake``/``--simulate`` modes of ``bench``, ``rolling`` and
+``scale`` import this package, and only once they run.
+"""
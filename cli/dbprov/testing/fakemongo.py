@@ -0,0 +1,897 @@
+"""In-process fake mongod/mongos speaking OP_MSG, for tests and local benchmarks.
+
+A ``FakeMongoServer`` answers the handful of admin commands dbprovision uses
+(``hello``, ``ping``, ``serverStatus``, ``replSetGetStatus`` ...). Replica set
+members share a ``FakeReplicaSet`` model so their views agree and tests can
+change the primary or inject replication lag. Extra commands are plugged in
+with ``FakeMongoServer.register``; ``enable_crud`` adds basic in-memory
+collections, cursors and catalog commands for load and backup tests, and with
+``FakeStore(oplog=True)`` an ``local.oplog.rs`` that tailable cursors can follow.
+``enable_sharding`` turns a mongos into a tiny config server with ``addShard``
+and a balancer that migrates ``config.chunks`` between shards by data size. ``enable_auth``
+answers the SCRAM-SHA-256 conversation for a set of users.
+"""
+
+import asyncio
+import base64
+import bisect
+import datetime
+import hashlib
+import hmac
+import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from dbprov.wire import (BSONError, Binary, Int64, MaxKey, MinKey, ObjectId, Timestamp, encode_message, read_message,
+                         saslprep)
+
+Handler = Callable[["FakeMongoServer", Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+
+PRIMARY, SECONDARY, ARBITER, DOWN = 1, 2, 7, 8
+STATE_NAMES = {PRIMARY: "PRIMARY", SECONDARY: "SECONDARY", ARBITER: "ARBITER", DOWN: "(not reachable/healthy)"}
+
+
+def command_error(code: int, code_name: str, errmsg: str) -> Dict[str, Any]:
+    return {"ok": 0.0, "errmsg": errmsg, "code": code, "codeName": code_name}
+
+
+class FakeReplicaSet:
+    """Shared replica set state: which member is primary and how far each one lags."""
+
+    def __init__(self, name: str, config_server: bool = False):
+        self.name = name
+        self.config_server = config_server
+        self.members: List["FakeMongoServer"] = []
+        self.primary = 0
+        self.term = 1
+        self.version = 1
+        self.initial_sync = 2.0  # seconds a member added by replSetReconfig starts behind
+        self.election_date = datetime.datetime.now(datetime.timezone.utc)
+        self.lag: Dict[int, float] = {}
+        self.down: set = set()
+
+    def hosts(self) -> List[str]:
+        return [m.member_name for m in self.members]
+
+    def state_of(self, index: int) -> int:
+        if index in self.down:
+            return DOWN
+        return PRIMARY if index == self.primary else SECONDARY
+
+    def elect(self, index: int):
+        self.primary = index
+        self.term += 1
+        self.election_date = datetime.datetime.now(datetime.timezone.utc)
+
+    def optime(self, index: int) -> datetime.datetime:
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        return now - datetime.timedelta(seconds=self.lag.get(index, 0.0))
+
+
+class FakeMongoServer:
+    # Started servers by address, so a replica set reconfig can find the members it adds
+    running: Dict[str, "FakeMongoServer"] = {}
+
+    def __init__(self, role: str = "mongod", host: str = "127.0.0.1", port: int = 0,
+                 replica_set: Optional[FakeReplicaSet] = None, delay: float = 0.0,
+                 name: Optional[str] = None):
+        self.role = role
+        # Member name in the replica set config; a hostname while clients connect by IP
+        self.name = name
+        self.host = host
+        self.port = port
+        self.replica_set = replica_set
+        self.delay = delay
+        self.started = time.time()
+        self.requests = 0
+        self.connections = 0
+        self.commands: Dict[str, Handler] = {
+            "hello": FakeMongoServer._hello,
+            "isMaster": FakeMongoServer._hello,
+            "ismaster": FakeMongoServer._hello,
+            "ping": lambda server, cmd: {"ok": 1.0},
+            "buildInfo": lambda server, cmd: {"version": "8.0.0", "versionArray": [8, 0, 0, 0], "ok": 1.0},
+            "getParameter": lambda server, cmd: {"featureCompatibilityVersion": {"version": "8.0"}, "ok": 1.0},
+            "serverStatus": FakeMongoServer._server_status,
+            "replSetGetStatus": FakeMongoServer._repl_set_get_status,
+            "replSetStepDown": FakeMongoServer._repl_set_step_down,
+            "replSetGetConfig": FakeMongoServer._repl_set_get_config,
+            "replSetReconfig": FakeMongoServer._repl_set_reconfig,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.catching_up: Optional[asyncio.Future] = None
+        self.tasks: List[asyncio.Future] = []  # background work cancelled by stop()
+        if replica_set is not None:
+            replica_set.members.append(self)
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def member_name(self) -> str:
+        return f"{self.name}:{self.port}" if self.name else self.address
+
+    @property
+    def index(self) -> int:
+        return self.replica_set.members.index(self) if self.replica_set else 0
+
+    def register(self, name: str, handler: Handler):
+        self.commands[name] = handler
+
+    async def start(self) -> "FakeMongoServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        FakeMongoServer.running[self.address] = self
+        return self
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        FakeMongoServer.running.pop(self.address, None)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeMongoServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request_id, _, cmd = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, BSONError):
+                    break
+                self.requests += 1
+                reply = await self.dispatch(cmd)
+                if reply is None:
+                    break
+                writer.write(encode_message(reply, request_id ^ 0x40000000, request_id))
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def dispatch(self, cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.replica_set is not None and self.index in self.replica_set.down:
+            # A "down" member accepts TCP but drops every request
+            return None
+        name = next(iter(cmd))
+        handler = self.commands.get(name)
+        if handler is None:
+            return command_error(59, "CommandNotFound", f"no such command: '{name}'")
+        try:
+            reply = handler(self, cmd)
+            if asyncio.iscoroutine(reply):
+                reply = await reply
+        except Exception as e:
+            return command_error(1, "InternalError", str(e))
+        reply.setdefault("ok", 1.0)
+        return reply
+
+    def _hello(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        reply: Dict[str, Any] = {
+            "isWritablePrimary": True,
+            "maxBsonObjectSize": 16 * 1024 * 1024,
+            "maxMessageSizeBytes": 48000000,
+            "maxWriteBatchSize": 100000,
+            "localTime": datetime.datetime.now(datetime.timezone.utc),
+            "minWireVersion": 0,
+            "maxWireVersion": 25,
+            "connectionId": self.requests,
+        }
+        if self.role == "mongos":
+            reply["msg"] = "isdbgrid"
+        elif self.replica_set is not None:
+            rs = self.replica_set
+            state = rs.state_of(self.index)
+            reply.update({
+                "isWritablePrimary": state == PRIMARY,
+                "secondary": state == SECONDARY,
+                "setName": rs.name,
+                "setVersion": rs.version,
+                "hosts": rs.hosts(),
+                "me": self.member_name,
+                "electionId": ObjectId(b"\x7f\xff\xff\xff" + rs.term.to_bytes(8, "big")),
+            })
+            if rs.config_server:
+                reply["configsvr"] = 2
+            primary = rs.members[rs.primary]
+            reply["primary"] = primary.member_name
+        return reply
+
+    def _server_status(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        uptime = time.time() - self.started
+        status: Dict[str, Any] = {
+            "host": self.address,
+            "version": "8.0.0",
+            "process": self.role,
+            "uptime": float(int(uptime)),
+            "uptimeMillis": Int64(int(uptime * 1000)),
+            "localTime": datetime.datetime.now(datetime.timezone.utc),
+            "connections": {"current": self.connections, "available": 838860, "totalCreated": self.connections},
+            "opcounters": {
+                "insert": Int64(0), "query": Int64(self.requests), "update": Int64(0),
+                "delete": Int64(0), "getmore": Int64(0), "command": Int64(self.requests),
+            },
+            "mem": {"bits": 64, "resident": 128, "virtual": 1024},
+            "network": {"bytesIn": Int64(0), "bytesOut": Int64(0), "numRequests": Int64(self.requests)},
+        }
+        if self.role != "mongos":
+            status["wiredTiger"] = {"cache": {
+                "maximum bytes configured": float(1 << 30),
+                "bytes currently in the cache": float(64 << 20),
+                "tracked dirty bytes in the cache": float(1 << 20),
+            }}
+        if self.replica_set is not None:
+            status["repl"] = self._hello(cmd)
+        return status
+
+    def _repl_set_step_down(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        rs = self.replica_set
+        if rs is None:
+            return command_error(76, "NoReplicationEnabled", "not running with --replSet")
+        if rs.state_of(self.index) != PRIMARY:
+            return command_error(10107, "NotWritablePrimary", "not primary so can't step down")
+        candidates = [i for i in range(len(rs.members)) if i != self.index and i not in rs.down
+                      and rs.lag.get(i, 0.0) <= cmd.get("secondaryCatchUpPeriodSecs", 10)]
+        if not candidates:
+            return command_error(262, "ExceededTimeLimit", "No electable secondaries caught up")
+        rs.elect(min(candidates, key=lambda i: rs.lag.get(i, 0.0)))
+        return {}
+
+    def _repl_set_get_config(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        rs = self.replica_set
+        if rs is None:
+            return command_error(76, "NoReplicationEnabled", "not running with --replSet")
+        members = [{"_id": i, "host": m.member_name, "priority": 1.0, "votes": 1} for i, m in enumerate(rs.members)]
+        return {"config": {"_id": rs.name, "version": rs.version, "term": Int64(rs.term), "protocolVersion": Int64(1),
+                           "configsvr": rs.config_server, "members": members}}
+
+    def _repl_set_reconfig(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        """Add members: each new host must be a running fake server; it joins
+        ``FakeReplicaSet.initial_sync`` seconds behind the primary and catches up in the background."""
+        rs = self.replica_set
+        if rs is None:
+            return command_error(76, "NoReplicationEnabled", "not running with --replSet")
+        if rs.state_of(self.index) != PRIMARY:
+            return command_error(10107, "NotWritablePrimary", "replSetReconfig should only be run on a writable PRIMARY")
+        config = cmd["replSetReconfig"]
+        if config.get("version", 0) <= rs.version:
+            return command_error(103, "NewReplicaSetConfigurationIncompatible",
+                                 f"New config version {config.get('version')} must be greater than {rs.version}")
+        added = [m["host"] for m in config.get("members", []) if m["host"] not in rs.hosts()]
+        if sum(1 for m in config.get("members", []) if m["host"] in added and m.get("votes", 1)) > 1:
+            return command_error(103, "NewReplicaSetConfigurationIncompatible",
+                                 "Only one voting member may be added at a time")
+        servers = []
+        for host in added:
+            server = FakeMongoServer.running.get(host)
+            if server is None or server.replica_set is not None:
+                return command_error(74, "NodeNotFound", f"Cannot reach {host} or it already belongs to a set")
+            servers.append(server)
+        rs.version = int(config["version"])
+        for server in servers:
+            server.replica_set = rs
+            rs.members.append(server)
+            _catch_up(server, rs.initial_sync)
+        return {}
+
+    def _repl_set_get_status(self, cmd: Mapping[str, Any]) -> Dict[str, Any]:
+        rs = self.replica_set
+        if rs is None:
+            return command_error(76, "NoReplicationEnabled", "not running with --replSet")
+        members = []
+        for i, member in enumerate(rs.members):
+            state = rs.state_of(i)
+            optime = rs.optime(i)
+            entry: Dict[str, Any] = {
+                "_id": i,
+                "name": member.member_name,
+                "health": 0.0 if state == DOWN else 1.0,
+                "state": state,
+                "stateStr": STATE_NAMES[state],
+                "optime": {"ts": Timestamp(int(optime.timestamp()), 1), "t": Int64(rs.term)},
+                "optimeDate": optime,
+                "self": member is self,
+            }
+            if state == PRIMARY:
+                entry["electionDate"] = rs.election_date
+            members.append(entry)
+        return {
+            "set": rs.name,
+            "date": datetime.datetime.now(datetime.timezone.utc),
+            "myState": rs.state_of(self.index),
+            "term": Int64(rs.term),
+            "configsvr": rs.config_server,
+            "members": members,
+        }
+
+
+async def restart_member(server: FakeMongoServer, downtime: float = 1.0, catch_up: float = 2.0):
+    """Simulate a mongod restart: unreachable for ``downtime`` seconds, then back as a
+    secondary ``catch_up`` seconds behind that replicates at twice real time (in the
+    background, after this returns). A primary
+    that goes down is replaced by the least lagging reachable member, as an election would."""
+    rs = server.replica_set
+    index = server.index
+    rs.down.add(index)
+    if rs.primary == index:
+        others = sorted((i for i in range(len(rs.members)) if i not in rs.down), key=lambda i: rs.lag.get(i, 0.0))
+        if others:
+            rs.elect(others[0])
+    await asyncio.sleep(downtime)
+    rs.down.discard(index)
+    _catch_up(server, catch_up)
+
+
+def _catch_up(server: FakeMongoServer, behind: float):
+    """Put a member ``behind`` seconds behind the primary, replicating at twice real time."""
+    rs = server.replica_set
+    index = server.index
+    rs.lag[index] = behind
+
+    async def replicate():
+        while rs.lag.get(index, 0.0) > 0:
+            await asyncio.sleep(0.1)
+            rs.lag[index] = max(0.0, rs.lag[index] - 0.2)
+
+    server.catching_up = asyncio.ensure_future(replicate())
+
+
+async def start_replica_set(name: str, size: int = 3, role: str = "mongod", delay: float = 0.0,
+                            config_server: bool = False) -> FakeReplicaSet:
+    rs = FakeReplicaSet(name, config_server=config_server)
+    for _ in range(size):
+        await FakeMongoServer(role=role, replica_set=rs, delay=delay).start()
+    return rs
+
+
+async def stop_all(servers: List[FakeMongoServer]):
+    await asyncio.gather(*(s.stop() for s in servers))
+
+
+# ---------------------------------------------------------------------------
+# In-memory collections
+# ---------------------------------------------------------------------------
+
+_COMPARATORS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$ne": lambda a, b: a != b,
+}
+
+
+def _matches(doc: Mapping[str, Any], query: Mapping[str, Any]) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            for op, operand in condition.items():
+                if op == "$in":
+                    if value not in operand:
+                        return False
+                elif op not in _COMPARATORS:
+                    raise ValueError(f"unsupported query operator {op}")
+                else:
+                    try:
+                        if value is None or not _COMPARATORS[op](value, operand):
+                            return False
+                    except TypeError:
+                        return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _index_order(value: Any) -> Tuple[int, Any]:
+    return (0, 0) if value is MinKey else (2, 0) if value is MaxKey else (1, value)
+
+
+def _in_index_range(doc: Mapping[str, Any], pattern: Mapping[str, Any], low: Optional[Mapping[str, Any]],
+                    high: Optional[Mapping[str, Any]]) -> bool:
+    """``find``'s ``min`` (inclusive) and ``max`` (exclusive) bounds on the fields of the hinted index."""
+    key = [_index_order(doc.get(field)) for field in pattern]
+    return ((low is None or key >= [_index_order(low[field]) for field in pattern]) and
+            (high is None or key < [_index_order(high[field]) for field in pattern]))
+
+
+class FakeCollection:
+    """Documents by ``_id`` plus a sorted ``_id`` index for range scans."""
+
+    def __init__(self):
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+        self.ids: List[Any] = []
+
+    def insert(self, doc: Dict[str, Any]) -> bool:
+        key = doc.setdefault("_id", ObjectId())
+        if key in self.docs:
+            return False
+        self.docs[key] = doc
+        try:
+            bisect.insort(self.ids, key)
+        except TypeError:
+            self.ids = sorted(self.docs, key=str)
+        return True
+
+    def remove(self, key: Any):
+        del self.docs[key]
+        self.ids.remove(key)
+
+    def find(self, query: Mapping[str, Any], sort: Optional[Mapping[str, int]] = None,
+             skip: int = 0, limit: int = 0) -> List[Dict[str, Any]]:
+        id_cond = query.get("_id")
+        if id_cond is not None and not isinstance(id_cond, dict):
+            doc = self.docs.get(id_cond)
+            found = [doc] if doc is not None and _matches(doc, query) else []
+        elif isinstance(id_cond, dict) and set(id_cond) <= {"$gt", "$gte"} and (not sort or dict(sort) == {"_id": 1}):
+            # Range scan on _id in _id order: walk the index from the lower bound
+            bound = id_cond.get("$gte", id_cond.get("$gt"))
+            side = bisect.bisect_right if "$gt" in id_cond else bisect.bisect_left
+            found = []
+            for key in self.ids[side(self.ids, bound):]:
+                doc = self.docs[key]
+                if _matches(doc, query):
+                    found.append(doc)
+                    if limit and len(found) >= skip + limit:
+                        break
+            return found[skip:]
+        else:
+            found = [doc for doc in self.docs.values() if _matches(doc, query)]
+        if sort:
+            for field, direction in reversed(list(sort.items())):
+                found.sort(key=lambda d: (d.get(field) is None, d.get(field)), reverse=direction < 0)
+        found = found[skip:]
+        return found[:limit] if limit else found
+
+
+class FakeStore:
+    """Collections keyed by namespace, shared by every server that should see the same data.
+
+    With ``oplog=True`` every write made through the CRUD commands is also
+    appended to ``oplog`` in the shape mongod writes ``local.oplog.rs``.
+    """
+
+    def __init__(self, oplog: bool = False):
+        self.collections: Dict[str, FakeCollection] = {}
+        self.indexes: Dict[str, List[Dict[str, Any]]] = {}
+        self.oplog: Optional[List[Dict[str, Any]]] = [] if oplog else None
+
+    def collection(self, db: str, name: str) -> FakeCollection:
+        return self.collections.setdefault(f"{db}.{name}", FakeCollection())
+
+    def log(self, op: str, ns: str, o: Dict[str, Any], o2: Optional[Dict[str, Any]] = None):
+        if self.oplog is None:
+            return
+        now = int(time.time())
+        last = self.oplog[-1]["ts"] if self.oplog else Timestamp(0, 0)
+        ts = Timestamp(last.time, last.inc + 1) if now <= last.time else Timestamp(now, 1)
+        entry = {"ts": ts, "t": Int64(1), "v": Int64(2), "op": op, "ns": ns, "o": o,
+                 "wall": datetime.datetime.now(datetime.timezone.utc)}
+        if o2 is not None:
+            entry["o2"] = o2
+        self.oplog.append(entry)
+
+    def log_update(self, ns: str, before: Dict[str, Any], after: Dict[str, Any], replaced: bool):
+        if replaced:
+            self.log("u", ns, dict(after), {"_id": after["_id"]})
+            return
+        # mongod 5.0+ logs $v: 2 delta updates with the resulting field values
+        diff: Dict[str, Any] = {}
+        changed = {k: v for k, v in after.items() if k not in before or before[k] != v}
+        removed = {k: False for k in before if k not in after}
+        if changed:
+            diff["u"] = changed
+        if removed:
+            diff["d"] = removed
+        self.log("u", ns, {"$v": 2, "diff": diff}, {"_id": after["_id"]})
+
+
+def _apply_update(doc: Dict[str, Any], update: Mapping[str, Any]) -> Dict[str, Any]:
+    if not any(k.startswith("$") for k in update):
+        return {"_id": doc["_id"], **update}
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(fields)
+        elif op == "$inc":
+            for field, amount in fields.items():
+                doc[field] = doc.get(field, 0) + amount
+        elif op == "$unset":
+            for field in fields:
+                doc.pop(field, None)
+        else:
+            raise ValueError(f"unsupported update operator {op}")
+    return doc
+
+
+def enable_crud(server: FakeMongoServer, store: Optional[FakeStore] = None) -> FakeStore:
+    """Let ``server`` answer CRUD, cursor and catalog commands from an in-memory ``FakeStore``."""
+    store = store if store is not None else FakeStore()
+    cursors: Dict[int, List[Dict[str, Any]]] = {}
+    tailing: Dict[int, Dict[str, Any]] = {}
+    cursor_ids = itertools.count(1)
+
+    def insert(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['insert']}"
+        coll = store.collection(cmd["$db"], cmd["insert"])
+        errors = []
+        for i, doc in enumerate(cmd.get("documents", [])):
+            doc = dict(doc)
+            if coll.insert(doc):
+                store.log("i", ns, dict(doc), {"_id": doc["_id"]})
+            else:
+                errors.append({"index": i, "code": 11000, "errmsg": f"E11000 duplicate key error _id: {doc['_id']!r}"})
+        reply = {"n": len(cmd.get("documents", [])) - len(errors)}
+        if errors:
+            reply["writeErrors"] = errors
+        return reply
+
+    def batch(ns: str, docs: List[Dict[str, Any]], size: int, key: str, cursor_id: int = 0) -> Dict[str, Any]:
+        if size and len(docs) > size:
+            cursor_id = cursor_id or next(cursor_ids)
+            cursors[cursor_id] = docs[size:]
+            docs = docs[:size]
+        else:
+            cursor_id = 0
+        return {"cursor": {"id": Int64(cursor_id), "ns": ns, key: docs}}
+
+    def find_oplog(cmd):
+        query = cmd.get("filter", {})
+        docs = [entry for entry in store.oplog if _matches(entry, query)]
+        if cmd.get("sort", {}).get("$natural", 1) < 0:
+            docs.reverse()
+        if cmd.get("limit"):
+            docs = docs[:abs(cmd["limit"])]
+        if not cmd.get("tailable"):
+            return batch("local.oplog.rs", docs, cmd.get("batchSize", 0), "firstBatch")
+        # A tailable cursor stays open at the end of the oplog, even when nothing matched yet
+        cursor_id = next(cursor_ids)
+        tailing[cursor_id] = {"query": query, "last": docs[-1]["ts"] if docs else None}
+        return {"cursor": {"id": Int64(cursor_id), "ns": "local.oplog.rs", "firstBatch": docs}}
+
+    async def get_more_oplog(cmd, state):
+        query = state["query"]
+        deadline = time.monotonic() + cmd.get("maxTimeMS", 1000) / 1000.0
+        while True:
+            last = state["last"]
+            docs = [entry for entry in store.oplog if (last is None or entry["ts"] > last) and _matches(entry, query)]
+            if docs or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.02)
+        if cmd.get("batchSize"):
+            docs = docs[:cmd["batchSize"]]
+        if docs:
+            state["last"] = docs[-1]["ts"]
+        return {"cursor": {"id": Int64(cmd["getMore"]), "ns": "local.oplog.rs", "nextBatch": docs}}
+
+    def find(_, cmd):
+        if store.oplog is not None and cmd["$db"] == "local" and cmd["find"] == "oplog.rs":
+            return find_oplog(cmd)
+        coll = store.collection(cmd["$db"], cmd["find"])
+        docs = coll.find(cmd.get("filter", {}), cmd.get("sort"), cmd.get("skip", 0), abs(cmd.get("limit", 0)))
+        if "min" in cmd or "max" in cmd:
+            docs = [doc for doc in docs if _in_index_range(doc, cmd["hint"], cmd.get("min"), cmd.get("max"))]
+        size = 0 if cmd.get("singleBatch") else cmd.get("batchSize", 0)
+        return batch(f"{cmd['$db']}.{cmd['find']}", docs, size, "firstBatch")
+
+    def get_more(_, cmd):
+        if int(cmd["getMore"]) in tailing:
+            return get_more_oplog(cmd, tailing[int(cmd["getMore"])])
+        docs = cursors.pop(int(cmd["getMore"]), None)
+        if docs is None:
+            return command_error(43, "CursorNotFound", f"cursor id {cmd['getMore']} not found")
+        return batch(f"{cmd['$db']}.{cmd['collection']}", docs, cmd.get("batchSize", 0), "nextBatch",
+                     int(cmd["getMore"]))
+
+    def list_databases(_, cmd):
+        names = sorted({ns.split(".", 1)[0] for ns in store.collections})
+        return {"databases": [{"name": name} for name in names]}
+
+    def list_collections(_, cmd):
+        prefix = f"{cmd['$db']}."
+        docs = [{"name": ns[len(prefix):], "type": "collection", "options": {}}
+                for ns in sorted(store.collections) if ns.startswith(prefix)]
+        return {"cursor": {"id": Int64(0), "ns": f"{cmd['$db']}.$cmd.listCollections", "firstBatch": docs}}
+
+    def list_indexes(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['listIndexes']}"
+        if ns not in store.collections:
+            return command_error(26, "NamespaceNotFound", f"ns does not exist: {ns}")
+        indexes = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}] + store.indexes.get(ns, [])
+        return {"cursor": {"id": Int64(0), "ns": ns, "firstBatch": indexes}}
+
+    def create_indexes(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['createIndexes']}"
+        store.collection(cmd["$db"], cmd["createIndexes"])
+        existing = store.indexes.setdefault(ns, [])
+        for index in cmd.get("indexes", []):
+            if index["name"] not in {i["name"] for i in existing} and index["name"] != "_id_":
+                existing.append(index)
+                store.log("c", f"{cmd['$db']}.$cmd", {"createIndexes": cmd["createIndexes"], **index})
+        return {"numIndexesAfter": len(existing) + 1}
+
+    def drop_indexes(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['dropIndexes']}"
+        existing = store.indexes.get(ns, [])
+        kept = [index for index in existing if index["name"] != cmd["index"]]
+        if len(kept) == len(existing):
+            return command_error(27, "IndexNotFound", f"index not found with name [{cmd['index']}]")
+        store.indexes[ns] = kept
+        store.log("c", f"{cmd['$db']}.$cmd", {"dropIndexes": cmd["dropIndexes"], "index": cmd["index"]})
+        return {"nIndexesWas": len(existing) + 1}
+
+    def create(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['create']}"
+        if ns in store.collections:
+            return command_error(48, "NamespaceExists", f"Collection {ns} already exists.")
+        store.collection(cmd["$db"], cmd["create"])
+        store.log("c", f"{cmd['$db']}.$cmd", {"create": cmd["create"]})
+        return {}
+
+    def update(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['update']}"
+        coll = store.collection(cmd["$db"], cmd["update"])
+        matched = modified = 0
+        upserted = []
+        for i, spec in enumerate(cmd.get("updates", [])):
+            docs = coll.find(spec.get("q", {}), limit=0 if spec.get("multi") else 1)
+            for doc in docs:
+                before = dict(doc)
+                replaced = _apply_update(doc, spec["u"])
+                if replaced is not doc:
+                    coll.docs[doc["_id"]] = replaced
+                store.log_update(ns, before, replaced, replaced is not doc)
+                matched += 1
+                modified += 1
+            if not docs and spec.get("upsert"):
+                base = {k: v for k, v in spec.get("q", {}).items() if not isinstance(v, dict)}
+                doc = _apply_update({"_id": ObjectId(), **base}, spec["u"])
+                coll.insert(doc)
+                store.log("i", ns, dict(doc), {"_id": doc["_id"]})
+                upserted.append({"index": i, "_id": doc["_id"]})
+        reply: Dict[str, Any] = {"n": matched + len(upserted), "nModified": modified}
+        if upserted:
+            reply["upserted"] = upserted
+        return reply
+
+    def delete(_, cmd):
+        coll = store.collection(cmd["$db"], cmd["delete"])
+        removed = 0
+        for spec in cmd.get("deletes", []):
+            for doc in coll.find(spec.get("q", {}), limit=spec.get("limit", 0)):
+                coll.remove(doc["_id"])
+                store.log("d", f"{cmd['$db']}.{cmd['delete']}", {"_id": doc["_id"]})
+                removed += 1
+        return {"n": removed}
+
+    def count(_, cmd):
+        coll = store.collection(cmd["$db"], cmd["count"])
+        query = cmd.get("query") or {}
+        return {"n": len(coll.docs) if not query else len(coll.find(query))}
+
+    def drop(_, cmd):
+        ns = f"{cmd['$db']}.{cmd['drop']}"
+        store.indexes.pop(ns, None)
+        if store.collections.pop(ns, None) is None:
+            return command_error(26, "NamespaceNotFound", "ns not found")
+        store.log("c", f"{cmd['$db']}.$cmd", {"drop": cmd["drop"]})
+        return {"ns": ns}
+
+    def drop_database(_, cmd):
+        prefix = f"{cmd['$db']}."
+        for ns in [ns for ns in store.collections if ns.startswith(prefix)]:
+            del store.collections[ns]
+            store.indexes.pop(ns, None)
+        store.log("c", f"{cmd['$db']}.$cmd", {"dropDatabase": 1})
+        return {"dropped": cmd["$db"]}
+
+    for name, handler in (("insert", insert), ("find", find), ("getMore", get_more), ("update", update),
+                          ("delete", delete), ("count", count), ("drop", drop), ("dropDatabase", drop_database),
+                          ("create", create), ("listDatabases", list_databases), ("listCollections", list_collections),
+                          ("listIndexes", list_indexes), ("createIndexes", create_indexes),
+                          ("dropIndexes", drop_indexes)):
+        server.register(name, handler)
+    return store
+
+
+# ---------------------------------------------------------------------------
+# Sharding
+# ---------------------------------------------------------------------------
+
+def enable_sharding(server: FakeMongoServer, store: Optional[FakeStore] = None,
+                    move_seconds: float = 0.2) -> FakeStore:
+    """Let a fake mongos manage shards: ``listShards``, ``addShard``, ``balancerStatus``/``Start``/``Stop``,
+    ``balancerCollectionStatus`` and the ``$shardedDataDistribution`` aggregation.
+
+    Shards live in ``config.shards`` and chunk ownership in ``config.chunks`` of
+    ``store``; a chunk's ``bytes`` and ``count`` fields stand for the data in
+    its range. Like the 6.0.3+ balancer, a collection is balanced once its
+    shards hold within three chunk sizes (``config.settings`` ``chunksize``,
+    128 MB by default) of each other. While the balancer is on and inside its
+    ``activeWindow`` it moves one chunk every ``move_seconds`` from the shard
+    with the most data of an unbalanced collection to the one with the least,
+    logging ``moveChunk.commit`` to ``config.changelog``.
+    """
+    store = enable_crud(server, store)
+    shards = store.collection("config", "shards")
+    chunks = store.collection("config", "chunks")
+    collections = store.collection("config", "collections")
+    settings = store.collection("config", "settings")
+    changelog = store.collection("config", "changelog")
+    state = {"rounds": 0, "in_round": False}
+
+    def balancer_settings() -> Dict[str, Any]:
+        return settings.docs.get("balancer", {})
+
+    def threshold() -> int:
+        return 3 * int(settings.docs.get("chunksize", {}).get("value", 128)) * 1024 * 1024
+
+    def namespace_of() -> Callable[[Mapping[str, Any]], str]:
+        by_uuid = {bytes(c["uuid"].data): name for name, c in collections.docs.items() if "uuid" in c}
+        return lambda chunk: chunk.get("ns") or by_uuid[bytes(chunk["uuid"].data)]
+
+    def distribution() -> Dict[str, Dict[str, List[int]]]:
+        """Owned ``[bytes, documents]`` by namespace and shard, every shard listed."""
+        namespace = namespace_of()
+        owned: Dict[str, Dict[str, List[int]]] = {}
+        for chunk in chunks.docs.values():
+            sizes = owned.setdefault(namespace(chunk), {name: [0, 0] for name in shards.docs})
+            size = sizes.setdefault(chunk["shard"], [0, 0])
+            size[0] += chunk.get("bytes", 0)
+            size[1] += chunk.get("count", 0)
+        return owned
+
+    def imbalanced(sizes: Mapping[str, List[int]]) -> bool:
+        return max(s[0] for s in sizes.values()) - min(s[0] for s in sizes.values()) > threshold()
+
+    def sharded_data_distribution(_, cmd):
+        if cmd["$db"] != "admin" or [next(iter(stage)) for stage in cmd.get("pipeline", [])] != [
+                "$shardedDataDistribution"]:
+            return command_error(40324, "Location40324", "Only $shardedDataDistribution is supported on a fake mongos")
+        docs = [{"ns": ns, "shards": [{"shardName": name, "numOrphanedDocs": 0, "numOwnedDocuments": Int64(count),
+                                       "ownedSizeBytes": Int64(size), "orphanedSizeBytes": Int64(0)}
+                                      for name, (size, count) in sorted(sizes.items()) if size or count]}
+                for ns, sizes in sorted(distribution().items())]
+        return {"cursor": {"id": Int64(0), "ns": "admin.$cmd.aggregate", "firstBatch": docs}}
+
+    def balancer_collection_status(_, cmd):
+        sizes = distribution().get(cmd["balancerCollectionStatus"])
+        if sizes is None:
+            return command_error(61, "ShardingStateNotInitialized",
+                                 f"Collection {cmd['balancerCollectionStatus']} is not sharded")
+        if len(sizes) > 1 and imbalanced(sizes):
+            return {"balancerCompliant": False, "firstComplianceViolation": "chunksImbalance"}
+        return {"balancerCompliant": True}
+
+    def in_window(window: Optional[Mapping[str, str]]) -> bool:
+        if not window:
+            return True
+        now = time.strftime("%H:%M")
+        start, stop = window["start"], window["stop"]
+        return start <= now < stop if start <= stop else now >= start or now < stop
+
+    def list_shards(_, cmd):
+        return {"shards": list(shards.docs.values())}
+
+    def add_shard(_, cmd):
+        spec = cmd["addShard"]
+        set_name, _, hosts = spec.partition("/")
+        name = cmd.get("name") or (set_name if hosts else f"shard{len(shards.docs)}")
+        existing = next((s for s in shards.docs.values() if s["host"] == spec), None)
+        if existing is not None:
+            return {"shardAdded": existing["_id"]}
+        if name in shards.docs:
+            return command_error(96, "OperationFailed", f"A shard named {name} already exists")
+        for host in (hosts or spec).split(","):
+            if host not in FakeMongoServer.running:
+                return command_error(96, "OperationFailed", f"failed to connect to new shard: {host} unreachable")
+        shards.insert({"_id": name, "host": spec, "state": 1})
+        return {"shardAdded": name}
+
+    def balancer_status(_, cmd):
+        mode = "off" if balancer_settings().get("stopped") else "full"
+        return {"mode": mode, "inBalancerRound": state["in_round"], "numBalancerRounds": Int64(state["rounds"])}
+
+    def set_balancer(stopped: bool):
+        def handler(_, cmd):
+            doc = settings.docs.setdefault("balancer", {"_id": "balancer"})
+            doc["stopped"] = stopped
+            return {}
+        return handler
+
+    async def balance():
+        while True:
+            await asyncio.sleep(move_seconds)
+            config = balancer_settings()
+            state["in_round"] = False
+            if config.get("stopped") or not in_window(config.get("activeWindow")) or len(shards.docs) < 2:
+                continue
+            state["rounds"] += 1
+            unbalanced = [(ns, sizes) for ns, sizes in sorted(distribution().items()) if imbalanced(sizes)]
+            if not unbalanced:
+                continue
+            ns, sizes = unbalanced[0]
+            donor = max(sizes, key=lambda name: sizes[name][0])
+            recipient = min(sizes, key=lambda name: sizes[name][0])
+            state["in_round"] = True
+            if config.get("_waitForDelete"):
+                await asyncio.sleep(move_seconds)
+            namespace = namespace_of()
+            chunk = next(c for c in chunks.docs.values() if c["shard"] == donor and namespace(c) == ns)
+            chunk["shard"] = recipient
+            changelog.insert({"what": "moveChunk.commit", "ns": ns,
+                              "time": datetime.datetime.now(datetime.timezone.utc),
+                              "details": {"min": chunk.get("min"), "max": chunk.get("max"),
+                                          "from": donor, "to": recipient}})
+
+    for name, handler in (("listShards", list_shards), ("addShard", add_shard),
+                          ("balancerStatus", balancer_status), ("balancerStart", set_balancer(False)),
+                          ("balancerStop", set_balancer(True)),
+                          ("balancerCollectionStatus", balancer_collection_status),
+                          ("aggregate", sharded_data_distribution)):
+        server.register(name, handler)
+    server.tasks.append(asyncio.ensure_future(balance()))
+    return store
+
+
+# ---------------------------------------------------------------------------
+# Authentication
+# ---------------------------------------------------------------------------
+
+def enable_auth(server: FakeMongoServer, users: Mapping[str, str], iterations: int = 4096):
+    """Answer ``saslStart``/``saslContinue`` for SCRAM-SHA-256 like mongod, passwords SASLprep'ed.
+
+    Commands are not checked for an authenticated connection; the conversation
+    itself succeeds or fails with ``AuthenticationFailed`` as mongod's does.
+    """
+    conversations: Dict[int, Dict[str, Any]] = {}
+    conversation_ids = itertools.count(1)
+    failed = command_error(18, "AuthenticationFailed", "Authentication failed.")
+
+    def payload(cmd) -> str:
+        value = cmd["payload"]
+        return (value.data if isinstance(value, Binary) else bytes(value)).decode()
+
+    def sasl_start(_, cmd):
+        if cmd.get("mechanism") != "SCRAM-SHA-256":
+            return command_error(334, "MechanismUnavailable", f"Unsupported mechanism {cmd.get('mechanism')}")
+        client_first_bare = payload(cmd).split(",", 2)[2]
+        fields = dict(item.split("=", 1) for item in client_first_bare.split(","))
+        user = fields["n"].replace("=2C", ",").replace("=3D", "=")
+        salt = os.urandom(16)
+        server_first = f"r={fields['r']}{base64.b64encode(os.urandom(18)).decode()}," \
+                       f"s={base64.b64encode(salt).decode()},i={iterations}"
+        conversation = next(conversation_ids)
+        conversations[conversation] = {"user": user, "salt": salt, "first": f"{client_first_bare},{server_first}"}
+        return {"conversationId": conversation, "done": False, "payload": Binary(server_first.encode())}
+
+    def sasl_continue(_, cmd):
+        state = conversations.pop(cmd["conversationId"], None)
+        if state is None or state["user"] not in users:
+            return failed
+        final = payload(cmd)
+        without_proof, _, proof = final.rpartition(",p=")
+        salted = hashlib.pbkdf2_hmac("sha256", saslprep(users[state["user"]]).encode(), state["salt"], iterations)
+        stored_key = hashlib.sha256(hmac.new(salted, b"Client Key", hashlib.sha256).digest()).digest()
+        auth_message = f"{state['first']},{without_proof}".encode()
+        signature = hmac.new(stored_key, auth_message, hashlib.sha256).digest()
+        client_key = bytes(a ^ b for a, b in zip(base64.b64decode(proof), signature))
+        if not hmac.compare_digest(hashlib.sha256(client_key).digest(), stored_key):
+            return failed
+        server_key = hmac.new(salted, b"Server Key", hashlib.sha256).digest()
+        verifier = base64.b64encode(hmac.new(server_key, auth_message, hashlib.sha256).digest()).decode()
+        return {"conversationId": cmd["conversationId"], "done": True, "payload": Binary(f"v={verifier}".encode())}
+
+    server.register("saslStart", sasl_start)
+    server.register("saslContinue", sasl_continue)
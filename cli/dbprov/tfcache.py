@@ -0,0 +1,143 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+LOCK_FILE = ".terraform.lock.hcl"
+CACHE_FILE = "dbprovision-fingerprints.json"
+CACHE_LOCK = "dbprovision-fingerprints.lock"
+STATE_FILE = "terraform.tfstate"
+
+
+class TerraformCache:
+    """Content fingerprints of terraform inputs, used to skip redundant runs.
+
+    The cache lives inside ``.terraform`` so removing the provider directory
+    (the usual way to force a clean init) also invalidates every fingerprint.
+
+    * ``init`` is keyed on the ``.tf`` sources plus the provider lock file and
+      is skipped while providers are installed and those are unchanged.
+    * ``apply:<cluster>`` is keyed on the sources, lock file and the rendered
+      ``.tfvars`` plus the state's lineage and serial, and lets plan/apply be
+      skipped for an unchanged cluster. Clusters applied from one directory
+      share its state, so any apply there (another cluster, a targeted resize,
+      a manual run) changes the serial and forces the others to plan again.
+
+    Several dbprovision processes may share the directory (the backend's
+    workers do), so updates are read-modify-write under a file lock.
+    """
+
+    def __init__(self, terraform_dir: Path):
+        self.terraform_dir = Path(terraform_dir)
+        self.data_dir = self.terraform_dir / ".terraform"
+        self.cache_file = self.data_dir / CACHE_FILE
+        self._sources_digest: Optional[str] = None
+
+    def source_files(self) -> List[Path]:
+        files = [
+            p for p in self.terraform_dir.rglob("*.tf")
+            if ".terraform" not in p.relative_to(self.terraform_dir).parts
+        ]
+        lock = self.terraform_dir / LOCK_FILE
+        if lock.exists():
+            files.append(lock)
+        return sorted(files)
+
+    def sources_digest(self) -> str:
+        if self._sources_digest is None:
+            self._sources_digest = self._digest(self.source_files())
+        return self._sources_digest
+
+    def fingerprint(self, vars_file: Path) -> str:
+        digest = hashlib.sha256(self.sources_digest().encode())
+        digest.update(Path(vars_file).read_bytes())
+        return digest.hexdigest()
+
+    def _digest(self, files: Iterable[Path]) -> str:
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(str(path.relative_to(self.terraform_dir)).encode())
+            digest.update(b"\0")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def providers_installed(self) -> bool:
+        providers = self.data_dir / "providers"
+        return providers.is_dir() and any(providers.iterdir())
+
+    def plan_file(self, cluster_name: str) -> Path:
+        return self.data_dir / "plans" / f"{cluster_name}.tfplan"
+
+    def state_serial(self) -> Optional[str]:
+        """``lineage:serial`` of the local state; None without one (or with a remote backend)."""
+        try:
+            with open(self.terraform_dir / STATE_FILE) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return f"{state.get('lineage')}:{state.get('serial')}"
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        with self._locked():
+            return self._load().get(key) == fingerprint
+
+    def is_applied(self, cluster_name: str, fingerprint: str) -> bool:
+        return self.is_current(f"apply:{cluster_name}", f"{fingerprint}@{self.state_serial()}")
+
+    def record(self, key: str, fingerprint: str):
+        with self._locked():
+            entries = self._load()
+            entries[key] = fingerprint
+            self._save(entries)
+
+    def record_applied(self, cluster_name: str, fingerprint: str, changed: bool = True):
+        """Record an up-to-date cluster; after a change, what others would plan against this state is unknown."""
+        with self._locked():
+            entries = self._load()
+            if changed:
+                entries = {k: v for k, v in entries.items() if not k.startswith("apply:")}
+            entries[f"apply:{cluster_name}"] = f"{fingerprint}@{self.state_serial()}"
+            self._save(entries)
+
+    def forget(self, key: str):
+        with self._locked():
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+    def invalidate_sources(self):
+        self._sources_digest = None
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.data_dir / CACHE_LOCK, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save(self, entries: Dict[str, str]):
+        with tempfile.NamedTemporaryFile("w", dir=self.data_dir, prefix=CACHE_FILE, suffix=".tmp",
+                                         delete=False) as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        try:
+            os.replace(f.name, self.cache_file)
+        except OSError:
+            os.unlink(f.name)
+            raise
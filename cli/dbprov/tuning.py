@@ -0,0 +1,245 @@
+"""Named mongod tuning profiles.
+
+A profile is a flat set of tuning keys that ``generate_ansible_vars`` writes
+to group_vars as ``mongod_tuning`` and ``templates/mongod.conf.j2`` turns into
+mongod options. ``resolve_tuning`` merges a profile with explicit overrides
+and validates the result, so a bad combination fails before any playbook
+runs; ``render_mongod_conf`` produces the same configuration in Python for
+previewing.
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import yaml
+
+from dbprov.capacity import MACHINE_TYPES, MIN_OPLOG_MB, parse_size, wiredtiger_cache_gb
+
+COMPRESSORS = ("none", "snappy", "zlib", "zstd")
+NETWORK_COMPRESSORS = ("snappy", "zlib", "zstd", "disabled")
+PROFILING_MODES = ("off", "slowOp", "all")
+# The open-file ulimit MongoDB recommends; every connection holds a descriptor
+NOFILE_LIMIT = 64000
+
+# Key -> (type, description); every profile and override is checked against this
+TUNING_KEYS: Dict[str, Tuple[type, str]] = {
+    "cache_size_gb": (float, "storage.wiredTiger.engineConfig.cacheSizeGB"),
+    "cache_ratio": (float, "cache as a fraction of (RAM - 1GB) when cache_size_gb is unset"),
+    "block_compressor": (str, "storage.wiredTiger.collectionConfig.blockCompressor"),
+    "journal_compressor": (str, "storage.wiredTiger.engineConfig.journalCompressor"),
+    "prefix_compression": (bool, "storage.wiredTiger.indexConfig.prefixCompression"),
+    "journal_commit_interval_ms": (int, "storage.journal.commitIntervalMs"),
+    "max_incoming_connections": (int, "net.maxIncomingConnections"),
+    "network_compressors": (str, "net.compression.compressors"),
+    "service_executor": (str, "net.serviceExecutor (MongoDB < 5.0 only)"),
+    "profiling_mode": (str, "operationProfiling.mode"),
+    "slow_op_threshold_ms": (int, "operationProfiling.slowOpThresholdMs"),
+    "slow_op_sample_rate": (float, "operationProfiling.slowOpSampleRate"),
+    "oplog_size_mb": (int, "replication.oplogSizeMB"),
+}
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # MongoDB defaults, spelled out, with connections kept within the recommended ulimit
+    "default": {
+        "cache_ratio": 0.5,
+        "block_compressor": "snappy",
+        "journal_compressor": "snappy",
+        "prefix_compression": True,
+        "journal_commit_interval_ms": 100,
+        "max_incoming_connections": NOFILE_LIMIT,
+        "network_compressors": "snappy,zstd,zlib",
+        "profiling_mode": "off",
+        "slow_op_threshold_ms": 100,
+        "slow_op_sample_rate": 1.0,
+    },
+    # Many short requests: cheap compression, fast slow-op visibility
+    "oltp-low-latency": {
+        "cache_ratio": 0.6,
+        "block_compressor": "snappy",
+        "journal_compressor": "snappy",
+        "prefix_compression": True,
+        "journal_commit_interval_ms": 50,
+        "max_incoming_connections": 20000,
+        "network_compressors": "snappy",
+        "profiling_mode": "slowOp",
+        "slow_op_threshold_ms": 50,
+        "slow_op_sample_rate": 0.5,
+    },
+    # Sustained inserts from few loaders: batch journal flushes, keep CPU for writes
+    "bulk-ingest": {
+        "cache_ratio": 0.5,
+        "block_compressor": "snappy",
+        "journal_compressor": "none",
+        "prefix_compression": True,
+        "journal_commit_interval_ms": 300,
+        "max_incoming_connections": 2000,
+        "network_compressors": "zstd",
+        "profiling_mode": "off",
+        "slow_op_threshold_ms": 1000,
+        "slow_op_sample_rate": 0.1,
+    },
+    # Large scans: dense on-disk data, only long queries are interesting
+    "analytics": {
+        "cache_ratio": 0.6,
+        "block_compressor": "zstd",
+        "journal_compressor": "zstd",
+        "prefix_compression": True,
+        "journal_commit_interval_ms": 100,
+        "max_incoming_connections": 5000,
+        "network_compressors": "zstd",
+        "profiling_mode": "slowOp",
+        "slow_op_threshold_ms": 2000,
+        "slow_op_sample_rate": 0.2,
+    },
+}
+
+
+class TuningError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def parse_override(text: str) -> Tuple[str, Any]:
+    """Parse a ``key=value`` override, converting the value to the key's type."""
+    key, sep, raw = text.partition("=")
+    key = key.strip().replace("-", "_")
+    if not sep or key not in TUNING_KEYS:
+        raise TuningError([f"Unknown tuning override {text!r}; valid keys: {', '.join(sorted(TUNING_KEYS))}"])
+    kind = TUNING_KEYS[key][0]
+    raw = raw.strip()
+    try:
+        if kind is bool:
+            if raw.lower() not in ("true", "false", "1", "0", "yes", "no"):
+                raise ValueError(raw)
+            return key, raw.lower() in ("true", "1", "yes")
+        return key, kind(raw)
+    except ValueError:
+        raise TuningError([f"{key} expects a {kind.__name__}, got {raw!r}"])
+
+
+def resolve_tuning(profile: str = "default", overrides: Optional[Mapping[str, Any]] = None,
+                   cache_size: Optional[str] = None, oplog_size: Optional[str] = None,
+                   mongodb_version: str = "8.0", instance_type: Optional[str] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Merge a profile with overrides; returns (settings, warnings) or raises ``TuningError``."""
+    if profile not in PROFILES:
+        raise TuningError([f"Unknown tuning profile {profile!r}; choose from {', '.join(PROFILES)}"])
+    settings = dict(PROFILES[profile])
+    if cache_size:
+        settings["cache_size_gb"] = round(parse_size(cache_size) / 1024 ** 3, 2)
+    if oplog_size:
+        settings["oplog_size_mb"] = int(parse_size(oplog_size) / 1024 ** 2)
+    settings.update(overrides or {})
+    return settings, validate_tuning(settings, mongodb_version, instance_type)
+
+
+def validate_tuning(settings: Mapping[str, Any], mongodb_version: str = "8.0",
+                    instance_type: Optional[str] = None) -> List[str]:
+    errors: List[str] = []
+    warnings: List[str] = []
+    major = int(str(mongodb_version).split(".")[0])
+
+    for key, value in settings.items():
+        if key not in TUNING_KEYS:
+            errors.append(f"unknown tuning key {key}")
+        elif not isinstance(value, TUNING_KEYS[key][0]) and not (
+                TUNING_KEYS[key][0] is float and isinstance(value, int) and not isinstance(value, bool)):
+            errors.append(f"{key} must be a {TUNING_KEYS[key][0].__name__}")
+    if errors:
+        raise TuningError(errors)
+
+    for key in ("block_compressor", "journal_compressor"):
+        if key in settings and settings[key] not in COMPRESSORS:
+            errors.append(f"{key} must be one of {', '.join(COMPRESSORS)}")
+    compressors = [c.strip() for c in settings.get("network_compressors", "").split(",") if c.strip()]
+    unknown = [c for c in compressors if c not in NETWORK_COMPRESSORS]
+    if unknown:
+        errors.append(f"unknown network compressor(s): {', '.join(unknown)}")
+    elif "disabled" in compressors and len(compressors) > 1:
+        errors.append("network_compressors 'disabled' cannot be combined with other compressors")
+    if settings.get("profiling_mode", "off") not in PROFILING_MODES:
+        errors.append(f"profiling_mode must be one of {', '.join(PROFILING_MODES)}")
+    if "service_executor" in settings and major >= 5:
+        errors.append(f"service_executor was removed in MongoDB 5.0 and cannot be set for {mongodb_version}")
+
+    ranges = {
+        "cache_ratio": (0.05, 0.8),
+        "journal_commit_interval_ms": (1, 500),
+        "max_incoming_connections": (1, 1000000),
+        "slow_op_threshold_ms": (0, None),
+        "slow_op_sample_rate": (0.0, 1.0),
+        "cache_size_gb": (0.25, None),
+        "oplog_size_mb": (MIN_OPLOG_MB, None),
+    }
+    for key, (low, high) in ranges.items():
+        value = settings.get(key)
+        if value is None:
+            continue
+        if value < low or (high is not None and value > high):
+            bound = f"between {low} and {high}" if high is not None else f"at least {low}"
+            errors.append(f"{key} must be {bound}, got {value}")
+
+    machine = next((m for m in MACHINE_TYPES if m.name == instance_type), None)
+    cache_gb = settings.get("cache_size_gb")
+    if machine is not None and cache_gb is not None:
+        limit = round((machine.memory_gb - 1) * 0.8, 2)
+        if cache_gb > limit:
+            errors.append(f"cache_size_gb {cache_gb:g} leaves too little memory on {machine.name} "
+                          f"({machine.memory_gb:g} GB RAM, at most {limit:g})")
+        elif cache_gb > wiredtiger_cache_gb(machine.memory_gb) * 1.2:
+            warnings.append(f"cache_size_gb {cache_gb:g} is well above the default for {machine.name}; "
+                            f"leave room for the filesystem cache and connections")
+
+    if settings.get("profiling_mode") == "all":
+        warnings.append("profiling_mode 'all' records every operation and slows down every write")
+    if settings.get("journal_compressor") == "none" and settings.get("block_compressor") == "none":
+        warnings.append("no journal or block compression; disk usage will grow considerably")
+    if settings.get("max_incoming_connections", 0) > NOFILE_LIMIT:
+        warnings.append(f"max_incoming_connections above {NOFILE_LIMIT} also needs a raised nofile ulimit")
+
+    if errors:
+        raise TuningError(errors)
+    return warnings
+
+
+def render_mongod_conf(settings: Mapping[str, Any], replica_set_name: Optional[str] = None,
+                       port: int = 27017, memory_gb: Optional[float] = None) -> str:
+    """Render mongod.conf the way templates/mongod.conf.j2 does."""
+    wired_tiger: Dict[str, Dict[str, Any]] = {"engineConfig": {}, "collectionConfig": {}, "indexConfig": {}}
+    if settings.get("cache_size_gb") is not None:
+        wired_tiger["engineConfig"]["cacheSizeGB"] = settings["cache_size_gb"]
+    elif memory_gb is not None and "cache_ratio" in settings:
+        wired_tiger["engineConfig"]["cacheSizeGB"] = round(max(0.25, (memory_gb - 1) * settings["cache_ratio"]), 2)
+    if "journal_compressor" in settings:
+        wired_tiger["engineConfig"]["journalCompressor"] = settings["journal_compressor"]
+    if "block_compressor" in settings:
+        wired_tiger["collectionConfig"]["blockCompressor"] = settings["block_compressor"]
+    if "prefix_compression" in settings:
+        wired_tiger["indexConfig"]["prefixCompression"] = settings["prefix_compression"]
+
+    storage: Dict[str, Any] = {"dbPath": "/var/lib/mongodb"}
+    if "journal_commit_interval_ms" in settings:
+        storage["journal"] = {"commitIntervalMs": settings["journal_commit_interval_ms"]}
+    storage["wiredTiger"] = {k: v for k, v in wired_tiger.items() if v}
+
+    net: Dict[str, Any] = {"port": port, "bindIp": "0.0.0.0"}
+    if "max_incoming_connections" in settings:
+        net["maxIncomingConnections"] = settings["max_incoming_connections"]
+    if "network_compressors" in settings:
+        net["compression"] = {"compressors": settings["network_compressors"]}
+    if "service_executor" in settings:
+        net["serviceExecutor"] = settings["service_executor"]
+
+    conf: Dict[str, Any] = {"storage": storage, "net": net}
+    if replica_set_name:
+        conf["replication"] = {"replSetName": replica_set_name}
+        if "oplog_size_mb" in settings:
+            conf["replication"]["oplogSizeMB"] = settings["oplog_size_mb"]
+    profiling = {
+        "mode": settings.get("profiling_mode"),
+        "slowOpThresholdMs": settings.get("slow_op_threshold_ms"),
+        "slowOpSampleRate": settings.get("slow_op_sample_rate"),
+    }
+    profiling = {k: v for k, v in profiling.items() if v is not None}
+    if profiling:
+        conf["operationProfiling"] = profiling
+    return yaml.safe_dump(conf, sort_keys=False)
@@ -0,0 +1,598 @@
+"""Minimal MongoDB wire protocol client (BSON + OP_MSG).
+
+Only what dbprovision needs to talk to mongod/mongos directly: running
+commands, pipelining several commands on one connection, SCRAM-SHA-256
+authentication and a small per-host connection pool. It keeps the CLI free of
+driver dependencies and lets the fake server in ``dbprov.testing.fakemongo``
+speak the same protocol in tests.
+"""
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import itertools
+import os
+import ssl
+import stringprep
+import struct
+import unicodedata
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (Any, AsyncIterator, Collection, Deque, Dict, Iterator, List, Mapping, NamedTuple, Optional,
+                    Sequence, Tuple)
+
+OP_MSG = 2013
+MAX_MESSAGE_SIZE = 48 * 1000 * 1000
+RAW_BATCHES = ("firstBatch", "nextBatch")
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+_request_ids = itertools.count(1)
+
+
+class ObjectId:
+    _counter = itertools.count(int.from_bytes(os.urandom(3), "big"))
+    _process = os.urandom(5)
+
+    __slots__ = ("binary",)
+
+    def __init__(self, binary: Optional[bytes] = None):
+        if binary is None:
+            import time
+            binary = (struct.pack(">I", int(time.time())) + self._process
+                      + (next(self._counter) % 0xFFFFFF).to_bytes(3, "big"))
+        elif isinstance(binary, str):
+            binary = bytes.fromhex(binary)
+        if len(binary) != 12:
+            raise ValueError("ObjectId must be 12 bytes")
+        self.binary = binary
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectId) and other.binary == self.binary
+
+    def __lt__(self, other):
+        return self.binary < other.binary
+
+    def __hash__(self):
+        return hash(self.binary)
+
+    def __str__(self):
+        return self.binary.hex()
+
+    def __repr__(self):
+        return f"ObjectId('{self}')"
+
+
+class Timestamp(NamedTuple):
+    time: int
+    inc: int
+
+
+class Binary(NamedTuple):
+    data: bytes
+    subtype: int = 0
+
+
+class Regex(NamedTuple):
+    pattern: str
+    flags: str = ""
+
+
+class Decimal128(NamedTuple):
+    raw: bytes
+
+
+class Int64(int):
+    pass
+
+
+class RawDocument(bytes):
+    """An encoded BSON document passed through as is, never decoded or re-encoded."""
+
+
+class _Key:
+    def __init__(self, name: str, order: int):
+        self.name = name
+        self.order = order
+
+    def __repr__(self):
+        return self.name
+
+
+MinKey = _Key("MinKey", -1)
+MaxKey = _Key("MaxKey", 1)
+
+
+class BSONError(ValueError):
+    pass
+
+
+class CommandError(Exception):
+    def __init__(self, reply: Mapping[str, Any]):
+        self.reply = reply
+        self.code = reply.get("code")
+        self.code_name = reply.get("codeName", "")
+        super().__init__(f"{reply.get('errmsg', 'command failed')} ({self.code_name or self.code})")
+
+
+# ---------------------------------------------------------------------------
+# BSON
+# ---------------------------------------------------------------------------
+
+def _cstring(value: str) -> bytes:
+    data = value.encode()
+    if b"\0" in data:
+        raise BSONError(f"BSON keys cannot contain NUL: {value!r}")
+    return data + b"\0"
+
+
+def _encode_element(out: bytearray, key: str, value: Any):
+    name = _cstring(key)
+    if isinstance(value, bool):
+        out += b"\x08" + name + (b"\x01" if value else b"\x00")
+    elif isinstance(value, Int64):
+        out += b"\x12" + name + struct.pack("<q", value)
+    elif isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            out += b"\x10" + name + struct.pack("<i", value)
+        else:
+            out += b"\x12" + name + struct.pack("<q", value)
+    elif isinstance(value, float):
+        out += b"\x01" + name + struct.pack("<d", value)
+    elif isinstance(value, str):
+        data = value.encode()
+        out += b"\x02" + name + struct.pack("<i", len(data) + 1) + data + b"\0"
+    elif value is None:
+        out += b"\x0a" + name
+    elif isinstance(value, RawDocument):
+        out += b"\x03" + name + value
+    elif isinstance(value, Mapping):
+        out += b"\x03" + name + encode(value)
+    elif isinstance(value, (list, tuple)) and not isinstance(value, (Timestamp, Binary, Regex, Decimal128)):
+        out += b"\x04" + name + encode({str(i): v for i, v in enumerate(value)})
+    elif isinstance(value, ObjectId):
+        out += b"\x07" + name + value.binary
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        millis = (value - EPOCH) // datetime.timedelta(milliseconds=1)
+        out += b"\x09" + name + struct.pack("<q", millis)
+    elif isinstance(value, Timestamp):
+        out += b"\x11" + name + struct.pack("<II", value.inc, value.time)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        out += b"\x05" + name + struct.pack("<iB", len(data), 0) + data
+    elif isinstance(value, Binary):
+        out += b"\x05" + name + struct.pack("<iB", len(value.data), value.subtype) + value.data
+    elif isinstance(value, Regex):
+        out += b"\x0b" + name + _cstring(value.pattern) + _cstring(value.flags)
+    elif isinstance(value, Decimal128):
+        out += b"\x13" + name + value.raw
+    elif value is MinKey:
+        out += b"\xff" + name
+    elif value is MaxKey:
+        out += b"\x7f" + name
+    else:
+        raise BSONError(f"Cannot encode {type(value).__name__} as BSON")
+
+
+def encode(doc: Mapping[str, Any]) -> bytes:
+    if isinstance(doc, RawDocument):
+        return bytes(doc)
+    out = bytearray(4)
+    for key, value in doc.items():
+        _encode_element(out, key, value)
+    out += b"\0"
+    struct.pack_into("<i", out, 0, len(out))
+    return bytes(out)
+
+
+def _read_cstring(data: memoryview, pos: int) -> Tuple[str, int]:
+    end = pos
+    while data[end] != 0:
+        end += 1
+    return bytes(data[pos:end]).decode(), end + 1
+
+
+def _document_end(data: memoryview, pos: int) -> int:
+    """Position of the NUL that ends the document at ``pos``."""
+    if pos + 5 > len(data):
+        raise BSONError("Truncated BSON document")
+    (size,) = struct.unpack_from("<i", data, pos)
+    end = pos + size - 1
+    if size < 5 or end >= len(data) or data[end] != 0:
+        raise BSONError("Invalid BSON document length")
+    return end
+
+
+def _raw_documents(data: memoryview, pos: int) -> Tuple[List[RawDocument], int]:
+    """The elements of the array at ``pos`` as ``RawDocument``, each only checked for framing."""
+    end = _document_end(data, pos)
+    pos += 4
+    docs = []
+    while pos < end:
+        kind = data[pos]
+        _, pos = _read_cstring(data, pos + 1)
+        if kind != 0x03:
+            raise BSONError(f"Expected a document in a raw batch, got BSON type 0x{kind:02x}")
+        doc_end = _document_end(data, pos)
+        if doc_end >= end:
+            raise BSONError("Document overruns its batch")
+        docs.append(RawDocument(data[pos:doc_end + 1]))
+        pos = doc_end + 1
+    return docs, end + 1
+
+
+def _decode_document(data: memoryview, pos: int, as_array: bool = False,
+                     raw: Collection[str] = ()) -> Tuple[Any, int]:
+    end = _document_end(data, pos)
+    pos += 4
+    doc: Dict[str, Any] = {}
+    while pos < end:
+        kind = data[pos]
+        key, pos = _read_cstring(data, pos + 1)
+        if kind == 0x01:
+            (value,) = struct.unpack_from("<d", data, pos)
+            pos += 8
+        elif kind == 0x02:
+            (length,) = struct.unpack_from("<i", data, pos)
+            value = bytes(data[pos + 4:pos + 3 + length]).decode("utf-8", errors="replace")
+            pos += 4 + length
+        elif kind == 0x04 and key in raw:
+            value, pos = _raw_documents(data, pos)
+        elif kind in (0x03, 0x04):
+            value, pos = _decode_document(data, pos, as_array=kind == 0x04, raw=raw)
+        elif kind == 0x05:
+            length, subtype = struct.unpack_from("<iB", data, pos)
+            raw = bytes(data[pos + 5:pos + 5 + length])
+            value = raw if subtype == 0 else Binary(raw, subtype)
+            pos += 5 + length
+        elif kind == 0x07:
+            value = ObjectId(bytes(data[pos:pos + 12]))
+            pos += 12
+        elif kind == 0x08:
+            value = data[pos] == 1
+            pos += 1
+        elif kind == 0x09:
+            (millis,) = struct.unpack_from("<q", data, pos)
+            try:
+                value = EPOCH + datetime.timedelta(milliseconds=millis)
+            except OverflowError:
+                raise BSONError(f"Datetime {millis}ms for key {key!r} is outside the range Python supports")
+            pos += 8
+        elif kind in (0x0A, 0x06):
+            value = None
+        elif kind == 0x0B:
+            pattern, pos = _read_cstring(data, pos)
+            flags, pos = _read_cstring(data, pos)
+            value = Regex(pattern, flags)
+        elif kind == 0x10:
+            (value,) = struct.unpack_from("<i", data, pos)
+            pos += 4
+        elif kind == 0x11:
+            inc, secs = struct.unpack_from("<II", data, pos)
+            value = Timestamp(secs, inc)
+            pos += 8
+        elif kind == 0x12:
+            (value,) = struct.unpack_from("<q", data, pos)
+            value = Int64(value)
+            pos += 8
+        elif kind == 0x13:
+            value = Decimal128(bytes(data[pos:pos + 16]))
+            pos += 16
+        elif kind == 0xFF:
+            value = MinKey
+        elif kind == 0x7F:
+            value = MaxKey
+        else:
+            raise BSONError(f"Unsupported BSON type 0x{kind:02x} for key {key!r}")
+        doc[key] = value
+    result = list(doc.values()) if as_array else doc
+    return result, end + 1
+
+
+def decode(data: bytes) -> Dict[str, Any]:
+    try:
+        doc, _ = _decode_document(memoryview(data), 0)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise BSONError(f"Malformed BSON: {e}")
+    return doc
+
+
+def decode_all(data: bytes) -> List[Dict[str, Any]]:
+    view = memoryview(data)
+    docs, pos = [], 0
+    try:
+        while pos < len(view):
+            doc, pos = _decode_document(view, pos)
+            docs.append(doc)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise BSONError(f"Malformed BSON: {e}")
+    return docs
+
+
+def split_documents(data: bytes) -> Iterator[RawDocument]:
+    """The documents of a concatenated BSON stream (a ``.bson`` dump), checked for framing only."""
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        end = _document_end(view, pos)
+        yield RawDocument(view[pos:end + 1])
+        pos = end + 1
+
+
+# ---------------------------------------------------------------------------
+# OP_MSG framing
+# ---------------------------------------------------------------------------
+
+def encode_message(doc: Mapping[str, Any], request_id: int, response_to: int = 0,
+                   sequences: Optional[Mapping[str, Sequence[Mapping[str, Any]]]] = None) -> bytes:
+    body = bytearray(struct.pack("<I", 0))
+    body += b"\x00" + encode(doc)
+    for identifier, docs in (sequences or {}).items():
+        payload = _cstring(identifier) + b"".join(encode(d) for d in docs)
+        body += b"\x01" + struct.pack("<i", len(payload) + 4) + payload
+    return struct.pack("<iiii", 16 + len(body), request_id, response_to, OP_MSG) + bytes(body)
+
+
+def decode_message(body: bytes, raw: Collection[str] = ()) -> Dict[str, Any]:
+    """Decode an OP_MSG body (after the header), folding document sequences into the command.
+
+    Arrays named in ``raw`` (``firstBatch``/``nextBatch`` for a dump) are
+    returned as lists of ``RawDocument`` instead of being decoded.
+    """
+    view = memoryview(body)
+    pos = 4
+    doc: Dict[str, Any] = {}
+    sequences: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        while pos < len(view):
+            kind = view[pos]
+            pos += 1
+            if kind == 0:
+                doc, pos = _decode_document(view, pos, raw=raw)
+            elif kind == 1:
+                (size,) = struct.unpack_from("<i", view, pos)
+                end = pos + size
+                identifier, cursor = _read_cstring(view, pos + 4)
+                items = []
+                while cursor < end:
+                    item, cursor = _decode_document(view, cursor)
+                    items.append(item)
+                sequences[identifier] = items
+                pos = end
+            else:
+                raise BSONError(f"Unsupported OP_MSG section kind {kind}")
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise BSONError(f"Malformed OP_MSG: {e}")
+    doc.update(sequences)
+    return doc
+
+
+async def read_message(reader: asyncio.StreamReader, raw: Collection[str] = ()) -> Tuple[int, int, Dict[str, Any]]:
+    header = await reader.readexactly(16)
+    length, request_id, response_to, opcode = struct.unpack("<iiii", header)
+    if opcode != OP_MSG:
+        raise BSONError(f"Unsupported opcode {opcode}")
+    if not 16 < length <= MAX_MESSAGE_SIZE:
+        raise BSONError(f"Invalid message length {length}")
+    body = await reader.readexactly(length - 16)
+    return request_id, response_to, decode_message(body, raw)
+
+
+# ---------------------------------------------------------------------------
+# Connections
+# ---------------------------------------------------------------------------
+
+class Credentials(NamedTuple):
+    username: str
+    password: str
+    source: str = "admin"
+
+
+_PROHIBITED = (
+    stringprep.in_table_c12, stringprep.in_table_c21_c22, stringprep.in_table_c3, stringprep.in_table_c4,
+    stringprep.in_table_c5, stringprep.in_table_c6, stringprep.in_table_c7, stringprep.in_table_c8,
+    stringprep.in_table_c9, stringprep.in_table_a1,
+)
+
+
+def saslprep(text: str) -> str:
+    """RFC 4013 SASLprep, applied to SCRAM-SHA-256 passwords by mongod and the drivers.
+
+    Without it a password such as ``"I\u00adX"`` or one typed with a non-ASCII
+    space hashes differently from what the server stored. Raises ValueError
+    for strings SASLprep does not allow (control characters, unassigned code
+    points, mixed right-to-left text).
+    """
+    if text.isascii() and text.isprintable():
+        return text
+    mapped = "".join(" " if stringprep.in_table_c12(c) else c for c in text if not stringprep.in_table_b1(c))
+    prepared = unicodedata.ucd_3_2_0.normalize("NFKC", mapped)
+    for c in prepared:
+        if any(prohibited(c) for prohibited in _PROHIBITED):
+            raise ValueError(f"SASLprep does not allow U+{ord(c):04X}")
+    if any(stringprep.in_table_d1(c) for c in prepared):
+        if any(stringprep.in_table_d2(c) for c in prepared):
+            raise ValueError("SASLprep does not allow mixing right-to-left and left-to-right text")
+        if not (stringprep.in_table_d1(prepared[0]) and stringprep.in_table_d1(prepared[-1])):
+            raise ValueError("SASLprep requires right-to-left text to start and end with a right-to-left character")
+    return prepared
+
+
+class MongoConnection:
+    """A single connection; requests are serialized, pipelining is explicit."""
+
+    def __init__(self, host: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.host = host
+        self.port = port
+        self.reader = reader
+        self.writer = writer
+        self.hello: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @classmethod
+    async def open(cls, host: str, port: int, timeout: float = 5.0, tls: Optional[ssl.SSLContext] = None,
+                   credentials: Optional[Credentials] = None) -> "MongoConnection":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=tls, limit=MAX_MESSAGE_SIZE), timeout)
+        conn = cls(host, port, reader, writer)
+        try:
+            if credentials is not None:
+                await asyncio.wait_for(conn.authenticate(credentials), timeout)
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    @property
+    def closed(self) -> bool:
+        return self.writer.is_closing()
+
+    async def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ConnectionError):
+            pass
+
+    async def command(self, db: str, cmd: Mapping[str, Any], check: bool = True,
+                      sequences: Optional[Mapping[str, Sequence[Mapping[str, Any]]]] = None,
+                      raw_batches: bool = False) -> Dict[str, Any]:
+        """Run one command; with ``raw_batches`` cursor batches hold ``RawDocument`` values."""
+        async with self._lock:
+            request_id = self._send(db, cmd, sequences)
+            await self.writer.drain()
+            reply = await self._receive(request_id, RAW_BATCHES if raw_batches else ())
+        if check:
+            self._check(reply)
+        return reply
+
+    async def pipeline(self, db: str, cmds: Sequence[Mapping[str, Any]], check: bool = True) -> List[Dict[str, Any]]:
+        """Send every command before reading any reply: N commands cost one round trip."""
+        async with self._lock:
+            ids = [self._send(db, cmd) for cmd in cmds]
+            await self.writer.drain()
+            replies = [await self._receive(request_id) for request_id in ids]
+        if check:
+            for reply in replies:
+                self._check(reply)
+        return replies
+
+    def _send(self, db: str, cmd: Mapping[str, Any],
+              sequences: Optional[Mapping[str, Sequence[Mapping[str, Any]]]] = None) -> int:
+        request_id = next(_request_ids) & 0x7FFFFFFF
+        doc = dict(cmd)
+        doc["$db"] = db
+        self.writer.write(encode_message(doc, request_id, sequences=sequences))
+        return request_id
+
+    async def _receive(self, request_id: int, raw: Collection[str] = ()) -> Dict[str, Any]:
+        _, response_to, reply = await read_message(self.reader, raw)
+        if response_to != request_id:
+            self.writer.close()
+            raise BSONError(f"Reply to request {response_to}, expected {request_id}")
+        return reply
+
+    @staticmethod
+    def _check(reply: Mapping[str, Any]):
+        if not reply.get("ok"):
+            raise CommandError(reply)
+
+    async def authenticate(self, credentials: Credentials):
+        try:
+            password = saslprep(credentials.password)
+        except ValueError as e:
+            raise CommandError({"errmsg": f"Invalid password for {credentials.username}: {e}", "code": 18})
+        user = credentials.username.replace("=", "=3D").replace(",", "=2C")
+        nonce = base64.b64encode(os.urandom(24)).decode()
+        first_bare = f"n={user},r={nonce}"
+        reply = await self.command(credentials.source, {
+            "saslStart": 1,
+            "mechanism": "SCRAM-SHA-256",
+            "payload": Binary(f"n,,{first_bare}".encode()),
+            "autoAuthorize": 1,
+            "options": {"skipEmptyExchange": True},
+        })
+        server_first = _payload(reply)
+        fields = dict(item.split("=", 1) for item in server_first.split(","))
+        if not fields["r"].startswith(nonce):
+            raise CommandError({"errmsg": "Server returned an invalid SCRAM nonce", "code": 18})
+
+        salted = hashlib.pbkdf2_hmac("sha256", password.encode(),
+                                     base64.b64decode(fields["s"]), int(fields["i"]))
+        client_key = hmac.new(salted, b"Client Key", hashlib.sha256).digest()
+        stored_key = hashlib.sha256(client_key).digest()
+        without_proof = f"c=biws,r={fields['r']}"
+        auth_message = f"{first_bare},{server_first},{without_proof}".encode()
+        signature = hmac.new(stored_key, auth_message, hashlib.sha256).digest()
+        proof = bytes(a ^ b for a, b in zip(client_key, signature))
+        final = f"{without_proof},p={base64.b64encode(proof).decode()}"
+
+        reply = await self.command(credentials.source, {
+            "saslContinue": 1, "conversationId": reply["conversationId"], "payload": Binary(final.encode()),
+        })
+        server_final = dict(item.split("=", 1) for item in _payload(reply).split(","))
+        if "e" in server_final:
+            raise CommandError({"errmsg": f"SCRAM authentication failed: {server_final['e']}", "code": 18})
+        server_key = hmac.new(salted, b"Server Key", hashlib.sha256).digest()
+        expected = hmac.new(server_key, auth_message, hashlib.sha256).digest()
+        if not hmac.compare_digest(base64.b64decode(server_final.get("v", "")), expected):
+            raise CommandError({"errmsg": "Server signature mismatch during SCRAM authentication", "code": 18})
+        while not reply.get("done"):
+            reply = await self.command(credentials.source, {
+                "saslContinue": 1, "conversationId": reply["conversationId"], "payload": Binary(b""),
+            })
+
+
+def _payload(reply: Mapping[str, Any]) -> str:
+    payload = reply.get("payload", b"")
+    if isinstance(payload, Binary):
+        payload = payload.data
+    return bytes(payload).decode()
+
+
+class ConnectionPool:
+    """Idle connections kept per host so repeated probes skip the TCP/TLS/auth handshake."""
+
+    def __init__(self, max_per_host: int = 4, connect_timeout: float = 5.0,
+                 tls: Optional[ssl.SSLContext] = None, credentials: Optional[Credentials] = None):
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.tls = tls
+        self.credentials = credentials
+        self._idle: Dict[Tuple[str, int], Deque[MongoConnection]] = {}
+        self._limits: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def acquire(self, host: str, port: int) -> AsyncIterator[MongoConnection]:
+        key = (host, port)
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_per_host))
+        async with limit:
+            idle = self._idle.setdefault(key, deque())
+            conn = None
+            while idle and conn is None:
+                candidate = idle.pop()
+                if not candidate.closed:
+                    conn = candidate
+            if conn is None:
+                conn = await MongoConnection.open(host, port, self.connect_timeout, self.tls, self.credentials)
+            try:
+                yield conn
+            except BaseException:
+                # The connection may hold an unread reply; never hand it out again.
+                await conn.close()
+                raise
+            if not conn.closed:
+                idle.append(conn)
+
+    async def close(self):
+        for idle in self._idle.values():
+            while idle:
+                await idle.pop().close()
@@ -1,15 +1,32 @@
 #!/usr/bin/env python3
 
+# Subcommands import what they need when they run: `status` in a cron loop should not pay
+# for numpy, yaml or the backup codecs. See `python -m dbprov.startup`.
+from __future__ import annotations
+
 import argparse
+import contextlib
+import functools
+import io
 import json
 import os
 import sys
-import subprocess
-import yaml
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 from enum import Enum
 
+if TYPE_CHECKING:
+    from dbprov.bench import BenchConfig, BenchResult
+    from dbprov.discovery import Discovery, DiscoveryOptions, DiscoveryService, Topology
+    from dbprov.fleet import RateLimiter
+    from dbprov.health import ClusterHealth, Node
+    from dbprov.process import ProcessResult, ProcessRunner
+    from dbprov.scale import BalancerSettings, ScaleOperation, ScaleOptions
+    from dbprov.scheduler import PhaseScheduler
+    from dbprov.tfcache import TerraformCache
+    from dbprov.wire import ConnectionPool, Credentials
+
 class ClusterType(Enum):
     STANDALONE = "standalone"
     REPLICASET = "replicaset"
@@ -30,12 +47,83 @@ class StorageEngine(Enum):
 class AuthMechanism(Enum):
     SCRAM_SHA_256 = "SCRAM-SHA-256"
 
+def state_home() -> Path:
+    return Path(os.environ.get("DBPROVISION_HOME", Path.home() / ".dbprovision"))
+
+def cluster_workspace(cluster_name: str) -> Path:
+    # dbprov.fleet.workspace_dir(state_home(), ...) without importing dbprov.fleet on the status path
+    return state_home() / "clusters" / cluster_name
+
+def executor() -> str:
+    """How terraform and ansible-playbook run: "subprocess", or "simulator" (see dbprov.simulator)."""
+    return os.environ.get("DBPROVISION_EXECUTOR", "subprocess")
+
 class DBProvision:
-    def __init__(self):
+    def __init__(self, workspace: Optional[Path] = None, echo: bool = True):
         self.project_root = Path(__file__).parent.parent
         self.terraform_dir = self.project_root / "infra/terraform"
         self.ansible_dir = self.project_root / "infra/ansible"
         self.scripts_dir = self.project_root / "infra/scripts"
+        self.state_dir = state_home()
+        # Where inventories/ and group_vars/ live; playbooks always run from ansible_dir
+        self.inventory_root = self.ansible_dir
+        self.command_env: Optional[Dict[str, str]] = None
+        log_file = self.state_dir / "logs" / "dbprovision.log"
+        
+        if workspace is not None:
+            # Isolated per-cluster copy of the terraform sources with its own state
+            from dbprov.fleet import sync_terraform_sources
+            sync_terraform_sources(self.terraform_dir, workspace / "terraform")
+            self.terraform_dir = workspace / "terraform"
+            self.inventory_root = workspace / "ansible"
+            plugin_cache = self.state_dir / "plugin-cache"
+            plugin_cache.mkdir(parents=True, exist_ok=True)
+            self.command_env = {**os.environ, "TF_PLUGIN_CACHE_DIR": str(plugin_cache)}
+            log_file = workspace / "logs" / "dbprovision.log"
+            
+        self.workspace = workspace
+        self.log_file = log_file
+        self.echo = echo
+        self.rate_limiter: Optional[RateLimiter] = None
+        self.command_timeout: Optional[float] = None
+        self.pending_plans: Dict[str, str] = {}
+        
+    # Created on first use: commands that only talk to the cluster never run terraform or ansible
+    @functools.cached_property
+    def runner(self) -> ProcessRunner:
+        if self.simulated:
+            from dbprov.simulator import SimulatorError, simulated_runner
+            try:
+                return simulated_runner(self.state_dir, log_file=self.log_file, echo=self.echo)
+            except SimulatorError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        if executor() != "subprocess":
+            print(f"Error: Unknown DBPROVISION_EXECUTOR {executor()!r} (expected subprocess or simulator)")
+            sys.exit(1)
+        from dbprov.process import ProcessRunner
+        return ProcessRunner(log_file=self.log_file, echo=self.echo)
+        
+    def close(self):
+        """Close the runner's log file, if a runner was created."""
+        runner = self.__dict__.pop("runner", None)
+        if runner is not None:
+            runner.close()
+        
+    @property
+    def simulated(self) -> bool:
+        return executor() == "simulator"
+        
+    @functools.cached_property
+    def terraform_cache(self) -> TerraformCache:
+        from dbprov.tfcache import TerraformCache
+        return TerraformCache(self.terraform_dir)
+        
+    @classmethod
+    def for_cluster(cls, cluster_name: str) -> "DBProvision":
+        """The workspace of a fleet-managed cluster if it has one, else the shared directories."""
+        workspace = cluster_workspace(cluster_name)
+        return cls(workspace=workspace) if workspace.is_dir() else cls()
         
     def validate_parameters(self, args):
         errors = []
@@ -57,6 +145,9 @@ class DBProvision:
         if not args.project_id:
             errors.append("GCP project ID is required")
             
+        if args.max_parallel < 1:
+            errors.append("Max parallel phases must be at least 1")
+            
         if errors:
             for error in errors:
                 print(f"Error: {error}")
@@ -112,124 +203,425 @@ class DBProvision:
         if args.oplog_size:
             vars_config["oplog_size"] = args.oplog_size
             
+        vars_config["tuning_profile"] = args.tuning_profile
+        vars_config["mongod_tuning"] = self.resolve_tuning(args)
+        
         if args.backup_schedule:
             vars_config["backup_schedule"] = args.backup_schedule
             
         return vars_config
         
-    def run_terraform(self, action: str, vars_file: str):
-        os.chdir(self.terraform_dir)
+    def resolve_tuning(self, args) -> Dict:
+        from dbprov.capacity import CapacityError
+        from dbprov.tuning import TuningError, parse_override, resolve_tuning
+        try:
+            overrides = dict(parse_override(item) for item in args.tuning_set or [])
+            tuning, warnings = resolve_tuning(args.tuning_profile, overrides, args.cache_size, args.oplog_size,
+                                              args.mongodb_version, args.instance_type)
+        except (TuningError, CapacityError) as e:
+            errors = e.errors if isinstance(e, TuningError) else [str(e)]
+            for error in errors:
+                print(f"Error: Invalid tuning: {error}")
+            sys.exit(1)
+        for warning in warnings:
+            print(f"Warning: {warning}")
+        return tuning
+        
+    def show_tuning(self, args):
+        from dbprov.tuning import PROFILES, TUNING_KEYS, render_mongod_conf
+        if not args.profile:
+            for name, settings in PROFILES.items():
+                print(f"{name}:")
+                for key, value in settings.items():
+                    print(f"  {key:<28} {value}")
+            print("\nOverride any key with: dbprovision create --tuning-set key=value")
+            for key, (kind, description) in TUNING_KEYS.items():
+                print(f"  {key:<28} {kind.__name__:<6} {description}")
+            return
+            
+        args.tuning_profile = args.profile
+        tuning = self.resolve_tuning(args)
+        print(render_mongod_conf(tuning, args.replica_set_name, memory_gb=args.memory_gb), end="")
         
+    def apply_capacity_plan(self, args):
+        from dbprov.capacity import CapacityPlan
+        try:
+            with open(args.capacity_plan) as f:
+                plan = CapacityPlan.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error: Cannot load capacity plan {args.capacity_plan}: {e}")
+            sys.exit(1)
+            
+        print(f"Using capacity plan {args.capacity_plan}: {plan.shard_count} x {plan.instance_type}, "
+              f"cache {plan.cache_size}, oplog {plan.oplog_size}")
+        args.cluster_type = plan.cluster_type
+        args.replica_nodes = plan.replica_nodes
+        args.instance_type = plan.instance_type
+        args.disk_size = plan.disk_size_gb
+        args.cache_size = plan.cache_size
+        args.oplog_size = plan.oplog_size
+        if plan.cluster_type == ClusterType.SHARDED.value:
+            args.shard_count = plan.shard_count
+            args.config_servers = plan.config_servers
+            args.mongos_count = plan.mongos_count
+            
+    def plan_capacity(self, args):
+        import yaml
+        from dbprov.capacity import CapacityError, WorkloadTarget, parse_size, plan_capacity
+        try:
+            target = WorkloadTarget(
+                working_set_bytes=parse_size(args.working_set),
+                write_bytes_per_sec=parse_size(args.write_rate),
+                oplog_window_hours=args.oplog_window,
+                peak_ops=args.peak_ops,
+                data_size_bytes=parse_size(args.data_size) if args.data_size else None,
+                cluster_type=args.cluster_type,
+                replica_nodes=args.replica_nodes,
+                headroom=args.headroom,
+                max_shards=args.max_shards,
+            )
+            plan = plan_capacity(target)
+        except CapacityError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+            
+        if args.json:
+            print(json.dumps(plan.to_dict(), indent=2))
+        else:
+            print(plan.format())
+            print("\nterraform vars:")
+            print(render_tfvars(plan.terraform_vars()), end="")
+            print("\ngroup_vars:")
+            print(yaml.dump(plan.ansible_vars()), end="")
+            
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(plan.to_dict(), f, indent=2)
+            print(f"\nPlan saved to {args.output}; apply it with: dbprovision create --capacity-plan {args.output} ...")
+            
+    def run_terraform(self, action: str, vars_file: str) -> ProcessResult:
+        import asyncio
+        from dbprov.process import ProcessError
+        try:
+            return asyncio.run(self.run_terraform_async(action, vars_file))
+        except ProcessError:
+            sys.exit(1)
+            
+    def terraform_command(self, action: str, vars_file: Optional[str] = None, plan_file: Optional[Path] = None,
+                          targets: Optional[List[str]] = None) -> List[str]:
         if action == "init":
-            cmd = ["terraform", "init"]
+            cmd = ["terraform", "init", "-input=false"]
         elif action == "plan":
-            cmd = ["terraform", "plan", f"-var-file={vars_file}"]
+            cmd = ["terraform", "plan", "-input=false", f"-var-file={vars_file}"]
+            if plan_file:
+                cmd.extend([f"-out={plan_file}", "-detailed-exitcode"])
         elif action == "apply":
-            cmd = ["terraform", "apply", f"-var-file={vars_file}", "-auto-approve"]
+            if plan_file:
+                cmd = ["terraform", "apply", "-input=false", "-auto-approve", str(plan_file)]
+            else:
+                cmd = ["terraform", "apply", "-input=false", f"-var-file={vars_file}", "-auto-approve"]
         elif action == "destroy":
-            cmd = ["terraform", "destroy", f"-var-file={vars_file}", "-auto-approve"]
+            cmd = ["terraform", "destroy", "-input=false", f"-var-file={vars_file}", "-auto-approve"]
+        elif action == "output":
+            cmd = ["terraform", "output", "-json"]
         else:
             raise ValueError(f"Unknown terraform action: {action}")
+        if targets and not plan_file:
+            cmd.extend(f"-target={target}" for target in targets)
+        return cmd
+        
+    async def run_terraform_async(self, action: str, vars_file: Optional[str] = None,
+                                  plan_file: Optional[Path] = None, targets: Optional[List[str]] = None) -> ProcessResult:
+        from dbprov.process import ProcessError
+        cmd = self.terraform_command(action, vars_file, plan_file, targets)
+            
+        if self.rate_limiter is not None and action not in ("init", "output"):
+            await self.rate_limiter.acquire()
             
         print(f"Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # output -json is parsed, not shown
+        result = await self.runner.run_async(cmd, cwd=self.terraform_dir, label=f"terraform {action}",
+                                             timeout=self.command_timeout, env=self.command_env,
+                                             capture=action == "output", echo=False if action == "output" else None)
         
-        if result.returncode != 0:
+        # With -detailed-exitcode, plan exits 2 when there are changes to apply
+        has_changes = action == "plan" and plan_file is not None and result.returncode == 2
+        if not result.ok and not has_changes:
             print(f"Terraform {action} failed:")
-            print(result.stderr)
-            sys.exit(1)
+            self.print_tail(result)
+            raise ProcessError(result)
             
-        return result.stdout
+        return result
         
-    def run_ansible(self, playbook: str, inventory: str, vars_file: Optional[str] = None):
-        os.chdir(self.ansible_dir)
+    async def terraform_init_phase(self, force: bool = False):
+        cache = self.terraform_cache
+        if not force and cache.providers_installed() and cache.is_current("init", cache.sources_digest()):
+            print("Terraform providers and modules unchanged, skipping init")
+            return None
+            
+        result = await self.run_terraform_async("init")
+        # init may create or update the lock file, so fingerprint what it left behind
+        cache.invalidate_sources()
+        cache.record("init", cache.sources_digest())
+        return result
         
-        cmd = ["ansible-playbook", "-i", f"inventories/{inventory}", f"playbooks/{playbook}"]
+    async def terraform_plan_phase(self, cluster_name: str, vars_file: str, force: bool = False):
+        cache = self.terraform_cache
+        fingerprint = cache.fingerprint(Path(vars_file))
+        if not force and cache.is_applied(cluster_name, fingerprint):
+            print(f"Terraform inputs for {cluster_name} unchanged since last apply, skipping plan/apply")
+            return None
+            
+        plan_file = cache.plan_file(cluster_name)
+        plan_file.parent.mkdir(parents=True, exist_ok=True)
+        result = await self.run_terraform_async("plan", vars_file, plan_file)
+        
+        if result.returncode == 0:
+            print("No infrastructure changes to apply")
+            cache.record_applied(cluster_name, fingerprint, changed=False)
+            plan_file.unlink()
+        else:
+            self.pending_plans[cluster_name] = fingerprint
+        return result
+        
+    async def terraform_apply_phase(self, cluster_name: str):
+        fingerprint = self.pending_plans.pop(cluster_name, None)
+        if fingerprint is None:
+            print("No saved plan to apply, skipping apply")
+            return None
+            
+        plan_file = self.terraform_cache.plan_file(cluster_name)
+        result = await self.run_terraform_async("apply", plan_file=plan_file)
+        self.terraform_cache.record_applied(cluster_name, fingerprint)
+        plan_file.unlink()
+        return result
+        
+    def run_ansible(self, playbook: str, inventory: str, vars_file: Optional[str] = None,
+                    limit: Optional[str] = None) -> ProcessResult:
+        import asyncio
+        from dbprov.process import ProcessError
+        try:
+            return asyncio.run(self.run_ansible_async(playbook, inventory, vars_file, limit))
+        except ProcessError:
+            sys.exit(1)
+            
+    def ansible_command(self, playbook: str, inventory: str, vars_file: Optional[str] = None,
+                        limit: Optional[str] = None) -> List[str]:
+        inventories = Path("inventories") if self.inventory_root == self.ansible_dir else self.inventory_root / "inventories"
+        cmd = ["ansible-playbook", "-i", str(inventories / inventory), f"playbooks/{playbook}"]
         
         if vars_file:
             cmd.extend(["-e", f"@{vars_file}"])
             
+        if limit:
+            cmd.extend(["--limit", limit])
+        return cmd
+        
+    async def run_ansible_async(self, playbook: str, inventory: str, vars_file: Optional[str] = None,
+                                limit: Optional[str] = None) -> ProcessResult:
+        from dbprov.process import ProcessError
+        cmd = self.ansible_command(playbook, inventory, vars_file, limit)
         print(f"Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        label = f"{playbook}:{limit}" if limit else playbook
+        result = await self.runner.run_async(cmd, cwd=self.ansible_dir, label=label,
+                                             timeout=self.command_timeout, env=self.command_env)
         
-        if result.returncode != 0:
+        if not result.ok:
             print(f"Ansible playbook {playbook} failed:")
-            print(result.stderr)
-            sys.exit(1)
+            self.print_tail(result)
+            raise ProcessError(result)
             
-        return result.stdout
+        return result
         
+    def print_tail(self, result: ProcessResult, lines: int = 30):
+        if result.timed_out:
+            print(f"Command timed out after {result.duration:.0f}s")
+        for line in result.tail[-lines:]:
+            print(f"  {line}")
+            
     def create_cluster(self, args):
-        print(f"Creating MongoDB {args.cluster_type} cluster...")
-        
         cluster_name = f"{args.cluster_name or 'mongodb-cluster'}"
+        if args.dry_run:
+            self.show_deployment_plan(args, cluster_name)
+            return
+            
+        import asyncio
+        report = asyncio.run(self.deploy_cluster_async(args, cluster_name))
+        
+        print("\n" + report.format())
+        
+        if not report.ok:
+            for failure in report.failures:
+                print(f"Deployment failed in phase {failure.name}: {failure.error}")
+            sys.exit(1)
+            
+        print("Cluster deployment completed successfully!")
+        self.show_cluster_info(cluster_name, args.cluster_type)
+        
+    async def deploy_cluster_async(self, args, cluster_name: str):
+        import yaml
+        from dbprov.scheduler import PhaseScheduler
+        print(f"Creating MongoDB {args.cluster_type} cluster...")
         
         terraform_vars = self.generate_terraform_vars(args)
         ansible_vars = self.generate_ansible_vars(args)
         
         terraform_vars_file = self.terraform_dir / f"{cluster_name}.tfvars"
-        ansible_vars_file = self.ansible_dir / f"group_vars/{cluster_name}.yml"
+        ansible_vars_file = self.inventory_root / f"group_vars/{cluster_name}.yml"
         
         with open(terraform_vars_file, 'w') as f:
-            for key, value in terraform_vars.items():
-                if isinstance(value, str):
-                    f.write(f'{key} = "{value}"\n')
-                elif isinstance(value, list):
-                    f.write(f'{key} = {json.dumps(value)}\n')
-                else:
-                    f.write(f'{key} = {value}\n')
-                    
-        ansible_vars_file.parent.mkdir(exist_ok=True)
+            f.write(render_tfvars(terraform_vars))
+            
+        ansible_vars_file.parent.mkdir(parents=True, exist_ok=True)
         with open(ansible_vars_file, 'w') as f:
             yaml.dump(ansible_vars, f)
             
+        self.command_timeout = args.command_timeout
+        scheduler = PhaseScheduler(max_workers=args.max_parallel, listener=self.report_phase)
+        self.add_deployment_phases(scheduler, args, cluster_name, str(terraform_vars_file), str(ansible_vars_file))
+        
+        print(f"Running {len(scheduler.phases)} deployment phases (max {args.max_parallel} in parallel)...")
+        return await scheduler.run_async()
+        
+    def show_deployment_plan(self, args, cluster_name: str):
+        import yaml
+        from dbprov.scheduler import PhaseScheduler
+        terraform_vars_file = self.terraform_dir / f"{cluster_name}.tfvars"
+        ansible_vars_file = self.inventory_root / f"group_vars/{cluster_name}.yml"
+        terraform_vars = self.generate_terraform_vars(args)
+        ansible_vars = self.generate_ansible_vars(args)
+        print(f"Dry run for MongoDB {args.cluster_type} cluster {cluster_name}: nothing is written or run")
+        
+        print(f"\n# {terraform_vars_file}")
+        print(render_tfvars(terraform_vars), end="")
+        print(f"\n# {ansible_vars_file}")
+        print(yaml.dump(ansible_vars), end="")
+        
+        scheduler = PhaseScheduler(max_workers=args.max_parallel)
+        self.add_deployment_phases(scheduler, args, cluster_name, str(terraform_vars_file), str(ansible_vars_file))
+        print(f"\n{len(scheduler.phases)} deployment phases (max {args.max_parallel} in parallel):")
+        print(scheduler.format_plan())
+        
+    def apply_fleet(self, args):
+        import asyncio
+        from dbprov.fleet import (CREATE, UPDATE, ClusterOutcome, FleetError, FleetManifest, FleetState, RateLimiter,
+                                  format_changes, plan_fleet, run_fleet, workspace_dir)
         try:
-            print("1. Initializing Terraform...")
-            self.run_terraform("init", str(terraform_vars_file))
-            
-            print("2. Planning infrastructure...")
-            self.run_terraform("plan", str(terraform_vars_file))
-            
-            print("3. Creating infrastructure...")
-            terraform_output = self.run_terraform("apply", str(terraform_vars_file))
-            
-            print("4. Configuring MongoDB...")
-            if args.cluster_type == ClusterType.STANDALONE.value:
-                self.run_ansible("deploy-standalone.yml", f"{cluster_name}.ini", str(ansible_vars_file))
-            elif args.cluster_type == ClusterType.REPLICASET.value:
-                self.run_ansible("deploy-replicaset.yml", f"{cluster_name}.ini", str(ansible_vars_file))
-                self.run_ansible("init-replica-set.yml", f"{cluster_name}.ini", str(ansible_vars_file))
-            elif args.cluster_type == ClusterType.SHARDED.value:
-                self.run_ansible("deploy-config-servers.yml", f"config-servers.ini", str(ansible_vars_file))
-                self.run_ansible("init-config-replica-set.yml", f"config-servers.ini", str(ansible_vars_file))
-                self.run_ansible("deploy-shard-servers.yml", f"shard-servers.ini", str(ansible_vars_file))
-                self.run_ansible("init-shard-replica-sets.yml", f"shard-servers.ini", str(ansible_vars_file))
-                self.run_ansible("deploy-mongos.yml", f"mongos.ini", str(ansible_vars_file))
-                self.run_ansible("configure-sharding.yml", f"mongos.ini", str(ansible_vars_file))
-                
-            print("5. Cluster deployment completed successfully!")
-            self.show_cluster_info(cluster_name, args.cluster_type)
+            manifest = FleetManifest.load(Path(args.file))
+        except FleetError as e:
+            print(f"Error: Invalid fleet manifest: {e}")
+            sys.exit(1)
             
-        except Exception as e:
-            print(f"Deployment failed: {e}")
+        state = FleetState(self.state_dir)
+        changes = plan_fleet(manifest, state.load())
+        if args.only:
+            changes = [c for c in changes if c.name in args.only]
+        print(f"Fleet {manifest.name}: {len(manifest.clusters)} clusters")
+        print(format_changes(changes))
+        if args.diff or not any(c.action in (CREATE, UPDATE) for c in changes):
+            return
+            
+        concurrency = args.concurrency or manifest.concurrency
+        limiter = RateLimiter(manifest.terraform_per_minute, manifest.burst)
+        print(f"\nProvisioning up to {concurrency} clusters at a time"
+              + (f", at most {manifest.terraform_per_minute:g} terraform runs per minute"
+                 if manifest.terraform_per_minute else "") + "...")
+        
+        async def provision(change) -> ClusterOutcome:
+            workspace = workspace_dir(self.state_dir, change.name)
+            outcome = ClusterOutcome(change.name, change.action, False,
+                                     log_file=workspace / "logs" / "dbprovision.log")
+            cluster = None
+            try:
+                cluster_args = fleet_cluster_args(change.spec, manifest.max_parallel, args.force_terraform)
+                cluster = DBProvision(workspace=workspace, echo=args.verbose)
+                cluster.rate_limiter = limiter
+                if cluster_args.capacity_plan:
+                    cluster.apply_capacity_plan(cluster_args)
+                cluster.validate_parameters(cluster_args)
+                report = await cluster.deploy_cluster_async(cluster_args, change.name)
+                if not report.ok:
+                    failure = report.failures[0] if report.failures else None
+                    outcome.error = f"phase {failure.name}: {failure.error}" if failure else "phases skipped"
+                outcome.ok = report.ok
+            except FleetError as e:
+                print(f"Error: {e}")
+                outcome.error = str(e)
+            except SystemExit:
+                outcome.error = "invalid cluster options, see errors above"
+            finally:
+                if cluster is not None:
+                    cluster.close()
+            state.record(manifest.name, change.spec, outcome.ok)
+            return outcome
+            
+        report = asyncio.run(run_fleet(changes, concurrency, provision))
+        print("\n" + report.format())
+        if not report.ok:
             sys.exit(1)
             
+    def add_deployment_phases(self, scheduler: PhaseScheduler, args, cluster_name: str,
+                              terraform_vars_file: str, ansible_vars_file: str):
+        force = args.force_terraform
+        plan_file = self.terraform_cache.plan_file(cluster_name)
+        init = scheduler.add("terraform-init", functools.partial(self.terraform_init_phase, force),
+                             description=" ".join(self.terraform_command("init")))
+        plan = scheduler.add("terraform-plan", functools.partial(self.terraform_plan_phase, cluster_name,
+                                                                 terraform_vars_file, force), [init],
+                             " ".join(self.terraform_command("plan", terraform_vars_file, plan_file)))
+        infra = scheduler.add("terraform-apply", functools.partial(self.terraform_apply_phase, cluster_name), [plan],
+                              " ".join(self.terraform_command("apply", plan_file=plan_file)))
+        
+        def playbook(phase: str, name: str, inventory: str, depends_on: List[str], limit: Optional[str] = None):
+            action = functools.partial(self.run_ansible_async, name, inventory, ansible_vars_file, limit)
+            command = " ".join(self.ansible_command(name, inventory, ansible_vars_file, limit))
+            return scheduler.add(phase, action, depends_on, command)
+            
+        if args.cluster_type == ClusterType.STANDALONE.value:
+            playbook("deploy-standalone", "deploy-standalone.yml", f"{cluster_name}.ini", [infra])
+        elif args.cluster_type == ClusterType.REPLICASET.value:
+            deploy = playbook("deploy-replicaset", "deploy-replicaset.yml", f"{cluster_name}.ini", [infra])
+            playbook("init-replica-set", "init-replica-set.yml", f"{cluster_name}.ini", [deploy])
+        elif args.cluster_type == ClusterType.SHARDED.value:
+            # Config servers and shard servers are independent until mongos needs
+            # the config replica set and sharding needs every shard initialized.
+            config = playbook("deploy-config-servers", "deploy-config-servers.yml", "config-servers.ini", [infra])
+            config_rs = playbook("init-config-replica-set", "init-config-replica-set.yml", "config-servers.ini", [config])
+            shards = playbook("deploy-shard-servers", "deploy-shard-servers.yml", "shard-servers.ini", [infra])
+            shard_rs = [
+                playbook(f"init-shard-replica-set-{i}", "init-shard-replica-sets.yml", "shard-servers.ini", [shards],
+                         f"shard{i}")
+                for i in range(1, args.shard_count + 1)
+            ]
+            mongos = playbook("deploy-mongos", "deploy-mongos.yml", "mongos.ini", [config_rs])
+            playbook("configure-sharding", "configure-sharding.yml", "mongos.ini", [mongos] + shard_rs)
+            
+    def report_phase(self, name: str, state: str, result):
+        if result is None:
+            print(f"==> [{name}] {state}")
+        else:
+            print(f"==> [{name}] {state} ({result.duration:.1f}s)")
+            
     def show_cluster_info(self, cluster_name: str, cluster_type: str):
+        import asyncio
+        from dbprov.discovery import DiscoveryError, DiscoveryOptions
+        from dbprov.process import ProcessError
         print("\n" + "="*50)
         print(f"MongoDB Cluster: {cluster_name}")
         print("="*50)
         
-        if cluster_type == ClusterType.SHARDED.value:
-            print("Connection Endpoints (mongos):")
-            print("- Use these endpoints to connect your applications")
-            print("- Format: mongodb://host1:27016,host2:27016/")
-        elif cluster_type == ClusterType.REPLICASET.value:
-            print("Connection Endpoints (Replica Set):")
-            print("- Use these endpoints to connect your applications")
-            print("- Format: mongodb://host1:27017,host2:27017,host3:27017/?replicaSet=rs0")
-        else:
-            print("Connection Endpoint (Standalone):")
-            print("- Format: mongodb://host:27017/")
+        if self.simulated:
+            # The simulated instances have no mongod to probe
+            print("Simulated with DBPROVISION_EXECUTOR=simulator: nothing was created")
+            return
+            
+        try:
+            options = DiscoveryOptions(username=os.environ.get("MONGODB_USERNAME"))
+            discovery = asyncio.run(self.discover_endpoints(cluster_name, options, refresh=True))
+            print(discovery.format())
+        except (DiscoveryError, ProcessError, ValueError, OSError) as e:
+            print(f"Endpoints not discovered yet: {e}")
+            print(f"Run: dbprovision endpoints --cluster {cluster_name}")
         
         print("\nNext Steps:")
         print("1. Test connectivity: dbprovision health --cluster", cluster_name)
@@ -237,13 +629,864 @@ class DBProvision:
         print("3. Scale cluster: dbprovision scale --cluster", cluster_name, "--shards 5")
         print("4. Backup data: dbprovision backup --cluster", cluster_name)
         
-    def show_status(self, cluster_name: str):
+    def discovery_service(self, cluster_name: str, max_age: float = 300.0) -> DiscoveryService:
+        from dbprov.discovery import DiscoveryService, TopologyCache, state_fingerprint
+        async def read_outputs():
+            result = await self.run_terraform_async("output")
+            return json.loads(result.stdout)
+            
+        cache = TopologyCache(self.state_dir / "discovery", max_age=max_age)
+        return DiscoveryService(cluster_name, read_outputs, cache, state_fingerprint(self.terraform_dir))
+        
+    async def discover_endpoints(self, cluster_name: str, options: DiscoveryOptions, refresh: bool = False,
+                                 max_age: float = 300.0, timeout: float = 3.0, concurrency: int = 64,
+                                 topology: Optional[Topology] = None) -> Discovery:
+        import ssl
+        from dbprov.discovery import probe_topology
+        from dbprov.health import HealthProber
+        from dbprov.wire import ConnectionPool
+        pool = ConnectionPool(max_per_host=2, connect_timeout=timeout,
+                              tls=ssl.create_default_context() if options.tls else None, credentials=env_credentials())
+        prober = HealthProber(pool, concurrency=concurrency, timeout=timeout)
+        try:
+            if topology is not None:
+                return await probe_topology(topology, prober, options)
+            return await self.discovery_service(cluster_name, max_age).discover(prober, options, refresh)
+        finally:
+            await prober.close()
+            
+    def show_endpoints(self, args):
+        import asyncio
+        from dbprov.discovery import DiscoveryError, DiscoveryOptions, topology_from_nodes
+        from dbprov.health import load_topology, parse_hosts
+        from dbprov.process import ProcessError
+        options = DiscoveryOptions(external=args.external, srv_domain=args.srv_domain, app_instances=args.app_instances,
+                                   tls=args.tls, username=os.environ.get("MONGODB_USERNAME"),
+                                   max_staleness=args.max_staleness)
+        topology = None
+        if args.hosts:
+            topology = topology_from_nodes(args.cluster, parse_hosts(args.hosts), "hosts")
+            
+        # terraform's progress line must not end up in the JSON
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            try:
+                discovery = asyncio.run(self.discover_endpoints(args.cluster, options, args.refresh, args.max_age,
+                                                                args.timeout, args.concurrency, topology))
+            except (ProcessError, ValueError) as e:
+                # No terraform state here (e.g. applied elsewhere): the Ansible inventory still lists the hosts
+                try:
+                    nodes = load_topology(self.inventory_root, args.cluster)
+                except FileNotFoundError:
+                    print(f"Error: Cannot read terraform outputs ({e}) and no inventory for {args.cluster}")
+                    print("Use --hosts host:port,... to check nodes directly")
+                    sys.exit(1)
+                topology = topology_from_nodes(args.cluster, nodes, "inventory")
+                discovery = asyncio.run(self.discover_endpoints(args.cluster, options, timeout=args.timeout,
+                                                                concurrency=args.concurrency, topology=topology))
+            except DiscoveryError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+                
+        if args.json:
+            print(json.dumps(discovery.to_dict(), indent=2))
+        else:
+            print(discovery.format())
+        if not any(e.reachable for e in discovery.endpoints):
+            sys.exit(1)
+            
+    def cluster_nodes(self, cluster_name: str, hosts: Optional[str] = None) -> List[Node]:
+        from dbprov.health import load_topology, parse_hosts
+        if hosts:
+            return parse_hosts(hosts)
+        try:
+            return load_topology(self.inventory_root, cluster_name)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            print("Use --hosts host:port,... to check nodes directly")
+            sys.exit(1)
+            
+    def probe_cluster(self, nodes: List[Node], timeout: float = 3.0, concurrency: int = 64,
+                      tls: bool = False, server_status: bool = False) -> ClusterHealth:
+        import asyncio
+        import ssl
+        from dbprov.health import HealthProber
+        from dbprov.wire import ConnectionPool
+        pool = ConnectionPool(max_per_host=2, connect_timeout=timeout,
+                              tls=ssl.create_default_context() if tls else None, credentials=env_credentials())
+        prober = HealthProber(pool, concurrency=concurrency, timeout=timeout)
+        
+        async def run():
+            try:
+                return await prober.probe(nodes, server_status=server_status)
+            finally:
+                await prober.close()
+                
+        return asyncio.run(run())
+        
+    def show_status(self, cluster_name: str, hosts: Optional[str] = None, timeout: float = 3.0,
+                    concurrency: int = 64, tls: bool = False):
         print(f"Checking status for cluster: {cluster_name}")
+        nodes = self.cluster_nodes(cluster_name, hosts)
+        report = self.probe_cluster(nodes, timeout, concurrency, tls)
+        print(report.summary())
         
-    def show_health(self, cluster_name: str, check_all: bool = False):
+    def show_health(self, cluster_name: str, check_all: bool = False, hosts: Optional[str] = None,
+                    timeout: float = 3.0, concurrency: int = 64, tls: bool = False):
         print(f"Health check for cluster: {cluster_name}")
+        nodes = self.cluster_nodes(cluster_name, hosts)
+        report = self.probe_cluster(nodes, timeout, concurrency, tls, server_status=check_all)
+        print(report.format())
+        
+        if not report.healthy:
+            sys.exit(1)
+            
+    def run_bench(self, args):
+        import asyncio
+        from dbprov.bench import WORKLOADS, BenchConfig, BenchError, BenchResult, check_targets, compare, run_benchmark
+        from dbprov.health import parse_hosts
+        from dbprov.wire import CommandError
+        if args.compare:
+            try:
+                results = []
+                for path in args.compare:
+                    with open(path) as f:
+                        results.append(BenchResult.from_dict(json.load(f)))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error: Cannot load benchmark result: {e}")
+                sys.exit(1)
+            print(compare(results))
+            return
+            
+        workload = dict(WORKLOADS[args.workload])
+        mix = {op: getattr(args, op) for op in ('read', 'update', 'insert', 'scan') if getattr(args, op) is not None}
+        if mix:
+            workload = {'distribution': workload['distribution'], **mix}
+        if args.distribution:
+            workload['distribution'] = args.distribution
+        credentials = env_credentials()
+        config = BenchConfig(
+            hosts=[],
+            read=workload.get('read', 0.0),
+            update=workload.get('update', 0.0),
+            insert=workload.get('insert', 0.0),
+            scan=workload.get('scan', 0.0),
+            distribution=workload['distribution'],
+            record_count=args.records,
+            operations=args.operations,
+            duration=args.duration,
+            clients=args.clients,
+            processes=args.processes,
+            document_size=args.document_size,
+            field_count=args.fields,
+            max_scan_length=args.scan_length,
+            database=args.database,
+            collection=args.collection,
+            load=not args.no_load,
+            timeout=args.timeout,
+            tls=args.tls,
+            credentials=credentials,
+            label=args.label or f"workload-{args.workload}",
+        )
         
+        try:
+            if args.fake or args.fake_shards:
+                result = asyncio.run(self.bench_stand_in(config, args.fake_shards))
+            else:
+                if args.cluster:
+                    nodes = self.cluster_nodes(args.cluster, args.hosts)
+                    routers = [n for n in nodes if n.role == 'mongos']
+                    nodes = routers or [n for n in nodes if n.role == 'mongod']
+                elif args.hosts:
+                    nodes = parse_hosts(args.hosts)
+                else:
+                    print("Error: bench needs --cluster, --hosts or --fake")
+                    sys.exit(1)
+                config.hosts = [(n.host, n.port) for n in nodes]
+                result = run_benchmark(config)
+        except (BenchError, CommandError, OSError, asyncio.TimeoutError) as e:
+            print(f"Error: Benchmark failed: {e or type(e).__name__}")
+            sys.exit(1)
+            
+        print(result.format())
+        output = Path(args.output) if args.output else (
+            self.state_dir / "bench" / f"{config.label}-{result.started_at[:19].replace(':', '')}.json")
+        result.save(output)
+        print(f"\nResults saved to {output}")
+        
+        failures = check_targets(result, args.target_p99_ms, args.target_ops)
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        if failures:
+            sys.exit(1)
+            
+    async def bench_stand_in(self, config: BenchConfig, shards: int = 0) -> BenchResult:
+        from dbprov.bench import run_benchmark_async, start_stand_in
+        servers, address = await start_stand_in(shards, config.record_count, config.database, config.collection)
+        print(f"Benchmarking in-memory stand-in at {address[0]}:{address[1]}"
+              + (f" ({shards} fake shards)" if shards else ""))
+        config.hosts = [address]
+        try:
+            return await run_benchmark_async(config)
+        finally:
+            for server in servers:
+                await server.stop()
+                
+    def run_advise(self, args):
+        import asyncio
+        from dbprov.advisor import AdvisorError, AdvisorOptions, analyze, check_findings, load_catalog, read_capture
+        from dbprov.wire import CommandError
+        options = AdvisorOptions(
+            examine_ratio=args.examine_ratio,
+            min_count=args.min_count,
+            min_cardinality=args.min_cardinality,
+            max_frequency=args.max_frequency,
+            min_coverage=args.min_coverage,
+            top=args.top,
+        )
+        try:
+            catalog = load_catalog(Path(args.catalog)) if args.catalog else {}
+            if args.input:
+                operations, catalog, skipped = read_capture([Path(p) for p in args.input], catalog)
+            elif args.cluster or args.hosts:
+                operations, catalog = self.sample_queries(args, catalog)
+                skipped = 0
+            else:
+                print("Error: advise needs captured files (--input) or a live --cluster/--hosts to sample")
+                sys.exit(1)
+        except (AdvisorError, CommandError, OSError, asyncio.TimeoutError) as e:
+            print(f"Error: Query sampling failed: {e or type(e).__name__}")
+            sys.exit(1)
+            
+        report = analyze(operations, catalog, options, skipped)
+        if args.json:
+            print(json.dumps(report.to_dict(), indent=2, default=str))
+        else:
+            print(report.format())
+        if not report.operations:
+            print("\nNo queries on user collections in the sample"
+                  + ("" if args.input else "; try a longer --duration or --slowms to turn on the profiler"))
+            
+        failures = check_findings(report, args.fail_on or [])
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        if failures:
+            sys.exit(1)
+            
+    def sample_queries(self, args, catalog):
+        import asyncio
+        import ssl
+        from dbprov.advisor import LiveSampler, SampleOptions, operation_from_profile
+        from dbprov.health import parse_hosts
+        from dbprov.wire import ConnectionPool
+        nodes = self.cluster_nodes(args.cluster, args.hosts) if args.cluster else parse_hosts(args.hosts)
+        routers = [n for n in nodes if n.role == 'mongos']
+        pool = ConnectionPool(max_per_host=2, connect_timeout=args.timeout,
+                              tls=ssl.create_default_context() if args.tls else None, credentials=env_credentials())
+        sampler = LiveSampler(pool, SampleOptions(duration=args.duration, interval=args.interval,
+                                                  slowms=args.slowms, timeout=args.timeout))
+        data_nodes = len([n for n in nodes if n.role == 'mongod'])
+        print(f"Sampling queries on {data_nodes} nodes for {args.duration:.0f}s ...")
+        
+        async def run():
+            try:
+                return await sampler.sample(nodes, routers)
+            finally:
+                await pool.close()
+                
+        records = asyncio.run(run())
+        for ns, collection in sampler.catalog.items():
+            catalog.setdefault(ns, collection)
+        if args.capture:
+            with open(args.capture, 'w') as f:
+                for line in sampler.capture_lines():
+                    f.write(line + "\n")
+            print(f"Captured {len(records)} operations to {args.capture}")
+        operations = [op for op in (operation_from_profile(r) for r in records) if op is not None]
+        return operations, catalog
+        
+    def analyze_logs(self, args):
+        from dbprov.logs import (REPORTS, LogError, LogFilter, connection_churn, election_events, epoch_ms,
+                                 format_connections, format_elections, format_latency, format_slow_ops, format_summary,
+                                 latency_over_time, load_logs, parse_bucket, slow_ops_by_namespace, summary)
+        reports = REPORTS if 'all' in args.report else args.report
+        try:
+            bucket = parse_bucket(args.bucket) if args.bucket else None
+            bounds = {}
+            for name in ('since', 'until'):
+                value = getattr(args, name)
+                if value is not None:
+                    bounds[name] = epoch_ms(value)
+                    if bounds[name] is None:
+                        raise LogError(f"Invalid --{name} {value!r}, expected an ISO-8601 time")
+            table = load_logs([Path(p) for p in args.files], Path(args.cache_dir) if args.cache_dir
+                              else self.state_dir / "log-cache", rebuild=args.rebuild,
+                              progress=print if not args.json else lambda message: None)
+        except LogError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+            
+        started = time.perf_counter()
+        flt = LogFilter(since=bounds.get('since'), until=bounds.get('until'), namespace=args.namespace,
+                        min_ms=args.min_ms)
+        results = {}
+        if 'summary' in reports:
+            results['summary'] = summary(table)
+        if 'slow' in reports:
+            results['slow'] = slow_ops_by_namespace(table, flt, args.top)
+        if 'latency' in reports:
+            results['latency'] = latency_over_time(table, flt, bucket)
+        if 'connections' in reports:
+            results['connections'] = connection_churn(table, flt, bucket, args.top)
+        if 'elections' in reports:
+            results['elections'] = election_events(table, flt)
+        elapsed = time.perf_counter() - started
+        
+        if args.json:
+            print(json.dumps(results, indent=2))
+            return
+        formatters = {'summary': format_summary, 'slow': format_slow_ops, 'latency': format_latency,
+                      'connections': format_connections, 'elections': format_elections}
+        print("\n\n".join(formatters[name](results[name]) for name in REPORTS if name in results))
+        print(f"\nQueried {len(table.ops['time'])} slow ops and {len(table.connections['time'])} connection "
+              f"events in {elapsed * 1000:.1f}ms")
+            
+    def run_backup(self, args):
+        import asyncio
+        import ssl
+        from dbprov.backup import (BackupEngine, BackupError, BackupOptions, choose_router, choose_sources, get_codec,
+                                   list_backups, open_target, verify_backup)
+        from dbprov.capacity import CapacityError, parse_size
+        from dbprov.oplog import TailOptions, coverage, format_ts, list_segments, tail_cluster
+        from dbprov.wire import CommandError
+        target = open_target(args.target or str(self.state_dir / "backups" / args.cluster), args.s3_endpoint)
+        try:
+            if args.list:
+                backups = list_backups(target, args.cluster)
+                if not backups:
+                    print(f"No backups of {args.cluster} in {target}")
+                for manifest in backups:
+                    print(f"{manifest.id}  {manifest.started_at[:19]}  {manifest.documents:>10} docs  "
+                          f"{manifest.stored_bytes / 1024 ** 2:>9.1f}MB  {manifest.codec}")
+                for shard, segments in sorted(list_segments(target).items()):
+                    ranges = ", ".join(f"{format_ts(start)} -> {format_ts(end)}" for start, end in coverage(segments))
+                    print(f"oplog {shard}: {len(segments)} segment(s) covering {ranges}")
+                return
+            if args.verify:
+                problems = verify_backup(target, args.verify, deep=args.deep)
+                for problem in problems:
+                    print(f"FAILED: {problem}")
+                if problems:
+                    sys.exit(1)
+                print(f"Backup {args.verify} is intact" + (" (all chunks re-read)" if args.deep else ""))
+                return
+                
+            codec = get_codec(args.compression, args.level)
+            tail_options = TailOptions(
+                segment_size=parse_size(args.segment_size),
+                segment_seconds=args.segment_seconds,
+                timeout=args.timeout,
+            )
+            options = BackupOptions(
+                chunk_size=parse_size(args.chunk_size),
+                node_concurrency=args.node_concurrency,
+                node_rate=parse_size(args.node_rate) if args.node_rate else 0.0,
+                databases=args.db or [],
+                timeout=args.timeout,
+            )
+        except (BackupError, CapacityError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+            
+        nodes = self.cluster_nodes(args.cluster, args.hosts)
+        report = self.probe_cluster(nodes, timeout=args.timeout, tls=args.tls)
+        sources = choose_sources(report)
+        for issue in report.issues:
+            print(f"Warning: {issue}")
+        tls = ssl.create_default_context() if args.tls else None
+        
+        if args.oplog:
+            print(f"Tailing the oplog of {args.cluster} into {target} ({codec.name}, {len(sources)} replica set(s))"
+                  + (f" for {args.duration:.0f}s" if args.duration else "; Ctrl-C to stop"))
+            try:
+                stats = asyncio.run(tail_cluster(target, args.cluster, codec, sources, tail_options, env_credentials(),
+                                                 tls, duration=args.duration, progress=print))
+            except (BackupError, OSError) as e:
+                print(f"Error: Oplog tailing failed: {e}")
+                sys.exit(1)
+            for s in stats:
+                print(f"{s.shard}: {s.entries} entries in {s.segments} segment(s), "
+                      f"{s.raw_bytes / 1024 ** 2:.1f}MB -> {s.stored_bytes / 1024 ** 2:.1f}MB, "
+                      f"up to {format_ts(s.position)}")
+            return
+            
+        router = choose_router(report)
+        if router is None and any(n.node.role == "mongos" for n in report.nodes):
+            print("Error: No reachable mongos to stop the balancer; chunks migrating during the dump would be "
+                  "read twice or missed")
+            sys.exit(1)
+        print(f"Backing up {args.cluster} to {target} ({codec.name}, {len(sources)} replica set(s) in parallel)")
+        engine = BackupEngine(target, codec, options, env_credentials(), tls, progress=print)
+        started = time.monotonic()
+        try:
+            manifest = asyncio.run(engine.run(args.cluster, sources, router))
+        except (BackupError, CommandError, OSError, asyncio.TimeoutError) as e:
+            print(f"Error: Backup failed: {e or type(e).__name__}")
+            sys.exit(1)
+            
+        print("\n" + manifest.format())
+        print(f"\nBackup {manifest.id} completed in {time.monotonic() - started:.1f}s")
+        
+    def run_restore(self, args):
+        import asyncio
+        import ssl
+        from dbprov.backup import BackupError, open_target
+        from dbprov.health import parse_hosts
+        from dbprov.oplog import RestoreEngine, RestoreOptions, format_ts, parse_point_in_time, plan_restore
+        from dbprov.wire import CommandError
+        target = open_target(args.target or str(self.state_dir / "backups" / args.cluster), args.s3_endpoint)
+        try:
+            until = parse_point_in_time(args.point_in_time) if args.point_in_time else None
+            plan = plan_restore(target, args.cluster, args.backup_id, until)
+        except BackupError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(plan.format())
+        if args.dry_run:
+            return
+            
+        if args.to:
+            destination = parse_hosts(args.to)[0]
+        else:
+            report = self.probe_cluster(self.cluster_nodes(args.cluster, args.hosts), timeout=args.timeout,
+                                        tls=args.tls)
+            candidates = [n for n in report.nodes if n.ok and (n.node.role == "mongos" or n.state == "PRIMARY")]
+            candidates.sort(key=lambda n: n.node.role != "mongos")
+            if not candidates:
+                print("Error: No reachable mongos or primary to restore into; use --to host:port")
+                sys.exit(1)
+            destination = candidates[0].node
+        print(f"\nRestoring into {destination.address}" + (" (dropping existing collections)" if args.drop else ""))
+        
+        options = RestoreOptions(
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            drop=args.drop,
+            databases=args.db or [],
+            timeout=args.timeout,
+        )
+        engine = RestoreEngine(target, options, env_credentials(), ssl.create_default_context() if args.tls else None,
+                               progress=print)
+        started = time.monotonic()
+        try:
+            stats = asyncio.run(engine.run(plan, destination.host, destination.port))
+        except (BackupError, CommandError, OSError, asyncio.TimeoutError) as e:
+            print(f"Error: Restore failed: {e or type(e).__name__}")
+            sys.exit(1)
+        print("\n" + stats.format())
+        print(f"\nRestore of {args.cluster} to {format_ts(plan.until) if plan.until else plan.base.id} "
+              f"completed in {time.monotonic() - started:.1f}s")
+        
+    def run_rolling(self, args):
+        import asyncio
+        import ssl
+        from dbprov.rolling import (RollingError, RollingOperation, RollingOptions, plan_rolling, read_versions,
+                                    simulate, upgrade_problem)
+        from dbprov.wire import CommandError, ConnectionPool
+        options = RollingOptions(
+            blast_radius=args.blast_radius,
+            max_lag=args.max_lag,
+            step_timeout=args.step_timeout,
+            poll_interval=args.poll_interval,
+            include_routers=not args.skip_routers,
+            timeout=args.timeout,
+        )
+        if args.simulate:
+            options.poll_interval = min(options.poll_interval, 0.2)
+            print(f"Simulating a rolling restart: config servers, {args.fake_shards} shard(s), "
+                  f"{args.blast_radius} at a time")
+            report = asyncio.run(simulate(options, args.fake_shards, downtime=args.fake_downtime, progress=print))
+            print("\n" + report.format())
+            if not report.ok:
+                sys.exit(1)
+            return
+            
+        nodes = self.cluster_nodes(args.cluster, args.hosts)
+        health = self.probe_cluster(nodes, timeout=args.timeout, tls=args.tls)
+        if not health.healthy and not args.force:
+            for issue in health.issues:
+                print(f"Error: {issue}")
+            print("Error: The cluster must be healthy before a rolling operation (use --force to start anyway)")
+            sys.exit(1)
+        try:
+            plan = plan_rolling(health, options.include_routers)
+        except RollingError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Rolling {args.operation} of {args.cluster}: {len(plan.steps)} nodes, "
+              f"up to {args.blast_radius} shard(s) at a time")
+        print(plan.format())
+        
+        action, finish = self.rolling_action(args)
+        
+        def connection_pool():
+            return ConnectionPool(max_per_host=2, connect_timeout=args.timeout,
+                                  tls=ssl.create_default_context() if args.tls else None,
+                                  credentials=env_credentials())
+        
+        if args.operation == 'upgrade':
+            # What the nodes run decides, not the version the group vars last recorded
+            async def versions():
+                pool = connection_pool()
+                try:
+                    return await read_versions(pool, health)
+                finally:
+                    await pool.close()
+                    
+            try:
+                problem = upgrade_problem(args.mongodb_version, *asyncio.run(versions()))
+            except (CommandError, KeyError, OSError, asyncio.TimeoutError) as e:
+                problem = f"Cannot read the running versions: {e or type(e).__name__}"
+            if problem:
+                print(f"Error: {problem}")
+                sys.exit(1)
+        if args.dry_run:
+            return
+        pool = connection_pool()
+        operation = RollingOperation(action, options, pool, progress=print)
+        
+        async def run():
+            try:
+                return await operation.run(args.operation, plan)
+            finally:
+                await operation.close()
+                
+        self.command_timeout = args.step_timeout
+        report = asyncio.run(run())
+        print("\n" + report.format())
+        if not report.ok:
+            print("Error: Rolling operation stopped; fix the failed node and run it again, "
+                  "nodes already done are quick to redo")
+            sys.exit(1)
+        finish()
+        print(f"Rolling {args.operation} of {args.cluster} completed")
+        
+    def rolling_action(self, args):
+        """The per-node action of a rolling operation and what to record once every node has it."""
+        import asyncio
+        import tempfile
+        import yaml
+        from dbprov.health import INVENTORY_FILES
+        from dbprov.rolling import RollingError, instance_address
+        vars_file = self.inventory_root / f"group_vars/{args.cluster}.yml"
+        cluster_vars = yaml.safe_load(vars_file.read_text()) if vars_file.exists() else {}
+        cluster_vars = cluster_vars or {}
+        
+        if args.operation == 'resize':
+            if not args.instance_type:
+                print("Error: resize needs --instance-type")
+                sys.exit(1)
+            tfvars = self.terraform_dir / f"{args.cluster}.tfvars"
+            if not tfvars.exists():
+                print(f"Error: Terraform vars file not found: {tfvars}")
+                sys.exit(1)
+            updated = set_tfvar(tfvars.read_text(), "instance_type", args.instance_type)
+            # Shards in the blast radius resize concurrently, but they share one Terraform state
+            state_lock = None
+            
+            async def resize(node: Node):
+                nonlocal state_lock
+                if not node.name:
+                    raise RollingError(f"{node.address} is not in the inventory, cannot resize it")
+                if state_lock is None:
+                    state_lock = asyncio.Lock()
+                # The cluster's own tfvars keep the old type until every node is resized, so a
+                # full apply in between does not resize the rest at once
+                with tempfile.NamedTemporaryFile("w", dir=self.terraform_dir, prefix=f"{args.cluster}-resize-",
+                                                 suffix=".tfvars") as apply_vars:
+                    apply_vars.write(updated)
+                    apply_vars.flush()
+                    async with state_lock:
+                        await self.run_terraform_async("apply", apply_vars.name,
+                                                       targets=[instance_address(node.name)])
+                    
+            def finish():
+                tfvars.write_text(updated)
+                self.terraform_cache.forget(f"apply:{args.cluster}")
+                
+            return resize, finish
+            
+        rolling_vars = dict(cluster_vars, rolling_operation=args.operation)
+        if args.operation == 'upgrade':
+            if not args.mongodb_version:
+                print("Error: upgrade needs --mongodb-version")
+                sys.exit(1)
+            rolling_vars["mongodb_version"] = args.mongodb_version
+        elif args.operation == 'config':
+            args.mongodb_version = str(cluster_vars.get("mongodb_version", "8.0"))
+            args.tuning_profile = args.tuning_profile or cluster_vars.get("tuning_profile")
+            args.instance_type = None
+            rolling_vars["tuning_profile"] = args.tuning_profile
+            rolling_vars["mongod_tuning"] = self.resolve_tuning(args)
+            
+        rolling_file = self.inventory_root / "rolling" / f"{args.cluster}.yml"
+        inventories = self.inventory_root / "inventories"
+        own_inventory = f"{args.cluster}.ini"
+        written = False
+        
+        async def apply(node: Node):
+            nonlocal written
+            # Written when the first node is rolled, so a dry run leaves the inventory untouched
+            if not written:
+                written = True
+                rolling_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(rolling_file, 'w') as f:
+                    yaml.dump(rolling_vars, f)
+            inventory = own_inventory if (inventories / own_inventory).exists() else INVENTORY_FILES[node.role]
+            await self.run_ansible_async("rolling-node.yml", inventory, str(rolling_file), node.name or node.host)
+            
+        def finish():
+            if args.operation != 'restart':
+                rolling_vars.pop("rolling_operation")
+                with open(vars_file, 'w') as f:
+                    yaml.dump(rolling_vars, f)
+            if written:
+                rolling_file.unlink()
+            
+        return apply, finish
+        
+    def run_scale(self, args):
+        import asyncio
+        from dbprov.scale import (BalancerSettings, ScaleError, ScaleOptions, new_instance_targets, parse_members,
+                                  parse_window, router_instance_names, shard_instance_names, simulate as simulate_scale)
+        options = ScaleOptions(
+            max_lag=args.max_lag,
+            sync_timeout=args.sync_timeout,
+            poll_interval=args.poll_interval,
+            timeout=args.timeout,
+            settle=args.settle,
+            watch_timeout=args.watch_timeout,
+        )
+        try:
+            balancer = BalancerSettings(
+                window=parse_window(args.balancer_window) if args.balancer_window else None,
+                secondary_throttle=args.secondary_throttle,
+                wait_for_delete=args.wait_for_delete,
+                enabled=None if args.balancer is None else args.balancer == 'on',
+            )
+            new_members = parse_members(args.add_member or [])
+        except ScaleError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+            
+        if args.simulate:
+            shards = args.shards or args.fake_shards + 1
+            options.poll_interval = min(options.poll_interval, 0.5)
+            options.settle = min(options.settle, 5.0)
+            print(f"Simulating a scale-out from {args.fake_shards} to {shards} shard(s) with {args.fake_chunks} chunks"
+                  + (f" and {args.fake_members} new member(s) on shard1" if args.fake_members else ""))
+            result = asyncio.run(simulate_scale(options, balancer, args.fake_shards, shards - args.fake_shards,
+                                                args.fake_members, args.fake_chunks, progress=print))
+            print(f"\nBalanced {sum(result.shards.values())} chunks over {len(result.shards)} shards "
+                  f"in {result.seconds:.1f}s")
+            return
+            
+        nodes = self.cluster_nodes(args.cluster, args.hosts)
+        health = self.probe_cluster(nodes, timeout=args.timeout, tls=args.tls)
+        if not health.healthy and not args.force:
+            for issue in health.issues:
+                print(f"Error: {issue}")
+            print("Error: The cluster must be healthy before scaling out (use --force to start anyway)")
+            sys.exit(1)
+        routers = [n.node for n in health.nodes if n.ok and n.state == "MONGOS"]
+        for set_name in new_members:
+            if set_name not in health.replica_sets:
+                print(f"Error: Replica set {set_name} not found in {args.cluster}")
+                sys.exit(1)
+        if (args.shards or balancer.changed or args.watch) and not routers:
+            print("Error: No reachable mongos; scaling shards and the balancer go through one")
+            sys.exit(1)
+            
+        tfvars = self.terraform_dir / f"{args.cluster}.tfvars"
+        current = read_tfvars(tfvars.read_text()) if tfvars.exists() else {}
+        joined = asyncio.run(self.list_shards(routers[0], args.tls)) if args.shards else []
+        new_shards = [i for i in range(1, (args.shards or 0) + 1) if f"shard{i}" not in joined]
+        known_routers = max(int(current.get("mongos_count", 0)), sum(n.role == "mongos" for n in nodes))
+        new_routers = router_instance_names(known_routers, args.mongos or 0)
+        if args.shards and args.shards < len(joined):
+            print(f"Error: {args.cluster} already has {len(joined)} shards; removing shards (removeShard drains "
+                  f"them first) is not done by scale")
+            sys.exit(1)
+        if (new_shards or new_routers) and current.get("cluster_type") != ClusterType.SHARDED.value:
+            print(f"Error: Adding shards or mongos needs the Terraform vars of a sharded cluster: {tfvars}")
+            sys.exit(1)
+        if not (new_shards or new_routers or new_members or balancer.changed or args.watch):
+            if args.shards or args.mongos:
+                print(f"{args.cluster} already has {len(joined) or current.get('shard_count', '?')} shards and "
+                      f"{known_routers} mongos, nothing to add")
+                return
+            print("Error: Nothing to do; give --shards, --mongos, --add-member, balancer settings or --watch")
+            sys.exit(1)
+            
+        targets = new_instance_targets(min(new_shards, default=1) - 1, max(new_shards, default=0),
+                                       known_routers, args.mongos or 0) if new_shards or new_routers else []
+        print(f"Scaling {args.cluster}:")
+        for i in new_shards:
+            print(f"  + shard{i}: {', '.join(shard_instance_names(i))}")
+        if new_routers:
+            print(f"  + mongos: {', '.join(new_routers)}")
+        for set_name, members in new_members.items():
+            print(f"  + {set_name} members: {', '.join(n.address for n in members)}")
+        if balancer.changed:
+            print(f"  balancer settings: {balancer.format()}")
+        for target in targets:
+            print(f"  terraform -target={target}")
+        if args.dry_run:
+            return
+            
+        self.command_timeout = args.command_timeout
+        if new_shards or new_routers or new_members or balancer.changed:
+            report = asyncio.run(self.scale_out_async(args, routers[0] if routers else None, health, new_shards,
+                                                      new_routers, new_members, balancer, targets, options))
+            print("\n" + report.format())
+            if not report.ok:
+                for failure in report.failures:
+                    print(f"Scaling failed in phase {failure.name}: {failure.error}")
+                sys.exit(1)
+        if (new_shards or args.watch) and not args.no_wait:
+            print("\nFollowing chunk migrations" + (f" for up to {args.watch_timeout:.0f}s" if args.watch_timeout
+                                                    else " until balanced; Ctrl-C stops watching, not balancing"))
+            progress = asyncio.run(self.watch_balancing(args, routers[0], options))
+            if progress.balanced:
+                print("Chunks are balanced across all shards")
+            else:
+                print(f"Still balancing; follow it with: dbprovision scale --cluster {args.cluster} --watch")
+        print(f"Scaling {args.cluster} completed")
+        
+    def scale_pool(self, args) -> ConnectionPool:
+        import ssl
+        from dbprov.wire import ConnectionPool
+        return ConnectionPool(max_per_host=2, connect_timeout=args.timeout,
+                              tls=ssl.create_default_context() if args.tls else None, credentials=env_credentials())
+        
+    async def list_shards(self, router: Node, tls: bool = False) -> List[str]:
+        import ssl
+        from dbprov.wire import ConnectionPool
+        pool = ConnectionPool(max_per_host=1, tls=ssl.create_default_context() if tls else None,
+                              credentials=env_credentials())
+        try:
+            async with pool.acquire(router.host, router.port) as conn:
+                reply = await conn.command("admin", {"listShards": 1})
+        finally:
+            await pool.close()
+        return [shard["_id"] for shard in reply.get("shards", [])]
+        
+    async def scale_out_async(self, args, router: Optional[Node], health: ClusterHealth, new_shards: List[int],
+                              new_routers: List[str], new_members: Dict[str, List[Node]],
+                              balancer: BalancerSettings, targets: List[str], options: ScaleOptions):
+        from dbprov.scale import ScaleOperation
+        from dbprov.scheduler import PhaseScheduler
+        operation = ScaleOperation(options, self.scale_pool(args), progress=print)
+        try:
+            scheduler = PhaseScheduler(max_workers=args.max_parallel, listener=self.report_phase)
+            self.add_scale_phases(scheduler, args, operation, router, health, new_shards, new_routers,
+                                  new_members, balancer, targets)
+            print(f"Running {len(scheduler.phases)} scaling phases (max {args.max_parallel} in parallel)...")
+            return await scheduler.run_async()
+        finally:
+            await operation.close()
+            
+    async def watch_balancing(self, args, router: Node, options: ScaleOptions):
+        from dbprov.scale import ScaleOperation
+        operation = ScaleOperation(options, self.scale_pool(args), progress=print)
+        try:
+            return await operation.watch(router)
+        finally:
+            await operation.close()
+            
+    def add_scale_phases(self, scheduler: PhaseScheduler, args, operation: ScaleOperation, router: Optional[Node],
+                         health: ClusterHealth, new_shards: List[int], new_routers: List[str],
+                         new_members: Dict[str, List[Node]], balancer: BalancerSettings, targets: List[str]):
+        from dbprov.health import INVENTORY_FILES
+        from dbprov.scale import (SHARD_PORT, ScaleError, add_inventory_hosts, instances_from_outputs,
+                                  shard_instance_names)
+        balancer_phase = []
+        if balancer.changed:
+            # Throttle migrations before new shards give the balancer work
+            balancer_phase = [scheduler.add("configure-balancer",
+                                            functools.partial(operation.configure_balancer, router, balancer))]
+        for set_name, members in new_members.items():
+            current = [n.node for n in health.nodes if n.set_name == set_name]
+            scheduler.add(f"add-members-{set_name}", functools.partial(operation.add_members, set_name, current, members))
+        if not targets:
+            return
+            
+        tfvars = self.terraform_dir / f"{args.cluster}.tfvars"
+        inventories = self.inventory_root / "inventories"
+        vars_file = self.inventory_root / f"group_vars/{args.cluster}.yml"
+        vars_file = str(vars_file) if vars_file.exists() else None
+        shard_addresses: Dict[int, List[str]] = {}
+        
+        async def provision():
+            text = tfvars.read_text()
+            current = read_tfvars(text)
+            if new_shards:
+                text = set_tfvar(text, "shard_count", max(int(current.get("shard_count", 0)), max(new_shards)))
+            if new_routers:
+                text = set_tfvar(text, "mongos_count", max(int(current.get("mongos_count", 0)), args.mongos))
+            # The new counts stay even if a later phase fails: a full apply with the old ones
+            # would destroy the instances created here
+            tfvars.write_text(text)
+            result = await self.run_terraform_async("apply", str(tfvars), targets=targets)
+            self.terraform_cache.forget(f"apply:{args.cluster}")
+            return result
+            
+        async def update_inventory():
+            result = await self.run_terraform_async("output")
+            try:
+                outputs = json.loads(result.stdout)
+                shard_hosts = instances_from_outputs(outputs, "shard_servers") if new_shards else {}
+                router_hosts = instances_from_outputs(outputs, "mongo_routers") if new_routers else {}
+            except ValueError as e:
+                raise ScaleError(f"Cannot parse terraform output: {e}")
+            for i in new_shards:
+                names = shard_instance_names(i)
+                missing = [name for name in names if name not in shard_hosts]
+                if missing:
+                    raise ScaleError(f"Terraform output has no {', '.join(missing)}")
+                add_inventory_hosts(inventories / INVENTORY_FILES["mongod"], f"shard{i}",
+                                    [(name, shard_hosts[name]) for name in names])
+                shard_addresses[i] = [f"{shard_hosts[name]['internal_ip']}:{SHARD_PORT}" for name in names]
+            missing = [name for name in new_routers if name not in router_hosts]
+            if missing:
+                raise ScaleError(f"Terraform output has no {', '.join(missing)}")
+            add_inventory_hosts(inventories / INVENTORY_FILES["mongos"], "mongos",
+                                [(name, router_hosts[name]) for name in new_routers])
+            return result
+            
+        def playbook(name: str, inventory: str, limit: str):
+            return functools.partial(self.run_ansible_async, name, inventory, vars_file, limit)
+            
+        async def add_shard(i: int):
+            await operation.add_shard(router, f"shard{i}", shard_addresses[i])
+            
+        init = scheduler.add("terraform-init", functools.partial(self.terraform_init_phase, False))
+        infra = scheduler.add("terraform-apply", provision, [init])
+        inventory = scheduler.add("update-inventory", update_inventory, [infra])
+        if new_shards:
+            deploy = scheduler.add("deploy-shard-servers",
+                                   playbook("deploy-shard-servers.yml", INVENTORY_FILES["mongod"],
+                                            ",".join(f"shard{i}" for i in new_shards)), [inventory])
+            for i in new_shards:
+                rs = scheduler.add(f"init-shard-replica-set-{i}",
+                                   playbook("init-shard-replica-sets.yml", INVENTORY_FILES["mongod"], f"shard{i}"),
+                                   [deploy])
+                scheduler.add(f"add-shard-{i}", functools.partial(add_shard, i), [rs] + balancer_phase)
+        if new_routers:
+            scheduler.add("deploy-mongos", playbook("deploy-mongos.yml", INVENTORY_FILES["mongos"],
+                                                    ",".join(new_routers)), [inventory])
+            
     def destroy_cluster(self, cluster_name: str):
+        from dbprov.fleet import FleetState
         print(f"Destroying cluster: {cluster_name}")
         
         terraform_vars_file = self.terraform_dir / f"{cluster_name}.tfvars"
@@ -257,34 +1500,81 @@ class DBProvision:
         
         if confirm.lower() == 'yes':
             self.run_terraform("destroy", str(terraform_vars_file))
+            self.terraform_cache.forget(f"apply:{cluster_name}")
             terraform_vars_file.unlink()
+            FleetState(self.state_dir).forget(cluster_name)
             print("Cluster destroyed successfully!")
         else:
             print("Destruction cancelled.")
 
-def create_parser():
-    parser = argparse.ArgumentParser(
-        description="MongoDB Cluster Provisioning CLI",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  # Create a 3-node replica set
-  dbprovision create --cluster-type replicaset --replica-nodes 3 --project-id my-project
+def fleet_cluster_args(spec, max_parallel: int, force_terraform: bool = False):
+    """Parse a fleet cluster's options exactly like ``dbprovision create`` arguments."""
+    from dbprov.fleet import FleetError
+    argv = ["create", "--max-parallel", str(max_parallel)] + spec.argv()
+    if force_terraform:
+        argv.append("--force-terraform")
+    stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    try:
+        return create_parser(argv).parse_args(argv)
+    except SystemExit:
+        message = sys.stderr.getvalue().strip().splitlines()
+        raise FleetError(message[-1].split("error: ", 1)[-1] if message else "invalid options")
+    finally:
+        sys.stderr = stderr
 
-  # Create a sharded cluster with 3 shards
-  dbprovision create --cluster-type sharded --shards 3 --project-id my-project
+def env_credentials() -> Optional[Credentials]:
+    from dbprov.wire import Credentials
+    if not os.environ.get("MONGODB_USERNAME"):
+        return None
+    return Credentials(os.environ["MONGODB_USERNAME"], os.environ.get("MONGODB_PASSWORD", ""))
 
-  # Check cluster status
-  dbprovision status --cluster my-cluster
+def read_tfvars(text: str) -> Dict:
+    """Values of a file written by ``render_tfvars``."""
+    values = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        try:
+            values[key.strip()] = json.loads(value.strip())
+        except ValueError:
+            values[key.strip()] = value.strip()
+    return values
 
-  # Destroy cluster
-  dbprovision destroy --cluster my-cluster
-        """
-    )
-    
-    subparsers = parser.add_subparsers(dest='command', help='Available commands')
-    
-    create_parser = subparsers.add_parser('create', help='Create a new MongoDB cluster')
+def set_tfvar(text: str, key: str, value) -> str:
+    """Replace (or append) one ``key = value`` line of a file written by ``render_tfvars``."""
+    line = render_tfvars({key: value}).rstrip("\n")
+    lines = text.splitlines()
+    for i, existing in enumerate(lines):
+        if existing.split("=", 1)[0].strip() == key:
+            lines[i] = line
+            break
+    else:
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def render_tfvars(values: Dict) -> str:
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            lines.append(f'{key} = {str(value).lower()}')
+        elif isinstance(value, str):
+            lines.append(f'{key} = "{value}"')
+        elif isinstance(value, list):
+            lines.append(f'{key} = {json.dumps(value)}')
+        else:
+            lines.append(f'{key} = {value}')
+    return "\n".join(lines) + "\n"
+
+def add_probe_arguments(parser):
+    parser.add_argument('--hosts', type=str, help='Comma-separated host:port list (default: from Ansible inventory)')
+    parser.add_argument('--timeout', type=float, default=3.0, help='Per-node timeout in seconds')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum nodes probed at the same time')
+    parser.add_argument('--tls', action='store_true', help='Connect to nodes with TLS')
+
+def add_create_arguments(create_parser):
+    from dbprov.tuning import PROFILES
     create_parser.add_argument('--cluster-name', type=str, help='Cluster name')
     create_parser.add_argument('--cluster-type', choices=[e.value for e in ClusterType], 
                               default=ClusterType.REPLICASET.value, help='Cluster type')
@@ -315,6 +1605,10 @@ Examples:
                               default=StorageEngine.WIRED_TIGER.value, help='Storage engine')
     create_parser.add_argument('--cache-size', type=str, help='WiredTiger cache size (e.g., 1GB)')
     create_parser.add_argument('--oplog-size', type=str, help='Oplog size (e.g., 1024MB)')
+    create_parser.add_argument('--tuning-profile', choices=list(PROFILES), default='default',
+                              help='mongod tuning profile rendered into mongod.conf')
+    create_parser.add_argument('--tuning-set', action='append', metavar='KEY=VALUE',
+                              help='Override one tuning key (repeatable, see: dbprovision tuning)')
     
     create_parser.add_argument('--enable-auth', action='store_true', default=True, help='Enable authentication')
     create_parser.add_argument('--enable-tls', action='store_true', help='Enable TLS encryption')
@@ -326,16 +1620,328 @@ Examples:
     create_parser.add_argument('--backup-enabled', action='store_true', help='Enable automatic backup')
     create_parser.add_argument('--backup-schedule', type=str, default='0 2 * * *', help='Backup schedule (cron format)')
     
-    status_parser = subparsers.add_parser('status', help='Show cluster status')
+    create_parser.add_argument('--max-parallel', type=int, default=4, help='Maximum deployment phases run in parallel')
+    create_parser.add_argument('--force-terraform', action='store_true',
+                              help='Run terraform init/plan/apply even if inputs are unchanged')
+    create_parser.add_argument('--command-timeout', type=int, help='Kill a terraform/ansible command after this many seconds')
+    create_parser.add_argument('--capacity-plan', type=str,
+                              help='Size the cluster from a plan saved by plan-capacity --output')
+    create_parser.add_argument('--dry-run', action='store_true',
+                              help='Only print the tfvars, group_vars and phase schedule; nothing is written or run')
+    create_parser.add_argument('--workspace', action='store_true',
+                              help='Run in the cluster\'s own workspace (terraform state, inventories) as apply does, '
+                                   'so concurrent creates never share a terraform state')
+
+def add_plan_capacity_arguments(capacity_parser):
+    capacity_parser.add_argument('--working-set', type=str, required=True, help='Hot data and indexes to keep in cache (e.g., 200GB)')
+    capacity_parser.add_argument('--data-size', type=str, help='Total data size (default: working set)')
+    capacity_parser.add_argument('--write-rate', type=str, default='0', help='Oplog write volume at peak (e.g., 5MB/s)')
+    capacity_parser.add_argument('--oplog-window', type=float, default=24.0, help='Hours of writes the oplog must hold')
+    capacity_parser.add_argument('--peak-ops', type=int, default=0, help='Peak operations per second')
+    capacity_parser.add_argument('--cluster-type', choices=[ClusterType.REPLICASET.value, ClusterType.SHARDED.value],
+                                help='Cluster type (default: cheapest that fits)')
+    capacity_parser.add_argument('--replica-nodes', type=int, default=3, help='Nodes per replica set')
+    capacity_parser.add_argument('--max-shards', type=int, default=10, help='Largest shard count to consider')
+    capacity_parser.add_argument('--headroom', type=float, default=0.3, help='Spare capacity on top of targets (0.3 = 30%%)')
+    capacity_parser.add_argument('--output', type=str, help='Save the plan as JSON for create --capacity-plan')
+    capacity_parser.add_argument('--json', action='store_true', help='Print the plan as JSON')
+
+def add_tuning_arguments(tuning_parser):
+    from dbprov.tuning import PROFILES
+    tuning_parser.add_argument('--profile', choices=list(PROFILES), help='Profile to render (default: list profiles)')
+    tuning_parser.add_argument('--tuning-set', action='append', metavar='KEY=VALUE', help='Override one tuning key')
+    tuning_parser.add_argument('--cache-size', type=str, help='WiredTiger cache size (e.g., 1GB)')
+    tuning_parser.add_argument('--oplog-size', type=str, help='Oplog size (e.g., 1024MB)')
+    tuning_parser.add_argument('--mongodb-version', choices=[e.value for e in MongoDBVersion],
+                              default=MongoDBVersion.V8_0.value, help='MongoDB version')
+    tuning_parser.add_argument('--instance-type', type=str, help='VM instance type, checks the cache fits')
+    tuning_parser.add_argument('--memory-gb', type=float, help='Node memory used to resolve cache_ratio')
+    tuning_parser.add_argument('--replica-set-name', type=str, default='rs0', help='Replica set name')
+
+def add_status_arguments(status_parser):
     status_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
-    
-    health_parser = subparsers.add_parser('health', help='Health check for cluster')
+    add_probe_arguments(status_parser)
+
+def add_health_arguments(health_parser):
     health_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
     health_parser.add_argument('--check-all', action='store_true', help='Check all components')
-    
-    destroy_parser = subparsers.add_parser('destroy', help='Destroy a cluster')
+    add_probe_arguments(health_parser)
+
+def add_endpoints_arguments(endpoints_parser):
+    endpoints_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
+    endpoints_parser.add_argument('--refresh', action='store_true', help='Re-read terraform outputs instead of the cache')
+    endpoints_parser.add_argument('--max-age', type=float, default=300.0,
+                                  help='Seconds a cached topology stays valid without a local terraform state')
+    endpoints_parser.add_argument('--external', action='store_true', help='Use external IPs (connecting from outside the VPC)')
+    endpoints_parser.add_argument('--srv-domain', type=str,
+                                  help='DNS domain for a mongodb+srv:// seed list; prints the records to create')
+    endpoints_parser.add_argument('--app-instances', type=int, default=10,
+                                  help='Application processes sharing the connections, for maxPoolSize')
+    endpoints_parser.add_argument('--max-staleness', type=int, default=90,
+                                  help='maxStalenessSeconds of the read-mostly profile (90 or more)')
+    endpoints_parser.add_argument('--json', action='store_true', help='Print the discovery as JSON')
+    add_probe_arguments(endpoints_parser)
+
+def add_bench_arguments(bench_parser):
+    from dbprov.bench import WORKLOADS
+    bench_parser.add_argument('--cluster', type=str, help='Cluster name (targets its mongos, or the replica set primary)')
+    bench_parser.add_argument('--hosts', type=str, help='Comma-separated host:port list instead of the inventory')
+    bench_parser.add_argument('--workload', choices=list(WORKLOADS), default='a',
+                              help='YCSB core workload: a=50/50 read/update, b=95/5, c=read only, '
+                                   'd=read latest, e=short scans')
+    bench_parser.add_argument('--read', type=float, help='Read proportion (any of --read/--update/--insert/--scan '
+                                                          'replaces the workload mix)')
+    bench_parser.add_argument('--update', type=float, help='Update proportion')
+    bench_parser.add_argument('--insert', type=float, help='Insert proportion')
+    bench_parser.add_argument('--scan', type=float, help='Scan proportion')
+    bench_parser.add_argument('--distribution', choices=['uniform', 'zipfian', 'latest'], help='Key distribution')
+    bench_parser.add_argument('--records', type=int, default=10000, help='Documents loaded before the run')
+    bench_parser.add_argument('--operations', type=int, default=0, help='Stop after this many operations (default: use --duration)')
+    bench_parser.add_argument('--duration', type=float, default=30.0, help='Run time in seconds')
+    bench_parser.add_argument('--clients', type=int, default=16, help='Concurrent clients, one connection each')
+    bench_parser.add_argument('--processes', type=int, default=1, help='Worker processes the clients are spread over')
+    bench_parser.add_argument('--document-size', type=int, default=1000, help='Approximate document size in bytes')
+    bench_parser.add_argument('--fields', type=int, default=10, help='Fields per document')
+    bench_parser.add_argument('--scan-length', type=int, default=100, help='Maximum documents per scan')
+    bench_parser.add_argument('--no-load', action='store_true', help='Reuse data from a previous run')
+    bench_parser.add_argument('--database', type=str, default='dbprovision_bench', help='Benchmark database')
+    bench_parser.add_argument('--collection', type=str, default='usertable', help='Benchmark collection')
+    bench_parser.add_argument('--tls', action='store_true', help='Connect with TLS')
+    bench_parser.add_argument('--timeout', type=float, default=10.0, help='Per-operation timeout in seconds')
+    bench_parser.add_argument('--label', type=str, help='Run name, e.g. the tuning profile under test')
+    bench_parser.add_argument('--output', type=str, help='Result JSON path (default: ~/.dbprovision/bench/)')
+    bench_parser.add_argument('--target-p99-ms', type=float, help='Fail if overall p99 latency exceeds this')
+    bench_parser.add_argument('--target-ops', type=float, help='Fail if throughput is below this many ops/s')
+    bench_parser.add_argument('--fake', action='store_true', help='Run against an in-memory stand-in (CI smoke test)')
+    bench_parser.add_argument('--fake-shards', type=int, default=0, help='Stand-in mongos with this many fake shards')
+    bench_parser.add_argument('--compare', nargs='+', metavar='RESULT', help='Compare saved result files instead of running')
+
+def add_advise_arguments(advise_parser):
+    from dbprov.advisor import FINDINGS
+    advise_parser.add_argument('--cluster', type=str, help='Cluster to sample live (system.profile and $currentOp)')
+    advise_parser.add_argument('--input', nargs='+', metavar='FILE',
+                               help='Analyze captured files instead: JSON logs, profiler exports or --capture output')
+    advise_parser.add_argument('--catalog', type=str,
+                               help='JSON of {"db.coll": {"shardKey": {...}, "indexes": [{...}]}} for offline runs')
+    advise_parser.add_argument('--duration', type=float, default=30.0, help='Seconds to poll $currentOp when sampling live')
+    advise_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between $currentOp polls')
+    advise_parser.add_argument('--slowms', type=int,
+                               help='Turn on the profiler at this threshold while sampling, then restore it')
+    advise_parser.add_argument('--capture', type=str, help='Save the live sample here to re-analyze offline')
+    advise_parser.add_argument('--examine-ratio', type=float, default=10.0,
+                               help='Documents examined per document returned before an index is advised')
+    advise_parser.add_argument('--min-count', type=int, default=1, help='Operations a query shape needs to get advice')
+    advise_parser.add_argument('--min-cardinality', type=int, default=100,
+                               help='Distinct sampled values a shard key needs')
+    advise_parser.add_argument('--max-frequency', type=float, default=0.2,
+                               help='Largest share of operations one shard key value may have')
+    advise_parser.add_argument('--min-coverage', type=float, default=0.5,
+                               help='Share of operations the current shard key should route to specific shards')
+    advise_parser.add_argument('--top', type=int, default=10, help='Shapes, indexes and scatter-gather queries to list')
+    advise_parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    advise_parser.add_argument('--fail-on', nargs='+', choices=FINDINGS, metavar='KIND',
+                               help=f'Exit 1 if the report has findings of these kinds ({", ".join(FINDINGS)})')
+    add_probe_arguments(advise_parser)
+
+def add_logs_arguments(logs_parser):
+    from dbprov.logs import REPORTS
+    logs_subparsers = logs_parser.add_subparsers(dest='logs_command', required=True)
+    analyze_parser = logs_subparsers.add_parser(
+        'analyze', help='Slow ops, latency, connection churn and elections from logs, via a columnar cache')
+    analyze_parser.add_argument('files', nargs='+', metavar='LOG', help='mongod/mongos JSON log files (.gz too)')
+    analyze_parser.add_argument('--report', nargs='+', choices=REPORTS + ('all',), default=['summary', 'slow'],
+                                help='Reports to print (default: summary slow)')
+    analyze_parser.add_argument('--namespace', type=str, help='Only slow ops on matching namespaces, e.g. "shop.*"')
+    analyze_parser.add_argument('--min-ms', type=float, default=0.0, help='Only slow ops at least this slow')
+    analyze_parser.add_argument('--since', type=str, help='Only entries at or after this ISO-8601 time')
+    analyze_parser.add_argument('--until', type=str, help='Only entries before this ISO-8601 time')
+    analyze_parser.add_argument('--bucket', type=str, help='Time bucket width, e.g. 5m or 1h (default: about 24 buckets)')
+    analyze_parser.add_argument('--top', type=int, default=10, help='Namespaces and clients to list')
+    analyze_parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+    analyze_parser.add_argument('--cache-dir', type=str, help='Columnar cache directory (default: ~/.dbprovision/log-cache)')
+    analyze_parser.add_argument('--rebuild', action='store_true', help='Parse the logs again even if cached')
+
+def add_backup_arguments(backup_parser):
+    backup_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
+    backup_parser.add_argument('--hosts', type=str, help='Comma-separated host:port list (default: from Ansible inventory)')
+    backup_parser.add_argument('--target', type=str, help='Directory or s3://bucket/prefix (default: ~/.dbprovision/backups/<cluster>)')
+    backup_parser.add_argument('--s3-endpoint', type=str, help='S3-compatible endpoint URL (default: $S3_ENDPOINT_URL or AWS)')
+    backup_parser.add_argument('--compression', choices=['zstd', 'zlib', 'none'], help='Chunk compression (default: zstd if installed)')
+    backup_parser.add_argument('--level', type=int, help='Compression level')
+    backup_parser.add_argument('--chunk-size', type=str, default='16MB', help='Uncompressed bytes per chunk')
+    backup_parser.add_argument('--node-concurrency', type=int, default=2, help='Collections read at the same time per node')
+    backup_parser.add_argument('--node-rate', type=str, help='Read throttle per node (e.g., 50MB/s)')
+    backup_parser.add_argument('--db', action='append', help='Only back up this database (repeatable)')
+    backup_parser.add_argument('--list', action='store_true', help='List backups in the target')
+    backup_parser.add_argument('--verify', type=str, metavar='BACKUP_ID', help='Check a backup against its manifest')
+    backup_parser.add_argument('--deep', action='store_true', help='With --verify, also re-read and hash every chunk')
+    backup_parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    backup_parser.add_argument('--tls', action='store_true', help='Connect to nodes with TLS')
+    backup_parser.add_argument('--oplog', action='store_true', help='Tail the oplog of every shard into segments (incremental)')
+    backup_parser.add_argument('--segment-size', type=str, default='16MB', help='With --oplog, uncompressed bytes per segment')
+    backup_parser.add_argument('--segment-seconds', type=float, default=60.0, help='With --oplog, close a segment after this long')
+    backup_parser.add_argument('--duration', type=float, default=0.0, help='With --oplog, stop after this many seconds (default: until Ctrl-C)')
+
+def add_restore_arguments(restore_parser):
+    restore_parser.add_argument('--cluster', type=str, required=True, help='Cluster the backup was taken from')
+    restore_parser.add_argument('--backup-id', type=str, help='Base backup (default: newest one consistent before --point-in-time)')
+    restore_parser.add_argument('--point-in-time', type=str, help='Replay the oplog up to this time (ISO 8601 UTC or Unix seconds)')
+    restore_parser.add_argument('--target', type=str, help='Directory or s3://bucket/prefix (default: ~/.dbprovision/backups/<cluster>)')
+    restore_parser.add_argument('--s3-endpoint', type=str, help='S3-compatible endpoint URL (default: $S3_ENDPOINT_URL or AWS)')
+    restore_parser.add_argument('--to', type=str, help='mongos or primary to restore into (default: from the cluster inventory)')
+    restore_parser.add_argument('--hosts', type=str, help='Comma-separated host:port list to look for a mongos or primary')
+    restore_parser.add_argument('--drop', action='store_true', help='Drop each collection before loading it')
+    restore_parser.add_argument('--db', action='append', help='Only restore this database (repeatable)')
+    restore_parser.add_argument('--concurrency', type=int, default=8, help='Collections loaded and namespaces replayed at the same time')
+    restore_parser.add_argument('--batch-size', type=int, default=1000, help='Documents or oplog entries per write command')
+    restore_parser.add_argument('--dry-run', action='store_true', help='Only show the base backup and oplog segments that would be used')
+    restore_parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    restore_parser.add_argument('--tls', action='store_true', help='Connect with TLS')
+
+def add_rolling_arguments(rolling_parser):
+    from dbprov.tuning import PROFILES
+    rolling_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
+    rolling_parser.add_argument('--operation', choices=['restart', 'upgrade', 'config', 'resize'], default='restart',
+                                help='What to do to every node')
+    rolling_parser.add_argument('--mongodb-version', choices=[e.value for e in MongoDBVersion], help='Target version (upgrade)')
+    rolling_parser.add_argument('--tuning-profile', choices=list(PROFILES), help='New tuning profile (config)')
+    rolling_parser.add_argument('--tuning-set', action='append', metavar='KEY=VALUE', help='Override one tuning key (config)')
+    rolling_parser.add_argument('--cache-size', type=str, help='WiredTiger cache size (config)')
+    rolling_parser.add_argument('--oplog-size', type=str, help='Oplog size (config)')
+    rolling_parser.add_argument('--instance-type', type=str, help='New VM instance type (resize)')
+    rolling_parser.add_argument('--blast-radius', type=int, default=1, help='Shards operated on at the same time')
+    rolling_parser.add_argument('--max-lag', type=float, default=10.0, help='Seconds of replication lag allowed between steps')
+    rolling_parser.add_argument('--step-timeout', type=float, default=900.0, help='Seconds a node may take to come back')
+    rolling_parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between health checks')
+    rolling_parser.add_argument('--skip-routers', action='store_true', help='Leave mongos routers alone')
+    rolling_parser.add_argument('--force', action='store_true', help='Start even if the cluster is not healthy')
+    rolling_parser.add_argument('--dry-run', action='store_true', help='Only show the order nodes would be handled in')
+    rolling_parser.add_argument('--simulate', action='store_true', help='Roll a restart through an in-memory fake cluster')
+    rolling_parser.add_argument('--fake-shards', type=int, default=2, help='Shards of the simulated cluster')
+    rolling_parser.add_argument('--fake-downtime', type=float, default=1.0, help='Seconds each simulated node is down')
+    add_probe_arguments(rolling_parser)
+
+def add_scale_arguments(scale_parser):
+    scale_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
+    scale_parser.add_argument('--shards', type=int, help='Total shards wanted; only the new ones are provisioned')
+    scale_parser.add_argument('--mongos', type=int, help='Total mongos routers wanted')
+    scale_parser.add_argument('--add-member', action='append', metavar='SET=HOST:PORT',
+                              help='Add a running mongod (started with --replSet SET) to a replica set (repeatable)')
+    scale_parser.add_argument('--balancer', choices=['on', 'off'], help='Start or stop the balancer')
+    scale_parser.add_argument('--balancer-window', type=str, metavar='HH:MM-HH:MM',
+                              help="Only migrate chunks in this daily window (config server time); 'any' removes it")
+    scale_parser.add_argument('--secondary-throttle', dest='secondary_throttle', action='store_const', const=True,
+                              help='Make each migrated batch wait for a majority of the recipient shard')
+    scale_parser.add_argument('--no-secondary-throttle', dest='secondary_throttle', action='store_const', const=False,
+                              help='Let migrations run without waiting for replication')
+    scale_parser.add_argument('--wait-for-delete', dest='wait_for_delete', action='store_const', const=True,
+                              help='Finish deleting a migrated range on the donor before the next migration')
+    scale_parser.add_argument('--no-wait-for-delete', dest='wait_for_delete', action='store_const', const=False,
+                              help='Delete migrated ranges in the background')
+    scale_parser.add_argument('--watch', action='store_true', help='Follow chunk migrations (also without adding anything)')
+    scale_parser.add_argument('--no-wait', action='store_true', help='Do not follow the rebalancing after adding shards')
+    scale_parser.add_argument('--watch-timeout', type=float, default=0.0, help='Stop following after this many seconds (default: until balanced)')
+    scale_parser.add_argument('--settle', type=float, default=120.0,
+                              help='Seconds without migrations, balancer idle, after which chunks count as balanced')
+    scale_parser.add_argument('--max-lag', type=float, default=10.0, help='Seconds of replication lag allowed for a new member')
+    scale_parser.add_argument('--sync-timeout', type=float, default=3600.0, help='Seconds a new member may take for its initial sync')
+    scale_parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between progress samples')
+    scale_parser.add_argument('--max-parallel', type=int, default=4, help='Maximum scaling phases run in parallel')
+    scale_parser.add_argument('--command-timeout', type=int, help='Kill a terraform/ansible command after this many seconds')
+    scale_parser.add_argument('--force', action='store_true', help='Start even if the cluster is not healthy')
+    scale_parser.add_argument('--dry-run', action='store_true', help='Only show what would be added')
+    scale_parser.add_argument('--simulate', action='store_true', help='Scale an in-memory fake cluster and watch it rebalance')
+    scale_parser.add_argument('--fake-shards', type=int, default=2, help='Shards of the simulated cluster before scaling')
+    scale_parser.add_argument('--fake-chunks', type=int, default=60, help='Chunks of the simulated cluster')
+    scale_parser.add_argument('--fake-members', type=int, default=0, help='Simulated members added to shard1')
+    add_probe_arguments(scale_parser)
+
+def add_apply_arguments(apply_parser):
+    apply_parser.add_argument('-f', '--file', type=str, required=True, help='Fleet manifest (YAML)')
+    apply_parser.add_argument('--diff', action='store_true', help='Only show what would be created or updated')
+    apply_parser.add_argument('--only', action='append', metavar='CLUSTER', help='Limit to these clusters (repeatable)')
+    apply_parser.add_argument('--concurrency', type=int, help='Clusters provisioned at the same time (default: manifest)')
+    apply_parser.add_argument('--force-terraform', action='store_true', help='Run terraform even if inputs are unchanged')
+    apply_parser.add_argument('--verbose', action='store_true', help='Stream terraform/ansible output of every cluster')
+
+def add_destroy_arguments(destroy_parser):
     destroy_parser.add_argument('--cluster', type=str, required=True, help='Cluster name')
+
+COMMANDS = {
+    'create': ('Create a new MongoDB cluster', add_create_arguments),
+    'plan-capacity': ('Size instances, cache, oplog and shards from workload targets', add_plan_capacity_arguments),
+    'tuning': ('List tuning profiles or preview the mongod.conf of one', add_tuning_arguments),
+    'status': ('Show cluster status', add_status_arguments),
+    'health': ('Health check for cluster', add_health_arguments),
+    'endpoints': ('Discover connection strings for applications', add_endpoints_arguments),
+    'bench': ('Run a YCSB-style load test against a cluster', add_bench_arguments),
+    'advise': ('Recommend indexes and shard keys from sampled queries', add_advise_arguments),
+    'logs': ('Analyze mongod/mongos JSON logs', add_logs_arguments),
+    'backup': ('Back up every shard in parallel, or list/verify backups', add_backup_arguments),
+    'restore': ('Restore a backup, optionally rolled forward to a point in time', add_restore_arguments),
+    'rolling': ('Upgrade, reconfigure or resize a cluster one node at a time', add_rolling_arguments),
+    'scale': ('Add shards, mongos or replica set members online and follow the rebalancing', add_scale_arguments),
+    'apply': ('Create or update every cluster of a fleet manifest', add_apply_arguments),
+    'destroy': ('Destroy a cluster', add_destroy_arguments),
+}
+
+def selected_command(argv: List[str]) -> Optional[str]:
+    """The subcommand named on the command line; the top-level parser has no options taking values."""
+    for arg in argv:
+        if not arg.startswith('-'):
+            return arg
+    return None
+
+def create_parser(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="MongoDB Cluster Provisioning CLI",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Create a 3-node replica set
+  dbprovision create --cluster-type replicaset --replica-nodes 3 --project-id my-project
+
+  # Create a sharded cluster with 3 shards
+  dbprovision create --cluster-type sharded --shards 3 --project-id my-project
+
+  # Preview the tfvars, group_vars and deployment phases without running anything
+  dbprovision create --cluster-type sharded --shard-count 3 --project-id my-project --dry-run
+
+  # Load-test a cluster and compare two tuning profiles
+  dbprovision bench --cluster my-cluster --workload a --label oltp-low-latency
+  dbprovision bench --compare run-a.json run-b.json
+
+  # Recommend indexes and shard keys from a captured slow-query log, failing CI on scatter-gather queries
+  dbprovision advise --input mongod.log --catalog catalog.json --fail-on scatter
+
+  # Slow ops and latency over time from mongod logs (parsed once into a columnar cache)
+  dbprovision logs analyze /var/log/mongodb/mongod.log --report slow latency --bucket 15m
+
+  # Add two shards and follow the rebalancing, migrating only at night
+  dbprovision scale --cluster my-cluster --shards 5 --balancer-window 01:00-05:00
+
+  # Provision or update every cluster in a fleet manifest
+  dbprovision apply -f fleet.yaml
+
+  # Check cluster status
+  dbprovision status --cluster my-cluster
+
+  # Connection strings tuned to the measured latency, with SRV records for a mongodb+srv:// seed list
+  dbprovision endpoints --cluster my-cluster --app-instances 20 --srv-domain db.example.com
+
+  # Destroy cluster
+  dbprovision destroy --cluster my-cluster
+        """
+    )
     
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+    # Only the command being run gets its arguments (and imports what their choices need)
+    command = selected_command(sys.argv[1:] if argv is None else argv)
+    for name, (help_text, add_arguments) in COMMANDS.items():
+        command_parser = subparsers.add_parser(name, help=help_text)
+        if name == command:
+            add_arguments(command_parser)
+            
     return parser
 
 def main():
@@ -346,17 +1952,49 @@ def main():
         parser.print_help()
         sys.exit(1)
         
-    db_provision = DBProvision()
+    cluster = getattr(args, 'cluster', None)
+    if getattr(args, 'workspace', False):
+        db_provision = DBProvision(workspace=cluster_workspace(args.cluster_name or 'mongodb-cluster'))
+    else:
+        db_provision = DBProvision.for_cluster(cluster) if cluster else DBProvision()
     
-    if args.command == 'create':
-        db_provision.validate_parameters(args)
-        db_provision.create_cluster(args)
-    elif args.command == 'status':
-        db_provision.show_status(args.cluster)
-    elif args.command == 'health':
-        db_provision.show_health(args.cluster, args.check_all)
-    elif args.command == 'destroy':
-        db_provision.destroy_cluster(args.cluster)
+    try:
+        if args.command == 'create':
+            if args.capacity_plan:
+                db_provision.apply_capacity_plan(args)
+            db_provision.validate_parameters(args)
+            db_provision.create_cluster(args)
+        elif args.command == 'tuning':
+            db_provision.show_tuning(args)
+        elif args.command == 'plan-capacity':
+            db_provision.plan_capacity(args)
+        elif args.command == 'status':
+            db_provision.show_status(args.cluster, args.hosts, args.timeout, args.concurrency, args.tls)
+        elif args.command == 'health':
+            db_provision.show_health(args.cluster, args.check_all, args.hosts, args.timeout,
+                                     args.concurrency, args.tls)
+        elif args.command == 'endpoints':
+            db_provision.show_endpoints(args)
+        elif args.command == 'backup':
+            db_provision.run_backup(args)
+        elif args.command == 'restore':
+            db_provision.run_restore(args)
+        elif args.command == 'rolling':
+            db_provision.run_rolling(args)
+        elif args.command == 'scale':
+            db_provision.run_scale(args)
+        elif args.command == 'apply':
+            db_provision.apply_fleet(args)
+        elif args.command == 'bench':
+            db_provision.run_bench(args)
+        elif args.command == 'advise':
+            db_provision.run_advise(args)
+        elif args.command == 'logs':
+            db_provision.analyze_logs(args)
+        elif args.command == 'destroy':
+            db_provision.destroy_cluster(args.cluster)
+    finally:
+        db_provision.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,9 +9,14 @@ setup(
     author="MongoDB Automation Team",
     python_requires=">=3.8",
     py_modules=["dbprovision"],
+    packages=find_packages(),
     install_requires=[
         "PyYAML>=6.0",
     ],
+    extras_require={
+        "zstd": ["zstandard>=0.21"],
+        "logs": ["numpy>=1.20"],
+    },
     entry_points={
         "console_scripts": [
             "dbprovision=dbprovision:main",
@@ -0,0 +1,92 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Run against this checkout (dbprovision.py and dbprov/) without installing it
+CLI_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(CLI_DIR))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", help="Also run the timing benchmarks")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing budget that needs a quiet machine; run with --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Timing budgets flake on loaded CI runners; run them on purpose, with --benchmark or -m benchmark
+    if config.getoption("--benchmark") or config.option.markexpr:
+        return
+    skip = pytest.mark.skip(reason="timing benchmark, run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def dbprovision(tmp_path):
+    """Run the CLI in a subprocess with its state kept under ``tmp_path``."""
+    def run(*args: str, check: bool = True) -> subprocess.CompletedProcess:
+        # Read the environment per call, so tests can monkeypatch.setenv before running
+        env = {**os.environ, "DBPROVISION_HOME": str(tmp_path / "home")}
+        result = subprocess.run([sys.executable, str(CLI_DIR / "dbprovision.py"), *args], cwd=tmp_path,
+                                env=env, capture_output=True, text=True, timeout=120)
+        if check and result.returncode != 0:
+            pytest.fail(f"dbprovision {' '.join(args)} exited {result.returncode}:\n{result.stdout}{result.stderr}")
+        return result
+    return run
+
+
+def log_line(at: float, component: str, id: int, msg: str, severity: str = "I", **attr) -> str:
+    """One mongod/mongos 4.4+ structured log line."""
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(at)) + f".{int(at * 1000) % 1000:03d}+00:00"
+    entry = {"t": {"$date": timestamp}, "s": severity, "c": component, "id": id, "ctx": "conn1", "msg": msg}
+    if attr:
+        entry["attr"] = attr
+    return json.dumps(entry)
+
+
+# 2024-03-01T00:00:00Z; the fixture log covers the two hours after it
+LOG_START = 1709251200
+
+
+@pytest.fixture
+def mongod_log(tmp_path) -> Path:
+    """Two hours of a mongod log: slow queries on shop.orders (unindexed, 150 customers) and
+    scatter-gather finds on the sharded shop.events, client connections and one election."""
+    rng = random.Random(42)
+    lines = [log_line(LOG_START, "CONTROL", 23403, "Build Info", build={"version": "8.0.4"}),
+             "2024-03-01 00:00:00 a plain text line from a wrapper script"]
+    for i in range(300):
+        at = LOG_START + i * 24
+        customer = rng.randrange(150)
+        lines.append(log_line(at, "COMMAND", 51803, "Slow query", type="command", ns="shop.orders",
+                              command={"find": "orders", "filter": {"customerId": customer, "status": "A"},
+                                       "sort": {"createdAt": -1}, "$db": "shop"},
+                              planSummary="COLLSCAN", docsExamined=50_000, keysExamined=0, nreturned=5,
+                              durationMillis=100 + rng.randrange(200)))
+        if i % 3 == 0:
+            lines.append(log_line(at + 1, "COMMAND", 51803, "Slow query", type="command", ns="shop.events",
+                                  command={"find": "events", "filter": {"type": "click"}, "$db": "shop"},
+                                  planSummary="IXSCAN { type: 1 }", docsExamined=40, keysExamined=40, nreturned=40,
+                                  nShards=3, durationMillis=20 + rng.randrange(30)))
+        if i % 10 == 0:
+            remote = f"10.0.1.{i % 4}:{50000 + i}"
+            lines.append(log_line(at + 2, "NETWORK", 22943, "Connection accepted", remote=remote,
+                                  connectionCount=10 + i % 7))
+            lines.append(log_line(at + 3, "NETWORK", 22944, "Connection ended", remote=remote,
+                                  connectionCount=9 + i % 7))
+    lines.append(log_line(LOG_START + 3600, "REPL", 21358, "Replica set state changes", oldState="SECONDARY",
+                          newState="PRIMARY"))
+    lines.append(log_line(LOG_START + 3601, "ELECTION", 21450, "Election succeeded", term=3))
+    path = tmp_path / "mongod.log"
+    path.write_text("\n".join(lines) + "\n")
+    return path
@@ -0,0 +1,68 @@
+import json
+
+from dbprov.advisor import Collection, analyze, check_findings, operation_from_profile, read_capture, shape_of
+
+CATALOG = {"shop.events": {"shardKey": {"userId": 1}, "indexes": [{"userId": 1}, {"type": 1}]}}
+
+
+def test_advise_on_slow_query_log(dbprovision, mongod_log, tmp_path):
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text(json.dumps(CATALOG))
+    result = dbprovision("advise", "--input", str(mongod_log), "--catalog", str(catalog), "--json")
+
+    report = json.loads(result.stdout)
+    assert (report["operations"], report["namespaces"], report["skipped"]) == (400, 2, 1)
+    assert report["shapes"][0]["ns"] == "shop.orders"
+
+    # Equality fields first, by cardinality, then the sort
+    [index] = report["indexes"]
+    assert index["ns"] == "shop.orders"
+    assert list(index["key"].items()) == [("customerId", 1), ("status", 1), ("createdAt", -1)]
+    assert index["command"].endswith('createIndex({"customerId": 1, "status": 1, "createdAt": -1})')
+
+    keys = {advice["ns"]: advice for advice in report["shard_keys"]}
+    assert keys["shop.orders"]["current"] is None
+    assert keys["shop.orders"]["recommended"]["key"] == {"customerId": 1}
+    assert keys["shop.events"]["current"]["problems"]
+
+    [scatter] = report["scatter"]
+    assert (scatter["ns"], scatter["count"], scatter["shards"]) == ("shop.events", 100, 3)
+    assert report["findings"] == {"index": 1, "shard-key": 1, "scatter": 1}
+
+
+def test_advise_fail_on_findings(dbprovision, mongod_log):
+    result = dbprovision("advise", "--input", str(mongod_log), "--fail-on", "index", check=False)
+
+    assert result.returncode == 1
+    assert "FAILED: 1 index finding(s)" in result.stdout
+
+
+def test_read_capture_merges_catalog_lines(mongod_log, tmp_path):
+    capture = tmp_path / "capture.jsonl"
+    capture.write_text(json.dumps({"catalog": "shop.orders", "shardKey": None, "indexes": [
+        {"key": {"customerId": 1, "status": 1, "createdAt": -1}}]}) + "\n")
+
+    operations, catalog, skipped = read_capture([capture, mongod_log])
+    report = analyze(operations, catalog)
+    assert skipped == 1
+    assert report.indexes == []
+    assert check_findings(report, ["index"]) == []
+
+
+def test_monotonic_shard_key_gets_hashed():
+    operations = []
+    for i in range(300):
+        oid = f"{0x65E11A00 << 64 | i * 7:024x}"
+        operations.append(operation_from_profile({
+            "op": "query", "ns": "app.logs", "command": {"find": "logs", "filter": {"_id": {"$oid": oid}}},
+            "millis": 5, "docsExamined": 1, "nreturned": 1, "planSummary": "IDHACK"}))
+
+    [advice] = analyze(operations, {"app.logs": Collection(shard_key={"_id": 1})}).shard_keys
+    assert advice.current.monotonic
+    assert any("only increases" in problem for problem in advice.current.problems)
+    assert advice.recommended.key == {"_id": "hashed"}
+
+
+def test_shape_replaces_literals():
+    assert shape_of({"a": 1, "b": {"$in": [1, 2]}, "c": {"$gt": {"$date": "2024-03-01T00:00:00Z"}}}) == {
+        "a": "?", "b": {"$in": "?"}, "c": {"$gt": "?"}}
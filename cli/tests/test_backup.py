@@ -0,0 +1,276 @@
+import asyncio
+import datetime
+import http.server
+import struct
+import threading
+
+import pytest
+
+from dbprov.backup import (
+    BackupEngine, BackupError, BackupOptions, BackupSource, LocalTarget, OwnedRanges, S3Target, chunk_key, get_codec,
+    load_manifest, manifest_key, owned_ranges, read_chunks, verify_backup,
+)
+from dbprov.health import Node
+from dbprov.oplog import RestoreEngine, RestoreOptions, plan_restore
+from dbprov.testing.fakemongo import FakeMongoServer, FakeStore, enable_crud, enable_sharding
+from dbprov.wire import BSONError, Binary, Int64, MaxKey, MinKey, ObjectId, RawDocument, Regex, Timestamp, decode
+
+CREATED = datetime.datetime(2024, 3, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+def raw_document(*elements: bytes) -> RawDocument:
+    body = b"".join(elements) + b"\0"
+    return RawDocument(struct.pack("<i", len(body) + 4) + body)
+
+
+# Values the decoder turns into something else or rejects: invalid UTF-8, undefined (0x06),
+# a symbol (0x0E) and a datetime past year 9999
+ODD_DOCUMENTS = [
+    raw_document(b"\x07_id\0" + bytes(range(12)), b"\x02name\0" + struct.pack("<i", 3) + b"\xff\xfe\0",
+                 b"\x06gone\0"),
+    raw_document(b"\x10_id\0" + struct.pack("<i", 2), b"\x0esym\0" + struct.pack("<i", 2) + b"x\0",
+                 b"\x09at\0" + struct.pack("<q", 2 ** 62)),
+]
+
+
+def serve_documents(server: FakeMongoServer, collection: str, documents):
+    """Answer ``find`` on ``collection`` with exactly these encoded documents."""
+    find = server.commands["find"]
+
+    def handler(srv, cmd):
+        if cmd["find"] != collection:
+            return find(srv, cmd)
+        return {"cursor": {"id": Int64(0), "ns": f"{cmd['$db']}.{collection}", "firstBatch": documents}}
+    server.register("find", handler)
+
+
+def fill(store: FakeStore, count: int = 250):
+    orders = store.collection("shop", "orders")
+    for i in range(count):
+        orders.insert({"_id": i, "customer": ObjectId(), "total": Int64(i * 100), "ratio": i / 7,
+                       "created": CREATED + datetime.timedelta(minutes=i), "tags": ["a", {"b": i}],
+                       "blob": Binary(b"\x00\x01" * i, 4), "pattern": Regex("^o", "i"),
+                       "seen": Timestamp(1700000000, i), "note": "café" if i % 2 else None})
+    store.indexes["shop.orders"] = [{"v": 2, "key": {"customer": 1}, "name": "customer_1"}]
+    store.collection("shop", "empty")
+
+
+def backup(target, sources, router=None, chunk_size=4096, **options):
+    engine = BackupEngine(target, get_codec("zlib"), BackupOptions(chunk_size=chunk_size, batch_size=40, **options))
+    return engine.run("shop-cluster", sources, router)
+
+
+def test_backup_and_restore_round_trip(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+
+    async def run():
+        async with FakeMongoServer() as source, FakeMongoServer() as destination:
+            store = enable_crud(source)
+            fill(store)
+            manifest = await backup(target, [BackupSource("rs0", source.host, source.port, "PRIMARY")])
+            restored = enable_crud(destination)
+            stats = await RestoreEngine(target, RestoreOptions(batch_size=64)).run(
+                plan_restore(target, "shop-cluster", manifest.id), destination.host, destination.port)
+            return manifest, store, restored, stats
+
+    manifest, store, restored, stats = asyncio.run(run())
+
+    orders = next(c for c in manifest.collections if c.ns == "shop.orders")
+    assert orders.documents == 250 and len(orders.chunks) > 1
+    assert sum(c.documents for c in orders.chunks) == 250
+    assert {c.ns for c in manifest.collections} == {"shop.orders", "shop.empty"}
+    assert stats.documents == 250 and stats.duplicates == 0 and stats.indexes == 1
+    assert restored.collection("shop", "orders").docs == store.collection("shop", "orders").docs
+    assert "shop.empty" in restored.collections
+    assert restored.indexes["shop.orders"] == [{"v": 2, "key": {"customer": 1}, "name": "customer_1"}]
+    assert verify_backup(target, manifest.id, deep=True) == []
+
+
+def test_documents_are_stored_byte_for_byte(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+    with pytest.raises(BSONError):
+        decode(ODD_DOCUMENTS[1])
+
+    async def run():
+        async with FakeMongoServer() as source:
+            store = enable_crud(source)
+            store.collection("shop", "odd")
+            serve_documents(source, "odd", ODD_DOCUMENTS)
+            return await backup(target, [BackupSource("rs0", source.host, source.port)])
+
+    manifest = asyncio.run(run())
+    [dump] = manifest.collections
+    assert dump.documents == 2
+    assert b"".join(read_chunks(target, manifest, dump)) == b"".join(ODD_DOCUMENTS)
+    assert verify_backup(target, manifest.id, deep=True) == []
+
+
+def test_malformed_reply_is_a_backup_error(tmp_path):
+    # The document claims 100 bytes but holds 8
+    broken = RawDocument(struct.pack("<i", 100) + b"\x0ax\0\0")
+
+    async def run():
+        async with FakeMongoServer() as source:
+            enable_crud(source).collection("shop", "bad")
+            serve_documents(source, "bad", [broken])
+            await backup(LocalTarget(tmp_path / "backups"), [BackupSource("rs0", source.host, source.port)])
+
+    with pytest.raises(BackupError, match="Dumping shop.bad from .* failed: Invalid BSON document length"):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("balancer_was_stopped", [False, True])
+def test_sharded_backup_stops_the_balancer(tmp_path, balancer_was_stopped):
+    target = LocalTarget(tmp_path / "backups")
+    seen = []
+
+    async def run():
+        async with FakeMongoServer(role="mongos") as mongos, FakeMongoServer() as a, FakeMongoServer() as b:
+            config = enable_sharding(mongos, move_seconds=0.01)
+            settings = config.collection("config", "settings").docs
+            if balancer_was_stopped:
+                settings["balancer"] = {"_id": "balancer", "stopped": True}
+            for shard in (a, b):
+                fill(enable_crud(shard), 20)
+                find = shard.commands["find"]
+
+                def watch(srv, cmd, find=find):
+                    seen.append(settings.get("balancer", {}).get("stopped"))
+                    return find(srv, cmd)
+                shard.register("find", watch)
+            sources = [BackupSource("shard0", a.host, a.port), BackupSource("shard1", b.host, b.port)]
+            manifest = await backup(target, sources, Node(mongos.host, mongos.port, "mongos"))
+            return manifest, settings["balancer"]["stopped"]
+
+    manifest, stopped_after = asyncio.run(run())
+    assert seen and all(seen)
+    assert stopped_after is balancer_was_stopped
+    assert {(c.ns, c.shard) for c in manifest.collections} == {
+        ("shop.orders", "shard0"), ("shop.orders", "shard1"), ("shop.empty", "shard0"), ("shop.empty", "shard1")}
+
+
+def test_owned_ranges_merge_adjacent_chunks():
+    uuid = Binary(b"\x02" * 16, 4)
+    collections = [{"_id": "shop.orders", "key": {"customer": 1, "_id": 1}, "uuid": uuid},
+                   {"_id": "shop.old", "key": {"_id": "hashed"}, "dropped": True}]
+    shards = [{"_id": "sh0", "host": "rs0/a:27018,b:27018"}, {"_id": "sh1", "host": "rs1/c:27018"},
+              {"_id": "sh2", "host": "d:27018"}]
+    bounds = [{"customer": MinKey, "_id": MinKey}, {"customer": 5, "_id": MinKey}, {"customer": 5, "_id": 100},
+              {"customer": 9, "_id": MinKey}, {"customer": MaxKey, "_id": MaxKey}]
+    owners = ["sh1", "sh0", "sh1", "sh1"]
+    # Listed out of order, as config.chunks may return them
+    chunks = [{"uuid": uuid, "min": bounds[i], "max": bounds[i + 1], "shard": owners[i]} for i in (3, 0, 2, 1)]
+    chunks.append({"ns": "shop.old", "min": {"_id": MinKey}, "max": {"_id": MaxKey}, "shard": "sh0"})
+
+    ownership = owned_ranges(collections, chunks, shards)
+
+    assert set(ownership) == {("shop.orders", "rs0"), ("shop.orders", "rs1"), ("shop.orders", "d:27018")}
+    assert ownership[("shop.orders", "rs0")] == OwnedRanges(collections[0]["key"], [(bounds[1], bounds[2])])
+    assert sorted(ownership[("shop.orders", "rs1")].ranges, key=lambda r: r[0]["customer"] is not MinKey) == [
+        (bounds[0], bounds[1]), (bounds[2], bounds[4])]
+    assert ownership[("shop.orders", "d:27018")].ranges == []
+
+
+def test_verify_finds_missing_resized_and_corrupt_chunks(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+
+    async def run():
+        async with FakeMongoServer() as source:
+            fill(enable_crud(source))
+            return await backup(target, [BackupSource("rs0", source.host, source.port)])
+
+    manifest = asyncio.run(run())
+    assert verify_backup(target, manifest.id, deep=True) == []
+    orders = next(c for c in manifest.collections if c.ns == "shop.orders")
+    first, second, third = orders.chunks[:3]
+
+    # Same size, different bytes: only a deep verify reads the chunk
+    path = target.root / chunk_key(third.sha256)
+    data = bytearray(path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert verify_backup(target, manifest.id) == []
+    assert verify_backup(target, manifest.id, deep=True) == [
+        f"shop.orders: Chunk {third.sha256[:16]} of shop.orders is corrupt"]
+
+    (target.root / chunk_key(first.sha256)).unlink()
+    path = target.root / chunk_key(second.sha256)
+    path.write_bytes(path.read_bytes() + b"x")
+    assert verify_backup(target, manifest.id, deep=True) == [
+        f"shop.orders: chunk {first.sha256[:16]} is missing",
+        f"shop.orders: chunk {second.sha256[:16]} is {second.size + 1} bytes, expected {second.size}",
+    ]
+
+
+def test_verify_checks_the_manifest_root(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+
+    async def run():
+        async with FakeMongoServer() as source:
+            fill(enable_crud(source), 10)
+            return await backup(target, [BackupSource("rs0", source.host, source.port)])
+
+    manifest = asyncio.run(run())
+    data = target.get(manifest_key(manifest.id)).replace(b'"documents": 10', b'"documents": 11', 1)
+    target.put(manifest_key(manifest.id), data)
+
+    assert load_manifest(target, manifest.id).documents == 11
+    assert verify_backup(target, manifest.id) == ["manifest root digest does not match its chunk list"]
+
+
+class FlakyS3(http.server.BaseHTTPRequestHandler):
+    """Answers the first request for each key with 503 SlowDown, then stores and serves objects."""
+    objects = {}
+    attempts = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def handle_one(self):
+        FlakyS3.requests.append((self.command, self.path, self.headers))
+        FlakyS3.attempts[self.path] = FlakyS3.attempts.get(self.path, 0) + 1
+        if FlakyS3.attempts[self.path] == 1:
+            return self.respond(503, b"<Error><Code>SlowDown</Code></Error>")
+        if self.command == "PUT":
+            FlakyS3.objects[self.path] = self.rfile.read(int(self.headers["Content-Length"]))
+            return self.respond(200)
+        if self.path in FlakyS3.objects:
+            return self.respond(200, FlakyS3.objects[self.path])
+        return self.respond(404)
+
+    do_PUT = do_GET = do_HEAD = handle_one
+
+
+def test_s3_session_token_and_retries():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakyS3)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        target = S3Target("backups", "prod", endpoint=f"http://127.0.0.1:{server.server_port}",
+                          access_key="AKIA", secret_key="secret", session_token="token-1", backoff=0.01)
+        target.put("chunks/ab/abc", b"data")
+        assert target.get("chunks/ab/abc") == b"data"
+        assert target.size("chunks/ab/missing") is None
+
+        no_retries = S3Target("backups", "prod", endpoint=f"http://127.0.0.1:{server.server_port}", retries=0)
+        with pytest.raises(BackupError, match="HTTP 503"):
+            no_retries.get("chunks/ab/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # PUT: 503 then 200, GET: 200, HEAD: 503 then 404
+    assert [(method, path.rsplit("/", 1)[1]) for method, path, _ in FlakyS3.requests[:5]] == [
+        ("PUT", "abc"), ("PUT", "abc"), ("GET", "abc"), ("HEAD", "missing"), ("HEAD", "missing")]
+    for _, _, headers in FlakyS3.requests[:5]:
+        assert headers["x-amz-security-token"] == "token-1"
+        assert "x-amz-security-token" in headers["Authorization"].split("SignedHeaders=")[1]
+    assert "x-amz-security-token" not in FlakyS3.requests[-1][2]
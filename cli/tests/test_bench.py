@@ -0,0 +1,62 @@
+import json
+import random
+
+from dbprov.bench import BenchResult, Histogram, KeyChooser, check_targets
+
+
+def test_histogram_percentiles_within_bucket_error():
+    hist = Histogram()
+    for value in range(1, 10001):
+        hist.record(value)
+
+    assert hist.count == 10000 and hist.min == 1 and hist.max == 10000
+    assert abs(hist.percentile(50) - 5000) <= 5000 / 64
+    assert abs(hist.percentile(99) - 9900) <= 9900 / 64
+    assert hist.percentile(100) == 10000
+    assert Histogram().percentile(99) == 0
+
+    other = Histogram()
+    other.record(20000)
+    hist.merge(other)
+    restored = Histogram.from_dict(json.loads(json.dumps(hist.to_dict())))
+    assert (restored.count, restored.max, restored.percentile(99)) == (10001, 20000, hist.percentile(99))
+
+
+def test_key_distributions_stay_in_range():
+    for distribution in ("uniform", "zipfian", "latest"):
+        keys = KeyChooser(distribution, 1000, random.Random(7))
+        drawn = [keys.next() for _ in range(2000)]
+        assert min(drawn) >= 0 and max(drawn) < 1000, distribution
+    # Zipfian keys are scrambled, so the hottest key is not simply key 0
+    zipf = KeyChooser("zipfian", 1000, random.Random(7))
+    counts = {}
+    for _ in range(5000):
+        key = zipf.next()
+        counts[key] = counts.get(key, 0) + 1
+    assert max(counts.values()) > 5000 / 1000 * 10
+
+
+def test_fake_sharded_run(dbprovision, tmp_path):
+    output = tmp_path / "result.json"
+    result = dbprovision("bench", "--fake-shards", "2", "--operations", "400", "--clients", "4",
+                         "--records", "200", "--workload", "a", "--output", str(output))
+
+    assert "2 fake shards" in result.stdout
+    data = json.loads(output.read_text())
+    assert data["total_ops"] == 400
+    assert data["errors"] == {"read": 0, "update": 0}
+    assert sorted(data["shards"]) == ["shard1", "shard2"]
+    assert sum(h["count"] for ops in data["shards"].values() for h in ops.values()) == 400
+
+    saved = BenchResult.from_dict(data)
+    assert check_targets(saved, p99_ms=10_000) == []
+    assert check_targets(saved, throughput=1e12)
+
+
+def test_fake_run_fails_missed_target(dbprovision, tmp_path):
+    result = dbprovision("bench", "--fake", "--duration", "0.2", "--clients", "2", "--records", "100",
+                         "--workload", "e", "--target-ops", "1e12", check=False)
+
+    assert result.returncode == 1
+    assert "FAILED: throughput" in result.stdout
+    assert list((tmp_path / "home" / "bench").glob("workload-e-*.json"))
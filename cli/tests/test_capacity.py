@@ -0,0 +1,82 @@
+import pytest
+
+from dbprov.capacity import (
+    GB, MB, MIN_OPLOG_MB, CapacityError, CapacityPlan, WorkloadTarget, parse_size, plan_capacity,
+    wiredtiger_cache_gb,
+)
+
+
+@pytest.mark.parametrize("value, size", [
+    ("200GB", 200 * GB),
+    ("1.5TiB", int(1.5 * 1024 ** 4)),
+    ("512M", 512 * MB),
+    ("5MB/s", 5 * MB),
+    (" 64 kb ", 64 * 1024),
+    ("10", 10),
+    (2048, 2048),
+])
+def test_parse_size(value, size):
+    assert parse_size(value) == size
+
+
+@pytest.mark.parametrize("value", ["1.2.3GB", ".5G", "5.GB", "GB", "5ib", "1e3", "-5GB", "5 GB GB", ""])
+def test_parse_size_rejects(value):
+    with pytest.raises(CapacityError, match="Invalid size"):
+        parse_size(value)
+
+
+def test_wiredtiger_cache_follows_the_server_default():
+    assert wiredtiger_cache_gb(32) == 15.5
+    assert wiredtiger_cache_gb(4) == 1.5
+    assert wiredtiger_cache_gb(1) == 0.25
+
+
+def test_small_working_set_gets_the_cheapest_replica_set():
+    plan = plan_capacity(WorkloadTarget(working_set_bytes=10 * GB, write_bytes_per_sec=MB))
+
+    assert (plan.cluster_type, plan.shard_count, plan.instance_type) == ("replicaset", 1, "e2-highmem-4")
+    assert plan.required_cache_gb == 13.0 and plan.cache_size_gb >= plan.required_cache_gb
+    # 1MB/s for 24 hours plus 30% headroom
+    assert plan.oplog_size_mb == 112320
+    assert plan.hourly_cost == 0.69
+    assert plan.terraform_vars() == {"cluster_type": "replicaset", "replica_nodes": 3,
+                                     "instance_type": "e2-highmem-4", "disk_size": plan.disk_size_gb}
+    assert plan.ansible_vars() == {"cache_size": "15.5GB", "oplog_size": "112320MB"}
+
+
+def test_working_set_beyond_one_machine_is_sharded():
+    plan = plan_capacity(WorkloadTarget(working_set_bytes=600 * GB, peak_ops=100000))
+
+    assert plan.cluster_type == "sharded" and plan.shard_count == 4
+    assert plan.cache_size_gb >= plan.required_cache_gb == 195.0
+    assert plan.config_servers == 3 and plan.mongos_count == 5
+    assert any("9 mongos" in note for note in plan.notes)
+    assert plan.terraform_vars()["shard_count"] == 4
+    assert CapacityPlan.from_dict(plan.to_dict()) == plan
+
+
+def test_peak_ops_pick_enough_vcpus():
+    plan = plan_capacity(WorkloadTarget(working_set_bytes=GB, peak_ops=40000, cluster_type="replicaset"))
+    assert plan.vcpus * 4000 >= 40000 * 1.3
+
+
+def test_oplog_and_disk_floors():
+    plan = plan_capacity(WorkloadTarget(working_set_bytes=GB, write_bytes_per_sec=1,
+                                        cluster_type="sharded", replica_nodes=4))
+
+    assert plan.oplog_size_mb == MIN_OPLOG_MB and plan.disk_size_gb == 10
+    assert plan.shard_count == 1 and plan.mongos_count == 2
+    assert plan.notes == [f"oplog set to the {MIN_OPLOG_MB}MB minimum",
+                          "even number of replica nodes; prefer an odd count for elections"]
+
+
+@pytest.mark.parametrize("target, message", [
+    (WorkloadTarget(working_set_bytes=0), "must be positive"),
+    (WorkloadTarget(working_set_bytes=GB, replica_nodes=0), "at least 1"),
+    (WorkloadTarget(working_set_bytes=GB, max_shards=11), "between 1 and 10"),
+    (WorkloadTarget(working_set_bytes=GB, cluster_type="standalone"), "standalone"),
+    (WorkloadTarget(working_set_bytes=600 * GB, cluster_type="replicaset"), "try a sharded cluster"),
+])
+def test_invalid_targets(target, message):
+    with pytest.raises(CapacityError, match=message):
+        plan_capacity(target)
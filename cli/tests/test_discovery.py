@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+import urllib.parse
+
+from dbprov.discovery import (
+    DiscoveryOptions, DiscoveryService, TopologyCache, local_threshold_ms, pool_size, probe_topology,
+    topology_from_nodes, topology_from_outputs,
+)
+from dbprov.health import HealthProber, Node
+from dbprov.testing.fakemongo import FakeMongoServer, stop_all
+
+OUTPUTS = {
+    "mongo_routers": {"value": {
+        "names": ["mongo-router-1", "mongo-router-2"],
+        "connection_strings": ["10.0.0.11:27017", "10.0.0.12:27017"],
+        "ansible_inventory": {"hosts": {
+            "mongo-router-1": {"internal_ip": "10.0.0.11", "ansible_host": "34.1.1.11",
+                               "zone": "projects/p/zones/asia-northeast3-a"},
+            "mongo-router-2": {"internal_ip": "10.0.0.12", "zone": "asia-northeast3-b"}}}}},
+    "shard_servers": {"value": {
+        "names": [f"shard-server-{i}" for i in range(1, 7)],
+        "connection_strings": [f"10.0.1.{i}:27018" for i in range(1, 7)],
+        "ansible_inventory": {"hosts": {f"shard-server-{i}": {"internal_ip": f"10.0.1.{i}"} for i in range(1, 7)}}}},
+    "config_servers": {"value": {"names": ["config-server-1"], "connection_strings": []}},
+}
+
+
+def test_pool_size_is_set_by_the_busiest_server():
+    # Every application instance keeps a pool to each of the three routers
+    assert pool_size([1000, 1000, 1000], 30) == 26
+    assert pool_size([1000], 30) == 26
+    assert pool_size([5000, 5000, 1000], 30) == 26
+    assert pool_size([1000, 100], 30) == 5
+    assert pool_size([838860], 1) == 100
+    assert pool_size([], 30) == 100
+
+
+def test_local_threshold_ms_covers_the_nearest_zone():
+    assert local_threshold_ms([]) == 15
+    assert local_threshold_ms([("a", 1.0), ("a", 3.0), ("b", 2.5), ("c", 40.0)]) == 5
+    assert local_threshold_ms([("a", 0.4), ("b", 9.0)]) == 1
+    assert local_threshold_ms([("a", 1.0), ("a", 30.0)]) == 15
+
+
+def test_topology_from_outputs():
+    topology = topology_from_outputs("orders", OUTPUTS)
+
+    routers = topology.by_role("mongos")
+    assert [(e.name, e.host(), e.host(external=True), e.zone) for e in routers] == [
+        ("mongo-router-1", "10.0.0.11", "34.1.1.11", "asia-northeast3-a"),
+        ("mongo-router-2", "10.0.0.12", "10.0.0.12", "asia-northeast3-b")]
+    assert [(e.replica_set, e.port) for e in topology.by_role("mongod")] == [("shard1", 27018)] * 3 + [
+        ("shard2", 27018)] * 3
+    assert [(e.name, e.replica_set, e.port) for e in topology.by_role("config")] == [
+        ("config-server-1", "configRS", 27019)]
+    assert topology.sharded and topology.source == "terraform"
+
+
+def test_topology_cache_by_fingerprint_and_age(tmp_path):
+    cache = TopologyCache(tmp_path, max_age=60)
+    topology = topology_from_outputs("orders", OUTPUTS)
+    topology.fingerprint = "100:1"
+    cache.save(topology)
+
+    assert cache.load("orders", "100:1") == topology
+    assert cache.load("orders", "100:2") is None
+    assert cache.load("billing", "100:1") is None
+
+    # Without a local state file only the age counts
+    topology.fingerprint, topology.discovered_at = None, time.time() - 120
+    cache.save(topology)
+    assert cache.load("orders", None) is None
+    assert TopologyCache(tmp_path, max_age=300).load("orders", None) == topology
+
+    cache.path("orders").write_text("{not json")
+    assert cache.load("orders", None) is None
+
+
+def test_service_shares_one_terraform_read(tmp_path):
+    reads = []
+
+    async def read_outputs():
+        reads.append(time.monotonic())
+        await asyncio.sleep(0.05)
+        return OUTPUTS
+
+    async def run(service, callers):
+        return await asyncio.gather(*(service.topology() for _ in range(callers)))
+
+    cache = TopologyCache(tmp_path)
+    first = DiscoveryService("orders", read_outputs, cache, fingerprint="100:1")
+    topologies = asyncio.run(run(first, 5))
+    assert len(reads) == 1 and not first.cached
+    assert all(t is topologies[0] for t in topologies)
+    assert json.loads(cache.path("orders").read_text())["fingerprint"] == "100:1"
+
+    again = DiscoveryService("orders", read_outputs, cache, fingerprint="100:1")
+    assert asyncio.run(run(again, 1))[0] == topologies[0]
+    assert len(reads) == 1 and again.cached
+
+    applied = DiscoveryService("orders", read_outputs, cache, fingerprint="200:2")
+    asyncio.run(run(applied, 1))
+    assert len(reads) == 2 and not applied.cached
+
+
+def test_probe_recommends_pool_and_threshold_from_the_routers():
+    async def run():
+        routers = [await FakeMongoServer(role="mongos").start() for _ in range(3)]
+        for router in routers:
+            server_status = router.commands["serverStatus"]
+
+            def status(server, cmd, server_status=server_status):
+                reply = server_status(server, cmd)
+                reply["connections"]["available"] = 1000
+                return reply
+            router.register("serverStatus", status)
+        nodes = [Node(r.host, r.port, "mongos", name=f"mongo-router-{i}") for i, r in enumerate(routers, 1)]
+        prober = HealthProber(timeout=2.0)
+        try:
+            options = DiscoveryOptions(app_instances=30, srv_domain="db.example.com")
+            return await probe_topology(topology_from_nodes("orders", nodes, "hosts"), prober, options)
+        finally:
+            await prober.close()
+            await stop_all(routers)
+
+    discovery = asyncio.run(run())
+
+    assert [e.available_connections for e in discovery.endpoints] == [1000] * 3
+    read_write = discovery.profiles[0]
+    assert read_write.options["maxPoolSize"] == 26 and read_write.options["minPoolSize"] == 2
+    assert 1 <= read_write.options["localThresholdMS"] <= 15
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(read_write.uri).query)
+    assert query["maxPoolSize"] == ["26"] and query["readPreference"] == ["primary"]
+    assert read_write.srv_uri.startswith("mongodb+srv://orders.db.example.com/?")
+    assert sum(" IN SRV " in record for record in discovery.dns_records) == 3
+    assert not discovery.warnings
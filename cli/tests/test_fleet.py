@@ -0,0 +1,162 @@
+import asyncio
+import json
+import re
+import sys
+import time
+
+import pytest
+import yaml
+
+from dbprov.fleet import (
+    CREATE, ORPHANED, UNCHANGED, UPDATE, Change, ClusterOutcome, ClusterSpec, FleetError, FleetManifest,
+    PrefixedOutput, RateLimiter, current_cluster, plan_fleet, run_fleet,
+)
+
+MANIFEST = {
+    "fleet": "shop",
+    "concurrency": 3,
+    "rate_limit": {"terraform_per_minute": 600, "burst": 1},
+    "defaults": {"project_id": "my-project"},
+    "clusters": [
+        {"name": "orders"},
+        {"name": "events", "cluster_type": "sharded", "shard_count": 2},
+        {"name": "sessions", "replica_nodes": 5},
+    ],
+}
+
+
+@pytest.fixture
+def simulator(tmp_path, monkeypatch):
+    """Provision through dbprov.simulator with instant commands; shard deployments always fail."""
+    config = tmp_path / "simulator.yml"
+    config.write_text(yaml.safe_dump({"time_scale": 0, "failures": {"deploy-shard-servers.yml": 1.0}}))
+    monkeypatch.setenv("DBPROVISION_HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("DBPROVISION_EXECUTOR", "simulator")
+    monkeypatch.setenv("DBPROVISION_SIMULATOR_CONFIG", str(config))
+    return tmp_path / "home"
+
+
+def write_manifest(tmp_path, manifest=MANIFEST):
+    path = tmp_path / "fleet.yml"
+    path.write_text(yaml.safe_dump(manifest))
+    return path
+
+
+def test_manifest_validation():
+    manifest = FleetManifest.from_dict(MANIFEST)
+    assert [c.name for c in manifest.clusters] == ["orders", "events", "sessions"]
+    assert manifest.clusters[1].options == {"project_id": "my-project", "cluster_type": "sharded", "shard_count": 2}
+    assert manifest.clusters[1].argv() == ["--cluster-name", "events", "--project-id", "my-project",
+                                           "--cluster-type", "sharded", "--shard-count", "2"]
+
+    with pytest.raises(FleetError) as e:
+        FleetManifest.from_dict({"fleets": 1, "concurrency": 0,
+                                 "clusters": [{"name": "Orders"}, {"name": "ab"}, {"name": "ab"}]})
+    assert str(e.value) == ("unknown top-level key(s): fleets; clusters[0]: name must be 2-40 lowercase letters, "
+                            "digits or dashes; clusters[2]: duplicate cluster name ab; "
+                            "concurrency and max_parallel must be at least 1")
+
+
+def test_plan_diffs_against_recorded_state():
+    manifest = FleetManifest.from_dict(MANIFEST)
+    orders, events, sessions = manifest.clusters
+    state = {
+        "orders": {"fleet": "shop", "status": "ok", "fingerprint": orders.fingerprint, "options": orders.options},
+        "events": {"fleet": "shop", "status": "failed"},
+        "sessions": {"fleet": "shop", "status": "ok", "fingerprint": "old",
+                     "options": {**sessions.options, "replica_nodes": 3, "tuning_profile": "analytics"}},
+        "carts": {"fleet": "shop", "status": "ok"},
+        "other": {"fleet": "billing", "status": "ok"},
+    }
+
+    changes = plan_fleet(manifest, state)
+    assert [(c.action, c.name, c.reason) for c in changes] == [
+        (UNCHANGED, "orders", ""),
+        (UPDATE, "events", "last run failed"),
+        (UPDATE, "sessions", "changed: replica_nodes, tuning_profile"),
+        (ORPHANED, "carts", "no longer in manifest; destroy it with dbprovision destroy"),
+    ]
+
+
+def test_run_fleet_isolates_failures_and_prefixes_output(capsys):
+    async def provision(change):
+        print("stdout line")
+        print("stderr line", file=sys.stderr)
+        await asyncio.sleep(0.01)
+        if change.name == "bad":
+            raise RuntimeError("boom")
+        assert current_cluster.get() == change.name
+        return ClusterOutcome(change.name, change.action, True)
+
+    changes = [Change(CREATE, name, ClusterSpec(name, {})) for name in ("good", "bad", "other")]
+    changes.append(Change(UNCHANGED, "same", ClusterSpec("same", {})))
+    report = asyncio.run(run_fleet(changes, 2, provision))
+
+    assert not report.ok
+    assert {o.name: o.ok for o in report.outcomes} == {"good": True, "bad": False, "other": True}
+    assert next(o for o in report.outcomes if o.name == "bad").error == "boom"
+    out, err = capsys.readouterr()
+    assert "[good] stdout line" in out and "[bad] ==> create failed" in out
+    assert err.splitlines() == ["[good] stderr line", "[bad] stderr line", "[other] stderr line"]
+    assert not isinstance(sys.stdout, PrefixedOutput) and not isinstance(sys.stderr, PrefixedOutput)
+
+
+def test_rate_limiter_spaces_out_after_the_burst():
+    async def run():
+        limiter = RateLimiter(per_minute=600, burst=2)  # one token every 0.1s
+        started = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    assert 0.25 <= asyncio.run(run()) < 1.0
+    # No limit configured
+    assert asyncio.run(asyncio.wait_for(RateLimiter(0).acquire(), 1)) is None
+
+
+def test_apply_fleet_with_simulator(simulator, dbprovision, tmp_path):
+    manifest = write_manifest(tmp_path)
+
+    result = dbprovision("apply", "-f", str(manifest), check=False)
+    assert result.returncode == 1, result.stdout + result.stderr
+    summary = result.stdout.split("Cluster ")[-1]
+    assert re.search(r"events\s+create\s+\S+\s+FAILED: phase deploy-shard-servers", summary)
+    assert re.search(r"orders\s+create\s+\S+\s+ok", summary)
+    assert re.search(r"sessions\s+create\s+\S+\s+ok", summary)
+    # Six terraform plan/apply runs at one per 0.1s after a burst of one
+    assert float(re.search(r"2 succeeded, 1 failed in ([\d.]+)s", summary).group(1)) >= 0.4
+
+    state = json.loads((simulator / "fleet-state.json").read_text())
+    assert {name: entry["status"] for name, entry in state.items()} == {
+        "events": "failed", "orders": "ok", "sessions": "ok"}
+    # Every cluster works in its own workspace
+    for name in state:
+        assert (simulator / "clusters" / name / "terraform" / f"{name}.tfvars").exists()
+
+    changed = {**MANIFEST, "clusters": [{"name": "events", "cluster_type": "sharded", "shard_count": 2},
+                                        {"name": "sessions", "replica_nodes": 3}]}
+    result = dbprovision("apply", "-f", str(write_manifest(tmp_path, changed)), "--diff")
+    assert re.search(r"~ events\s+update\s+last run failed", result.stdout)
+    assert re.search(r"~ sessions\s+update\s+changed: replica_nodes", result.stdout)
+    assert re.search(r"\? orders\s+orphaned", result.stdout)
+    assert "0 to create, 2 to update, 0 unchanged, 1 orphaned" in result.stdout
+
+
+def test_apply_fleet_closes_every_cluster(simulator, tmp_path, monkeypatch):
+    import dbprovision
+    closed = []
+    close = dbprovision.DBProvision.close
+
+    def recording_close(self):
+        runner = self.__dict__.get("runner")
+        close(self)
+        if self.workspace is not None:
+            closed.append((self.workspace.name, runner is not None and not runner.logger.handlers))
+    monkeypatch.setattr(dbprovision.DBProvision, "close", recording_close)
+
+    argv = ["apply", "-f", str(write_manifest(tmp_path))]
+    args = dbprovision.create_parser(argv).parse_args(argv)
+    with pytest.raises(SystemExit):
+        dbprovision.DBProvision(echo=False).apply_fleet(args)
+
+    assert sorted(closed) == [("events", True), ("orders", True), ("sessions", True)]
@@ -0,0 +1,116 @@
+import asyncio
+import socket
+
+from dbprov.health import HealthProber, Node
+from dbprov.testing.fakemongo import FakeMongoServer, FakeReplicaSet, start_replica_set, stop_all
+
+
+def nodes_of(rs: FakeReplicaSet):
+    return [Node(m.host, m.port, "mongod", rs.name) for m in rs.members]
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def probe(nodes, timeout=1.0, **kwargs):
+    async def run():
+        prober = HealthProber(concurrency=8, timeout=timeout, max_lag=10.0)
+        try:
+            return await prober.probe(nodes, **kwargs)
+        finally:
+            await prober.close()
+    return run()
+
+
+def test_healthy_replica_set_and_mongos():
+    async def run():
+        rs = await start_replica_set("rs0", 3)
+        mongos = await FakeMongoServer(role="mongos").start()
+        try:
+            report = await probe(nodes_of(rs) + [Node(mongos.host, mongos.port, "mongos")], server_status=True)
+        finally:
+            await stop_all(rs.members + [mongos])
+        return rs, report
+
+    rs, report = asyncio.run(run())
+    assert report.healthy, report.issues
+    assert sorted(n.state for n in report.nodes) == ["MONGOS", "PRIMARY", "SECONDARY", "SECONDARY"]
+    health = report.replica_sets["rs0"]
+    assert health.primary == rs.members[0].address
+    assert health.max_lag == 0
+    assert all(n.server_status["uptime"] is not None for n in report.nodes)
+
+
+def test_lagging_secondary_is_reported():
+    async def run():
+        rs = await start_replica_set("rs0", 3)
+        rs.lag[2] = 42.0
+        try:
+            return rs, await probe(nodes_of(rs))
+        finally:
+            await stop_all(rs.members)
+
+    rs, report = asyncio.run(run())
+    lagging = next(n for n in report.nodes if n.node.port == rs.members[2].port)
+    assert lagging.lag_seconds == 42
+    assert report.replica_sets["rs0"].max_lag == 42
+    assert any("lags 42s behind the primary" in issue for issue in report.issues)
+
+
+def test_lag_maps_to_nodes_when_members_are_configured_by_hostname():
+    async def run():
+        rs = FakeReplicaSet("rs0")
+        for i in range(3):
+            await FakeMongoServer(replica_set=rs, name=f"mongodb-{i}.internal").start()
+        rs.lag[1] = 30.0
+        try:
+            # The inventory lists IPs, the replica set config hostnames
+            return rs, await probe(nodes_of(rs))
+        finally:
+            await stop_all(rs.members)
+
+    rs, report = asyncio.run(run())
+    by_port = {n.node.port: n for n in report.nodes}
+    assert by_port[rs.members[1].port].member == f"mongodb-1.internal:{rs.members[1].port}"
+    assert by_port[rs.members[1].port].lag_seconds == 30
+    assert by_port[rs.members[2].port].lag_seconds == 0
+    assert by_port[rs.members[0].port].lag_seconds is None  # the primary
+
+
+def test_unreachable_nodes():
+    async def run():
+        rs = await start_replica_set("rs0", 3)
+        rs.down.add(2)  # accepts connections, never answers
+        gone = Node("127.0.0.1", closed_port(), "mongod", "rs0")
+        try:
+            return rs, await probe(nodes_of(rs) + [gone], timeout=0.5)
+        finally:
+            await stop_all(rs.members)
+
+    rs, report = asyncio.run(run())
+    states = {n.node.port: n for n in report.nodes}
+    assert states[rs.members[2].port].state in ("DOWN", "TIMEOUT")
+    assert not states[rs.members[2].port].ok
+    closed = [n for n in report.nodes if n.node.port not in {m.port for m in rs.members}]
+    assert closed[0].state == "DOWN" and not closed[0].ok
+    assert not report.healthy
+    assert sum("unreachable" in issue for issue in report.issues) == 2
+    # The primary's view still reports the down member
+    assert any(f"member {rs.members[2].address} is" in issue for issue in report.issues)
+    assert report.replica_sets["rs0"].primary == rs.members[0].address
+
+
+def test_conflicting_primaries():
+    async def run():
+        first = await start_replica_set("rs0", 2)
+        second = await start_replica_set("rs0", 1)  # a split brain: another set with the same name
+        try:
+            return await probe(nodes_of(first) + nodes_of(second))
+        finally:
+            await stop_all(first.members + second.members)
+
+    report = asyncio.run(run())
+    assert any("conflicting primaries" in issue for issue in report.issues)
@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import CLI_DIR
+from dbprov.loadtest import parse_mix, percentile
+
+# Orchestration-only budgets: with --time-scale 0 every simulated command is
+# instant, so these bound what the scheduler itself costs per cluster and phase
+BUDGET = ("--min-clusters-per-minute", "500", "--max-overhead-ms", "5")
+
+
+def loadtest(*args: str) -> subprocess.CompletedProcess:
+    """Run ``python -m dbprov.loadtest pipeline``; it provisions into a temporary DBPROVISION_HOME."""
+    return subprocess.run([sys.executable, "-m", "dbprov.loadtest", "pipeline", *args], cwd=CLI_DIR,
+                          capture_output=True, text=True, timeout=120)
+
+
+@pytest.mark.benchmark
+def test_pipeline_meets_throughput_and_overhead_budgets():
+    result = loadtest("--clusters", "30", "--concurrency", "10", "--time-scale", "0", *BUDGET, "--json")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    data = json.loads(result.stdout)
+    assert (data["succeeded"], data["failed"], data["quota_errors"]) == (30, 0, 0)
+    assert data["budget_failures"] == []
+    # 18 replica sets, 6 sharded and 6 standalone clusters, 3 shards each
+    assert data["nodes"] == 18 * 3 + 6 * (3 + 3 * 3 + 2) + 6
+    assert data["phases"] > 30
+    assert data["clusters_per_minute"] >= 500
+    assert data["overhead_ms_per_phase"] <= 5
+
+
+def test_pipeline_missed_budget_exits_1():
+    result = loadtest("--clusters", "5", "--time-scale", "0", "--min-clusters-per-minute", "1000000")
+
+    assert result.returncode == 1
+    assert "clusters/min < 1000000.0" in result.stdout.splitlines()[-1]
+
+
+def test_quota_errors_are_counted():
+    result = loadtest("--clusters", "6", "--mix", "replicaset", "--time-scale", "0", "--quota", "9",
+                      "--json")
+
+    data = json.loads(result.stdout)
+    assert data["succeeded"] == 3 and data["nodes"] == 9
+    assert data["quota_errors"] == data["failed"] == 3
+
+
+def test_parse_mix_and_percentile():
+    assert parse_mix("replicaset=2,sharded") == ["replicaset", "replicaset", "sharded"]
+    with pytest.raises(ValueError):
+        parse_mix("cluster=1")
+    assert percentile([], 95) == 0.0
+    assert percentile(list(range(1, 101)), 95) == 95
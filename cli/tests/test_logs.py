@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from conftest import LOG_START, log_line
+
+pytest.importorskip("numpy")  # optional dependency of dbprov.logs
+
+from dbprov.logs import LogFilter, load_logs, slow_ops_by_namespace, summary  # noqa: E402
+
+
+def analyze(dbprovision, tmp_path, *args):
+    result = dbprovision("logs", "analyze", *args, "--cache-dir", str(tmp_path / "cache"), "--json")
+    return json.loads(result.stdout)
+
+
+def test_reports_on_fixture_log(dbprovision, mongod_log, tmp_path):
+    data = analyze(dbprovision, tmp_path, str(mongod_log), "--report", "all", "--bucket", "1h")
+
+    assert data["summary"]["lines"] == 464
+    assert data["summary"]["slow_ops"] == 400
+    assert data["summary"]["first"] == LOG_START * 1000
+
+    orders, events = data["slow"]
+    assert (orders["namespace"], orders["count"], orders["collscans"]) == ("shop.orders", 300, 300)
+    assert 100 <= orders["p50_ms"] <= orders["p95_ms"] <= orders["p99_ms"] <= orders["max_ms"] < 300
+    assert (events["namespace"], events["count"], events["collscans"]) == ("shop.events", 100, 0)
+
+    latency = data["latency"]
+    assert latency["bucket_ms"] == 3_600_000
+    assert [row["count"] for row in latency["rows"]] == [200, 200]
+    assert sum(sum(row["histogram"]) for row in latency["rows"]) == 400
+
+    churn = data["connections"]
+    assert (churn["accepted"], churn["ended"]) == (30, 30)
+    assert {r["remote"] for r in churn["remotes"]} == {"10.0.1.0", "10.0.1.2"}
+
+    assert [e.get("newState") for e in data["elections"]] == ["PRIMARY", None]
+
+
+def test_filters(dbprovision, mongod_log, tmp_path):
+    data = analyze(dbprovision, tmp_path, str(mongod_log), "--namespace", "shop.ev*", "--report", "slow")
+    assert [row["namespace"] for row in data["slow"]] == ["shop.events"]
+
+    data = analyze(dbprovision, tmp_path, str(mongod_log), "--min-ms", "250", "--since", "2024-03-01T01:00:00Z",
+                   "--report", "slow")
+    [orders] = data["slow"]
+    assert orders["namespace"] == "shop.orders"
+    assert orders["count"] < 100 and orders["p50_ms"] >= 250
+
+
+def test_cache_is_reused_and_extended(mongod_log, tmp_path):
+    cache, messages = tmp_path / "cache", []
+    first = summary(load_logs([mongod_log], cache, progress=messages.append))
+    assert messages[0].startswith("Parsing") and first["slow_ops"] == 400
+
+    messages.clear()
+    assert summary(load_logs([mongod_log], cache, progress=messages.append))["lines"] == 464
+    assert messages == []
+
+    # A log that only grew is parsed from where the cache ends
+    with open(mongod_log, "a") as f:
+        for i in range(5):
+            f.write(log_line(LOG_START + 7200 + i, "COMMAND", 51803, "Slow query", type="command", ns="shop.carts",
+                             command={"find": "carts"}, planSummary="COLLSCAN", durationMillis=900) + "\n")
+    table = load_logs([mongod_log], cache, progress=messages.append)
+    assert "from byte" in messages[0]
+    assert summary(table)["slow_ops"] == 405
+    assert slow_ops_by_namespace(table, LogFilter(), top=1)[0]["namespace"] == "shop.orders"
+
+    # Rewritten (e.g. rotated) logs are parsed from scratch
+    mongod_log.write_text(log_line(LOG_START, "CONTROL", 23403, "Build Info") + "\n")
+    messages.clear()
+    assert summary(load_logs([mongod_log], cache, progress=messages.append))["slow_ops"] == 0
+    assert messages[0].startswith("Parsing")
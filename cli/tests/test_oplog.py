@@ -0,0 +1,213 @@
+import asyncio
+import copy
+
+import pytest
+
+from dbprov.backup import BackupEngine, BackupOptions, BackupSource, LocalTarget, get_codec
+from dbprov.health import Node
+from dbprov.oplog import (
+    OplogError, OplogTailer, RestoreEngine, TailOptions, coverage, list_segments, plan_restore, read_segment,
+    resume_points,
+)
+from dbprov.testing.fakemongo import (
+    FakeMongoServer, FakeStore, enable_crud, enable_sharding, start_replica_set, stop_all,
+)
+from dbprov.wire import Binary, MaxKey, MinKey, MongoConnection
+
+CODEC = get_codec("zlib")
+TAIL = TailOptions(segment_size=300, await_ms=50)
+
+
+async def run_commands(server: FakeMongoServer, *commands):
+    conn = await MongoConnection.open(server.host, server.port)
+    try:
+        for cmd in commands:
+            await conn.command("shop", cmd)
+    finally:
+        await conn.close()
+
+
+def insert(*docs):
+    return {"insert": "orders", "documents": list(docs)}
+
+
+def update(_id, changes):
+    return {"update": "orders", "updates": [{"q": {"_id": _id}, "u": {"$set": changes}}]}
+
+
+def delete(_id):
+    return {"delete": "orders", "deletes": [{"q": {"_id": _id}, "limit": 1}]}
+
+
+async def tail(target, source: BackupSource, until: asyncio.Event, options: TailOptions = TAIL):
+    stop = asyncio.Event()
+    tailer = OplogTailer(target, CODEC, source, options)
+    task = asyncio.ensure_future(tailer.run(resume_points(target, "shop", [source.shard])[source.shard], stop))
+    await until.wait()
+    await asyncio.sleep(0.3)
+    stop.set()
+    return tailer, await task
+
+
+def test_segments_chain_and_restore_to_a_point_in_time(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+
+    async def run():
+        rs = await start_replica_set("rs0", 1)
+        primary = rs.members[0]
+        store = enable_crud(primary, FakeStore(oplog=True))
+        try:
+            await run_commands(primary, insert(*({"_id": i, "qty": i} for i in range(10))))
+            source = BackupSource("rs0", primary.host, primary.port)
+            manifest = await BackupEngine(target, CODEC).run("shop", [source])
+
+            done = asyncio.Event()
+            tailing = asyncio.ensure_future(tail(target, source, done))
+            await run_commands(primary, update(1, {"qty": 100}), delete(2), insert({"_id": 10, "qty": 10}))
+            point = store.oplog[-1]["ts"]
+            snapshot = copy.deepcopy(store.collection("shop", "orders").docs)
+            await run_commands(primary, update(3, {"qty": 300}), delete(4), insert({"_id": 11}))
+            done.set()
+            tailer, stats = await tailing
+
+            async with FakeMongoServer() as destination:
+                restored = enable_crud(destination)
+                plan = plan_restore(target, "shop", until=point)
+                restore = await RestoreEngine(target).run(plan, destination.host, destination.port)
+            return manifest, store, stats, plan, restore, restored, point, snapshot
+        finally:
+            await stop_all(rs.members)
+
+    manifest, store, stats, plan, restore, restored, point, snapshot = asyncio.run(run())
+
+    # Every entry after the backup started, in chained segments
+    segments = list_segments(target)["rs0"]
+    assert stats.entries == 6 and stats.segments == len(segments) > 1
+    assert all(b.start == a.end for a, b in zip(segments, segments[1:]))
+    assert coverage(segments) == [(manifest.shards["rs0"]["oplog_start"], store.oplog[-1]["ts"])]
+    tailed = [(e["ts"], e["op"], e["o"]) for segment in segments for e in read_segment(target, segment)]
+    assert tailed == [(e["ts"], e["op"], e["o"]) for e in store.oplog[-6:]]
+
+    assert plan.base.id == manifest.id and plan.stops["rs0"] == point
+    assert restore.entries == 3
+    assert restored.collection("shop", "orders").docs == snapshot
+
+
+def test_tailer_follows_a_failover(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+    finds = []
+
+    async def run():
+        rs = await start_replica_set("rs0", 2)
+        store = FakeStore(oplog=True)
+        for member in rs.members:
+            enable_crud(member, store)
+            find = member.commands["find"]
+
+            def record(server, cmd, find=find):
+                if cmd["find"] == "oplog.rs" and cmd.get("tailable"):
+                    finds.append((server.address, cmd.get("readConcern")))
+                return find(server, cmd)
+            member.register("find", record)
+        old, new = rs.members
+        try:
+            await run_commands(old, insert({"_id": 1}))
+            source = BackupSource("rs0", old.host, old.port)
+            await BackupEngine(target, CODEC).run("shop", [source])
+            done = asyncio.Event()
+            tailing = asyncio.ensure_future(tail(target, source, done, TailOptions(await_ms=50)))
+            await run_commands(old, insert({"_id": 2}))
+            await asyncio.sleep(0.2)
+
+            rs.down.add(0)
+            rs.elect(1)
+            await run_commands(new, insert({"_id": 3}), update(2, {"moved": True}))
+            # The tailer waits a second before looking for another member
+            await asyncio.sleep(1.5)
+            done.set()
+            tailer, stats = await tailing
+            return tailer, stats, store, old, new
+        finally:
+            await stop_all(rs.members)
+
+    tailer, stats, store, old, new = asyncio.run(run())
+
+    assert tailer.source.address == new.address and tailer.source.state == "PRIMARY"
+    assert sorted(tailer.members) == sorted([old.address, new.address])
+    assert stats.entries == 3 and stats.position == store.oplog[-1]["ts"]
+    assert [entry["ts"] for segment in list_segments(target)["rs0"]
+            for entry in read_segment(target, segment)] == [entry["ts"] for entry in store.oplog[-3:]]
+    assert [address for address, _ in finds] == [old.address, new.address]
+    assert all(read_concern == {"level": "majority"} for _, read_concern in finds)
+
+
+def test_tailer_refuses_another_replica_set(tmp_path):
+    async def run():
+        rs = await start_replica_set("rs1", 1)
+        enable_crud(rs.members[0], FakeStore(oplog=True))
+        try:
+            tailer = OplogTailer(LocalTarget(tmp_path), CODEC, BackupSource("rs0", rs.members[0].host,
+                                                                            rs.members[0].port))
+            await tailer.connect()
+        finally:
+            await stop_all(rs.members)
+
+    with pytest.raises(OplogError, match="rs0: no readable member .*member of rs1"):
+        asyncio.run(run())
+
+
+def test_sharded_restore_keeps_the_owning_shards_copy(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+    uuid = Binary(b"\x01" * 16, 4)
+
+    async def run():
+        async with FakeMongoServer(role="mongos") as mongos, FakeMongoServer() as a, FakeMongoServer() as b, \
+                FakeMongoServer() as destination:
+            config = enable_sharding(mongos)
+            # Off already, so the fake balancer cannot even out the 3:1 chunk split before the backup starts
+            config.collection("config", "settings").insert({"_id": "balancer", "stopped": True})
+            config.collection("config", "shards").insert({"_id": "sh0", "host": f"rs0/{a.address}"})
+            config.collection("config", "shards").insert({"_id": "sh1", "host": f"rs1/{b.address}"})
+            config.collection("config", "collections").insert({"_id": "shop.orders", "key": {"_id": 1}, "uuid": uuid})
+            chunks = config.collection("config", "chunks")
+            for i, (low, high, shard) in enumerate([(MinKey, 10, "sh0"), (10, 20, "sh0"), (20, 30, "sh1"),
+                                                    (30, MaxKey, "sh0")]):
+                chunks.insert({"_id": i, "uuid": uuid, "min": {"_id": low}, "max": {"_id": high}, "shard": shard})
+
+            first, second = enable_crud(a).collection("shop", "orders"), enable_crud(b).collection("shop", "orders")
+            for i in range(40):
+                (second if 20 <= i < 30 else first).insert({"_id": i, "owner": True})
+            # Left behind on rs0 by a migration of [20, 30) whose range deletion has not run yet
+            for i in range(20, 25):
+                first.insert({"_id": i, "owner": False})
+
+            sources = [BackupSource("rs0", a.host, a.port), BackupSource("rs1", b.host, b.port)]
+            manifest = await BackupEngine(target, CODEC, BackupOptions(batch_size=7)).run(
+                "shop", sources, Node(mongos.host, mongos.port, "mongos"))
+            restored = enable_crud(destination)
+            stats = await RestoreEngine(target).run(plan_restore(target, "shop", manifest.id),
+                                                    destination.host, destination.port)
+            return manifest, stats, restored
+
+    manifest, stats, restored = asyncio.run(run())
+
+    assert {(d.shard, d.documents, str(d.shard_key)) for d in manifest.collections} == {
+        ("rs0", 30, "{'_id': 1}"), ("rs1", 10, "{'_id': 1}")}
+    assert stats.documents == 40 and stats.duplicates == 0
+    docs = restored.collection("shop", "orders").docs
+    assert len(docs) == 40 and all(doc["owner"] for doc in docs.values())
+
+
+def test_restore_plan_warns_about_dumps_without_ownership(tmp_path):
+    target = LocalTarget(tmp_path / "backups")
+
+    async def run():
+        async with FakeMongoServer() as a, FakeMongoServer() as b:
+            for server in (a, b):
+                enable_crud(server).collection("shop", "orders").insert({"_id": 1})
+            sources = [BackupSource("rs0", a.host, a.port), BackupSource("rs1", b.host, b.port)]
+            return await BackupEngine(target, CODEC).run("shop", sources)
+
+    manifest = asyncio.run(run())
+    assert plan_restore(target, "shop", manifest.id).warnings[0].startswith(
+        "shop.orders dumped from several shards without chunk ownership")
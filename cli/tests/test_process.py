@@ -0,0 +1,83 @@
+import asyncio
+import gc
+import logging
+import sys
+import time
+
+from dbprov.process import ProcessRunner
+
+
+def test_output_is_captured_and_logged(tmp_path):
+    log = tmp_path / "run.log"
+    runner = ProcessRunner(log_file=log, echo=False)
+    lines = []
+    result = runner.run([sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr)"],
+                        label="py", capture=True, on_line=lambda stream, line: lines.append((stream, line)))
+    runner.close()
+
+    assert result.ok and result.stdout == "out"
+    assert sorted(lines) == [("stderr", "err"), ("stdout", "out")]
+    text = log.read_text()
+    assert "[py] out" in text and "[py] err" in text and "[py] exit=0" in text
+
+
+def test_runners_never_share_log_handlers(tmp_path):
+    # A runner that is collected without close() must not pass its handler on to the next one,
+    # which may well be allocated at the same address
+    for i in range(5):
+        runner = ProcessRunner(log_file=tmp_path / f"{i}.log", echo=False)
+        assert runner.logger.name not in logging.Logger.manager.loggerDict
+        runner.logger.info("cluster %d", i)
+        runner.logger.handlers[0].flush()
+        del runner
+        gc.collect()
+
+    for i in range(5):
+        assert (tmp_path / f"{i}.log").read_text().count("cluster") == 1
+
+
+def test_close_releases_the_log_file(tmp_path):
+    runner = ProcessRunner(log_file=tmp_path / "run.log", echo=False)
+    [handler] = runner.logger.handlers
+    runner.close()
+    assert runner.logger.handlers == [] and handler.stream is None
+
+
+def test_timeout_kills_the_process_group():
+    runner = ProcessRunner(echo=False, kill_grace=1.0)
+    started = time.monotonic()
+    result = runner.run(["sh", "-c", "sleep 30 & sleep 30"], timeout=0.2)
+
+    assert result.timed_out and not result.ok
+    assert time.monotonic() - started < 5
+
+
+def test_does_not_wait_for_a_grandchild_holding_the_pipes(tmp_path):
+    runner = ProcessRunner(log_file=tmp_path / "run.log", echo=False, drain_timeout=0.2)
+    started = time.monotonic()
+    # The background sleep inherits stdout, like an ssh ControlPersist master
+    result = runner.run(["sh", "-c", "sleep 5 & echo started"])
+    runner.close()
+
+    assert result.ok and result.tail == ["started"]
+    assert time.monotonic() - started < 3
+    assert "no longer reading it" in (tmp_path / "run.log").read_text()
+
+
+def test_cancellation_propagates():
+    runner = ProcessRunner(echo=False, kill_grace=1.0)
+
+    async def run():
+        task = asyncio.ensure_future(runner.run_async(["sleep", "30"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await task
+
+    started = time.monotonic()
+    try:
+        asyncio.run(run())
+    except asyncio.CancelledError:
+        pass
+    else:
+        raise AssertionError("run_async swallowed the cancellation")
+    assert time.monotonic() - started < 5
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import contextlib
+import threading
+from pathlib import Path
+
+import pytest
+
+from dbprov.health import HealthProber, Node
+from dbprov.rolling import (
+    DONE, RollingError, RollingOperation, RollingOptions, instance_address, plan_rolling, simulate, upgrade_problem,
+)
+from dbprov.testing.fakemongo import start_replica_set, stop_all
+
+
+def nodes_of(servers):
+    return [Node(s.host, s.port) for s in servers]
+
+
+async def probe(servers, timeout: float = 3.0):
+    prober = HealthProber(timeout=timeout)
+    try:
+        return await prober.probe(nodes_of(servers))
+    finally:
+        await prober.close()
+
+
+def test_simulated_restart_keeps_order_and_blast_radius():
+    options = RollingOptions(blast_radius=2, poll_interval=0.05, step_timeout=30)
+    events = []
+    report = asyncio.run(simulate(options, shards=2, downtime=0.1, catch_up=0.1, progress=events.append))
+
+    assert report.ok, report.format()
+    assert all(s.status == DONE for s in report.steps)
+    sets = [s.replica_set for s in report.steps]
+    assert sets[:3] == ["configRS"] * 3
+    assert sets[-2:] == ["mongos", "mongos"]
+    for name in ("configRS", "shard1", "shard2"):
+        steps = [s for s in report.steps if s.replica_set == name]
+        assert [s.role for s in steps] == ["secondary", "secondary", "primary"]
+        assert steps[-1].election_seconds is not None
+
+    # With a blast radius of 2 both shards have a node down at the same time
+    down, overlapped = set(), False
+    for event in events:
+        if event.startswith("==> [shard"):
+            shard = event.split()[1].lstrip("[")
+            if event.endswith("started"):
+                down.add(shard)
+            elif "finished" in event:
+                down.discard(shard)
+            overlapped |= down == {"shard1", "shard2"}
+    assert overlapped
+
+
+def test_rolling_simulate_command(dbprovision):
+    result = dbprovision("rolling", "--cluster", "sim", "--simulate", "--fake-shards", "1", "--fake-downtime", "0.1")
+
+    assert "Rolling restart (simulated): 8/8 nodes" in result.stdout
+
+
+def test_instance_address():
+    assert instance_address("shard-server-4") == "module.shard_servers.google_compute_instance.mongodb_instances[3]"
+    with pytest.raises(RollingError):
+        instance_address("bastion-1")
+
+
+def test_resize_serializes_terraform_and_leaves_cluster_vars_alone(tmp_path, monkeypatch):
+    monkeypatch.setenv("DBPROVISION_HOME", str(tmp_path / "home"))
+    import dbprovision
+    provision = dbprovision.DBProvision(workspace=tmp_path / "orders")
+    tfvars = provision.terraform_dir / "orders.tfvars"
+    original = dbprovision.render_tfvars({"cluster_name": "orders", "instance_type": "e2-standard-4"})
+    tfvars.write_text(original)
+
+    applies, running = [], []
+
+    async def fake_terraform(action, vars_file=None, plan_file=None, targets=None):
+        running.append(targets)
+        assert len(running) == 1, "terraform applies overlapped on one state"
+        assert tfvars.read_text() == original
+        applies.append((Path(vars_file), Path(vars_file).read_text(), targets))
+        await asyncio.sleep(0.01)
+        running.remove(targets)
+
+    monkeypatch.setattr(provision, "run_terraform_async", fake_terraform)
+    args = argparse.Namespace(operation="resize", cluster="orders", instance_type="e2-standard-8")
+    resize, finish = provision.rolling_action(args)
+
+    nodes = [Node(f"10.0.0.{i}", 27018, name=f"shard-server-{i}") for i in range(1, 5)]
+
+    async def run():
+        await asyncio.gather(*(resize(node) for node in nodes))
+
+    asyncio.run(run())
+
+    assert len(applies) == 4
+    assert len({path for path, _, _ in applies}) == 4  # a vars file of its own per apply
+    assert all('instance_type = "e2-standard-8"' in text for _, text, _ in applies)
+    assert sorted(targets[0] for _, _, targets in applies) == [instance_address(n.name) for n in nodes]
+    assert not any(path.exists() for path, _, _ in applies)
+    assert tfvars.read_text() == original
+
+    finish()
+    assert 'instance_type = "e2-standard-8"' in tfvars.read_text()
+
+
+def test_primary_elected_after_planning_is_stepped_down_first():
+    options = RollingOptions(poll_interval=0.05, step_timeout=10)
+
+    async def run():
+        rs = await start_replica_set("rs0", 3)
+        acted = []
+
+        async def action(node: Node):
+            index = next(i for i, m in enumerate(rs.members) if m.address == node.address)
+            acted.append((node.address, rs.primary == index))
+
+        operation = RollingOperation(action, options)
+        try:
+            plan = plan_rolling(await operation.prober.probe(nodes_of(rs.members)))
+            # An election between planning and rolling makes a planned secondary the primary
+            rs.elect(1)
+            return rs, acted, await operation.run("restart", plan)
+        finally:
+            await operation.close()
+            await stop_all(rs.members)
+
+    rs, acted, report = asyncio.run(run())
+
+    assert report.ok, report.format()
+    roles = {s.node.address: s.role for s in report.steps}
+    assert roles[rs.members[1].address] == "primary"
+    assert report.steps[-1].node.address == rs.members[0].address
+    assert all(s.election_seconds is not None for s in report.steps if s.role == "primary")
+    assert not any(was_primary for _, was_primary in acted)
+
+
+def test_plan_refuses_down_or_missing_members():
+    async def run():
+        rs = await start_replica_set("rs0", 3)
+        try:
+            missing = await probe(rs.members[:2])
+            rs.down.add(2)
+            down = await probe(rs.members, timeout=0.3)
+            return rs, missing, down
+        finally:
+            await stop_all(rs.members)
+
+    rs, missing, down = asyncio.run(run())
+
+    with pytest.raises(RollingError, match="rs0 has 3 members but only 2 were given"):
+        plan_rolling(missing)
+    with pytest.raises(RollingError, match=f"unreachable: {rs.members[2].address}"):
+        plan_rolling(down)
+
+
+@pytest.mark.parametrize("target, versions, fcv, problem", [
+    ("8.0", ["7.0.12", "7.0.12"], {"version": "7.0"}, None),
+    ("8.0", ["8.0.1", "7.0.12"], {"version": "7.0"}, None),
+    ("8.0", ["8.0.1", "8.0.1"], {"version": "7.0"}, None),
+    ("7.0", ["8.0.1", "7.0.12"], {"version": "7.0"}, "a rolling upgrade cannot downgrade to 7.0"),
+    ("8.0", ["6.0.5", "6.0.5"], {"version": "6.0"}, "one major release at a time"),
+    ("8.0", ["7.0.12", "7.0.12"], {"version": "6.0"}, "featureCompatibilityVersion is 6.0; set it to 7.0"),
+    ("8.0", ["7.0.12", "7.0.12"], {"version": "6.0", "targetVersion": "7.0"}, "moving from 6.0 to 7.0"),
+])
+def test_upgrade_problem(target, versions, fcv, problem):
+    found = upgrade_problem(target, {f"10.0.0.{i}:27018": v for i, v in enumerate(versions)}, {"rs0": fcv})
+
+    assert found is None if problem is None else problem in found
+
+
+@contextlib.contextmanager
+def replica_set_in_background(name: str, size: int = 3):
+    """A fake replica set served from another thread, for code that runs its own event loop."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    rs = asyncio.run_coroutine_threadsafe(start_replica_set(name, size), loop).result()
+    try:
+        yield rs
+    finally:
+        asyncio.run_coroutine_threadsafe(stop_all(rs.members), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@pytest.mark.parametrize("version, error", [("8.0", None), ("7.0", "cannot downgrade to 7.0")])
+def test_upgrade_dry_run_checks_versions_and_writes_nothing(tmp_path, monkeypatch, capsys, version, error):
+    monkeypatch.setenv("DBPROVISION_HOME", str(tmp_path / "home"))
+    import dbprovision
+    provision = dbprovision.DBProvision(workspace=tmp_path / "orders")
+
+    with replica_set_in_background("rs0") as rs:
+        hosts = ",".join(m.address for m in rs.members)
+        argv = ["rolling", "--cluster", "orders", "--operation", "upgrade", "--mongodb-version", version,
+                "--hosts", hosts, "--dry-run"]
+        args = dbprovision.create_parser(argv).parse_args(argv)
+        if error:
+            with pytest.raises(SystemExit):
+                provision.run_rolling(args)
+        else:
+            provision.run_rolling(args)
+
+    out = capsys.readouterr().out
+    assert f"already run 8.0.0; a rolling upgrade {error}" in out if error else "Rolling upgrade of orders" in out
+    assert not (provision.inventory_root / "rolling").exists()
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from dbprov.health import Node, parse_inventory
+from dbprov.scale import (
+    BalancerSettings,
+    MigrationMonitor,
+    ScaleError,
+    ScaleOptions,
+    add_inventory_hosts,
+    chunks_to_move,
+    data_to_move,
+    new_instance_targets,
+    parse_window,
+    simulate,
+)
+from dbprov.testing.fakemongo import FakeMongoServer, enable_sharding
+from dbprov.wire import ConnectionPool
+
+MB = 1024 * 1024
+
+
+def test_simulated_scale_out_rebalances_onto_new_shard():
+    options = ScaleOptions(poll_interval=0.05, settle=1.0, sync_timeout=30, watch_timeout=60)
+    balancer = BalancerSettings(window=parse_window("00:00-23:59"), secondary_throttle=True)
+    messages = []
+    result = asyncio.run(simulate(options, balancer, shards=2, new_shards=1, new_members=1, chunks=30,
+                                  move_seconds=0.01, progress=messages.append))
+
+    # Balanced by data: with 128MB chunks the shards end within three chunks of each other
+    assert result.shards == {"shard1": 11, "shard2": 11, "shard3": 8}
+    assert result.progress.balanced and result.progress.sample.by_data
+    assert result.progress.remaining == 0
+    assert result.progress.sample.moved == 8
+    assert result.progress.sample.shard_bytes == {"shard1": 11 * 128 * MB, "shard2": 11 * 128 * MB,
+                                                  "shard3": 8 * 128 * MB}
+    assert any(m.startswith("Added shard shard3") for m in messages)
+
+
+def test_scale_simulate_command(dbprovision):
+    result = dbprovision("scale", "--cluster", "sim", "--simulate", "--shards", "3", "--fake-chunks", "12")
+
+    assert "Balanced 12 chunks over 3 shards" in result.stdout
+
+
+def test_chunks_to_move():
+    assert chunks_to_move({"a": 30, "b": 30, "c": 0}) == 20
+    assert chunks_to_move({"a": 11, "b": 10, "c": 10}) == 0
+    assert chunks_to_move({"a": 5}) == 0
+
+
+def test_data_to_move():
+    assert data_to_move({"a": 600 * MB, "b": 600 * MB, "c": 0}, 384 * MB) == 400 * MB
+    assert data_to_move({"a": 600 * MB, "b": 300 * MB, "c": 300 * MB}, 384 * MB) == 0
+    assert data_to_move({"a": 600 * MB}, 384 * MB) == 0
+
+
+def sample_monitor(version, chunks, stopped=True):
+    """One sample of a fake cluster whose mongos reports ``version``; chunks are ``(shard, bytes)``."""
+    async def run():
+        async with FakeMongoServer(role="mongos") as mongos:
+            major, minor, patch = (int(part) for part in version.split("."))
+            mongos.register("buildInfo", lambda server, cmd: {"version": version,
+                                                              "versionArray": [major, minor, patch, 0]})
+            config = enable_sharding(mongos)
+            config.collection("config", "settings").insert({"_id": "balancer", "stopped": stopped})
+            for name in ("sh0", "sh1"):
+                config.collection("config", "shards").insert({"_id": name, "host": f"{name}/h:27018"})
+            for i, (shard, size) in enumerate(chunks):
+                config.collection("config", "chunks").insert({"_id": i, "ns": "app.events", "shard": shard,
+                                                              "bytes": size, "count": size // 1024})
+            pool = ConnectionPool()
+            try:
+                monitor = MigrationMonitor(pool, Node(mongos.host, mongos.port, "mongos"))
+                return monitor.progress(await monitor.sample())
+            finally:
+                await pool.close()
+
+    return asyncio.run(run())
+
+
+def test_monitor_follows_data_size_from_6_0_3():
+    # Even chunk counts, but sh0's chunks hold five times the data
+    progress = sample_monitor("8.0.0", [("sh0", 500 * MB), ("sh0", 500 * MB), ("sh1", 100 * MB), ("sh1", 100 * MB)])
+
+    assert progress.sample.by_data and not progress.sample.compliant
+    assert progress.sample.threshold == 384 * MB
+    assert progress.sample.data == {"app.events": {"sh0": 1000 * MB, "sh1": 200 * MB}}
+    assert progress.remaining == 400 * MB and not progress.balanced
+    assert progress.format().startswith("Balancing: moved=0 remaining=400.0MB rate=0B/min eta=- (balancer off)")
+    assert progress.format().endswith("| sh0=1000.0MB/2 sh1=200.0MB/2")
+
+
+def test_monitor_counts_chunks_before_6_0_3():
+    progress = sample_monitor("6.0.2", [("sh0", 500 * MB), ("sh0", 500 * MB), ("sh1", 100 * MB), ("sh1", 100 * MB)])
+
+    assert not progress.sample.by_data and progress.sample.data == {}
+    assert progress.remaining == 0 and progress.balanced
+
+
+def test_parse_window():
+    assert parse_window("01:00-05:30") == {"start": "01:00", "stop": "05:30"}
+    assert parse_window("any") == {}
+    with pytest.raises(ScaleError):
+        parse_window("25:00-05:00")
+    assert BalancerSettings(window={}).update() == {"$unset": {"activeWindow": 1}}
+
+
+def test_new_instance_targets_cover_only_new_shards_and_routers():
+    targets = new_instance_targets(current_shards=2, shards=3, current_routers=2, routers=3)
+    assert targets == [
+        "module.shard_servers.google_compute_instance.mongodb_instances[6]",
+        "module.shard_servers.google_compute_instance.mongodb_instances[7]",
+        "module.shard_servers.google_compute_instance.mongodb_instances[8]",
+        "module.mongo_routers.google_compute_instance.mongodb_instances[2]",
+    ]
+
+
+def test_add_inventory_hosts_is_idempotent(tmp_path):
+    inventory = tmp_path / "shard-servers.ini"
+    inventory.write_text("[shard1]\nshard-server-1 ansible_host=10.0.0.1\n\n[all:vars]\nansible_user=mongodb\n")
+    hosts = [("shard-server-4", {"ansible_host": "10.0.0.4"}), ("shard-server-1", {"ansible_host": "10.0.0.1"})]
+
+    assert add_inventory_hosts(inventory, "shard1", hosts) == 1
+    assert add_inventory_hosts(inventory, "shard1", hosts) == 0
+    assert [name for name, _ in parse_inventory(inventory)["shard1"]] == ["shard-server-1", "shard-server-4"]
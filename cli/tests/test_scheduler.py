@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from dbprov.scheduler import PhaseScheduler
+
+
+def sleeper(log, name, seconds=0.02, fail=False):
+    async def action():
+        log.append(("start", name))
+        await asyncio.sleep(seconds)
+        log.append(("end", name))
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        return name
+    return action
+
+
+def test_dependencies_start_after_they_finish():
+    log = []
+    scheduler = PhaseScheduler(max_workers=4)
+    scheduler.add("network", sleeper(log, "network"))
+    scheduler.add("config", sleeper(log, "config"), ["network"])
+    scheduler.add("shards", sleeper(log, "shards"), ["network"])
+    scheduler.add("mongos", sleeper(log, "mongos"), ["config", "shards"])
+
+    report = scheduler.run()
+
+    assert report.ok and report.results["mongos"].value == "mongos"
+    position = {event: i for i, event in enumerate(log)}
+    for phase, deps in (("config", ["network"]), ("shards", ["network"]), ("mongos", ["config", "shards"])):
+        assert all(position[("end", d)] < position[("start", phase)] for d in deps)
+    # Independent phases overlap
+    assert position[("start", "shards")] < position[("end", "config")]
+    assert report.results["mongos"].ready == max(report.results[d].finished for d in ("config", "shards"))
+
+
+def test_worker_limit():
+    running, peak = 0, 0
+
+    async def action():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    scheduler = PhaseScheduler(max_workers=2)
+    for i in range(6):
+        scheduler.add(f"p{i}", action)
+    report = scheduler.run()
+
+    assert report.ok and peak == 2
+    assert [len(stage) for stage in scheduler.stages()] == [2, 2, 2]
+
+
+def test_blocking_actions_run_on_threads():
+    scheduler = PhaseScheduler(max_workers=3)
+    for i in range(3):
+        scheduler.add(f"p{i}", lambda: time.sleep(0.1))
+
+    report = scheduler.run()
+    assert report.ok and report.wall_time < report.serial_time
+
+
+def test_no_new_phases_after_a_failure():
+    log = []
+    scheduler = PhaseScheduler(max_workers=2)
+    scheduler.add("bad", sleeper(log, "bad", 0.01, fail=True))
+    scheduler.add("slow", sleeper(log, "slow", 0.05))
+    scheduler.add("after-bad", sleeper(log, "after-bad"), ["bad"])
+    scheduler.add("after-slow", sleeper(log, "after-slow"), ["slow"])
+
+    report = scheduler.run()
+
+    assert not report.ok
+    assert [r.name for r in report.failures] == ["bad"]
+    assert str(report.failures[0].error) == "bad failed"
+    assert report.results["slow"].ok  # already running, allowed to finish
+    assert report.skipped == ["after-bad", "after-slow"]
+    assert "after-bad" in report.format() and "skipped" in report.format()
+
+
+def test_critical_path_follows_the_latest_dependency():
+    log = []
+    scheduler = PhaseScheduler(max_workers=4)
+    scheduler.add("network", sleeper(log, "network", 0.01))
+    scheduler.add("config", sleeper(log, "config", 0.01), ["network"])
+    scheduler.add("shards", sleeper(log, "shards", 0.08), ["network"])
+    scheduler.add("mongos", sleeper(log, "mongos", 0.01), ["config", "shards"])
+
+    report = scheduler.run()
+    assert report.critical_path == ["network", "shards", "mongos"]
+    assert "Critical path (*): network -> shards -> mongos" in report.format()
+
+
+def test_listener_sees_every_transition():
+    events = []
+    scheduler = PhaseScheduler(listener=lambda name, state, result: events.append((name, state)))
+    scheduler.add("a", lambda: None)
+    scheduler.add("b", lambda: 1 / 0, ["a"])
+    scheduler.run()
+
+    assert events == [("a", "started"), ("a", "finished"), ("b", "started"), ("b", "failed")]
+
+
+def test_validation():
+    scheduler = PhaseScheduler()
+    scheduler.add("a", lambda: None, ["b"])
+    scheduler.add("b", lambda: None, ["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        scheduler.validate()
+    with pytest.raises(ValueError, match="Duplicate"):
+        scheduler.add("a", lambda: None)
+
+    scheduler = PhaseScheduler()
+    scheduler.add("a", lambda: None, ["missing"])
+    with pytest.raises(ValueError, match="unknown phase missing"):
+        scheduler.validate()
+    with pytest.raises(ValueError):
+        PhaseScheduler(max_workers=0)
@@ -0,0 +1,23 @@
+import pytest
+
+from dbprov.startup import CASES, CaseResult, format_results, measure
+
+RUNS = 5
+
+
+@pytest.mark.benchmark
+def test_commands_start_within_budget():
+    baseline, results = measure(CASES, runs=RUNS)
+
+    report = format_results(baseline, results, RUNS)
+    assert [r.name for r in results] == [c.name for c in CASES]
+    assert all(r.returncode == 0 for r in results), report
+    assert all(r.ok for r in results), report
+
+
+def test_failed_command_is_not_ok():
+    failed = CaseResult("status", 60.0, 70.0, 20.0, 100.0, returncode=2)
+
+    assert not failed.ok
+    assert format_results(40.0, [failed], 5).splitlines()[-2:] == [
+        "status                  60.0ms    70.0ms    20.0ms    100ms  FAILED", f"{'':<20} exited 2"]
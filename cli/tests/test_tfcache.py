@@ -0,0 +1,155 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from dbprov.process import ProcessResult
+from dbprov.tfcache import LOCK_FILE, STATE_FILE, TerraformCache
+
+
+class StubTerraform:
+    """Stands in for the process runner: records terraform actions and leaves behind what they would."""
+
+    def __init__(self, plan_exit: int = 2):
+        self.plan_exit = plan_exit
+        self.commands = []
+
+    async def run_async(self, cmd, cwd=None, **kwargs) -> ProcessResult:
+        action, directory = cmd[1], Path(cwd)
+        self.commands.append(cmd[1:])
+        returncode = 0
+        if action == "init":
+            (directory / ".terraform" / "providers" / "google").mkdir(parents=True, exist_ok=True)
+        elif action == "plan":
+            out = next(arg for arg in cmd if arg.startswith("-out="))
+            Path(out[len("-out="):]).write_text("plan")
+            returncode = self.plan_exit
+        elif action == "apply":
+            bump_serial(directory)
+        return ProcessResult(cmd=list(cmd), returncode=returncode, duration=0.0, tail=[])
+
+    def actions(self):
+        return [command[0] for command in self.commands]
+
+
+def bump_serial(terraform_dir: Path):
+    state = terraform_dir / STATE_FILE
+    serial = json.loads(state.read_text())["serial"] + 1 if state.exists() else 1
+    state.write_text(json.dumps({"lineage": "l1", "serial": serial}))
+
+
+@pytest.fixture
+def provision(tmp_path, monkeypatch):
+    monkeypatch.setenv("DBPROVISION_HOME", str(tmp_path / "home"))
+    import dbprovision
+    provision = dbprovision.DBProvision(workspace=tmp_path / "orders", echo=False)
+    provision.runner = StubTerraform()
+    return provision
+
+
+def deploy(provision, cluster: str, vars_file: Path, force: bool = False):
+    async def run():
+        await provision.terraform_init_phase(force)
+        await provision.terraform_plan_phase(cluster, str(vars_file), force)
+        await provision.terraform_apply_phase(cluster)
+    asyncio.run(run())
+
+
+def write_vars(provision, cluster: str, instance_type: str = "e2-standard-4") -> Path:
+    path = provision.terraform_dir / f"{cluster}.tfvars"
+    path.write_text(f'cluster_name = "{cluster}"\ninstance_type = "{instance_type}"\n')
+    return path
+
+
+def test_init_is_skipped_until_sources_or_lock_change(provision):
+    stub, cache = provision.runner, provision.terraform_cache
+
+    asyncio.run(provision.terraform_init_phase())
+    asyncio.run(provision.terraform_init_phase())
+    assert stub.actions() == ["init"]
+
+    (provision.terraform_dir / "extra.tf").write_text('variable "x" {}\n')
+    cache.invalidate_sources()
+    asyncio.run(provision.terraform_init_phase())
+    assert stub.actions() == ["init", "init"]
+
+    (provision.terraform_dir / LOCK_FILE).write_text('provider "google" { version = "5.0.0" }\n')
+    cache.invalidate_sources()
+    asyncio.run(provision.terraform_init_phase())
+    assert stub.actions() == ["init"] * 3
+
+    asyncio.run(provision.terraform_init_phase(force=True))
+    assert stub.actions() == ["init"] * 4
+
+
+def test_removing_providers_forces_init(provision):
+    asyncio.run(provision.terraform_init_phase())
+    shutil.rmtree(provision.terraform_dir / ".terraform")
+    asyncio.run(provision.terraform_init_phase())
+    assert provision.runner.actions() == ["init", "init"]
+
+
+def test_apply_uses_the_saved_plan_and_is_skipped_when_unchanged(provision):
+    stub, cache = provision.runner, provision.terraform_cache
+    vars_file = write_vars(provision, "orders")
+
+    deploy(provision, "orders", vars_file)
+    plan_file = cache.plan_file("orders")
+    assert stub.actions() == ["init", "plan", "apply"]
+    assert f"-out={plan_file}" in stub.commands[1]
+    assert stub.commands[2][-1] == str(plan_file)  # the reviewed plan, not a fresh one
+    assert not plan_file.exists()
+
+    deploy(provision, "orders", vars_file)
+    assert stub.actions() == ["init", "plan", "apply"]
+
+    deploy(provision, "orders", vars_file, force=True)
+    assert stub.actions()[3:] == ["init", "plan", "apply"]
+
+
+def test_changed_vars_or_state_plan_again(provision):
+    stub = provision.runner
+    orders, events = write_vars(provision, "orders"), write_vars(provision, "events")
+    deploy(provision, "orders", orders)
+    deploy(provision, "events", events)
+    assert stub.actions().count("apply") == 2
+
+    # The events apply changed the shared state, so orders is no longer known to be current
+    deploy(provision, "orders", orders)
+    assert stub.actions().count("plan") == 3
+
+    write_vars(provision, "orders", "e2-standard-8")
+    deploy(provision, "orders", orders)
+    assert stub.actions().count("plan") == 4
+
+    # A manual terraform run changes the serial as well
+    deploy(provision, "orders", orders)
+    plans = stub.actions().count("plan")
+    bump_serial(provision.terraform_dir)
+    deploy(provision, "orders", orders)
+    assert stub.actions().count("plan") == plans + 1
+
+
+def test_plan_without_changes_records_the_cluster(provision):
+    stub = provision.runner
+    stub.plan_exit = 0
+    vars_file = write_vars(provision, "orders")
+
+    deploy(provision, "orders", vars_file)
+    deploy(provision, "orders", vars_file)
+    assert stub.actions() == ["init", "plan"]
+    assert not provision.terraform_cache.plan_file("orders").exists()
+
+
+def test_records_from_separate_instances_are_merged(tmp_path):
+    cache = TerraformCache(tmp_path)
+    caches = [TerraformCache(tmp_path) for _ in range(4)]
+    for i, other in enumerate(caches):
+        other.record(f"apply:c{i}", f"f{i}")
+
+    assert all(cache.is_current(f"apply:c{i}", f"f{i}") for i in range(4))
+    cache.forget("apply:c0")
+    assert not cache.is_current("apply:c0", "f0")
+    assert cache.state_serial() is None
@@ -0,0 +1,98 @@
+import pytest
+import yaml
+
+from dbprov.tuning import (
+    NOFILE_LIMIT, PROFILES, TuningError, parse_override, render_mongod_conf, resolve_tuning, validate_tuning,
+)
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_profiles_validate_without_warnings(profile):
+    settings, warnings = resolve_tuning(profile, instance_type="e2-standard-4")
+    assert settings == PROFILES[profile] and warnings == []
+
+
+def test_render_default_profile():
+    conf = yaml.safe_load(render_mongod_conf(PROFILES["default"], "rs0", memory_gb=16))
+
+    assert conf["storage"]["wiredTiger"] == {
+        "engineConfig": {"cacheSizeGB": 7.5, "journalCompressor": "snappy"},
+        "collectionConfig": {"blockCompressor": "snappy"},
+        "indexConfig": {"prefixCompression": True},
+    }
+    assert conf["storage"]["journal"] == {"commitIntervalMs": 100}
+    assert conf["net"]["maxIncomingConnections"] == NOFILE_LIMIT
+    assert conf["net"]["compression"] == {"compressors": "snappy,zstd,zlib"}
+    assert conf["replication"] == {"replSetName": "rs0"}
+    assert conf["operationProfiling"] == {"mode": "off", "slowOpThresholdMs": 100, "slowOpSampleRate": 1.0}
+
+
+def test_explicit_sizes_override_the_ratio():
+    settings, _ = resolve_tuning("analytics", {"slow_op_threshold_ms": 500}, cache_size="4GB", oplog_size="2GB")
+    conf = yaml.safe_load(render_mongod_conf(settings, "rs0", memory_gb=64))
+
+    assert conf["storage"]["wiredTiger"]["engineConfig"]["cacheSizeGB"] == 4.0
+    assert conf["storage"]["wiredTiger"]["collectionConfig"] == {"blockCompressor": "zstd"}
+    assert conf["replication"]["oplogSizeMB"] == 2048
+    assert conf["operationProfiling"]["slowOpThresholdMs"] == 500
+    # No replica set, no replication section (a standalone node)
+    assert "replication" not in yaml.safe_load(render_mongod_conf(settings))
+
+
+def test_parse_override():
+    assert parse_override("max-incoming-connections=30000") == ("max_incoming_connections", 30000)
+    assert parse_override("prefix_compression=no") == ("prefix_compression", False)
+    assert parse_override("cache_ratio=0.4") == ("cache_ratio", 0.4)
+    with pytest.raises(TuningError, match="Unknown tuning override"):
+        parse_override("cache=1")
+    with pytest.raises(TuningError, match="expects a int"):
+        parse_override("max_incoming_connections=many")
+    with pytest.raises(TuningError, match="expects a bool"):
+        parse_override("prefix_compression=maybe")
+
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"block_compressor": "lz4"}, "block_compressor must be one of"),
+    ({"network_compressors": "zstd,disabled"}, "cannot be combined"),
+    ({"network_compressors": "brotli"}, "unknown network compressor"),
+    ({"service_executor": "adaptive"}, "removed in MongoDB 5.0"),
+    ({"cache_ratio": 0.9}, "cache_ratio must be between 0.05 and 0.8"),
+    ({"oplog_size_mb": 100}, "oplog_size_mb must be at least 990"),
+    ({"cache_size_gb": 14.0}, "leaves too little memory on e2-standard-4"),
+    ({"journal_commit_interval_ms": "100"}, "must be a int"),
+])
+def test_invalid_settings(overrides, message):
+    with pytest.raises(TuningError, match=message):
+        resolve_tuning("default", overrides, instance_type="e2-standard-4")
+
+
+def test_every_error_is_reported():
+    with pytest.raises(TuningError) as e:
+        validate_tuning({"block_compressor": "lz4", "profiling_mode": "verbose", "slow_op_sample_rate": 2.0})
+    assert len(e.value.errors) == 3
+
+
+def test_warnings():
+    _, warnings = resolve_tuning("default", {"max_incoming_connections": NOFILE_LIMIT + 1, "profiling_mode": "all",
+                                             "block_compressor": "none", "journal_compressor": "none",
+                                             "cache_size_gb": 10.0}, instance_type="e2-standard-4")
+    assert len(warnings) == 4
+    assert any("nofile ulimit" in w for w in warnings)
+    assert any("well above the default for e2-standard-4" in w for w in warnings)
+
+
+def test_plain_create_does_not_warn(dbprovision):
+    result = dbprovision("create", "--project-id", "p", "--dry-run")
+    assert "Warning" not in result.stdout
+    assert f"max_incoming_connections: {NOFILE_LIMIT}" in result.stdout
+
+
+def test_tuning_command_renders_a_profile(dbprovision):
+    result = dbprovision("tuning", "--profile", "bulk-ingest", "--memory-gb", "8", "--replica-set-name", "rs1")
+    conf = yaml.safe_load(result.stdout)
+    assert conf["net"]["maxIncomingConnections"] == 2000
+    assert conf["storage"]["wiredTiger"]["engineConfig"] == {"cacheSizeGB": 3.5, "journalCompressor": "none"}
+
+    result = dbprovision("tuning", "--profile", "default", "--tuning-set", "cache_ratio=2", check=False)
+    assert result.returncode == 1
+    assert "Error: Invalid tuning: cache_ratio must be between 0.05 and 0.8, got 2.0" in result.stdout
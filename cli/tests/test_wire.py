@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import pytest
+
+from dbprov.testing.fakemongo import FakeMongoServer, enable_auth
+from dbprov.wire import CommandError, ConnectionPool, Credentials, MongoConnection, saslprep
+
+
+@pytest.mark.parametrize("text, prepared", [
+    ("I\u00adX", "IX"),  # RFC 4013 examples: soft hyphen mapped to nothing
+    ("user", "user"),
+    ("USER", "USER"),
+    ("\u00aa", "a"),  # NFKC
+    ("\u2168", "IX"),
+    ("pass\u00a0word", "pass word"),  # non-ASCII space
+    ("p\u00e4ss", "p\u00e4ss"),
+])
+def test_saslprep(text, prepared):
+    assert saslprep(text) == prepared
+
+
+@pytest.mark.parametrize("text", ["\u0007", "a\u0000b", "\u06271", "\U000e0001"])
+def test_saslprep_rejects(text):
+    with pytest.raises(ValueError):
+        saslprep(text)
+
+
+def authenticate(users, credentials):
+    async def run():
+        async with FakeMongoServer() as server:
+            enable_auth(server, users)
+            conn = await MongoConnection.open(server.host, server.port, credentials=credentials)
+            try:
+                return await conn.command("admin", {"ping": 1})
+            finally:
+                await conn.close()
+    return asyncio.run(run())
+
+
+def test_scram_with_non_ascii_password():
+    # Stored as typed on one keyboard, entered with a decomposed umlaut and a no-break space
+    users = {"app,user=1": "gr\u00fc\u00dfe welt"}
+    assert authenticate(users, Credentials("app,user=1", "gru\u0308\u00dfe\u00a0welt"))["ok"] == 1
+
+
+def test_scram_wrong_password():
+    with pytest.raises(CommandError) as e:
+        authenticate({"admin": "secret"}, Credentials("admin", "Secret"))
+    assert e.value.code == 18
+
+
+def test_password_saslprep_rejects_is_reported():
+    with pytest.raises(CommandError, match="Invalid password for admin: SASLprep does not allow U\\+0007"):
+        authenticate({"admin": "secret"}, Credentials("admin", "sec\u0007ret"))
+
+
+def test_pool_reuses_authenticated_connections():
+    async def run():
+        async with FakeMongoServer() as server:
+            enable_auth(server, {"admin": "secret"})
+            pool = ConnectionPool(credentials=Credentials("admin", "secret"))
+            for _ in range(3):
+                async with pool.acquire(server.host, server.port) as conn:
+                    await conn.command("admin", {"ping": 1})
+            await pool.close()
+            return server.requests
+    # One SCRAM conversation (saslStart, saslContinue), then three pings
+    assert asyncio.run(run()) == 5
+
+
+@pytest.mark.skipif(not os.environ.get("DBPROV_TEST_MONGOD"),
+                    reason="set DBPROV_TEST_MONGOD=host:port plus MONGODB_USERNAME/MONGODB_PASSWORD")
+def test_scram_against_real_mongod():
+    host, _, port = os.environ["DBPROV_TEST_MONGOD"].rpartition(":")
+    credentials = Credentials(os.environ["MONGODB_USERNAME"], os.environ.get("MONGODB_PASSWORD", ""))
+
+    async def run():
+        conn = await MongoConnection.open(host, int(port), credentials=credentials)
+        try:
+            return await conn.command("admin", {"connectionStatus": 1})
+        finally:
+            await conn.close()
+
+    status = asyncio.run(run())
+    assert status["authInfo"]["authenticatedUsers"][0]["user"] == credentials.username
@@ -8,6 +8,9 @@ resource "google_compute_instance" "mongodb_instances" {
   machine_type = var.machine_type
   zone         = var.zones[count.index % length(var.zones)]
 
+  # dbprovision rolling --operation resize 가 인스턴스를 하나씩 중지 후 타입 변경
+  allow_stopping_for_update = true
+
   boot_disk {
     initialize_params {
       image = var.image